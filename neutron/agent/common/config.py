@@ -29,11 +29,25 @@ ROOT_HELPER_OPTS = [
                help=_('Root helper application.')),
 ]
 
+ROOT_HELPER_DAEMON_OPTS = [
+    cfg.StrOpt('root_helper_daemon',
+               help=_('Root helper daemon application. When set, the '
+                      'commands run with the root helper are sent to this '
+                      'daemon, started once by the agent, instead of '
+                      'starting the root helper for each command.')),
+]
+
 AGENT_STATE_OPTS = [
     cfg.FloatOpt('report_interval', default=30,
                  help=_('Seconds between nodes reporting state to server; '
                         'should be less than agent_down_time, best if it '
                         'is half or less than agent_down_time.')),
+    cfg.IntOpt('metrics_report_interval', default=10,
+               help=_('Number of state reports after which the metrics of '
+                      'the agent, such as the commands it ran, are updated '
+                      'in the configurations it reports. The server writes '
+                      'the reports whose configurations changed at once. 0 '
+                      'disables the metrics.')),
 ]
 
 INTERFACE_DRIVER_OPTS = [
@@ -78,6 +92,7 @@ def register_root_helper(conf):
     # The first call is to ensure backward compatibility
     conf.register_opts(ROOT_HELPER_OPTS)
     conf.register_opts(ROOT_HELPER_OPTS, 'AGENT')
+    conf.register_opts(ROOT_HELPER_DAEMON_OPTS, 'AGENT')
 
 
 def register_agent_state_opts_helper(conf):
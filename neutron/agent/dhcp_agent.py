@@ -27,6 +27,7 @@ from neutron.agent.linux import dhcp
 from neutron.agent.linux import external_process
 from neutron.agent.linux import interface
 from neutron.agent.linux import ovs_lib  # noqa
+from neutron.agent.linux import utils as linux_utils
 from neutron.agent import rpc as agent_rpc
 from neutron.common import config as common_config
 from neutron.common import constants
@@ -60,6 +61,18 @@ class DhcpAgent(manager.Manager):
                            "enable_isolated_metadata = True")),
         cfg.IntOpt('num_sync_threads', default=4,
                    help=_('Number of threads to use during sync process.')),
+        cfg.IntOpt('sync_networks_chunk_size', default=0,
+                   help=_('Number of networks retrieved per call during '
+                          'sync process, so that networks are configured '
+                          'while the following ones are retrieved. 0 '
+                          'retrieves all the networks in a single call. '
+                          'Requires a server supporting chunked requests.')),
+        cfg.FloatOpt('port_reload_delay', default=0,
+                     help=_('Seconds to wait after a port event before '
+                            'reloading the DHCP allocations of its network, '
+                            'so that the port events received meanwhile are '
+                            'applied with a single reload. 0 reloads the '
+                            'allocations on each port event.')),
         cfg.StrOpt('metadata_proxy_socket',
                    default='$state_path/metadata_proxy',
                    help=_('Location of Metadata Proxy UNIX domain '
@@ -70,6 +83,8 @@ class DhcpAgent(manager.Manager):
         super(DhcpAgent, self).__init__(host=host)
         self.needs_resync_reasons = []
         self.conf = cfg.CONF
+        self._pending_reloads = {}
+        self.coalesced_reloads = 0
         self.cache = NetworkCache()
         self.root_helper = config.get_root_helper(self.conf)
         self.dhcp_driver_cls = importutils.import_class(self.conf.dhcp_driver)
@@ -149,6 +164,28 @@ class DhcpAgent(manager.Manager):
         """Schedule a resync for a given reason."""
         self.needs_resync_reasons.append(reason)
 
+    def _iter_active_networks(self):
+        """Retrieve the active networks, in chunks if configured to."""
+        chunk_size = self.conf.sync_networks_chunk_size
+        if not chunk_size:
+            yield self.plugin_rpc.get_active_networks_info()
+            return
+        seen_ids = set()
+        marker = None
+        while True:
+            networks = self.plugin_rpc.get_active_networks_info(
+                limit=chunk_size, marker=marker)
+            # A server which does not support chunked requests returns all
+            # the networks on each call
+            networks = [network for network in networks
+                        if network.id not in seen_ids]
+            if networks:
+                seen_ids.update(network.id for network in networks)
+                marker = networks[-1].id
+                yield networks
+            if len(networks) != chunk_size:
+                return
+
     @utils.synchronized('dhcp-agent')
     def sync_state(self):
         """Sync the local DHCP state with Neutron."""
@@ -157,8 +194,16 @@ class DhcpAgent(manager.Manager):
         known_network_ids = set(self.cache.get_network_ids())
 
         try:
-            active_networks = self.plugin_rpc.get_active_networks_info()
-            active_network_ids = set(network.id for network in active_networks)
+            active_network_ids = set()
+            try:
+                for networks in self._iter_active_networks():
+                    for network in networks:
+                        active_network_ids.add(network.id)
+                        pool.spawn(self.safe_configure_dhcp_for_network,
+                                   network)
+            finally:
+                pool.waitall()
+
             for deleted_id in known_network_ids - active_network_ids:
                 try:
                     self.disable_dhcp_helper(deleted_id)
@@ -166,10 +211,6 @@ class DhcpAgent(manager.Manager):
                     self.schedule_resync(e)
                     LOG.exception(_('Unable to sync network state on deleted '
                                     'network %s'), deleted_id)
-
-            for network in active_networks:
-                pool.spawn(self.safe_configure_dhcp_for_network, network)
-            pool.waitall()
             LOG.info(_('Synchronizing state complete'))
 
         except Exception as e:
@@ -309,7 +350,7 @@ class DhcpAgent(manager.Manager):
         network = self.cache.get_network_by_id(updated_port.network_id)
         if network:
             self.cache.put_port(updated_port)
-            self.call_driver('reload_allocations', network)
+            self.reload_allocations_after_port_event(network)
 
     # Use the update handler for the port create event.
     port_create_end = port_update_end
@@ -321,7 +362,33 @@ class DhcpAgent(manager.Manager):
         if port:
             network = self.cache.get_network_by_id(port.network_id)
             self.cache.remove_port(port)
+            self.reload_allocations_after_port_event(network)
+
+    def reload_allocations_after_port_event(self, network):
+        """Reload the allocations, coalescing port events if configured."""
+        if not self.conf.port_reload_delay:
             self.call_driver('reload_allocations', network)
+            return
+        if network.id in self._pending_reloads:
+            self._pending_reloads[network.id] += 1
+            self.coalesced_reloads += 1
+            return
+        self._pending_reloads[network.id] = 1
+        eventlet.spawn_after(self.conf.port_reload_delay,
+                             self._reload_pending_allocations, network.id)
+
+    @utils.synchronized('dhcp-agent')
+    def _reload_pending_allocations(self, network_id):
+        events = self._pending_reloads.pop(network_id, 0)
+        network = self.cache.get_network_by_id(network_id)
+        if not network:
+            return
+        LOG.debug(_('Reloading allocations for network %(net_id)s after '
+                    '%(events)d port events, %(coalesced)d reloads '
+                    'coalesced so far'),
+                  {'net_id': network_id, 'events': events,
+                   'coalesced': self.coalesced_reloads})
+        self.call_driver('reload_allocations', network)
 
     def enable_isolated_metadata_proxy(self, network):
 
@@ -384,6 +451,9 @@ class DhcpPluginApi(n_rpc.RpcProxy):
         1.0 - Initial version.
         1.1 - Added get_active_networks_info, create_dhcp_port,
               and update_dhcp_port methods.
+              Added the optional limit and marker arguments of
+              get_active_networks_info, which servers not supporting them
+              ignore by returning all the networks.
 
     """
 
@@ -396,11 +466,18 @@ class DhcpPluginApi(n_rpc.RpcProxy):
         self.host = cfg.CONF.host
         self.use_namespaces = use_namespaces
 
-    def get_active_networks_info(self):
-        """Make a remote process call to retrieve all network info."""
+    def get_active_networks_info(self, limit=None, marker=None):
+        """Make a remote process call to retrieve all network info.
+
+        If limit is given, only the limit networks following the one with id
+        marker, in id order, are retrieved.
+        """
+        kwargs = {'host': self.host}
+        if limit:
+            kwargs.update(limit=limit, marker=marker)
         networks = self.call(self.context,
                              self.make_msg('get_active_networks_info',
-                                           host=self.host),
+                                           **kwargs),
                              topic=self.topic)
         return [dhcp.NetModel(self.use_namespaces, n) for n in networks]
 
@@ -551,6 +628,7 @@ class DhcpAgentWithStateReport(DhcpAgent):
     def __init__(self, host=None):
         super(DhcpAgentWithStateReport, self).__init__(host=host)
         self.state_rpc = agent_rpc.PluginReportStateAPI(topics.PLUGIN)
+        self.metrics_report = agent_rpc.MetricsReport()
         self.agent_state = {
             'binary': 'neutron-dhcp-agent',
             'host': host,
@@ -572,6 +650,9 @@ class DhcpAgentWithStateReport(DhcpAgent):
         try:
             self.agent_state.get('configurations').update(
                 self.cache.get_state())
+            if self.metrics_report.due():
+                self.agent_state.get('configurations').update(
+                    linux_utils.EXECUTE_STATS.pop_state())
             ctx = context.get_admin_context_without_session()
             self.state_rpc.report_state(ctx, self.agent_state, self.use_call)
             self.use_call = False
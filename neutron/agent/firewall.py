@@ -51,8 +51,15 @@ class FirewallDriver(object):
       if direction is egress:
         remote_group_id will be a list of dest_ip_prefix
       remote_group_id will also remaining membership update management
+
+    Drivers setting use_security_group_info get the rules of the security
+    groups and the IP addresses of the remote groups once, through
+    update_security_group_rules and update_security_group_members, and
+    the ports only carry their provider rules.
     """
 
+    use_security_group_info = False
+
     def prepare_port_filter(self, port):
         """Prepare filters for the port.
 
@@ -83,6 +90,17 @@ class FirewallDriver(object):
         """Stop filtering port."""
         raise NotImplementedError()
 
+    def update_security_group_rules(self, sg_id, rules):
+        """Update the rules of a security group."""
+        raise NotImplementedError()
+
+    def update_security_group_members(self, sg_id, member_ips):
+        """Update the IP addresses of the members of a security group.
+
+        member_ips is a dict of the addresses by ethertype.
+        """
+        raise NotImplementedError()
+
     def filter_defer_apply_on(self):
         """Defer application of filtering rule."""
         pass
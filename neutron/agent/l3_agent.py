@@ -14,12 +14,15 @@
 #
 
 import sys
+import time
 
 import eventlet
 eventlet.monkey_patch()
 
+import eventlet.queue
 import netaddr
 from oslo.config import cfg
+from oslo import messaging
 
 from neutron.agent.common import config
 from neutron.agent.linux import external_process
@@ -27,6 +30,7 @@ from neutron.agent.linux import interface
 from neutron.agent.linux import ip_lib
 from neutron.agent.linux import iptables_manager
 from neutron.agent.linux import ovs_lib  # noqa
+from neutron.agent.linux import utils
 from neutron.agent import rpc as agent_rpc
 from neutron.common import config as common_config
 from neutron.common import constants as l3_constants
@@ -37,12 +41,12 @@ from neutron import context
 from neutron import manager
 from neutron.openstack.common import excutils
 from neutron.openstack.common import importutils
-from neutron.openstack.common import lockutils
 from neutron.openstack.common import log as logging
 from neutron.openstack.common import loopingcall
 from neutron.openstack.common import periodic_task
 from neutron.openstack.common import processutils
 from neutron.openstack.common import service
+from neutron.openstack.common import timeutils
 from neutron import service as neutron_service
 from neutron.services.firewall.agents.l3reference import firewall_l3_agent
 
@@ -50,9 +54,13 @@ LOG = logging.getLogger(__name__)
 NS_PREFIX = 'qrouter-'
 INTERNAL_DEV_PREFIX = 'qr-'
 EXTERNAL_DEV_PREFIX = 'qg-'
-RPC_LOOP_INTERVAL = 1
 FLOATING_IP_CIDR_SUFFIX = '/32'
 
+# Lower value is higher priority
+PRIORITY_RPC = 0
+PRIORITY_SYNC_ROUTERS_TASK = 1
+DELETE_ROUTER = 1
+
 
 class L3PluginApi(n_rpc.RpcProxy):
     """Agent side of the l3 agent RPC API.
@@ -60,6 +68,8 @@ class L3PluginApi(n_rpc.RpcProxy):
     API version history:
         1.0 - Initial version.
         1.1 - Floating IP operational status updates
+        1.2 - get_router_ids, to fetch the routers in chunks
+        1.3 - get_changed_routers, to fetch only the routers which changed
 
     """
 
@@ -77,6 +87,21 @@ class L3PluginApi(n_rpc.RpcProxy):
                                        router_ids=router_ids),
                          topic=self.topic)
 
+    def get_router_ids(self, context):
+        """Make a remote process call to retrieve the ids of the routers."""
+        return self.call(context,
+                         self.make_msg('get_router_ids', host=self.host),
+                         topic=self.topic,
+                         version='1.2')
+
+    def get_changed_routers(self, context, router_revisions):
+        """Make a remote process call to retrieve the changed routers."""
+        return self.call(context,
+                         self.make_msg('get_changed_routers', host=self.host,
+                                       router_revisions=router_revisions),
+                         topic=self.topic,
+                         version='1.3')
+
     def get_external_network_id(self, context):
         """Make a remote process call to retrieve the external network id.
 
@@ -99,6 +124,84 @@ class L3PluginApi(n_rpc.RpcProxy):
                          version='1.1')
 
 
+class RouterUpdate(object):
+    """An update of a router, waiting in a RouterProcessingQueue.
+
+    Unless the router data was fetched already, with its timestamp telling
+    when, the router is fetched when the update is processed.
+    """
+
+    def __init__(self, router_id, priority, action=None, router=None,
+                 timestamp=None):
+        self.id = router_id
+        self.priority = priority
+        self.action = action
+        self.router = router
+        self.timestamp = timestamp or timeutils.utcnow()
+
+    def __lt__(self, other):
+        # The oldest update of the highest priority goes first
+        return ((self.priority, self.timestamp, self.id) <
+                (other.priority, other.timestamp, other.id))
+
+
+class RouterProcessingQueue(object):
+    """Router updates processed by priority, one at a time per router.
+
+    Only the latest update of each router is kept, with the highest
+    priority of the updates it replaced. The update of a router being
+    processed waits until the router is done, and updates older than the
+    last one processed for their router are dropped.
+    """
+
+    def __init__(self):
+        self._queue = eventlet.queue.PriorityQueue()
+        self._pending = {}
+        self._processing = set()
+        self._processed_timestamps = {}
+
+    def __len__(self):
+        return len(self._pending)
+
+    def add(self, update):
+        pending = self._pending.get(update.id)
+        if pending:
+            newer = max(pending, update, key=lambda u: u.timestamp)
+            update = RouterUpdate(newer.id,
+                                  min(pending.priority, update.priority),
+                                  action=newer.action, router=newer.router,
+                                  timestamp=newer.timestamp)
+        # The replaced update stays in the queue, it is skipped by get
+        self._pending[update.id] = update
+        if update.id not in self._processing:
+            self._queue.put(update)
+
+    def get(self):
+        """Wait for the next update to process."""
+        while True:
+            update = self._queue.get()
+            if self._pending.get(update.id) is not update:
+                continue
+            del self._pending[update.id]
+            processed = self._processed_timestamps.get(update.id)
+            if processed and update.timestamp < processed:
+                LOG.debug(_("Dropping stale update of router %s"), update.id)
+                continue
+            self._processing.add(update.id)
+            return update
+
+    def done(self, update, processed=True):
+        """Release the router of an update returned by get."""
+        self._processing.discard(update.id)
+        if processed:
+            self._processed_timestamps[update.id] = max(
+                update.timestamp,
+                self._processed_timestamps.get(update.id, update.timestamp))
+        pending = self._pending.get(update.id)
+        if pending:
+            self._queue.put(pending)
+
+
 class RouterInfo(object):
 
     def __init__(self, router_id, root_helper, use_namespaces, router):
@@ -189,6 +292,11 @@ class L3NATAgent(firewall_l3_agent.FWaaSL3AgentRpcCallback, manager.Manager):
                    default='$state_path/metadata_proxy',
                    help=_('Location of Metadata Proxy UNIX domain '
                           'socket')),
+        cfg.IntOpt('router_processing_workers', default=8,
+                   help=_("Number of routers processed concurrently.")),
+        cfg.IntOpt('sync_routers_chunk_size', default=256,
+                   help=_("Number of routers fetched by each RPC call "
+                          "during a full resync.")),
     ]
 
     def __init__(self, host, conf=None):
@@ -215,15 +323,14 @@ class L3NATAgent(firewall_l3_agent.FWaaSL3AgentRpcCallback, manager.Manager):
         self.context = context.get_admin_context_without_session()
         self.plugin_rpc = L3PluginApi(topics.L3PLUGIN, host)
         self.fullsync = True
-        self.updated_routers = set()
-        self.removed_routers = set()
-        self.sync_progress = False
+        self.use_router_ids = True
+        self.use_router_revisions = True
+        self._queue = RouterProcessingQueue()
+        # The time the last update of each router took to process
+        self.router_update_times = {}
 
         self._clean_stale_namespaces = self.conf.use_namespaces
 
-        self.rpc_loop = loopingcall.FixedIntervalLoopingCall(
-            self._rpc_loop)
-        self.rpc_loop.start(interval=RPC_LOOP_INTERVAL)
         super(L3NATAgent, self).__init__(conf=self.conf)
 
         self.target_ex_net_id = None
@@ -419,6 +526,12 @@ class L3NATAgent(firewall_l3_agent.FWaaSL3AgentRpcCallback, manager.Manager):
         return [ip_dev.name for ip_dev in ip_devs]
 
     def process_router(self, ri):
+        # The changes made in the router namespace are queued together when
+        # ip_lib batches them.
+        with ip_lib.batch(self.root_helper, ri.ns_name):
+            self._process_router(ri)
+
+    def _process_router(self, ri):
         ri.iptables_manager.defer_apply_on()
         ex_gw_port = self._get_ex_gw_port(ri)
         internal_ports = ri.router.get(l3_constants.INTERFACE_KEY, [])
@@ -497,9 +610,12 @@ class L3NATAgent(firewall_l3_agent.FWaaSL3AgentRpcCallback, manager.Manager):
                 self.process_router_floating_ip_nat_rules(ri)
                 ri.iptables_manager.defer_apply_off()
                 # Once NAT rules for floating IPs are safely in place
-                # configure their addresses on the external gateway port
-                fip_statuses = self.process_router_floating_ip_addresses(
-                    ri, ex_gw_port)
+                # configure their addresses on the external gateway port.
+                # They are added at once, so that the failure of each one
+                # is known before its status is sent to the server.
+                with ip_lib.unbatched(ri.ns_name):
+                    fip_statuses = self.process_router_floating_ip_addresses(
+                        ri, ex_gw_port)
         except Exception:
             # TODO(salv-orlando): Less broad catching
             # All floating IPs must be put in error state
@@ -589,7 +705,8 @@ class L3NATAgent(firewall_l3_agent.FWaaSL3AgentRpcCallback, manager.Manager):
                 net = netaddr.IPNetwork(ip_cidr)
                 try:
                     device.addr.add(net.version, ip_cidr, str(net.broadcast))
-                except (processutils.UnknownArgumentError,
+                except (RuntimeError,
+                        processutils.UnknownArgumentError,
                         processutils.ProcessExecutionError):
                     # any exception occurred here should cause the floating IP
                     # to be set in error state
@@ -735,7 +852,8 @@ class L3NATAgent(firewall_l3_agent.FWaaSL3AgentRpcCallback, manager.Manager):
     def router_deleted(self, context, router_id):
         """Deal with router deletion RPC message."""
         LOG.debug(_('Got router deleted notification for %s'), router_id)
-        self.removed_routers.add(router_id)
+        self._queue.add(RouterUpdate(router_id, PRIORITY_RPC,
+                                     action=DELETE_ROUTER))
 
     def routers_updated(self, context, routers):
         """Deal with routers modification and creation RPC message."""
@@ -744,11 +862,13 @@ class L3NATAgent(firewall_l3_agent.FWaaSL3AgentRpcCallback, manager.Manager):
             # This is needed for backward compatibility
             if isinstance(routers[0], dict):
                 routers = [router['id'] for router in routers]
-            self.updated_routers.update(routers)
+            for router_id in routers:
+                self._queue.add(RouterUpdate(router_id, PRIORITY_RPC))
 
     def router_removed_from_agent(self, context, payload):
         LOG.debug(_('Got router removed from agent :%r'), payload)
-        self.removed_routers.add(payload['router_id'])
+        self._queue.add(RouterUpdate(payload['router_id'], PRIORITY_RPC,
+                                     action=DELETE_ROUTER))
 
     def router_added_to_agent(self, context, payload):
         LOG.debug(_('Got router added to agent :%r'), payload)
@@ -800,49 +920,102 @@ class L3NATAgent(firewall_l3_agent.FWaaSL3AgentRpcCallback, manager.Manager):
             pool.spawn_n(self._router_removed, router_id)
         pool.waitall()
 
-    @lockutils.synchronized('l3-agent', 'neutron-')
-    def _rpc_loop(self):
-        # _rpc_loop and _sync_routers_task will not be
-        # executed in the same time because of lock.
-        # so we can clear the value of updated_routers
-        # and removed_routers, but they can be updated by
-        # updated_routers and removed_routers rpc call
+    def _process_router_update(self):
+        update = self._queue.get()
+        start = time.time()
+        processed = False
         try:
-            LOG.debug(_("Starting RPC loop for %d updated routers"),
-                      len(self.updated_routers))
-            if self.updated_routers:
-                # We're capturing and clearing the list, and will
-                # process the "captured" updates in this loop,
-                # and any updates that happen due to a context switch
-                # will be picked up on the next pass.
-                updated_routers = set(self.updated_routers)
-                self.updated_routers.clear()
-                router_ids = list(updated_routers)
-                routers = self.plugin_rpc.get_routers(
-                    self.context, router_ids)
-                # routers with admin_state_up=false will not be in the fetched
-                fetched = set([r['id'] for r in routers])
-                self.removed_routers.update(updated_routers - fetched)
-
-                self._process_routers(routers)
-            self._process_router_delete()
-            LOG.debug(_("RPC loop successfully completed"))
+            if update.action == DELETE_ROUTER:
+                self._router_removed(update.id)
+            else:
+                router = update.router
+                if not router:
+                    update.timestamp = timeutils.utcnow()
+                    routers = self.plugin_rpc.get_routers(self.context,
+                                                          [update.id])
+                    router = routers[0] if routers else None
+                if router:
+                    self._process_routers([router])
+                else:
+                    # routers with admin_state_up=false are not fetched
+                    self._router_removed(update.id)
+            processed = True
         except Exception:
-            LOG.exception(_("Failed synchronizing routers"))
+            LOG.exception(_("Failed processing router %s"), update.id)
             self.fullsync = True
-
-    def _process_router_delete(self):
-        current_removed_routers = list(self.removed_routers)
-        for router_id in current_removed_routers:
-            self._router_removed(router_id)
-            self.removed_routers.remove(router_id)
+            # Make sure the router is sent again by the full sync
+            ri = self.router_info.get(update.id)
+            if ri:
+                ri.router.pop('revision', None)
+        finally:
+            self._queue.done(update, processed)
+        elapsed = time.time() - start
+        if update.id in self.router_info:
+            self.router_update_times[update.id] = elapsed
+        else:
+            self.router_update_times.pop(update.id, None)
+        LOG.debug(_("Processed update of router %(router)s in %(elapsed).3f "
+                    "seconds, %(pending)d updates pending"),
+                  {'router': update.id, 'elapsed': elapsed,
+                   'pending': len(self._queue)})
+
+    def _process_routers_loop(self):
+        LOG.debug(_("Starting _process_routers_loop"))
+        pool = eventlet.GreenPool(size=self.conf.router_processing_workers)
+        while True:
+            pool.spawn_n(self._process_router_update)
 
     def _router_ids(self):
         if not self.conf.use_namespaces:
             return [self.conf.router_id]
 
+    def _get_router_revisions(self, router_ids):
+        revisions = {}
+        for router_id in router_ids:
+            ri = self.router_info.get(router_id)
+            revisions[router_id] = ri and ri.router.get('revision')
+        return revisions
+
+    def _fetch_routers_in_chunks(self, context):
+        """Yield the routers to sync, with the time they were fetched.
+
+        The ids of the routers which did not change since they were
+        processed are yielded too, when the server supports it.
+        """
+        router_ids = self._router_ids()
+        if router_ids is None and self.use_router_ids:
+            try:
+                router_ids = self.plugin_rpc.get_router_ids(context)
+            except (messaging.UnsupportedVersion, n_rpc.RemoteError) as e:
+                if not n_rpc.is_unsupported_version(e):
+                    raise
+                LOG.warn(_("Server does not support get_router_ids, "
+                           "fetching all the routers at once instead"))
+                self.use_router_ids = False
+        if router_ids is None:
+            yield timeutils.utcnow(), self.plugin_rpc.get_routers(context), []
+            return
+        chunk_size = self.conf.sync_routers_chunk_size
+        for i in range(0, len(router_ids), chunk_size):
+            chunk = router_ids[i:i + chunk_size]
+            timestamp = timeutils.utcnow()
+            if self.use_router_revisions:
+                try:
+                    reply = self.plugin_rpc.get_changed_routers(
+                        context, self._get_router_revisions(chunk))
+                except (messaging.UnsupportedVersion, n_rpc.RemoteError) as e:
+                    if not n_rpc.is_unsupported_version(e):
+                        raise
+                    LOG.warn(_("Server does not support "
+                               "get_changed_routers, fetching all the "
+                               "routers instead"))
+                    self.use_router_revisions = False
+                else:
+                    yield timestamp, reply['routers'], reply['unchanged']
+                    continue
+            yield timestamp, self.plugin_rpc.get_routers(context, chunk), []
+
     @periodic_task.periodic_task
-    @lockutils.synchronized('l3-agent', 'neutron-')
     def periodic_sync_routers_task(self, context):
         self._sync_routers_task(context)
 
@@ -853,15 +1026,26 @@ class L3NATAgent(firewall_l3_agent.FWaaSL3AgentRpcCallback, manager.Manager):
                   self.fullsync)
         if not self.fullsync:
             return
+        # The routers are queued as each chunk is fetched, behind the
+        # updates notified by the server, and processed by the workers
+        # of _process_routers_loop while the next chunks are fetched.
+        prev_router_ids = set(self.router_info)
+        timestamp = timeutils.utcnow()
+        routers = []
         try:
-            router_ids = self._router_ids()
-            self.updated_routers.clear()
-            self.removed_routers.clear()
-            routers = self.plugin_rpc.get_routers(
-                context, router_ids)
-
-            LOG.debug(_('Processing :%r'), routers)
-            self._process_routers(routers, all_routers=True)
+            for timestamp, chunk, unchanged in self._fetch_routers_in_chunks(
+                    context):
+                LOG.debug(_('Queuing :%r'), chunk)
+                for router in chunk:
+                    self._queue.add(RouterUpdate(
+                        router['id'], PRIORITY_SYNC_ROUTERS_TASK,
+                        router=router, timestamp=timestamp))
+                routers.extend(chunk)
+                routers.extend({'id': router_id} for router_id in unchanged)
+            for router_id in prev_router_ids - set(r['id'] for r in routers):
+                self._queue.add(RouterUpdate(
+                    router_id, PRIORITY_SYNC_ROUTERS_TASK,
+                    action=DELETE_ROUTER, timestamp=timestamp))
             self.fullsync = False
             LOG.debug(_("_sync_routers_task successfully completed"))
         except n_rpc.RPCException:
@@ -876,6 +1060,7 @@ class L3NATAgent(firewall_l3_agent.FWaaSL3AgentRpcCallback, manager.Manager):
                 self._cleanup_namespaces(routers)
 
     def after_start(self):
+        eventlet.spawn_n(self._process_routers_loop)
         LOG.info(_("L3 agent started"))
 
     def _update_routing_table(self, ri, operation, route):
@@ -909,6 +1094,7 @@ class L3NATAgentWithStateReport(L3NATAgent):
     def __init__(self, host, conf=None):
         super(L3NATAgentWithStateReport, self).__init__(host=host, conf=conf)
         self.state_rpc = agent_rpc.PluginReportStateAPI(topics.PLUGIN)
+        self.metrics_report = agent_rpc.MetricsReport()
         self.agent_state = {
             'binary': 'neutron-l3-agent',
             'host': host,
@@ -951,6 +1137,11 @@ class L3NATAgentWithStateReport(L3NATAgent):
         configurations['ex_gw_ports'] = num_ex_gw_ports
         configurations['interfaces'] = num_interfaces
         configurations['floating_ips'] = num_floating_ips
+        if self.metrics_report.due():
+            configurations['pending_router_updates'] = len(self._queue)
+            configurations['max_router_update_time'] = round(
+                max(self.router_update_times.values() or [0]), 3)
+            configurations.update(utils.EXECUTE_STATS.pop_state())
         try:
             self.state_rpc.report_state(self.context, self.agent_state,
                                         self.use_call)
@@ -981,6 +1172,7 @@ def main(manager='neutron.agent.l3_agent.L3NATAgentWithStateReport'):
     config.register_root_helper(conf)
     conf.register_opts(interface.OPTS)
     conf.register_opts(external_process.OPTS)
+    conf.register_opts(ip_lib.OPTS)
     common_config.init(sys.argv[1:])
     config.setup_logging(conf)
     server = neutron_service.Service.create(
@@ -304,6 +304,17 @@ class Dnsmasq(DhcpLocalProcess):
     NEUTRON_RELAY_SOCKET_PATH_KEY = 'NEUTRON_RELAY_SOCKET_PATH'
     MINIMUM_VERSION = 2.59
 
+    # Last content written to each config file and leases listed in each
+    # hosts file, shared by the driver instances of all the networks.
+    _conf_files = {}
+    _hosts_leases = {}
+
+    def __init__(self, conf, network, root_helper='sudo',
+                 version=None, plugin=None):
+        super(Dnsmasq, self).__init__(conf, network, root_helper,
+                                      version, plugin)
+        self._written_files = []
+
     @classmethod
     def check_version(cls):
         ver = 0
@@ -335,6 +346,23 @@ class Dnsmasq(DhcpLocalProcess):
             if uuidutils.is_uuid_like(c)
         ]
 
+    def _remove_config_files(self):
+        super(Dnsmasq, self)._remove_config_files()
+        conf_dir = os.path.dirname(self.get_conf_file_name('host'))
+        for cache in (self._conf_files, self._hosts_leases):
+            for filename in list(cache):
+                if os.path.dirname(filename) == conf_dir:
+                    del cache[filename]
+
+    def _replace_conf_file(self, filename, content):
+        """Write a config file unless it already has the given content."""
+        if (self._conf_files.get(filename) == content and
+                os.path.exists(filename)):
+            return
+        utils.replace_file(filename, content)
+        self._conf_files[filename] = content
+        self._written_files.append(filename)
+
     def spawn_process(self):
         """Spawns a Dnsmasq process for the network."""
         env = {
@@ -434,11 +462,15 @@ class Dnsmasq(DhcpLocalProcess):
                         'turned off DHCP: %s'), self.network.id)
             return
 
+        self._written_files = []
         self._release_unused_leases()
         self._output_hosts_file()
         self._output_addn_hosts_file()
         self._output_opts_file()
-        if self.active:
+        if not self._written_files:
+            LOG.debug(_('Allocations for network %s did not change, not '
+                        'signaling dnsmasq'), self.network.id)
+        elif self.active:
             cmd = ['kill', '-HUP', self.pid]
             utils.execute(cmd, self.root_helper)
         else:
@@ -518,19 +550,29 @@ class Dnsmasq(DhcpLocalProcess):
                 buf.write('%s,%s,%s\n' %
                           (port.mac_address, name, ip_address))
 
-        utils.replace_file(filename, buf.getvalue())
+        content = buf.getvalue()
+        self._replace_conf_file(filename, content)
+        self._hosts_leases[filename] = self._parse_hosts_leases(
+            content.splitlines())
         LOG.debug(_('Done building host file %s'), filename)
         return filename
 
-    def _read_hosts_file_leases(self, filename):
+    @staticmethod
+    def _parse_hosts_leases(lines):
         leases = set()
-        if os.path.exists(filename):
-            with open(filename) as f:
-                for l in f.readlines():
-                    host = l.strip().split(',')
-                    leases.add((host[2], host[0]))
+        for l in lines:
+            host = l.strip().split(',')
+            leases.add((host[2], host[0]))
         return leases
 
+    def _read_hosts_file_leases(self, filename):
+        if not os.path.exists(filename):
+            return set()
+        if filename in self._hosts_leases:
+            return set(self._hosts_leases[filename])
+        with open(filename) as f:
+            return self._parse_hosts_leases(f.readlines())
+
     def _release_unused_leases(self):
         filename = self.get_conf_file_name('host')
         old_leases = self._read_hosts_file_leases(filename)
@@ -559,7 +601,7 @@ class Dnsmasq(DhcpLocalProcess):
             # order to obtain it in PTR responses.
             buf.write('%s\t%s %s\n' % (alloc.ip_address, fqdn, hostname))
         addn_hosts = self.get_conf_file_name('addn_hosts')
-        utils.replace_file(addn_hosts, buf.getvalue())
+        self._replace_conf_file(addn_hosts, buf.getvalue())
         return addn_hosts
 
     def _output_opts_file(self):
@@ -640,7 +682,7 @@ class Dnsmasq(DhcpLocalProcess):
                                                    ','.join(ips)))
 
         name = self.get_conf_file_name('opts')
-        utils.replace_file(name, '\n'.join(options))
+        self._replace_conf_file(name, '\n'.join(options))
         return name
 
     def _make_subnet_interface_ip_map(self):
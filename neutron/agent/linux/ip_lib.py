@@ -13,17 +13,30 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import contextlib
+import re
+
 import netaddr
 from oslo.config import cfg
 
 from neutron.agent.linux import utils
 from neutron.common import exceptions
+from neutron.openstack.common import excutils
 
 
 OPTS = [
     cfg.BoolOpt('ip_lib_force_root',
                 default=False,
                 help=_('Force ip_lib calls to use the root helper')),
+    cfg.StrOpt('ip_lib_backend',
+               default='command',
+               choices=['command', 'batch'],
+               help=_("How ip_lib applies changes. 'command' runs an ip "
+                      "command for each change, 'batch' sends the link, "
+                      "address and route changes made while a router is "
+                      "processed to a single 'ip -batch' command per "
+                      "namespace, and looks up the devices of the root "
+                      "namespace in sysfs")),
 ]
 
 
@@ -33,6 +46,123 @@ LOOPBACK_DEVNAME = 'lo'
 VLAN_INTERFACE_DETAIL = ['vlan protocol 802.1q',
                          'vlan protocol 802.1Q',
                          'vlan id']
+SYS_CLASS_NET = '/sys/class/net'
+# The type of the devices which 'ip link show' reports with a link/ether
+# address, see device_exists().
+ARPHRD_ETHER = '1'
+
+# The changes queued by namespace while a batch is open, see batch().
+_batches = {}
+BATCHED_CHANGES = {'addr': ('add', 'del', 'flush'),
+                   'route': ('replace', 'append', 'del'),
+                   'neigh': ('replace', 'del')}
+BATCHED_LINK_SETTINGS = ('up', 'down', 'address', 'mtu')
+BATCH_FAILURE_RE = re.compile(r'Command failed -:(\d+)')
+
+
+def _get_backend():
+    try:
+        return cfg.CONF.ip_lib_backend
+    except cfg.NoSuchOptError:
+        return 'command'
+
+
+class _Batch(object):
+    def __init__(self, root_helper):
+        self.root_helper = root_helper
+        self.depth = 0
+        self.commands = []
+
+    def run(self, namespace):
+        if not self.commands:
+            return
+        commands, self.commands = self.commands, []
+        if namespace:
+            ip_cmd = ['ip', 'netns', 'exec', namespace, 'ip']
+        else:
+            ip_cmd = ['ip']
+        lines = [' '.join(str(arg) for arg in command) for command in commands]
+        try:
+            # With -force, ip goes on after a failed change and reports the
+            # number of its line
+            utils.execute(ip_cmd + ['-force', '-batch', '-'],
+                          root_helper=self.root_helper,
+                          process_input=''.join(line + '\n'
+                                                for line in lines))
+        except RuntimeError as e:
+            failed = [lines[int(number) - 1] for number in
+                      BATCH_FAILURE_RE.findall(str(e))
+                      if int(number) <= len(lines)]
+            raise RuntimeError(_("Failed changes in namespace %(namespace)s: "
+                                 "%(failed)s%(error)s") %
+                               {'namespace': namespace,
+                                'failed': '; '.join(failed),
+                                'error': e})
+
+
+def _is_batchable(options, command, args):
+    # ip -batch does not take options by command. The only ones given to
+    # changes are address families, which their addresses imply.
+    if any(str(option) not in ('4', '6') for option in options):
+        return False
+    if command == 'link':
+        return args[0] == 'set' and args[2] in BATCHED_LINK_SETTINGS
+    return args[0] in BATCHED_CHANGES.get(command, ())
+
+
+def _run_batch(namespace):
+    queue = _batches.get(namespace)
+    if queue:
+        queue.run(namespace)
+
+
+def _end_batch(namespace, queue):
+    queue.depth -= 1
+    if not queue.depth:
+        del _batches[namespace]
+        queue.run(namespace)
+
+
+@contextlib.contextmanager
+def batch(root_helper, namespace=None):
+    """Send the changes made in a namespace to a single ip command.
+
+    With the 'batch' backend, the link, address and route changes made in
+    the namespace inside the block are queued. They are run by 'ip -batch'
+    before any other command is run in the namespace, or when the block
+    exits. The changes following a failed one are still made, and the
+    RuntimeError raised then names the failed changes.
+    """
+    if _get_backend() != 'batch' or not root_helper:
+        yield
+        return
+    queue = _batches.setdefault(namespace, _Batch(root_helper))
+    queue.depth += 1
+    try:
+        yield
+    except Exception:
+        with excutils.save_and_reraise_exception():
+            _end_batch(namespace, queue)
+    else:
+        _end_batch(namespace, queue)
+
+
+@contextlib.contextmanager
+def unbatched(namespace=None):
+    """Run the changes made in a namespace inside the block at once.
+
+    The changes queued by an enclosing batch() are run first, so that a
+    change failing in the block raises the RuntimeError where it is made.
+    """
+    queue = _batches.pop(namespace, None)
+    if queue is None:
+        yield
+        return
+    try:
+        queue.run(namespace)
+        yield
+    finally:
+        _batches[namespace] = queue
 
 
 class SubProcessBase(object):
@@ -61,6 +191,10 @@ class SubProcessBase(object):
             raise exceptions.SudoRequired()
 
         namespace = self.namespace if not use_root_namespace else None
+        queue = _batches.get(namespace)
+        if queue and _is_batchable(options, command, args):
+            queue.commands.append([command] + list(args))
+            return ''
 
         return self._execute(options,
                              command,
@@ -71,6 +205,7 @@ class SubProcessBase(object):
     @classmethod
     def _execute(cls, options, command, args, root_helper=None,
                  namespace=None):
+        _run_batch(namespace)
         opt_list = ['-%s' % o for o in options]
         if namespace:
             ip_cmd = ['ip', 'netns', 'exec', namespace, 'ip']
@@ -519,6 +654,7 @@ class IpNetnsCommand(IpCommandBase):
     def execute(self, cmds, addl_env={}, check_exit_code=True):
         if not self._parent.root_helper:
             raise exceptions.SudoRequired()
+        _run_batch(self._parent.namespace)
         ns_params = []
         if self._parent.namespace:
             ns_params = ['ip', 'netns', 'exec', self._parent.namespace]
@@ -542,6 +678,9 @@ class IpNetnsCommand(IpCommandBase):
 
 
 def device_exists(device_name, root_helper=None, namespace=None):
+    if (not namespace and _get_backend() == 'batch' and
+            not SubProcessBase().force_root):
+        return _device_exists_in_sysfs(device_name)
     try:
         address = IPDevice(device_name, root_helper, namespace).link.address
     except RuntimeError:
@@ -549,6 +688,14 @@ def device_exists(device_name, root_helper=None, namespace=None):
     return bool(address)
 
 
+def _device_exists_in_sysfs(device_name):
+    try:
+        with open('%s/%s/type' % (SYS_CLASS_NET, device_name)) as f:
+            return f.read().strip() == ARPHRD_ETHER
+    except IOError:
+        return False
+
+
 def ensure_device_is_ready(device_name, root_helper=None, namespace=None):
     dev = IPDevice(device_name, root_helper, namespace)
     try:
@@ -0,0 +1,87 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from neutron.agent.linux import utils as linux_utils
+from neutron.common import constants
+from neutron.openstack.common import log as logging
+
+LOG = logging.getLogger(__name__)
+
+# ipset names are limited to 31 characters
+MAX_NAME_LENGTH = 31
+NAME_PREFIX = 'N'
+SWAP_NAME_PREFIX = 'T'
+FAMILY = {constants.IPv4: 'inet',
+          constants.IPv6: 'inet6'}
+
+
+class IpsetManager(object):
+    """Manage the hash:net ipsets holding security group members.
+
+    The members of each set are remembered, so that member changes are
+    applied as ipset add and del commands. When more members change than
+    are kept, and the first time a set is updated by this manager, the set
+    contents are replaced atomically by swapping in a new set.
+    """
+
+    def __init__(self, root_helper=None, execute=None):
+        self.root_helper = root_helper
+        self.execute = execute or linux_utils.execute
+        self.ipsets = {}
+
+    @staticmethod
+    def get_name(security_group_id, ethertype):
+        name = NAME_PREFIX + ethertype + security_group_id.replace('-', '')
+        return name[:MAX_NAME_LENGTH]
+
+    def set_exists(self, name):
+        return name in self.ipsets
+
+    def set_members(self, name, ethertype, members):
+        """Make the set contain exactly the given members."""
+        members = set(members)
+        old_members = self.ipsets.get(name)
+        if old_members == members:
+            return
+        if old_members is None:
+            commands = self._swap_commands(name, ethertype, members)
+        else:
+            added = members - old_members
+            removed = old_members - members
+            if len(added) + len(removed) > len(members):
+                commands = self._swap_commands(name, ethertype, members)
+            else:
+                commands = (['add %s %s' % (name, ip) for ip in added] +
+                            ['del %s %s' % (name, ip) for ip in removed])
+        self._restore(commands)
+        self.ipsets[name] = members
+
+    def destroy(self, name):
+        """Destroy a set, which must not be referenced anymore."""
+        self.ipsets.pop(name, None)
+        try:
+            self.execute(['ipset', 'destroy', name], self.root_helper)
+        except RuntimeError:
+            LOG.exception(_("Unable to destroy ipset %s"), name)
+
+    def _swap_commands(self, name, ethertype, members):
+        swap_name = SWAP_NAME_PREFIX + name[len(NAME_PREFIX):]
+        create = 'create %%s hash:net family %s' % FAMILY[ethertype]
+        return ([create % swap_name, 'flush %s' % swap_name] +
+                ['add %s %s' % (swap_name, ip) for ip in members] +
+                [create % name,
+                 'swap %s %s' % (swap_name, name),
+                 'destroy %s' % swap_name])
+
+    def _restore(self, commands):
+        self.execute(['ipset', 'restore', '-exist'], self.root_helper,
+                     process_input='\n'.join(commands) + '\n')
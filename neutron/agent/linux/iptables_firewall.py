@@ -13,10 +13,14 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import collections
+import copy
+
 import netaddr
 from oslo.config import cfg
 
 from neutron.agent import firewall
+from neutron.agent.linux import ipset_manager
 from neutron.agent.linux import iptables_manager
 from neutron.common import constants
 from neutron.openstack.common import log as logging
@@ -30,13 +34,23 @@ SPOOF_FILTER = 'spoof-filter'
 CHAIN_NAME_PREFIX = {INGRESS_DIRECTION: 'i',
                      EGRESS_DIRECTION: 'o',
                      SPOOF_FILTER: 's'}
+IPSET_DIRECTION = {INGRESS_DIRECTION: 'src',
+                   EGRESS_DIRECTION: 'dst'}
+DIRECTION_IP_PREFIX = {INGRESS_DIRECTION: 'source_ip_prefix',
+                       EGRESS_DIRECTION: 'dest_ip_prefix'}
+IP_MASK = {constants.IPv4: 32,
+           constants.IPv6: 128}
 LINUX_DEV_LEN = 14
 
+cfg.CONF.import_opt('enable_ipset', 'neutron.agent.securitygroups_rpc',
+                    group='SECURITYGROUP')
+
 
 class IptablesFirewallDriver(firewall.FirewallDriver):
     """Driver which enforces security groups through iptables rules."""
     IPTABLES_DIRECTION = {INGRESS_DIRECTION: 'physdev-out',
                           EGRESS_DIRECTION: 'physdev-in'}
+    use_security_group_info = True
 
     def __init__(self):
         self.iptables = iptables_manager.IptablesManager(
@@ -46,19 +60,36 @@ class IptablesFirewallDriver(firewall.FirewallDriver):
         self.filtered_ports = {}
         self._add_fallback_chain_v4v6()
         self._defer_apply = False
-        self._pre_defer_filtered_ports = None
+        # devices whose chains need to be set up again, and what the chains
+        # of each filtered device were set up from
+        self._dirty_ports = set()
+        self._port_filters = {}
+        # rules and member IPs of the security groups, by security group id
+        self.sg_rules = {}
+        self.sg_members = {}
+        self.enable_ipset = cfg.CONF.SECURITYGROUP.enable_ipset
+        if self.enable_ipset:
+            self.ipset = ipset_manager.IpsetManager(
+                root_helper=cfg.CONF.AGENT.root_helper)
+            self._ipsets_in_use = set()
 
     @property
     def ports(self):
         return self.filtered_ports
 
+    def update_security_group_rules(self, sg_id, rules):
+        LOG.debug(_("Update rules of security group (%s)"), sg_id)
+        self.sg_rules[sg_id] = rules
+
+    def update_security_group_members(self, sg_id, member_ips):
+        LOG.debug(_("Update members of security group (%s)"), sg_id)
+        self.sg_members[sg_id] = member_ips
+
     def prepare_port_filter(self, port):
         LOG.debug(_("Preparing device (%s) filter"), port['device'])
-        self._remove_chains()
         self.filtered_ports[port['device']] = port
-        # each security group has it own chains
-        self._setup_chains()
-        self.iptables.apply()
+        self._setup_chains(port['device'])
+        self._apply()
 
     def update_port_filter(self, port):
         LOG.debug(_("Updating device (%s) filter"), port['device'])
@@ -66,10 +97,9 @@ class IptablesFirewallDriver(firewall.FirewallDriver):
             LOG.info(_('Attempted to update port filter which is not '
                        'filtered %s'), port['device'])
             return
-        self._remove_chains()
         self.filtered_ports[port['device']] = port
-        self._setup_chains()
-        self.iptables.apply()
+        self._setup_chains(port['device'])
+        self._apply()
 
     def remove_port_filter(self, port):
         LOG.debug(_("Removing device (%s) filter"), port['device'])
@@ -77,35 +107,107 @@ class IptablesFirewallDriver(firewall.FirewallDriver):
             LOG.info(_('Attempted to remove port filter which is not '
                        'filtered %r'), port)
             return
-        self._remove_chains()
         self.filtered_ports.pop(port['device'], None)
-        self._setup_chains()
+        self._setup_chains(port['device'])
+        self._apply()
+
+    def _apply(self):
         self.iptables.apply()
+        if self.enable_ipset and not self._defer_apply:
+            self._remove_unused_ipsets()
 
-    def _setup_chains(self):
+    def _setup_chains(self, device):
         """Setup ingress and egress chain for a port."""
+        self._dirty_ports.add(device)
         if not self._defer_apply:
-            self._setup_chains_apply(self.filtered_ports)
+            self._setup_chains_apply()
 
-    def _setup_chains_apply(self, ports):
-        self._add_chain_by_name_v4v6(SG_CHAIN)
-        for port in ports.values():
-            self._setup_chain(port, INGRESS_DIRECTION)
-            self._setup_chain(port, EGRESS_DIRECTION)
-            self.iptables.ipv4['filter'].add_rule(SG_CHAIN, '-j ACCEPT')
-            self.iptables.ipv6['filter'].add_rule(SG_CHAIN, '-j ACCEPT')
+    def _setup_chains_apply(self):
+        """Set the chains of the changed ports up again.
 
-    def _remove_chains(self):
-        """Remove ingress and egress chain for a port."""
-        if not self._defer_apply:
-            self._remove_chains_apply(self.filtered_ports)
+        Only the chains of the ports added, removed or whose rules changed
+        since the last call are rebuilt, the chains of the other ports and
+        their jumps are left untouched.
+        """
+        dirty_ports, self._dirty_ports = self._dirty_ports, set()
+        if not dirty_ports:
+            return
+        if self.enable_ipset:
+            # members may have changed even if the rules did not
+            self._update_ipset_members(self.filtered_ports)
+        had_ports = bool(self._port_filters)
+        changed = {}
+        for device in dirty_ports:
+            old_filter = self._port_filters.pop(device, None)
+            port = self.filtered_ports.get(device)
+            port_filter = port and self._get_port_filter(port)
+            if old_filter and old_filter == port_filter:
+                self._port_filters[device] = old_filter
+                continue
+            if old_filter:
+                self._remove_port_chains(old_filter[0])
+            if port:
+                changed[device] = port_filter
+        # the accept rule has to stay at the end of SG_CHAIN
+        if had_ports and (changed or not self._port_filters):
+            self._remove_rule_from_chain_v4v6(SG_CHAIN, ['-j ACCEPT'],
+                                              ['-j ACCEPT'])
+        if not changed:
+            return
 
-    def _remove_chains_apply(self, ports):
+        self._add_chain_by_name_v4v6(SG_CHAIN)
+        for device, port in self.filtered_ports.items():
+            if device in changed:
+                self._setup_chain(port, INGRESS_DIRECTION)
+                self._setup_chain(port, EGRESS_DIRECTION)
+                self._port_filters[device] = changed[device]
+        self._add_rule_to_chain_v4v6(SG_CHAIN, ['-j ACCEPT'], ['-j ACCEPT'])
+
+    def _get_port_filter(self, port):
+        """Return what the chains of a port are set up from."""
+        return copy.deepcopy((port, self._get_port_rules(port)))
+
+    def _update_ipset_members(self, ports):
+        """Create or update the ipsets of the remote groups of the ports.
+
+        With security_group_rules_for_devices, the server expands each
+        remote group rule into one rule per member prefix, the members of
+        each group are gathered back from them.
+        """
+        members = collections.defaultdict(set)
         for port in ports.values():
-            self._remove_chain(port, INGRESS_DIRECTION)
-            self._remove_chain(port, EGRESS_DIRECTION)
-            self._remove_chain(port, SPOOF_FILTER)
-        self._remove_chain_by_name_v4v6(SG_CHAIN)
+            for rule in self._get_port_rules(port):
+                remote_group_id = rule.get('remote_group_id')
+                if not remote_group_id:
+                    continue
+                ethertype = rule['ethertype']
+                prefix = rule.get(DIRECTION_IP_PREFIX[rule['direction']])
+                if prefix:
+                    members[(remote_group_id, ethertype)].add(prefix)
+                else:
+                    member_ips = self.sg_members.get(remote_group_id, {})
+                    members[(remote_group_id, ethertype)].update(
+                        member_ips.get(ethertype, []))
+        self._ipsets_in_use = set()
+        for (remote_group_id, ethertype), prefixes in members.items():
+            name = self.ipset.get_name(remote_group_id, ethertype)
+            self.ipset.set_members(name, ethertype, prefixes)
+            self._ipsets_in_use.add(name)
+
+    def _remove_unused_ipsets(self):
+        # Sets can only be destroyed once no rule references them anymore
+        for name in set(self.ipset.ipsets) - self._ipsets_in_use:
+            self.ipset.destroy(name)
+
+    def _remove_port_chains(self, port):
+        # the jumps to the chains of the port are removed with them, but not
+        # the jumps from FORWARD to SG_CHAIN for the port
+        for direction in (INGRESS_DIRECTION, EGRESS_DIRECTION):
+            jump_rule = [self._sg_chain_jump_rule(port, direction)]
+            self._remove_rule_from_chain_v4v6('FORWARD', jump_rule, jump_rule)
+        self._remove_chain(port, INGRESS_DIRECTION)
+        self._remove_chain(port, EGRESS_DIRECTION)
+        self._remove_chain(port, SPOOF_FILTER)
 
     def _setup_chain(self, port, DIRECTION):
         self._add_chain(port, DIRECTION)
@@ -136,6 +238,14 @@ class IptablesFirewallDriver(firewall.FirewallDriver):
         for rule in ipv6_rules:
             self.iptables.ipv6['filter'].add_rule(chain_name, rule)
 
+    def _remove_rule_from_chain_v4v6(self, chain_name, ipv4_rules,
+                                     ipv6_rules):
+        for rule in ipv4_rules:
+            self.iptables.ipv4['filter'].remove_rule(chain_name, rule)
+
+        for rule in ipv6_rules:
+            self.iptables.ipv6['filter'].remove_rule(chain_name, rule)
+
     def _get_device_name(self, port):
         return port['device']
 
@@ -149,14 +259,11 @@ class IptablesFirewallDriver(firewall.FirewallDriver):
         # We accept the packet at the end of SG_CHAIN.
 
         # jump to the security group chain
-        device = self._get_device_name(port)
-        jump_rule = ['-m physdev --%s %s --physdev-is-bridged '
-                     '-j $%s' % (self.IPTABLES_DIRECTION[direction],
-                                 device,
-                                 SG_CHAIN)]
+        jump_rule = [self._sg_chain_jump_rule(port, direction)]
         self._add_rule_to_chain_v4v6('FORWARD', jump_rule, jump_rule)
 
         # jump to the chain based on the device
+        device = self._get_device_name(port)
         jump_rule = ['-m physdev --%s %s --physdev-is-bridged '
                      '-j $%s' % (self.IPTABLES_DIRECTION[direction],
                                  device,
@@ -166,6 +273,12 @@ class IptablesFirewallDriver(firewall.FirewallDriver):
         if direction == EGRESS_DIRECTION:
             self._add_rule_to_chain_v4v6('INPUT', jump_rule, jump_rule)
 
+    def _sg_chain_jump_rule(self, port, direction):
+        return ('-m physdev --%s %s --physdev-is-bridged '
+                '-j $%s' % (self.IPTABLES_DIRECTION[direction],
+                            self._get_device_name(port),
+                            SG_CHAIN))
+
     def _split_sgr_by_ethertype(self, security_group_rules):
         ipv4_sg_rules = []
         ipv6_sg_rules = []
@@ -178,10 +291,45 @@ class IptablesFirewallDriver(firewall.FirewallDriver):
                 ipv6_sg_rules.append(rule)
         return ipv4_sg_rules, ipv6_sg_rules
 
+    def _get_port_rules(self, port, direction=None):
+        """Return the rules of a port, optionally for one direction only.
+
+        Ports received with security_group_info_for_devices only carry
+        their provider rules, the rules of their security groups are added
+        here, with one rule per member for the remote group rules.
+        """
+        rules = [rule for rule in port.get('security_group_rules', [])
+                 if direction in (None, rule['direction'])]
+        for sg_id in port.get('security_groups', []):
+            for rule in self.sg_rules.get(sg_id, []):
+                if direction in (None, rule['direction']):
+                    rules += self._expand_remote_group_rule(port, rule)
+        return rules
+
+    def _expand_remote_group_rule(self, port, rule):
+        remote_group_id = rule.get('remote_group_id')
+        if not remote_group_id or self.enable_ipset:
+            return [rule]
+        direction_ip_prefix = DIRECTION_IP_PREFIX[rule['direction']]
+        ethertype = rule['ethertype']
+        member_ips = self.sg_members.get(remote_group_id, {})
+        port_ips = port.get('fixed_ips', [])
+        rules = []
+        for ip in member_ips.get(ethertype, []):
+            if ip in port_ips:
+                continue
+            ip_rule = rule.copy()
+            if '/' in ip:
+                # allowed address pairs may be networks
+                ip_rule[direction_ip_prefix] = str(netaddr.IPNetwork(ip).cidr)
+            else:
+                ip_rule[direction_ip_prefix] = '%s/%s' % (ip,
+                                                          IP_MASK[ethertype])
+            rules.append(ip_rule)
+        return rules
+
     def _select_sgr_by_direction(self, port, direction):
-        return [rule
-                for rule in port.get('security_group_rules', [])
-                if rule['direction'] == direction]
+        return self._get_port_rules(port, direction)
 
     def _setup_spoof_filter_chain(self, port, table, mac_ip_pairs, rules):
         if mac_ip_pairs:
@@ -279,15 +427,19 @@ class IptablesFirewallDriver(firewall.FirewallDriver):
         iptables_rules = []
         self._drop_invalid_packets(iptables_rules)
         self._allow_established(iptables_rules)
+        ipset_rules = set()
         for rule in security_group_rules:
+            use_ipset = self.enable_ipset and rule.get('remote_group_id')
             # These arguments MUST be in the format iptables-save will
             # display them: source/dest, protocol, sport, dport, target
             # Otherwise the iptables_manager code won't be able to find
             # them to preserve their [packet:byte] counts.
-            args = self._ip_prefix_arg('s',
-                                       rule.get('source_ip_prefix'))
-            args += self._ip_prefix_arg('d',
-                                        rule.get('dest_ip_prefix'))
+            args = []
+            if not use_ipset:
+                args += self._ip_prefix_arg('s',
+                                            rule.get('source_ip_prefix'))
+                args += self._ip_prefix_arg('d',
+                                            rule.get('dest_ip_prefix'))
             args += self._protocol_arg(rule.get('protocol'))
             args += self._port_arg('sport',
                                    rule.get('protocol'),
@@ -297,8 +449,16 @@ class IptablesFirewallDriver(firewall.FirewallDriver):
                                    rule.get('protocol'),
                                    rule.get('port_range_min'),
                                    rule.get('port_range_max'))
+            if use_ipset:
+                args += self._ipset_arg(rule)
             args += ['-j RETURN']
-            iptables_rules += [' '.join(args)]
+            iptables_rule = ' '.join(args)
+            if use_ipset:
+                # All the member rules of a remote group become one rule
+                if iptables_rule in ipset_rules:
+                    continue
+                ipset_rules.add(iptables_rule)
+            iptables_rules += [iptables_rule]
 
         iptables_rules += ['-j $sg-fallback']
 
@@ -344,6 +504,11 @@ class IptablesFirewallDriver(firewall.FirewallDriver):
                     '--%ss' % direction,
                     '%s:%s' % (port_range_min, port_range_max)]
 
+    def _ipset_arg(self, rule):
+        name = self.ipset.get_name(rule['remote_group_id'], rule['ethertype'])
+        return ['-m set', '--match-set', name,
+                IPSET_DIRECTION[rule['direction']]]
+
     def _ip_prefix_arg(self, direction, ip_prefix):
         #NOTE (nati) : source_group_id is converted to list of source_
         # ip_prefix in server side
@@ -358,16 +523,15 @@ class IptablesFirewallDriver(firewall.FirewallDriver):
     def filter_defer_apply_on(self):
         if not self._defer_apply:
             self.iptables.defer_apply_on()
-            self._pre_defer_filtered_ports = dict(self.filtered_ports)
             self._defer_apply = True
 
     def filter_defer_apply_off(self):
         if self._defer_apply:
             self._defer_apply = False
-            self._remove_chains_apply(self._pre_defer_filtered_ports)
-            self._pre_defer_filtered_ports = None
-            self._setup_chains_apply(self.filtered_ports)
+            self._setup_chains_apply()
             self.iptables.defer_apply_off()
+            if self.enable_ipset:
+                self._remove_unused_ipsets()
 
 
 class OVSHybridIptablesFirewallDriver(IptablesFirewallDriver):
@@ -23,6 +23,8 @@ import inspect
 import os
 import re
 
+from oslo.config import cfg
+
 from neutron.agent.linux import utils as linux_utils
 from neutron.common import utils
 from neutron.openstack.common import excutils
@@ -31,6 +33,25 @@ from neutron.openstack.common import log as logging
 
 LOG = logging.getLogger(__name__)
 
+OPTS = [
+    cfg.BoolOpt('iptables_incremental_apply', default=False,
+                help=_("Keep the last applied iptables ruleset in memory "
+                       "and only send changed chains to "
+                       "iptables-restore --noflush, instead of running "
+                       "iptables-save and restoring every table on each "
+                       "apply. A full save/restore is still done on the "
+                       "first apply, whenever the incremental update "
+                       "fails or the unwrapped rules change, and every "
+                       "iptables_full_apply_interval applies.")),
+    cfg.IntOpt('iptables_full_apply_interval', default=50,
+               help=_("Number of applies after which a full save/restore "
+                      "is done again when iptables_incremental_apply is "
+                      "enabled, so that rules modified or removed by other "
+                      "tools are restored. 0 only does full save/restores "
+                      "when needed.")),
+]
+cfg.CONF.register_opts(OPTS)
+
 
 # NOTE(vish): Iptables supports chain names of up to 28 characters,  and we
 #             add up to 12 characters to binary_name which is used as a prefix,
@@ -289,6 +310,13 @@ class IptablesManager(object):
         self.iptables_apply_deferred = False
         self.wrap_name = binary_name[:16]
 
+        # When incremental apply is enabled, this holds a snapshot of the
+        # rules written by the last successful apply, keyed by command.
+        self.incremental_apply = cfg.CONF.iptables_incremental_apply
+        self._applied = {}
+        # Number of incremental applies since the last full one, by command
+        self._incremental_applies = {}
+
         self.ipv4 = {'filter': IptablesTable(binary_name=self.wrap_name)}
         self.ipv6 = {'filter': IptablesTable(binary_name=self.wrap_name)}
 
@@ -381,50 +409,166 @@ class IptablesManager(object):
         same component of Nova, and replace them with our current set of
         rules. This happens atomically, thanks to iptables-restore.
 
+        If incremental apply is enabled and a previous apply succeeded,
+        only the chains which changed since then are sent to
+        iptables-restore --noflush. If that fails, for instance because
+        the rules were modified behind our back, a full save/restore is
+        done instead. As the chains which did not change are not checked,
+        a full save/restore is also done every iptables_full_apply_interval
+        applies, restoring the rules other tools removed meanwhile.
+
         """
         s = [('iptables', self.ipv4)]
         if self.use_ipv6:
             s += [('ip6tables', self.ipv6)]
 
         for cmd, tables in s:
-            args = ['%s-save' % (cmd,), '-c']
-            if self.namespace:
-                args = ['ip', 'netns', 'exec', self.namespace] + args
-            all_tables = self.execute(args, root_helper=self.root_helper)
-            all_lines = all_tables.split('\n')
-            for table_name, table in tables.iteritems():
-                start, end = self._find_table(all_lines, table_name)
-                all_lines[start:end] = self._modify_rules(
-                    all_lines[start:end], table, table_name)
-
-            args = ['%s-restore' % (cmd,), '-c']
+            if not self.incremental_apply:
+                self._apply_full(cmd, tables)
+                continue
+
+            snapshot = self._get_snapshot(tables)
+            interval = cfg.CONF.iptables_full_apply_interval
+            applies = self._incremental_applies.get(cmd, 0)
+            if (cmd not in self._applied or
+                    (interval and applies >= interval) or
+                    not self._apply_incremental(cmd, tables, snapshot)):
+                self._applied.pop(cmd, None)
+                self._apply_full(cmd, tables)
+                self._incremental_applies[cmd] = 0
+            else:
+                self._incremental_applies[cmd] = applies + 1
+            self._applied[cmd] = snapshot
+        LOG.debug(_("IPTablesManager.apply completed with success"))
+
+    def _apply_full(self, cmd, tables):
+        args = ['%s-save' % (cmd,), '-c']
+        if self.namespace:
+            args = ['ip', 'netns', 'exec', self.namespace] + args
+        all_tables = self.execute(args, root_helper=self.root_helper)
+        all_lines = all_tables.split('\n')
+        for table_name, table in tables.iteritems():
+            start, end = self._find_table(all_lines, table_name)
+            all_lines[start:end] = self._modify_rules(
+                all_lines[start:end], table, table_name)
+
+        args = ['%s-restore' % (cmd,), '-c']
+        if self.namespace:
+            args = ['ip', 'netns', 'exec', self.namespace] + args
+        try:
+            self.execute(args, process_input='\n'.join(all_lines),
+                         root_helper=self.root_helper)
+        except RuntimeError as r_error:
+            with excutils.save_and_reraise_exception():
+                self._log_restore_error(r_error, all_lines)
+
+    def _log_restore_error(self, r_error, all_lines):
+        try:
+            line_no = int(re.search(
+                'iptables-restore: line ([0-9]+?) failed',
+                str(r_error)).group(1))
+            context = IPTABLES_ERROR_LINES_OF_CONTEXT
+            log_start = max(0, line_no - context)
+            log_end = line_no + context
+        except AttributeError:
+            # line error wasn't found, print all lines instead
+            log_start = 0
+            log_end = len(all_lines)
+        log_lines = ('%7d. %s' % (idx, l)
+                     for idx, l in enumerate(
+                         all_lines[log_start:log_end],
+                         log_start + 1)
+                     )
+        LOG.error(_("IPTablesManager.apply failed to apply the "
+                    "following set of iptables rules:\n%s"),
+                  '\n'.join(log_lines))
+
+    def _get_snapshot(self, tables):
+        """Return a comparable copy of the rules of the given tables."""
+        snapshot = {}
+        for table_name, table in tables.iteritems():
+            rules = {True: {}, False: {}}
+            for rule in table.rules:
+                rules[rule.wrap].setdefault(rule.chain, []).append(
+                    (str(rule), rule.top))
+            for chain_rules in rules[True].values() + rules[False].values():
+                # Top rules come first, as in _modify_rules
+                chain_rules.sort(key=lambda r: not r[1])
+            snapshot[table_name] = {
+                'chains': frozenset(table.chains),
+                'unwrapped_chains': frozenset(table.unwrapped_chains),
+                'rules': rules[True],
+                'unwrapped_rules': rules[False]}
+        return snapshot
+
+    def _apply_incremental(self, cmd, tables, snapshot):
+        """Send only the changes since the last apply to iptables-restore.
+
+        Returns False if the changes could not be applied incrementally
+        and a full save/restore is needed.
+        """
+        old_snapshot = self._applied[cmd]
+        all_lines = []
+        for table_name in tables:
+            if table_name not in old_snapshot:
+                return False
+            lines = self._get_table_changes(old_snapshot[table_name],
+                                            snapshot[table_name])
+            if lines is None:
+                return False
+            if lines:
+                all_lines += (['*%s' % table_name] + lines + ['COMMIT'])
+
+        if all_lines:
+            args = ['%s-restore' % (cmd,), '--noflush']
             if self.namespace:
                 args = ['ip', 'netns', 'exec', self.namespace] + args
             try:
-                self.execute(args, process_input='\n'.join(all_lines),
+                self.execute(args, process_input='\n'.join(all_lines + ['']),
                              root_helper=self.root_helper)
             except RuntimeError as r_error:
-                with excutils.save_and_reraise_exception():
-                    try:
-                        line_no = int(re.search(
-                            'iptables-restore: line ([0-9]+?) failed',
-                            str(r_error)).group(1))
-                        context = IPTABLES_ERROR_LINES_OF_CONTEXT
-                        log_start = max(0, line_no - context)
-                        log_end = line_no + context
-                    except AttributeError:
-                        # line error wasn't found, print all lines instead
-                        log_start = 0
-                        log_end = len(all_lines)
-                    log_lines = ('%7d. %s' % (idx, l)
-                                 for idx, l in enumerate(
-                                     all_lines[log_start:log_end],
-                                     log_start + 1)
-                                 )
-                    LOG.error(_("IPTablesManager.apply failed to apply the "
-                                "following set of iptables rules:\n%s"),
-                              '\n'.join(log_lines))
-        LOG.debug(_("IPTablesManager.apply completed with success"))
+                LOG.warn(_("Incremental %(cmd)s update failed, falling back "
+                           "to a full update: %(error)s"),
+                         {'cmd': cmd, 'error': r_error})
+                return False
+        else:
+            LOG.debug(_("No %s changes to apply"), cmd)
+
+        # Requests to remove rules or chains were covered by the diff
+        # against the last applied state.
+        for table in tables.itervalues():
+            table.remove_chains.clear()
+            del table.remove_rules[:]
+        return True
+
+    def _get_table_changes(self, old, new):
+        """Return the iptables-restore --noflush lines for one table.
+
+        Wrapped chains belong to us only, so a changed chain is simply
+        redeclared, which flushes it, and filled again. Returns None when
+        the unwrapped chains or rules changed: they are shared with other
+        components, and only a full apply puts our rules before theirs.
+        """
+        if (old['unwrapped_chains'] != new['unwrapped_chains'] or
+                old['unwrapped_rules'] != new['unwrapped_rules']):
+            return None
+
+        declare, rules, remove = [], [], []
+        for chain in sorted(new['chains']):
+            chain_rules = new['rules'].get(chain, [])
+            if (chain in old['chains'] and
+                    old['rules'].get(chain, []) == chain_rules):
+                continue
+            declare.append(':%s-%s - [0:0]' % (self.wrap_name, chain))
+            rules += [rule for rule, top in chain_rules]
+
+        for chain in sorted(old['chains'] - new['chains']):
+            name = '%s-%s' % (self.wrap_name, chain)
+            # Flush the chain before deleting it
+            declare.append(':%s - [0:0]' % name)
+            remove.append('-X %s' % name)
+
+        return declare + rules + remove
 
     def _find_table(self, lines, table_name):
         if len(lines) < 3:
@@ -13,9 +13,13 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import contextlib
+import itertools
+
 from oslo.config import cfg
 
 from neutron.agent.linux import ip_lib
+from neutron.agent.linux import ovsdb_native
 from neutron.agent.linux import utils
 from neutron.common import exceptions
 from neutron.common import utils as common_utils
@@ -32,11 +36,38 @@ OPTS = [
     cfg.IntOpt('ovs_vsctl_timeout',
                default=DEFAULT_OVS_VSCTL_TIMEOUT,
                help=_('Timeout in seconds for ovs-vsctl commands')),
+    cfg.StrOpt('ovsdb_interface',
+               default='vsctl',
+               choices=['vsctl', 'native'],
+               help=_("The interface used to access the OVSDB. 'vsctl' "
+                      "runs ovs-vsctl for every request, 'native' keeps "
+                      "a connection to ovsdb-server and a local copy of "
+                      "the Bridge, Port and Interface tables")),
+    cfg.StrOpt('ovsdb_connection',
+               default='unix:/var/run/openvswitch/db.sock',
+               help=_("The connection to ovsdb-server used by the native "
+                      "OVSDB interface, either unix:<path> or "
+                      "tcp:<ip>:<port>")),
 ]
 cfg.CONF.register_opts(OPTS)
 
 LOG = logging.getLogger(__name__)
 
+# Flow counters by bridge name, see reset_flow_stats()
+_flow_stats = {}
+
+
+def get_native_ovsdb():
+    """Return the native OVSDB connection if it is enabled, else None."""
+    if cfg.CONF.ovsdb_interface == 'native':
+        return ovsdb_native.get_connection(cfg.CONF.ovsdb_connection,
+                                           cfg.CONF.ovs_vsctl_timeout)
+
+
+@contextlib.contextmanager
+def _no_transaction():
+    yield
+
 
 class VifPort:
     def __init__(self, port_name, ofport, vif_id, vif_mac, switch):
@@ -58,6 +89,7 @@ class BaseOVS(object):
     def __init__(self, root_helper):
         self.root_helper = root_helper
         self.vsctl_timeout = cfg.CONF.ovs_vsctl_timeout
+        self.ovsdb = get_native_ovsdb()
 
     def run_vsctl(self, args, check_error=False):
         full_args = ["ovs-vsctl", "--timeout=%d" % self.vsctl_timeout] + args
@@ -71,6 +103,29 @@ class BaseOVS(object):
                 if not check_error:
                     ctxt.reraise = False
 
+    def run_native(self, func, *args, **kwargs):
+        """Call a method of the native OVSDB connection.
+
+        Errors are handled like in run_vsctl.
+        """
+        check_error = kwargs.pop('check_error', False)
+        try:
+            return func(*args)
+        except RuntimeError as e:
+            with excutils.save_and_reraise_exception() as ctxt:
+                LOG.error(_("Unable to access ovsdb: %s"), e)
+                if not check_error:
+                    ctxt.reraise = False
+
+    def ovsdb_transaction(self):
+        """Return a context batching the OVSDB writes done within it.
+
+        Writes are only batched with the native OVSDB interface.
+        """
+        if self.ovsdb:
+            return self.ovsdb.transaction()
+        return _no_transaction()
+
     def add_bridge(self, bridge_name):
         self.run_vsctl(["--", "--may-exist", "add-br", bridge_name])
         return OVSBridge(bridge_name, self.root_helper)
@@ -79,6 +134,9 @@ class BaseOVS(object):
         self.run_vsctl(["--", "--if-exists", "del-br", bridge_name])
 
     def bridge_exists(self, bridge_name):
+        if self.ovsdb:
+            return self.run_native(self.ovsdb.bridge_exists, bridge_name,
+                                   check_error=True)
         try:
             self.run_vsctl(['br-exists', bridge_name], check_error=True)
         except RuntimeError as e:
@@ -89,6 +147,9 @@ class BaseOVS(object):
         return True
 
     def get_bridge_name_for_port_name(self, port_name):
+        if self.ovsdb:
+            return self.run_native(self.ovsdb.get_port_bridge, port_name,
+                                   check_error=True)
         try:
             return self.run_vsctl(['port-to-br', port_name], check_error=True)
         except RuntimeError as e:
@@ -105,7 +166,7 @@ class OVSBridge(BaseOVS):
         super(OVSBridge, self).__init__(root_helper)
         self.br_name = br_name
         self.defer_apply_flows = False
-        self.deferred_flows = {'add': '', 'mod': '', 'del': ''}
+        self.deferred_flows = []
 
     def set_controller(self, controller_names):
         vsctl_command = ['--', 'set-controller', self.br_name]
@@ -152,10 +213,18 @@ class OVSBridge(BaseOVS):
                         port_name])
 
     def set_db_attribute(self, table_name, record, column, value):
+        if self.ovsdb and self.ovsdb.is_monitored(table_name, column):
+            self.run_native(self.ovsdb.set_value, table_name, record,
+                            column, value)
+            return
         args = ["set", table_name, record, "%s=%s" % (column, value)]
         self.run_vsctl(args)
 
     def clear_db_attribute(self, table_name, record, column):
+        if self.ovsdb and self.ovsdb.is_monitored(table_name, column):
+            self.run_native(self.ovsdb.clear_value, table_name, record,
+                            column)
+            return
         args = ["clear", table_name, record, column]
         self.run_vsctl(args)
 
@@ -189,26 +258,62 @@ class OVSBridge(BaseOVS):
         return self.db_get_val('Bridge',
                                self.br_name, 'datapath_id').strip('"')
 
+    def _count_flows(self, key, count=1):
+        if self.br_name not in _flow_stats:
+            _flow_stats[self.br_name] = {'requested': 0, 'applied': 0,
+                                         'ofctl_calls': 0}
+        _flow_stats[self.br_name][key] += count
+
+    def _run_ofctl_flows(self, cmd, args, count, process_input=None):
+        self._count_flows('applied', count)
+        self._count_flows('ofctl_calls')
+        self.run_ofctl(cmd, args, process_input)
+
+    def _defer_flow(self, action, flow_str):
+        match = _get_flow_match(flow_str)
+        if action == 'del':
+            # Deferred additions of flows removed by this deletion are
+            # useless. A modification may add a flow matching the deletion
+            # less strictly, do not look past it.
+            for i in reversed(range(len(self.deferred_flows))):
+                prev_action, _prev_flow, prev_match = self.deferred_flows[i]
+                if prev_action == 'mod':
+                    break
+                if prev_action == 'add' and match <= prev_match:
+                    del self.deferred_flows[i]
+        # Ignore duplicates of the flows deferred since the last flow with
+        # another action.
+        for prev_action, prev_flow, _prev_match in reversed(
+                self.deferred_flows):
+            if prev_action != action:
+                break
+            if prev_flow == flow_str:
+                return
+        self.deferred_flows.append((action, flow_str, match))
+
     def add_flow(self, **kwargs):
         flow_str = _build_flow_expr_str(kwargs, 'add')
+        self._count_flows('requested')
         if self.defer_apply_flows:
-            self.deferred_flows['add'] += flow_str + '\n'
+            self._defer_flow('add', flow_str)
         else:
-            self.run_ofctl("add-flow", [flow_str])
+            self._run_ofctl_flows("add-flow", [flow_str], 1)
 
     def mod_flow(self, **kwargs):
         flow_str = _build_flow_expr_str(kwargs, 'mod')
+        self._count_flows('requested')
         if self.defer_apply_flows:
-            self.deferred_flows['mod'] += flow_str + '\n'
+            self._defer_flow('mod', flow_str)
         else:
-            self.run_ofctl("mod-flows", [flow_str])
+            self._run_ofctl_flows("mod-flows", [flow_str], 1)
 
     def delete_flows(self, **kwargs):
         flow_expr_str = _build_flow_expr_str(kwargs, 'del')
+        self._count_flows('requested')
         if self.defer_apply_flows:
-            self.deferred_flows['del'] += flow_expr_str + '\n'
+            self._defer_flow('del', flow_expr_str)
         else:
-            self.run_ofctl("del-flows", [flow_expr_str])
+            self._run_ofctl_flows("del-flows", [flow_expr_str], 1)
 
     def dump_flows_for_table(self, table):
         retval = None
@@ -228,18 +333,36 @@ class OVSBridge(BaseOVS):
         # Note(ethuleau): stash flows and disable deferred mode. Then apply
         # flows from the stashed reference to be sure to not purge flows that
         # were added between two ofctl commands.
-        stashed_deferred_flows, self.deferred_flows = (
-            self.deferred_flows, {'add': '', 'mod': '', 'del': ''}
-        )
+        stashed_deferred_flows, self.deferred_flows = self.deferred_flows, []
         self.defer_apply_flows = False
-        for action, flows in stashed_deferred_flows.items():
-            if flows:
-                LOG.debug(_('Applying following deferred flows '
-                            'to bridge %s'), self.br_name)
-                for line in flows.splitlines():
-                    LOG.debug(_('%(action)s: %(flow)s'),
-                              {'action': action, 'flow': line})
-                self.run_ofctl('%s-flows' % action, ['-'], flows)
+        # Consecutive flows with the same action are applied at once, in
+        # the order in which they were requested.
+        for action, flows in itertools.groupby(stashed_deferred_flows,
+                                               lambda flow: flow[0]):
+            flows = [flow_str for _action, flow_str, _match in flows]
+            LOG.debug(_('Applying following deferred flows '
+                        'to bridge %s'), self.br_name)
+            for line in flows:
+                LOG.debug(_('%(action)s: %(flow)s'),
+                          {'action': action, 'flow': line})
+            self._run_ofctl_flows('%s-flows' % action, ['-'], len(flows),
+                                  ''.join(flow + '\n' for flow in flows))
+
+    @contextlib.contextmanager
+    def deferred(self):
+        """Defer the flows programmed within this context.
+
+        The flows are applied when leaving the outermost context, even if
+        an exception is raised.
+        """
+        if self.defer_apply_flows:
+            yield
+            return
+        self.defer_apply_on()
+        try:
+            yield
+        finally:
+            self.defer_apply_off()
 
     def add_tunnel_port(self, port_name, remote_ip, local_ip,
                         tunnel_type=p_const.TYPE_GRE,
@@ -275,6 +398,11 @@ class OVSBridge(BaseOVS):
         return self.get_port_ofport(local_name)
 
     def db_get_map(self, table, record, column, check_error=False):
+        if self.ovsdb and self.ovsdb.is_monitored(table, column):
+            value = self.run_native(self.ovsdb.get_value, table, record,
+                                    column, check_error=check_error)
+            return dict((key, ovsdb_native.to_vsctl_str(val).strip('"'))
+                        for key, val in (value or {}).items())
         output = self.run_vsctl(["get", table, record, column], check_error)
         if output:
             output_str = output.rstrip("\n\r")
@@ -282,6 +410,12 @@ class OVSBridge(BaseOVS):
         return {}
 
     def db_get_val(self, table, record, column, check_error=False):
+        if self.ovsdb and self.ovsdb.is_monitored(table, column):
+            value = self.run_native(self.ovsdb.get_value, table, record,
+                                    column, check_error=check_error)
+            if value is not None:
+                value = ovsdb_native.to_vsctl_str(value)
+            return value
         output = self.run_vsctl(["get", table, record, column], check_error)
         if output:
             return output.rstrip("\n\r")
@@ -297,6 +431,9 @@ class OVSBridge(BaseOVS):
         return ret
 
     def get_port_name_list(self):
+        if self.ovsdb:
+            return sorted(self.run_native(self.ovsdb.get_bridge_ports,
+                                          self.br_name, check_error=True))
         res = self.run_vsctl(["list-ports", self.br_name], check_error=True)
         if res:
             return res.strip().split("\n")
@@ -340,27 +477,33 @@ class OVSBridge(BaseOVS):
 
         return edge_ports
 
-    def get_vif_port_set(self):
+    def _get_interface_rows(self):
+        """Return (name, external_ids, ofport) of the bridge interfaces."""
+        if self.ovsdb:
+            interfaces = self.run_native(self.ovsdb.get_bridge_interfaces,
+                                         self.br_name, check_error=True)
+            return [(iface['name'], iface['external_ids'], iface['ofport'])
+                    for iface in interfaces]
         port_names = self.get_port_name_list()
-        edge_ports = set()
         args = ['--format=json', '--', '--columns=name,external_ids,ofport',
                 'list', 'Interface']
         result = self.run_vsctl(args, check_error=True)
         if not result:
-            return edge_ports
-        for row in jsonutils.loads(result)['data']:
-            name = row[0]
-            if name not in port_names:
-                continue
-            external_ids = dict(row[1][1])
+            return []
+        return [(row[0], dict(row[1][1]), row[2])
+                for row in jsonutils.loads(result)['data']
+                if row[0] in port_names]
+
+    def get_vif_port_set(self):
+        edge_ports = set()
+        for name, external_ids, ofport in self._get_interface_rows():
             # Do not consider VIFs which aren't yet ready
             # This can happen when ofport values are either [] or ["set", []]
             # We will therefore consider only integer values for ofport
-            ofport = row[2]
             try:
                 int_ofport = int(ofport)
             except (ValueError, TypeError):
-                LOG.warn(_("Found not yet ready openvswitch port: %s"), row)
+                LOG.warn(_("Found not yet ready openvswitch port: %s"), name)
             else:
                 if int_ofport > 0:
                     if ("iface-id" in external_ids and
@@ -375,7 +518,7 @@ class OVSBridge(BaseOVS):
                             external_ids["xs-vif-uuid"])
                         edge_ports.add(iface_id)
                 else:
-                    LOG.warn(_("Found failed openvswitch port: %s"), row)
+                    LOG.warn(_("Found failed openvswitch port: %s"), name)
         return edge_ports
 
     def get_port_tag_dict(self):
@@ -393,6 +536,9 @@ class OVSBridge(BaseOVS):
         in the "Interface" table queried by the get_vif_port_set() method.
 
         """
+        if self.ovsdb:
+            return self.run_native(self.ovsdb.get_bridge_port_tags,
+                                   self.br_name, check_error=True)
         port_names = self.get_port_name_list()
         args = ['--format=json', '--', '--columns=name,tag', 'list', 'Port']
         result = self.run_vsctl(args, check_error=True)
@@ -409,6 +555,17 @@ class OVSBridge(BaseOVS):
         return port_tag_dict
 
     def get_vif_port_by_id(self, port_id):
+        if self.ovsdb:
+            iface = self.run_native(self.ovsdb.find_interface_by_iface_id,
+                                    port_id)
+            if not iface:
+                return
+            switch = self.run_native(self.ovsdb.get_interface_bridge,
+                                     iface['name'])
+            return self._make_vif_port(port_id, iface['name'],
+                                       iface['ofport'], switch,
+                                       iface['external_ids'])
+
         args = ['--format=json', '--', '--columns=external_ids,name,ofport',
                 'find', 'Interface',
                 'external_ids:iface-id="%s"' % port_id]
@@ -429,28 +586,34 @@ class OVSBridge(BaseOVS):
             data = json_result['data'][0]
             port_name = data[name_idx]
             switch = get_bridge_for_iface(self.root_helper, port_name)
-            if switch != self.br_name:
-                LOG.info(_("Port: %(port_name)s is on %(switch)s,"
-                           " not on %(br_name)s"), {'port_name': port_name,
-                                                    'switch': switch,
-                                                    'br_name': self.br_name})
-                return
-            ofport = data[ofport_idx]
-            # ofport must be integer otherwise return None
-            if not isinstance(ofport, int) or ofport == -1:
-                LOG.warn(_("ofport: %(ofport)s for VIF: %(vif)s is not a "
-                           "positive integer"), {'ofport': ofport,
-                                                 'vif': port_id})
-                return
-            # Find VIF's mac address in external ids
             ext_id_dict = dict((item[0], item[1]) for item in
                                data[ext_ids_idx][1])
-            vif_mac = ext_id_dict['attached-mac']
-            return VifPort(port_name, ofport, port_id, vif_mac, self)
+            return self._make_vif_port(port_id, port_name, data[ofport_idx],
+                                       switch, ext_id_dict)
         except Exception as e:
             LOG.warn(_("Unable to parse interface details. Exception: %s"), e)
             return
 
+    def _make_vif_port(self, port_id, port_name, ofport, switch, ext_ids):
+        if switch != self.br_name:
+            LOG.info(_("Port: %(port_name)s is on %(switch)s,"
+                       " not on %(br_name)s"), {'port_name': port_name,
+                                                'switch': switch,
+                                                'br_name': self.br_name})
+            return
+        # ofport must be integer otherwise return None
+        if not isinstance(ofport, int) or ofport == -1:
+            LOG.warn(_("ofport: %(ofport)s for VIF: %(vif)s is not a "
+                       "positive integer"), {'ofport': ofport,
+                                             'vif': port_id})
+            return
+        # Find VIF's mac address in external ids
+        vif_mac = ext_ids.get('attached-mac')
+        if not vif_mac:
+            LOG.warn(_("No MAC address found for VIF: %s"), port_id)
+            return
+        return VifPort(port_name, ofport, port_id, vif_mac, self)
+
     def delete_ports(self, all_ports=False):
         if all_ports:
             port_names = self.get_port_name_list()
@@ -478,6 +641,13 @@ class OVSBridge(BaseOVS):
 
 
 def get_bridge_for_iface(root_helper, iface):
+    ovsdb = get_native_ovsdb()
+    if ovsdb:
+        try:
+            return ovsdb.get_interface_bridge(iface)
+        except RuntimeError:
+            LOG.exception(_("Interface %s not found."), iface)
+            return None
     args = ["ovs-vsctl", "--timeout=%d" % cfg.CONF.ovs_vsctl_timeout,
             "iface-to-br", iface]
     try:
@@ -488,6 +658,14 @@ def get_bridge_for_iface(root_helper, iface):
 
 
 def get_bridges(root_helper):
+    ovsdb = get_native_ovsdb()
+    if ovsdb:
+        try:
+            return ovsdb.get_bridges()
+        except RuntimeError as e:
+            with excutils.save_and_reraise_exception():
+                LOG.exception(_("Unable to retrieve bridges. Exception: %s"),
+                              e)
     args = ["ovs-vsctl", "--timeout=%d" % cfg.CONF.ovs_vsctl_timeout,
             "list-br"]
     try:
@@ -507,6 +685,27 @@ def get_bridge_external_bridge_id(root_helper, bridge):
         return None
 
 
+def reset_flow_stats():
+    """Return the flow counters of the bridges and reset them.
+
+    The counters are given by bridge name. 'requested' counts the flow
+    operations requested by the callers, 'applied' the ones sent to
+    ovs-ofctl once the deferred operations have been merged, and
+    'ofctl_calls' the ovs-ofctl invocations.
+    """
+    flow_stats = dict(_flow_stats)
+    _flow_stats.clear()
+    return flow_stats
+
+
+def _get_flow_match(flow_str):
+    """Return the match fields of a flow, ignoring its priority."""
+    match = flow_str.split('actions=')[0]
+    return frozenset(field for field in match.split(',')
+                     if field and field.split('=')[0] not in
+                     ('priority', 'hard_timeout', 'idle_timeout'))
+
+
 def _build_flow_expr_str(flow_dict, cmd):
     flow_expr_arr = []
     actions = None
@@ -15,11 +15,18 @@
 import eventlet
 
 from neutron.agent.linux import async_process
+from neutron.openstack.common import jsonutils
 from neutron.openstack.common import log as logging
 
 
 LOG = logging.getLogger(__name__)
 
+OVSDB_ACTION_INITIAL = 'initial'
+OVSDB_ACTION_INSERT = 'insert'
+OVSDB_ACTION_DELETE = 'delete'
+OVSDB_ACTION_OLD = 'old'
+OVSDB_ACTION_NEW = 'new'
+
 
 class OvsdbMonitor(async_process.AsyncProcess):
     """Manages an invocation of 'ovsdb-client monitor'."""
@@ -57,18 +64,21 @@ class SimpleInterfaceMonitor(OvsdbMonitor):
 
     The has_updates() method indicates whether changes to the ovsdb
     Interface table have been detected since the monitor started or
-    since the previous access.
+    since the previous access.  The rows reported by the monitor are
+    accumulated and can be retrieved with get_events().
     """
 
     def __init__(self, root_helper=None, respawn_interval=None):
         super(SimpleInterfaceMonitor, self).__init__(
             'Interface',
-            columns=['name', 'ofport'],
+            columns=['name', 'ofport', 'external_ids'],
             format='json',
             root_helper=root_helper,
             respawn_interval=respawn_interval,
         )
         self.data_received = False
+        self.events_lost = False
+        self.new_events = []
 
     @property
     def is_active(self):
@@ -85,7 +95,57 @@ class SimpleInterfaceMonitor(OvsdbMonitor):
         the absence of updates at the expense of potential false
         positives.
         """
-        return bool(list(self.iter_stdout())) or not self.is_active
+        return self._consume_output() or not self.is_active
+
+    def get_events(self):
+        """Return and clear the Interface rows changed since the last call.
+
+        Each event is a dict with the action reported by ovsdb ('initial',
+        'insert', 'delete' or 'new') and the name, ofport and external_ids
+        of the row.  None is returned if some events may have been missed,
+        e.g. because the monitor is not active or has been respawned, in
+        which case the caller has to look at the whole table.
+        """
+        self._consume_output()
+        events, self.new_events = self.new_events, []
+        if self.events_lost or not self.is_active:
+            # Once active again, the initial rows of the table have been
+            # consumed here and later events can be trusted.
+            self.events_lost = not self.is_active
+            return
+        return events
+
+    def _consume_output(self):
+        lines = list(self.iter_stdout())
+        for line in lines:
+            self._process_output(line)
+        return bool(lines)
+
+    def _process_output(self, line):
+        try:
+            output = jsonutils.loads(line)
+            headings = output['headings']
+            rows = output['data']
+        except (ValueError, KeyError, TypeError):
+            LOG.warn(_('Unable to parse ovsdb monitor output: %s'), line)
+            self.events_lost = True
+            return
+        for row in rows:
+            row = dict(zip(headings, row))
+            action = row.get('action')
+            if action == OVSDB_ACTION_OLD:
+                # Only the changed columns of the previous row are given
+                continue
+            ofport = row.get('ofport')
+            # 'ofport' can be [u'set', []] or an integer
+            if isinstance(ofport, list):
+                ofport = ofport[1] or None
+            external_ids = row.get('external_ids')
+            external_ids = dict(external_ids[1]) if external_ids else {}
+            self.new_events.append({'action': action,
+                                    'name': row.get('name'),
+                                    'ofport': ofport,
+                                    'external_ids': external_ids})
 
     def start(self, block=False, timeout=5):
         super(SimpleInterfaceMonitor, self).start()
@@ -96,6 +156,8 @@ class SimpleInterfaceMonitor(OvsdbMonitor):
 
     def _kill(self, *args, **kwargs):
         self.data_received = False
+        # The respawned monitor starts again with the initial rows
+        self.events_lost = True
         super(SimpleInterfaceMonitor, self)._kill(*args, **kwargs)
 
     def _read_stdout(self):
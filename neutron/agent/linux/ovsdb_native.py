@@ -0,0 +1,486 @@
+# Copyright 2014 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Native OVSDB client keeping a local copy of the switch tables.
+
+Instead of forking ovs-vsctl for every query, OvsdbConnection talks the
+OVSDB JSON-RPC protocol (RFC 7047) to ovsdb-server over a persistent
+socket. The Bridge, Port and Interface tables are monitored, so reads are
+served from memory, and writes can be batched into a single transaction.
+"""
+
+import contextlib
+import itertools
+import json
+
+import eventlet
+from eventlet import corolocal
+import eventlet.event
+from eventlet.green import socket
+import eventlet.semaphore
+
+from neutron.openstack.common import jsonutils
+from neutron.openstack.common import log as logging
+
+
+LOG = logging.getLogger(__name__)
+
+DATABASE = 'Open_vSwitch'
+MONITOR_ID = 'neutron'
+
+# The columns kept in the local copy of each table
+MONITORED_TABLES = {
+    'Bridge': ['name', 'ports', 'datapath_id', 'external_ids'],
+    'Port': ['name', 'interfaces', 'tag'],
+    'Interface': ['name', 'external_ids', 'ofport', 'type', 'options'],
+}
+
+_connections = {}
+
+
+def get_connection(connection, timeout):
+    """Return the connection shared by all users of the given ovsdb."""
+    if connection not in _connections:
+        _connections[connection] = OvsdbConnection(connection, timeout)
+    return _connections[connection]
+
+
+def _from_ovsdb(value):
+    """Convert an OVSDB wire value to a python value.
+
+    Sets become lists, maps become dicts and uuids become strings.
+    """
+    if isinstance(value, list):
+        kind, data = value
+        if kind == 'set':
+            return [_from_ovsdb(item) for item in data]
+        if kind == 'map':
+            return dict((_from_ovsdb(key), _from_ovsdb(item))
+                        for key, item in data)
+        return data
+    return value
+
+
+def _string_needs_quotes(value):
+    # Same rules as ovs-vsctl
+    if not value or not (value[0].isalpha() or value[0] == '_'):
+        return True
+    if value in ('true', 'false'):
+        return True
+    return any(not (c.isalpha() or c in '_-.') for c in value[1:])
+
+
+def to_vsctl_str(value):
+    """Format a python value the way 'ovs-vsctl get' prints it."""
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    if isinstance(value, (int, long, float)):
+        return str(value)
+    if isinstance(value, dict):
+        return '{%s}' % ', '.join('%s=%s' % (to_vsctl_str(key),
+                                             to_vsctl_str(value[key]))
+                                  for key in sorted(value))
+    if isinstance(value, list):
+        return '[%s]' % ', '.join(to_vsctl_str(item)
+                                  for item in sorted(value))
+    if _string_needs_quotes(value):
+        return jsonutils.dumps(value)
+    return str(value)
+
+
+class OvsdbConnection(object):
+    """A persistent connection to ovsdb-server.
+
+    The connection is established on first use and re-established, with a
+    full resync of the local tables, after it is lost.
+    """
+
+    def __init__(self, connection, timeout):
+        """Constructor.
+
+        :param connection: 'unix:<path>' or 'tcp:<host>:<port>'.
+        :param timeout: Seconds to wait for a reply from ovsdb-server.
+        """
+        self.connection = connection
+        self.timeout = timeout
+        self.tables = {}
+        self._table_names = dict((table.lower(), table)
+                                 for table in MONITORED_TABLES)
+        self._columns = {}
+        self._names = {}
+        self._index = None
+        self._sock = None
+        self._ids = itertools.count()
+        self._pending = {}
+        # The writes of the open transaction of each greenthread
+        self._local = corolocal.local()
+        self._lock = eventlet.semaphore.Semaphore()
+
+    @property
+    def connected(self):
+        return self._sock is not None
+
+    def start(self):
+        """Connect to ovsdb-server and load the monitored tables."""
+        if self._sock:
+            return
+        with self._lock:
+            if not self._sock:
+                self._start()
+
+    def _start(self):
+        LOG.debug(_("Connecting to ovsdb at %s"), self.connection)
+        try:
+            sock = self._connect()
+        except (socket.error, ValueError) as e:
+            raise RuntimeError(_("Unable to connect to ovsdb at %(conn)s: "
+                                 "%(error)s") %
+                               {'conn': self.connection, 'error': e})
+        self._sock = sock
+        eventlet.spawn_n(self._read_loop, sock)
+        try:
+            schema = self._call('get_schema', [DATABASE])
+            self._columns = dict((table, schema['tables'][table]['columns'])
+                                 for table in MONITORED_TABLES)
+            self.tables = dict((table, {}) for table in MONITORED_TABLES)
+            self._names = dict((table, {}) for table in MONITORED_TABLES)
+            self._index = None
+            requests = dict((table, {'columns': columns})
+                            for table, columns in MONITORED_TABLES.items())
+            self._apply_updates(
+                self._call('monitor', [DATABASE, MONITOR_ID, requests]))
+        except Exception:
+            self.stop()
+            raise
+
+    def stop(self):
+        sock, self._sock = self._sock, None
+        if sock:
+            self._shutdown(sock)
+
+    def _shutdown(self, sock):
+        # The socket is closed by its reader once it sees the end of the
+        # stream, closing it here would leave the reader waiting on it.
+        try:
+            sock.shutdown(socket.SHUT_RDWR)
+        except socket.error:
+            pass
+
+    def _connect(self):
+        kind, _sep, address = self.connection.partition(':')
+        if kind == 'unix':
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.connect(address)
+            return sock
+        elif kind == 'tcp':
+            host, _sep, port = address.rpartition(':')
+            return socket.create_connection((host, int(port)))
+        raise ValueError(_("Unsupported connection type %s") % kind)
+
+    def _send(self, message):
+        try:
+            self._sock.sendall(jsonutils.dumps(message))
+        except socket.error as e:
+            self._shutdown(self._sock)
+            raise RuntimeError(_("Lost connection to ovsdb: %s") % e)
+
+    def _call(self, method, params):
+        request_id = next(self._ids)
+        reply = eventlet.event.Event()
+        self._pending[request_id] = reply
+        try:
+            self._send({'method': method, 'params': params,
+                        'id': request_id})
+            timeout = RuntimeError(_("Timeout waiting for ovsdb %s reply") %
+                                   method)
+            with eventlet.Timeout(self.timeout, timeout):
+                message = reply.wait()
+        finally:
+            self._pending.pop(request_id, None)
+        if message.get('error'):
+            raise RuntimeError(_("ovsdb %(method)s failed: %(error)s") %
+                               {'method': method, 'error': message['error']})
+        return message['result']
+
+    def _read_loop(self, sock):
+        decoder = json.JSONDecoder()
+        buf = ''
+        while True:
+            try:
+                data = sock.recv(65536)
+            except (IOError, EOFError):
+                data = ''
+            if not data:
+                break
+            buf += data
+            while True:
+                buf = buf.lstrip()
+                try:
+                    message, end = decoder.raw_decode(buf)
+                except ValueError:
+                    # Wait for the rest of the message
+                    break
+                buf = buf[end:]
+                try:
+                    self._handle_message(message)
+                except Exception:
+                    LOG.exception(_("Error handling ovsdb message %s"),
+                                  message)
+        self._disconnected(sock)
+
+    def _handle_message(self, message):
+        method = message.get('method')
+        if method == 'echo':
+            self._send({'result': message['params'], 'error': None,
+                        'id': message['id']})
+        elif method == 'update':
+            self._apply_updates(message['params'][1])
+        elif message.get('id') in self._pending:
+            self._pending[message['id']].send(message)
+
+    def _disconnected(self, sock):
+        sock.close()
+        if sock is not self._sock:
+            return
+        LOG.warn(_("Connection to ovsdb at %s lost"), self.connection)
+        self._sock = None
+        for reply in self._pending.values():
+            if not reply.ready():
+                reply.send({'error': 'connection closed'})
+
+    def _is_set_column(self, table, column):
+        column_type = self._columns[table][column]['type']
+        return (isinstance(column_type, dict) and
+                'value' not in column_type and
+                column_type.get('max', 1) != 1)
+
+    def _apply_updates(self, updates):
+        for table, rows in updates.iteritems():
+            replica = self.tables[table]
+            names = self._names[table]
+            for uuid, change in rows.iteritems():
+                old_row = replica.pop(uuid, {})
+                names.pop(old_row.get('name'), None)
+                if change.get('new') is None:
+                    continue
+                row = dict(old_row)
+                for column, value in change['new'].iteritems():
+                    value = _from_ovsdb(value)
+                    if (self._is_set_column(table, column) and
+                            not isinstance(value, list)):
+                        # A set with one element is sent as that element
+                        value = [value]
+                    row[column] = value
+                replica[uuid] = row
+                names[row.get('name')] = uuid
+        self._index = None
+
+    def _get_index(self):
+        """Return the lookups which are not plain row reads.
+
+        They are built on demand and dropped on every update.
+        """
+        if self._index is None:
+            parents = {}
+            for table, child_column in (('Bridge', 'ports'),
+                                        ('Port', 'interfaces')):
+                for uuid, row in self.tables[table].iteritems():
+                    for child in row.get(child_column, []):
+                        parents[child] = uuid
+            iface_ids = {}
+            for uuid, row in self.tables['Interface'].iteritems():
+                iface_id = row.get('external_ids', {}).get('iface-id')
+                if iface_id:
+                    iface_ids[iface_id] = uuid
+            self._index = {'parents': parents, 'iface_ids': iface_ids}
+        return self._index
+
+    def _get_table(self, table):
+        return self._table_names.get(table.lower())
+
+    def is_monitored(self, table, column=None):
+        """Tell whether the local copy covers the given table and column."""
+        table = self._get_table(table)
+        if not table:
+            return False
+        return column is None or (column.partition(':')[0] in
+                                  MONITORED_TABLES[table])
+
+    def _get_row(self, table, record):
+        self.start()
+        table = self._get_table(table)
+        uuid = self._names[table].get(record)
+        if uuid is None and record in self.tables[table]:
+            uuid = record
+        if uuid is None:
+            raise RuntimeError(_("No row %(record)s in table %(table)s") %
+                               {'record': record, 'table': table})
+        return table, uuid, self.tables[table][uuid]
+
+    def get_value(self, table, record, column):
+        """Return a column, or a key of a map column given as column:key."""
+        table, uuid, row = self._get_row(table, record)
+        column, _sep, key = column.partition(':')
+        value = row[column]
+        if key:
+            if key not in value:
+                raise RuntimeError(_("No key %(key)s in column %(column)s "
+                                     "of %(record)s") %
+                                   {'key': key, 'column': column,
+                                    'record': record})
+            value = value[key]
+        return value
+
+    def get_bridges(self):
+        self.start()
+        return sorted(row['name'] for row in self.tables['Bridge'].values())
+
+    def bridge_exists(self, bridge_name):
+        self.start()
+        return bridge_name in self._names['Bridge']
+
+    def _get_bridge_port_rows(self, bridge_name):
+        """Return the Port rows of a bridge, excluding its local port."""
+        table, uuid, bridge = self._get_row('Bridge', bridge_name)
+        ports = self.tables['Port']
+        return [ports[port] for port in bridge['ports']
+                if port in ports and ports[port]['name'] != bridge_name]
+
+    def get_bridge_ports(self, bridge_name):
+        return [port['name']
+                for port in self._get_bridge_port_rows(bridge_name)]
+
+    def get_bridge_port_tags(self, bridge_name):
+        return dict((port['name'], port['tag'])
+                    for port in self._get_bridge_port_rows(bridge_name))
+
+    def get_bridge_interfaces(self, bridge_name):
+        """Return the Interface rows of all ports of a bridge."""
+        interfaces = self.tables['Interface']
+        return [interfaces[iface]
+                for port in self._get_bridge_port_rows(bridge_name)
+                for iface in port['interfaces'] if iface in interfaces]
+
+    def get_port_bridge(self, port_name):
+        self.start()
+        uuid = self._names['Port'].get(port_name)
+        bridge = self._get_index()['parents'].get(uuid)
+        if bridge:
+            return self.tables['Bridge'][bridge]['name']
+
+    def get_interface_bridge(self, iface_name):
+        self.start()
+        uuid = self._names['Interface'].get(iface_name)
+        port = self._get_index()['parents'].get(uuid)
+        if port:
+            return self.get_port_bridge(self.tables['Port'][port]['name'])
+
+    def find_interface_by_iface_id(self, iface_id):
+        self.start()
+        uuid = self._get_index()['iface_ids'].get(iface_id)
+        if uuid:
+            return self.tables['Interface'][uuid]
+
+    def _to_ovsdb(self, table, column, value):
+        """Convert a value, possibly given as a string, to the wire format."""
+        column_type = self._columns[table][column]['type']
+        if isinstance(column_type, dict):
+            column_type = column_type['key']
+        if isinstance(column_type, dict):
+            column_type = column_type['type']
+        if isinstance(value, dict):
+            return ['map', sorted(value.items())]
+        if isinstance(value, list):
+            return ['set', value]
+        if column_type == 'integer':
+            return int(value)
+        if column_type == 'real':
+            return float(value)
+        if column_type == 'boolean':
+            return value in (True, 'true')
+        return value
+
+    def set_value(self, table, record, column, value):
+        """Set a column, or a key of a map column given as column:key."""
+        table, uuid, row = self._get_row(table, record)
+        column, _sep, key = column.partition(':')
+        where = [['_uuid', '==', ['uuid', uuid]]]
+        if key:
+            value = str(value)
+            operation = {'op': 'mutate', 'table': table, 'where': where,
+                         'mutations': [
+                             [column, 'delete', ['set', [key]]],
+                             [column, 'insert', ['map', [[key, value]]]]]}
+            new_value = dict(row.get(column, {}))
+            new_value[key] = value
+        else:
+            wire_value = self._to_ovsdb(table, column, value)
+            operation = {'op': 'update', 'table': table, 'where': where,
+                         'row': {column: wire_value}}
+            new_value = _from_ovsdb(wire_value)
+        self._queue(operation, table, uuid, column, new_value)
+
+    def clear_value(self, table, record, column):
+        table, uuid, row = self._get_row(table, record)
+        column_type = self._columns[table][column]['type']
+        empty = {}
+        if not (isinstance(column_type, dict) and 'value' in column_type):
+            empty = []
+        operation = {'op': 'update', 'table': table,
+                     'where': [['_uuid', '==', ['uuid', uuid]]],
+                     'row': {column: ['map' if empty == {} else 'set', []]}}
+        self._queue(operation, table, uuid, column, empty)
+
+    def _queue(self, operation, table, uuid, column, new_value):
+        change = (operation, table, uuid, column, new_value)
+        txn = getattr(self._local, 'txn', None)
+        if txn is not None:
+            txn.append(change)
+        else:
+            self._commit([change])
+
+    @contextlib.contextmanager
+    def transaction(self):
+        """Batch all writes done in this context into one transaction.
+
+        The writes are only sent if the context exits without error.
+        Nested contexts are merged into the outermost one. Only the writes
+        of the greenthread which opened the context are batched.
+        """
+        if getattr(self._local, 'txn', None) is not None:
+            yield
+            return
+        self._local.txn = []
+        try:
+            yield
+            changes = self._local.txn
+        finally:
+            self._local.txn = None
+        if changes:
+            self._commit(changes)
+
+    def _commit(self, changes):
+        self.start()
+        results = self._call('transact',
+                             [DATABASE] + [change[0] for change in changes])
+        errors = [result for result in results
+                  if result and result.get('error')]
+        if errors:
+            raise RuntimeError(_("ovsdb transaction failed: %s") % errors)
+        # Do not wait for the monitor update to see our own writes
+        for operation, table, uuid, column, value in changes:
+            if uuid in self.tables[table]:
+                self.tables[table][uuid][column] = value
+        self._index = None
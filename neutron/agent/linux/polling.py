@@ -54,6 +54,14 @@ class BasePollingManager(object):
     def _is_polling_required(self):
         raise NotImplemented
 
+    def get_events(self):
+        """Return the interface changes detected since the last call.
+
+        None means that the changes are not known and that all the
+        interfaces have to be looked at.
+        """
+        return None
+
     @property
     def is_polling_required(self):
         # Always consume the updates to minimize polling.
@@ -105,6 +113,9 @@ class InterfacePollingMinimizer(BasePollingManager):
     def stop(self):
         self._monitor.stop()
 
+    def get_events(self):
+        return self._monitor.get_events()
+
     def _is_polling_required(self):
         # Maximize the chances of update detection having a chance to
         # collect output.
@@ -15,15 +15,19 @@
 #
 # @author: Juliano Martinez, Locaweb.
 
+import bisect
 import fcntl
 import os
 import shlex
 import socket
 import struct
 import tempfile
+import time
 
 from eventlet.green import subprocess
 from eventlet import greenthread
+from oslo.config import cfg
+from oslo.rootwrap import client as rootwrap_client
 
 from neutron.common import constants
 from neutron.common import utils
@@ -33,6 +37,49 @@ from neutron.openstack.common import log as logging
 
 LOG = logging.getLogger(__name__)
 
+# The rootwrap daemon clients, by command starting the daemon.
+_rootwrap_clients = {}
+
+
+class ExecuteStats(object):
+    """Counts the commands run by execute() and their latency."""
+
+    # Upper bounds in seconds of the latency histogram buckets, the last
+    # bucket counts the longer commands.
+    BUCKETS = (0.01, 0.05, 0.1, 0.5, 1, 5)
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.started = time.time()
+        self.calls = 0
+        self.total_time = 0.0
+        self.histogram = [0] * (len(self.BUCKETS) + 1)
+
+    def record(self, elapsed):
+        self.calls += 1
+        self.total_time += elapsed
+        self.histogram[bisect.bisect_left(self.BUCKETS, elapsed)] += 1
+
+    def pop_state(self):
+        """Return the statistics since the last call and reset them."""
+        elapsed = time.time() - self.started
+        labels = ['<=%ss' % bound for bound in self.BUCKETS]
+        labels.append('>%ss' % self.BUCKETS[-1])
+        state = {'execute_calls': self.calls,
+                 'execute_calls_per_sec': round(self.calls / elapsed, 3)
+                 if elapsed else 0,
+                 'execute_avg_latency': round(self.total_time / self.calls, 3)
+                 if self.calls else 0,
+                 'execute_latency_histogram': dict(zip(labels,
+                                                       self.histogram))}
+        self.reset()
+        return state
+
+
+EXECUTE_STATS = ExecuteStats()
+
 
 def create_process(cmd, root_helper=None, addl_env=None):
     """Create a process object for the given command.
@@ -58,25 +105,63 @@ def create_process(cmd, root_helper=None, addl_env=None):
     return obj, cmd
 
 
+def _get_root_helper_daemon():
+    try:
+        return cfg.CONF.AGENT.root_helper_daemon
+    except cfg.NoSuchOptError:
+        # Only the agents running commands as root register the option.
+        return None
+
+
+def execute_rootwrap_daemon(cmd, root_helper_daemon, process_input=None,
+                            addl_env=None):
+    """Run a command through the rootwrap daemon.
+
+    The daemon is started by the first command, and applies the filters of
+    rootwrap to the commands it receives.
+    """
+    client = _rootwrap_clients.get(root_helper_daemon)
+    if client is None:
+        client = rootwrap_client.Client(shlex.split(root_helper_daemon))
+        _rootwrap_clients[root_helper_daemon] = client
+    if addl_env:
+        # The daemon runs the commands in its own environment, the
+        # variables are given to env like for the commands run in a
+        # namespace.
+        cmd = ['env'] + ['%s=%s' % pair for pair in addl_env.items()] + cmd
+    cmd = map(str, cmd)
+    LOG.debug(_("Running command (rootwrap daemon): %s"), cmd)
+    returncode, _stdout, _stderr = client.execute(cmd, stdin=process_input)
+    return cmd, returncode, _stdout, _stderr
+
+
 def execute(cmd, root_helper=None, process_input=None, addl_env=None,
             check_exit_code=True, return_stderr=False):
+    start = time.time()
     try:
-        obj, cmd = create_process(cmd, root_helper=root_helper,
-                                  addl_env=addl_env)
-        _stdout, _stderr = (process_input and
-                            obj.communicate(process_input) or
-                            obj.communicate())
-        obj.stdin.close()
+        root_helper_daemon = root_helper and _get_root_helper_daemon()
+        if root_helper_daemon:
+            cmd, returncode, _stdout, _stderr = execute_rootwrap_daemon(
+                cmd, root_helper_daemon, process_input, addl_env)
+        else:
+            obj, cmd = create_process(cmd, root_helper=root_helper,
+                                      addl_env=addl_env)
+            _stdout, _stderr = (process_input and
+                                obj.communicate(process_input) or
+                                obj.communicate())
+            obj.stdin.close()
+            returncode = obj.returncode
         m = _("\nCommand: %(cmd)s\nExit code: %(code)s\nStdout: %(stdout)r\n"
-              "Stderr: %(stderr)r") % {'cmd': cmd, 'code': obj.returncode,
+              "Stderr: %(stderr)r") % {'cmd': cmd, 'code': returncode,
                                        'stdout': _stdout, 'stderr': _stderr}
-        if obj.returncode:
+        if returncode:
             LOG.error(m)
             if check_exit_code:
                 raise RuntimeError(m)
         else:
             LOG.debug(m)
     finally:
+        EXECUTE_STATS.record(time.time() - start)
         # NOTE(termie): this appears to be necessary to let the subprocess
         #               call clean something up in between calls, without
         #               it two execute calls in a row hangs the second one
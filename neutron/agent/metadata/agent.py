@@ -23,6 +23,7 @@ import sys
 import eventlet
 eventlet.monkey_patch()
 
+from eventlet import pools
 import httplib2
 from neutronclient.v2_0 import client
 from oslo.config import cfg
@@ -45,6 +46,10 @@ from neutron import wsgi
 
 LOG = logging.getLogger(__name__)
 
+# Maximum number of neutron clients, and so of concurrent port lookups, of
+# each metadata proxy process
+NEUTRON_CLIENT_POOL_SIZE = 8
+
 
 class MetadataProxyHandler(object):
     OPTS = [
@@ -93,16 +98,32 @@ class MetadataProxyHandler(object):
                    help=_("Client certificate for nova metadata api server.")),
         cfg.StrOpt('nova_client_priv_key',
                    default='',
-                   help=_("Private key of client certificate."))
+                   help=_("Private key of client certificate.")),
+        cfg.IntOpt('metadata_cache_size', default=4096,
+                   help=_("Maximum number of port lookups kept by the "
+                          "in-process cache used for memory:// cache_url.")),
+        cfg.IntOpt('metadata_cache_negative_ttl', default=2,
+                   help=_("Seconds during which the in-process cache keeps "
+                          "port lookups which found nothing. 0 disables "
+                          "caching them.")),
     ]
 
     def __init__(self, conf):
         self.conf = conf
         self.auth_info = {}
-        if self.conf.cache_url:
-            self._cache = cache.get_cache(self.conf.cache_url)
-        else:
-            self._cache = False
+        self._cache = self._get_cache()
+        self._clients = pools.Pool(max_size=NEUTRON_CLIENT_POOL_SIZE,
+                                   create=self._get_neutron_client)
+
+    def _get_cache(self):
+        if not self.conf.cache_url:
+            return False
+        url = urlparse.urlparse(self.conf.cache_url)
+        if url.scheme != 'memory':
+            return cache.get_cache(self.conf.cache_url)
+        ttl = int(urlparse.parse_qs(url.query).get('default_ttl', [0])[0])
+        return utils.LRUCache(self.conf.metadata_cache_size, ttl,
+                              self.conf.metadata_cache_negative_ttl)
 
     def _get_neutron_client(self):
         qclient = client.Client(
@@ -126,6 +147,9 @@ class MetadataProxyHandler(object):
             LOG.debug(_("Request: %s"), req)
 
             instance_id, tenant_id = self._get_instance_and_tenant_id(req)
+            if isinstance(self._cache, utils.LRUCache):
+                LOG.debug(_("Port lookup cache stats: %s"),
+                          self._cache.stats())
             if instance_id:
                 return self._proxy_request(instance_id, tenant_id, req)
             else:
@@ -137,14 +161,19 @@ class MetadataProxyHandler(object):
                     'Please try your request again.')
             return webob.exc.HTTPInternalServerError(explanation=unicode(msg))
 
+    def _list_ports(self, **filters):
+        """List ports with a neutron client from the pool."""
+        with self._clients.item() as qclient:
+            ports = qclient.list_ports(**filters)['ports']
+            self.auth_info = qclient.get_auth_info()
+        return ports
+
     @utils.cache_method_results
     def _get_router_networks(self, router_id):
         """Find all networks connected to given router."""
-        qclient = self._get_neutron_client()
-
-        internal_ports = qclient.list_ports(
+        internal_ports = self._list_ports(
             device_id=router_id,
-            device_owner=n_const.DEVICE_OWNER_ROUTER_INTF)['ports']
+            device_owner=n_const.DEVICE_OWNER_ROUTER_INTF)
         return tuple(p['network_id'] for p in internal_ports)
 
     @utils.cache_method_results
@@ -156,11 +185,9 @@ class MetadataProxyHandler(object):
                          searched for
 
         """
-        qclient = self._get_neutron_client()
-
-        return qclient.list_ports(
+        return self._list_ports(
             network_id=networks,
-            fixed_ips=['ip_address=%s' % remote_address])['ports']
+            fixed_ips=['ip_address=%s' % remote_address])
 
     def _get_ports(self, remote_address, network_id=None, router_id=None):
         """Search for all ports that contain passed ip address and belongs to
@@ -181,15 +208,11 @@ class MetadataProxyHandler(object):
         return self._get_ports_for_remote_address(remote_address, networks)
 
     def _get_instance_and_tenant_id(self, req):
-        qclient = self._get_neutron_client()
-
         remote_address = req.headers.get('X-Forwarded-For')
         network_id = req.headers.get('X-Neutron-Network-ID')
         router_id = req.headers.get('X-Neutron-Router-ID')
 
         ports = self._get_ports(remote_address, network_id, router_id)
-
-        self.auth_info = qclient.get_auth_info()
         if len(ports) == 1:
             return ports[0]['device_id'], ports[0]['tenant_id']
         return None, None
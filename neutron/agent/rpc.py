@@ -14,6 +14,8 @@
 #    under the License.
 
 import itertools
+
+from oslo.config import cfg
 from oslo import messaging
 
 from neutron.common import rpc as n_rpc
@@ -72,6 +74,26 @@ class PluginReportStateAPI(n_rpc.RpcProxy):
             return self.cast(context, msg, topic=self.topic)
 
 
+class MetricsReport(object):
+    """Tell which state reports of an agent update its metrics.
+
+    The metrics, such as the number of commands run, change between any
+    two reports. They are only updated every metrics_report_interval
+    reports, starting with the first one, so that the server can keep
+    the heartbeats of the other reports rather than write them at once.
+    """
+
+    def __init__(self):
+        self.reports = 0
+
+    def due(self):
+        """Count a report and return whether it updates the metrics."""
+        interval = cfg.CONF.AGENT.metrics_report_interval
+        due = bool(interval) and not self.reports % interval
+        self.reports += 1
+        return due
+
+
 class PluginApi(n_rpc.RpcProxy):
     '''Agent side of the rpc API.
 
@@ -14,14 +14,19 @@
 #    under the License.
 #
 
+import collections
+
 from oslo.config import cfg
+from oslo import messaging
 
+from neutron.common import rpc as n_rpc
 from neutron.common import topics
 from neutron.openstack.common import importutils
 from neutron.openstack.common import log as logging
 
 LOG = logging.getLogger(__name__)
 SG_RPC_VERSION = "1.1"
+SG_INFO_RPC_VERSION = "1.3"
 
 security_group_opts = [
     cfg.StrOpt(
@@ -33,7 +38,13 @@ security_group_opts = [
         help=_(
             'Controls whether the neutron security group API is enabled '
             'in the server. It should be false when using no security '
-            'groups or using the nova security group API.'))
+            'groups or using the nova security group API.')),
+    cfg.BoolOpt(
+        'enable_ipset',
+        default=False,
+        help=_('Match the members of remote security groups with ipsets '
+               'in the iptables based firewall drivers, instead of one '
+               'rule per member. Requires ipset on the agent host.'))
 ]
 cfg.CONF.register_opts(security_group_opts, 'SECURITYGROUP')
 
@@ -83,6 +94,15 @@ class SecurityGroupServerRpcApiMixin(object):
                          version=SG_RPC_VERSION,
                          topic=self.topic)
 
+    def security_group_info_for_devices(self, context, devices):
+        LOG.debug(_("Get security group information "
+                    "for devices via rpc %r"), devices)
+        return self.call(context,
+                         self.make_msg('security_group_info_for_devices',
+                                       devices=devices),
+                         version=SG_INFO_RPC_VERSION,
+                         topic=self.topic)
+
 
 class SecurityGroupAgentRpcCallbackMixin(object):
     """A mix-in that enable SecurityGroup agent
@@ -121,11 +141,16 @@ class SecurityGroupAgentRpcCallbackMixin(object):
         self.sg_agent.security_groups_member_updated(security_groups)
 
     def security_groups_provider_updated(self, context, **kwargs):
-        """Callback for security group provider update."""
-        LOG.debug(_("Provider rule updated"))
+        """Callback for security group provider update.
+
+        :param network_ids: list of the networks whose provider rules were
+                            updated, all of them when not given
+        """
+        network_ids = kwargs.get('network_ids')
+        LOG.debug(_("Provider rule updated on remote: %s"), network_ids)
         if not self.sg_agent:
             return self._security_groups_agent_not_set()
-        self.sg_agent.security_groups_provider_updated()
+        self.sg_agent.security_groups_provider_updated(network_ids)
 
 
 class SecurityGroupAgentRpcMixin(object):
@@ -150,13 +175,87 @@ class SecurityGroupAgentRpcMixin(object):
         self.devices_to_refilter = set()
         # Flag raised when a global refresh is needed
         self.global_refresh_firewall = False
+        # Number of refreshes of all the filtered devices, and of refreshes
+        # of the devices affected by a notification
+        self.firewall_refresh_counts = {'global': 0, 'targeted': 0}
+        # Reverse indexes of the filtered devices, so that the devices
+        # affected by a notification are found without going through all
+        # of them
+        self.devices_by_network = collections.defaultdict(set)
+        self.devices_by_security_group = {
+            'security_groups': collections.defaultdict(set),
+            'security_group_source_groups': collections.defaultdict(set)}
+        self._indexed_devices = {}
+        # Cleared when the server turns out not to support the
+        # security_group_info_for_devices RPC
+        self.use_security_group_info = self.firewall.use_security_group_info
+
+    def _get_devices_for_filter(self, device_ids):
+        """Return the ports of the devices, with their rules.
+
+        When supported, the rules of the security groups and the members
+        of the remote groups are received once for all the devices and
+        passed to the firewall, instead of being copied into every port.
+        """
+        if self.use_security_group_info:
+            try:
+                info = self.plugin_rpc.security_group_info_for_devices(
+                    self.context, list(device_ids))
+            except (messaging.UnsupportedVersion, n_rpc.RemoteError) as e:
+                if not n_rpc.is_unsupported_version(e):
+                    raise
+                LOG.warn(_("Server does not support "
+                           "security_group_info_for_devices, using "
+                           "security_group_rules_for_devices instead"))
+                self.use_security_group_info = False
+            else:
+                for sg_id, rules in info['security_groups'].items():
+                    self.firewall.update_security_group_rules(sg_id, rules)
+                for sg_id, member_ips in info['sg_member_ips'].items():
+                    self.firewall.update_security_group_members(sg_id,
+                                                                member_ips)
+                return info['devices']
+        return self.plugin_rpc.security_group_rules_for_devices(
+            self.context, list(device_ids))
+
+    def _index_devices(self, devices):
+        for device in devices.values():
+            self._unindex_device(device['device'])
+            keys = (device.get('network_id'),
+                    dict((attribute, list(device.get(attribute, [])))
+                         for attribute in self.devices_by_security_group))
+            self._indexed_devices[device['device']] = keys
+            self.devices_by_network[keys[0]].add(device['device'])
+            for attribute, sg_ids in keys[1].items():
+                for sg_id in sg_ids:
+                    self.devices_by_security_group[attribute][sg_id].add(
+                        device['device'])
+
+    def _unindex_device(self, device_id):
+        keys = self._indexed_devices.pop(device_id, None)
+        if not keys:
+            return
+        self._discard_indexed(self.devices_by_network, keys[0], device_id)
+        for attribute, sg_ids in keys[1].items():
+            for sg_id in sg_ids:
+                self._discard_indexed(
+                    self.devices_by_security_group[attribute], sg_id,
+                    device_id)
+
+    @staticmethod
+    def _discard_indexed(index, key, device_id):
+        devices = index.get(key)
+        if devices is not None:
+            devices.discard(device_id)
+            if not devices:
+                del index[key]
 
     def prepare_devices_filter(self, device_ids):
         if not device_ids:
             return
         LOG.info(_("Preparing filters for devices %s"), device_ids)
-        devices = self.plugin_rpc.security_group_rules_for_devices(
-            self.context, list(device_ids))
+        devices = self._get_devices_for_filter(device_ids)
+        self._index_devices(devices)
         with self.firewall.defer_apply():
             for device in devices.values():
                 self.firewall.prepare_port_filter(device)
@@ -176,29 +275,36 @@ class SecurityGroupAgentRpcMixin(object):
             'security_group_source_groups')
 
     def _security_group_updated(self, security_groups, attribute):
-        devices = []
-        sec_grp_set = set(security_groups)
-        for device in self.firewall.ports.values():
-            if sec_grp_set & set(device.get(attribute, [])):
-                devices.append(device['device'])
+        index = self.devices_by_security_group[attribute]
+        devices = set()
+        for sec_grp in security_groups:
+            devices |= index.get(sec_grp, set())
+        self._refresh_devices(devices)
+
+    def _refresh_devices(self, devices):
         if devices:
             if self.defer_refresh_firewall:
                 LOG.debug(_("Adding %s devices to the list of devices "
                             "for which firewall needs to be refreshed"),
                           devices)
-                self.devices_to_refilter |= set(devices)
+                self.devices_to_refilter |= devices
             else:
-                self.refresh_firewall(devices)
-
-    def security_groups_provider_updated(self):
-        LOG.info(_("Provider rule updated"))
-        if self.defer_refresh_firewall:
-            # NOTE(salv-orlando): A 'global refresh' might not be
-            # necessary if the subnet for which the provider rules
-            # were updated is known
-            self.global_refresh_firewall = True
-        else:
-            self.refresh_firewall()
+                self.refresh_firewall(list(devices))
+
+    def security_groups_provider_updated(self, network_ids=None):
+        LOG.info(_("Provider rule updated %r"), network_ids)
+        if network_ids is None:
+            # the server did not tell which networks were updated
+            if self.defer_refresh_firewall:
+                self.global_refresh_firewall = True
+            else:
+                self.refresh_firewall()
+            return
+        # devices whose network is unknown are refreshed for any network
+        devices = set(self.devices_by_network.get(None, set()))
+        for network_id in network_ids:
+            devices |= self.devices_by_network.get(network_id, set())
+        self._refresh_devices(devices)
 
     def remove_devices_filter(self, device_ids):
         if not device_ids:
@@ -206,6 +312,7 @@ class SecurityGroupAgentRpcMixin(object):
         LOG.info(_("Remove device filter for %r"), device_ids)
         with self.firewall.defer_apply():
             for device_id in device_ids:
+                self._unindex_device(device_id)
                 device = self.firewall.ports.get(device_id)
                 if not device:
                     continue
@@ -218,8 +325,11 @@ class SecurityGroupAgentRpcMixin(object):
             if not device_ids:
                 LOG.info(_("No ports here to refresh firewall"))
                 return
-        devices = self.plugin_rpc.security_group_rules_for_devices(
-            self.context, device_ids)
+            self.firewall_refresh_counts['global'] += 1
+        else:
+            self.firewall_refresh_counts['targeted'] += 1
+        devices = self._get_devices_for_filter(device_ids)
+        self._index_devices(devices)
         with self.firewall.defer_apply():
             for device in devices.values():
                 LOG.debug(_("Update port filter for %s"), device['device'])
@@ -249,9 +359,8 @@ class SecurityGroupAgentRpcMixin(object):
         global_refresh_firewall = self.global_refresh_firewall
         self.devices_to_refilter = set()
         self.global_refresh_firewall = False
-        # TODO(salv-orlando): Avoid if possible ever performing the global
-        # refresh providing a precise list of devices for which firewall
-        # should be refreshed
+        # NOTE: a global refresh is only needed when the server did not
+        # tell which networks a provider rule update was for
         if global_refresh_firewall:
             LOG.debug(_("Refreshing firewall for all filtered devices"))
             self.refresh_firewall()
@@ -293,9 +402,14 @@ class SecurityGroupAgentRpcApiMixin(object):
                          version=SG_RPC_VERSION,
                          topic=self._get_security_group_topic())
 
-    def security_groups_provider_updated(self, context):
-        """Notify provider updated security groups."""
+    def security_groups_provider_updated(self, context, network_ids=None):
+        """Notify provider updated security groups.
+
+        :param network_ids: the networks whose provider rules were updated,
+                            all of them when not given
+        """
         self.fanout_cast(context,
-                         self.make_msg('security_groups_provider_updated'),
+                         self.make_msg('security_groups_provider_updated',
+                                       network_ids=network_ids),
                          version=SG_RPC_VERSION,
                          topic=self._get_security_group_topic())
@@ -97,6 +97,13 @@ class DhcpAgentNotifyAPI(n_rpc.RpcProxy):
 
     def _notify_agents(self, context, method, payload, network_id):
         """Notify all the agents that are hosting the network."""
+        self._notify_agents_bulk(context, method, [payload], network_id)
+
+    def _notify_agents_bulk(self, context, method, payloads, network_id):
+        """Send the payloads to all the agents hosting the network.
+
+        The agents are looked up, and the network scheduled, once.
+        """
         # fanout is required as we do not know who is "listening"
         no_agents = not utils.is_extension_supported(
             self.plugin, constants.DHCP_AGENT_SCHEDULER_EXT_ALIAS)
@@ -107,7 +114,8 @@ class DhcpAgentNotifyAPI(n_rpc.RpcProxy):
         cast_required = method != 'network_create_end'
 
         if fanout_required:
-            self._fanout_message(context, method, payload)
+            for payload in payloads:
+                self._fanout_message(context, method, payload)
         elif cast_required:
             admin_ctx = (context if context.is_admin else context.elevated())
             network = self.plugin.get_network(admin_ctx, network_id)
@@ -120,10 +128,11 @@ class DhcpAgentNotifyAPI(n_rpc.RpcProxy):
                 agents = self._schedule_network(admin_ctx, network, agents)
 
             enabled_agents = self._get_enabled_agents(
-                context, network, agents, method, payload)
+                context, network, agents, method, payloads)
             for agent in enabled_agents:
-                self._cast_message(
-                    context, method, payload, agent.host, agent.topic)
+                for payload in payloads:
+                    self._cast_message(
+                        context, method, payload, agent.host, agent.topic)
 
     def _cast_message(self, context, method, payload, host,
                       topic=topics.DHCP_AGENT):
@@ -152,26 +161,48 @@ class DhcpAgentNotifyAPI(n_rpc.RpcProxy):
         self._cast_message(context, 'agent_updated',
                            {'admin_state_up': admin_state_up}, host)
 
-    def notify(self, context, data, method_name):
-        # data is {'key' : 'value'} with only one key
-        if method_name not in self.VALID_METHOD_NAMES:
-            return
-        obj_type = data.keys()[0]
-        if obj_type not in self.VALID_RESOURCES:
-            return
-        obj_value = data[obj_type]
+    def _get_payload(self, obj_type, obj_value, method_name):
+        """Return the network and payload of the event of a resource."""
         network_id = None
         if obj_type == 'network' and 'id' in obj_value:
             network_id = obj_value['id']
         elif obj_type in ['port', 'subnet'] and 'network_id' in obj_value:
             network_id = obj_value['network_id']
         if not network_id:
+            return None, None
+        if method_name.endswith("_delete_end"):
+            if 'id' not in obj_value:
+                return None, None
+            return network_id, {obj_type + '_id': obj_value['id']}
+        return network_id, {obj_type: obj_value}
+
+    def notify(self, context, data, method_name):
+        # data is {'key' : 'value'} with only one key
+        obj_type = data.keys()[0]
+        self.notify_bulk(context, obj_type, [data[obj_type]], method_name)
+
+    def notify_bulk(self, context, obj_type, obj_values, method_name):
+        """Notify the agents of an event of several resources.
+
+        The events of the resources of a network are sent to its agents
+        together, the agents are looked up once for each network.
+        """
+        if method_name not in self.VALID_METHOD_NAMES:
+            return
+        if obj_type not in self.VALID_RESOURCES:
             return
         method_name = method_name.replace(".", "_")
-        if method_name.endswith("_delete_end"):
-            if 'id' in obj_value:
-                self._notify_agents(context, method_name,
-                                    {obj_type + '_id': obj_value['id']},
-                                    network_id)
-        else:
-            self._notify_agents(context, method_name, data, network_id)
+        network_ids = []
+        payloads = {}
+        for obj_value in obj_values:
+            network_id, payload = self._get_payload(obj_type, obj_value,
+                                                    method_name)
+            if not network_id:
+                continue
+            if network_id not in payloads:
+                network_ids.append(network_id)
+                payloads[network_id] = []
+            payloads[network_id].append(payload)
+        for network_id in network_ids:
+            self._notify_agents_bulk(context, method_name,
+                                     payloads[network_id], network_id)
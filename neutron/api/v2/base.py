@@ -246,11 +246,12 @@ class Controller(object):
             # FIXME(salvatore-orlando): obj_getter might return references to
             # other resources. Must check authZ on them too.
             # Omit items from list that should not be visible
-            obj_list = [obj for obj in obj_list
-                        if policy.check(request.context,
+            allowed = policy.check_many(request.context,
                                         self._plugin_handlers[self.SHOW],
-                                        obj,
-                                        plugin=self._plugin)]
+                                        obj_list,
+                                        plugin=self._plugin)
+            obj_list = [obj for obj, is_allowed in zip(obj_list, allowed)
+                        if is_allowed]
         # Use the first element in the list for discriminating which attributes
         # should be filtered out because of authZ policies
         # fields_to_add contains a list of attributes added for request policy
@@ -289,6 +290,12 @@ class Controller(object):
     def _send_dhcp_notification(self, context, data, methodname):
         if cfg.CONF.dhcp_agent_notification:
             if self._collection in data:
+                notify_bulk = getattr(self._dhcp_agent_notifier,
+                                      'notify_bulk', None)
+                if notify_bulk:
+                    notify_bulk(context, self._resource,
+                                data[self._collection], methodname)
+                    return
                 for body in data[self._collection]:
                     item = {self._resource: body}
                     self._dhcp_agent_notifier.notify(context, item, methodname)
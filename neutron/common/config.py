@@ -69,6 +69,14 @@ core_opts = [
                help=_("Maximum number of host routes per subnet")),
     cfg.IntOpt('max_fixed_ips_per_port', default=5,
                help=_("Maximum number of fixed ips per port")),
+    cfg.StrOpt('ip_allocation_strategy', default='sequential',
+               choices=['sequential', 'random'],
+               help=_("How IP addresses are picked from the allocation "
+                      "pools of a subnet. 'sequential' takes the first free "
+                      "address and locks the free ranges of the subnet, "
+                      "'random' takes a random address without locking so "
+                      "that concurrent allocations on a network do not "
+                      "wait for each other")),
     cfg.IntOpt('dhcp_lease_duration', default=86400,
                deprecated_name='dhcp_lease_time',
                help=_("DHCP lease duration (in seconds). Use -1 to tell "
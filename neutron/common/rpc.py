@@ -276,3 +276,14 @@ def create_connection(new=True):
 RPCException = messaging.MessagingException
 RemoteError = messaging.RemoteError
 MessagingTimeout = messaging.MessagingTimeout
+
+
+def is_unsupported_version(error):
+    """Return whether an error means that the server lacks a call version.
+
+    The UnsupportedVersion error raised by a server is received as a
+    RemoteError, its module not being allowed for deserialization.
+    """
+    return (isinstance(error, messaging.UnsupportedVersion) or
+            isinstance(error, RemoteError) and
+            error.exc_type == 'UnsupportedVersion')
@@ -18,6 +18,7 @@
 
 """Utilities and helper functions."""
 
+import collections
 import datetime
 import functools
 import hashlib
@@ -35,6 +36,7 @@ from oslo.config import cfg
 from neutron.common import constants as q_const
 from neutron.openstack.common import lockutils
 from neutron.openstack.common import log as logging
+from neutron.openstack.common import timeutils
 
 
 TIME_FORMAT = "%Y-%m-%dT%H:%M:%SZ"
@@ -102,6 +104,59 @@ class cache_method_results(object):
         return functools.partial(self.__call__, obj)
 
 
+class LRUCache(object):
+    """In-process cache with a bounded number of expiring entries.
+
+    Once size entries are stored, the least recently used one is evicted.
+    Entries expire after ttl seconds, or never if ttl is 0. Empty values
+    expire after negative_ttl seconds instead, and are not cached at all if
+    negative_ttl is 0. It can be used as the _cache of cache_method_results.
+    """
+
+    def __init__(self, size, ttl=0, negative_ttl=None):
+        self.size = size
+        self.ttl = ttl
+        self.negative_ttl = ttl if negative_ttl is None else negative_ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = collections.OrderedDict()
+
+    def get(self, key, default=None):
+        try:
+            expires_at, value = self._entries.pop(key)
+        except KeyError:
+            self.misses += 1
+            return default
+        if expires_at and expires_at <= timeutils.utcnow_ts():
+            self.misses += 1
+            return default
+        self._entries[key] = (expires_at, value)
+        self.hits += 1
+        return value
+
+    def set(self, key, value, ttl=None):
+        if ttl is None:
+            if value:
+                ttl = self.ttl
+            elif not self.negative_ttl:
+                return
+            else:
+                ttl = self.negative_ttl
+        self._entries.pop(key, None)
+        self._entries[key] = (ttl and timeutils.utcnow_ts() + ttl, value)
+        while len(self._entries) > self.size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses,
+                'evictions': self.evictions, 'entries': len(self._entries)}
+
+
 def read_cached_file(filename, cache_info, reload_func=None):
     """Read from a file if it has been modified.
 
@@ -20,7 +20,10 @@ from oslo.db import exception as db_exc
 import sqlalchemy as sa
 from sqlalchemy.orm import exc
 
+from neutron.agent.common import config as agent_config
+from neutron.common import exceptions as n_exc
 from neutron.common import rpc as n_rpc
+from neutron import context as n_context
 from neutron.db import model_base
 from neutron.db import models_v2
 from neutron.extensions import agent as ext_agent
@@ -28,14 +31,28 @@ from neutron import manager
 from neutron.openstack.common import excutils
 from neutron.openstack.common import jsonutils
 from neutron.openstack.common import log as logging
+from neutron.openstack.common import loopingcall
 from neutron.openstack.common import timeutils
 
 LOG = logging.getLogger(__name__)
-cfg.CONF.register_opt(
+AGENT_OPTS = [
     cfg.IntOpt('agent_down_time', default=75,
                help=_("Seconds to regard the agent is down; should be at "
                       "least twice report_interval, to be sure the "
-                      "agent is down for good.")))
+                      "agent is down for good.")),
+    cfg.IntOpt('agent_heartbeat_flush_interval', default=0,
+               help=_("Seconds the heartbeats of the agents are kept by "
+                      "each server worker before they are written together "
+                      "to the database. The reports of agents which just "
+                      "started or whose configurations changed are written "
+                      "at once. 0 writes every report at once. Must be "
+                      "below agent_down_time minus report_interval.")),
+]
+cfg.CONF.register_opts(AGENT_OPTS)
+agent_config.register_agent_state_opts_helper(cfg.CONF)
+
+# Number of heartbeats written by each UPDATE statement.
+HEARTBEAT_FLUSH_CHUNK_SIZE = 500
 
 
 class Agent(model_base.BASEV2, models_v2.HasId):
@@ -68,7 +85,119 @@ class Agent(model_base.BASEV2, models_v2.HasId):
 
     @property
     def is_active(self):
-        return not AgentDbMixin.is_agent_down(self.heartbeat_timestamp)
+        return not AgentDbMixin.is_agent_down(
+            HEARTBEATS.get_heartbeat(self))
+
+
+class AgentHeartbeats(object):
+    """Heartbeats of the agents not written to the database yet.
+
+    Only the heartbeats of the agents whose row is known by this worker and
+    whose configurations did not change are kept. They are written by a
+    batch of UPDATE statements every agent_heartbeat_flush_interval.
+    """
+
+    def __init__(self):
+        # The id and the reported columns of the agent rows known by this
+        # worker, by agent type and host.
+        self._agents = {}
+        # The heartbeat timestamps to write, by agent id.
+        self._pending = {}
+        self._flush_loop = None
+
+    def add(self, res, timestamp):
+        """Keep the heartbeat of an agent if the rest of its row is known.
+
+        Returns False if the report has to be written at once.
+        """
+        if not cfg.CONF.agent_heartbeat_flush_interval:
+            return False
+        known = self._agents.get((res['agent_type'], res['host']))
+        if not known or known[1] != res:
+            return False
+        self._pending[known[0]] = timestamp
+        if not self._flush_loop:
+            self._flush_loop = loopingcall.FixedIntervalLoopingCall(
+                self._flush_heartbeats)
+            self._flush_loop.start(
+                interval=cfg.CONF.agent_heartbeat_flush_interval)
+        return True
+
+    def remember(self, agent_db, res):
+        if not cfg.CONF.agent_heartbeat_flush_interval:
+            return
+        self._agents[(agent_db.agent_type, agent_db.host)] = (agent_db.id,
+                                                              res)
+        self._pending.pop(agent_db.id, None)
+
+    def forget(self, agent_ids):
+        agent_ids = set(agent_ids)
+        for key, (agent_id, res) in self._agents.items():
+            if agent_id in agent_ids:
+                del self._agents[key]
+        for agent_id in agent_ids:
+            self._pending.pop(agent_id, None)
+
+    def get_heartbeat(self, agent_db):
+        pending = self._pending.get(agent_db.id)
+        if pending and pending > agent_db.heartbeat_timestamp:
+            return pending
+        return agent_db.heartbeat_timestamp
+
+    def _flush_heartbeats(self):
+        try:
+            self.flush(n_context.get_admin_context())
+        except Exception:
+            LOG.exception(_("Failed writing the heartbeats of the agents"))
+
+    def flush(self, context):
+        """Write the heartbeats kept since the last flush."""
+        pending, self._pending = self._pending, {}
+        agent_ids = pending.keys()
+        written = 0
+        try:
+            for i in range(0, len(agent_ids), HEARTBEAT_FLUSH_CHUNK_SIZE):
+                chunk = agent_ids[i:i + HEARTBEAT_FLUSH_CHUNK_SIZE]
+                with context.session.begin(subtransactions=True):
+                    result = context.session.execute(
+                        Agent.__table__.update().
+                        where(Agent.id.in_(chunk)).
+                        values(heartbeat_timestamp=sa.case(
+                            dict((agent_id, pending[agent_id])
+                                 for agent_id in chunk),
+                            value=Agent.id)))
+                if result.rowcount != len(chunk):
+                    # Agents deleted meanwhile, possibly by another worker,
+                    # are created again by their next report.
+                    existing = set(agent_id for agent_id, in
+                                   context.session.query(Agent.id).
+                                   filter(Agent.id.in_(chunk)))
+                    self.forget(set(chunk) - existing)
+                written = i + len(chunk)
+        except Exception:
+            with excutils.save_and_reraise_exception():
+                for agent_id in agent_ids[written:]:
+                    self._pending.setdefault(agent_id, pending[agent_id])
+        return written
+
+
+HEARTBEATS = AgentHeartbeats()
+
+
+def check_heartbeat_flush_interval():
+    """Reject a flush interval letting the other workers miss heartbeats.
+
+    A heartbeat kept by a worker is seen by the others once written, so
+    the agent would look down to them if it was kept longer than
+    agent_down_time minus report_interval.
+    """
+    interval = cfg.CONF.agent_heartbeat_flush_interval
+    limit = cfg.CONF.agent_down_time - cfg.CONF.AGENT.report_interval
+    if interval < 0 or interval and interval >= limit:
+        LOG.error(_("agent_heartbeat_flush_interval must be below "
+                    "agent_down_time minus report_interval (%s)"), limit)
+        raise n_exc.InvalidConfigurationOption(
+            opt_name='agent_heartbeat_flush_interval', opt_value=interval)
 
 
 class AgentDbMixin(ext_agent.AgentPluginBase):
@@ -102,6 +231,7 @@ class AgentDbMixin(ext_agent.AgentPluginBase):
             ext_agent.RESOURCE_NAME + 's')
         res = dict((k, agent[k]) for k in attr
                    if k not in ['alive', 'configurations'])
+        res['heartbeat_timestamp'] = HEARTBEATS.get_heartbeat(agent)
         res['alive'] = not AgentDbMixin.is_agent_down(
             res['heartbeat_timestamp'])
         res['configurations'] = self.get_configuration_dict(agent)
@@ -111,6 +241,7 @@ class AgentDbMixin(ext_agent.AgentPluginBase):
         with context.session.begin(subtransactions=True):
             agent = self._get_agent(context, id)
             context.session.delete(agent)
+        HEARTBEATS.forget([id])
 
     def update_agent(self, context, id, agent):
         agent_data = agent['agent']
@@ -146,31 +277,38 @@ class AgentDbMixin(ext_agent.AgentPluginBase):
         return self._make_agent_dict(agent, fields)
 
     def _create_or_update_agent(self, context, agent):
-        with context.session.begin(subtransactions=True):
-            res_keys = ['agent_type', 'binary', 'host', 'topic']
-            res = dict((k, agent[k]) for k in res_keys)
+        res_keys = ['agent_type', 'binary', 'host', 'topic']
+        res = dict((k, agent[k]) for k in res_keys)
 
-            configurations_dict = agent.get('configurations', {})
-            res['configurations'] = jsonutils.dumps(configurations_dict)
-            current_time = timeutils.utcnow()
+        configurations_dict = agent.get('configurations', {})
+        res['configurations'] = jsonutils.dumps(configurations_dict,
+                                                sort_keys=True)
+        current_time = timeutils.utcnow()
+        if not agent.get('start_flag') and HEARTBEATS.add(res,
+                                                          current_time):
+            return
+        with context.session.begin(subtransactions=True):
             try:
                 agent_db = self._get_agent_by_type_and_host(
                     context, agent['agent_type'], agent['host'])
-                res['heartbeat_timestamp'] = current_time
+                changes = dict((k, v) for k, v in res.items()
+                               if agent_db[k] != v)
+                changes['heartbeat_timestamp'] = current_time
                 if agent.get('start_flag'):
-                    res['started_at'] = current_time
+                    changes['started_at'] = current_time
                 greenthread.sleep(0)
-                agent_db.update(res)
+                agent_db.update(changes)
             except ext_agent.AgentNotFoundByTypeHost:
                 greenthread.sleep(0)
-                res['created_at'] = current_time
-                res['started_at'] = current_time
-                res['heartbeat_timestamp'] = current_time
-                res['admin_state_up'] = True
-                agent_db = Agent(**res)
+                agent_db = Agent(created_at=current_time,
+                                 started_at=current_time,
+                                 heartbeat_timestamp=current_time,
+                                 admin_state_up=True,
+                                 **res)
                 greenthread.sleep(0)
                 context.session.add(agent_db)
             greenthread.sleep(0)
+        HEARTBEATS.remember(agent_db, res)
 
     def create_or_update_agent(self, context, agent):
         """Create or update agent according to report."""
@@ -204,6 +342,7 @@ class AgentExtRpcCallback(n_rpc.RpcCallback):
 
     def __init__(self, plugin=None):
         super(AgentExtRpcCallback, self).__init__()
+        check_heartbeat_flush_interval()
         self.plugin = plugin
 
     def report_state(self, context, **kwargs):
@@ -23,6 +23,7 @@ from neutron.common import constants
 from neutron.common import utils
 from neutron.db import agents_db
 from neutron.db import model_base
+from neutron.db import models_v2
 from neutron.extensions import agent as ext_agent
 from neutron.extensions import dhcpagentscheduler
 from neutron.openstack.common import log as logging
@@ -78,8 +79,7 @@ class AgentSchedulerDbMixin(agents_db.AgentDbMixin):
             #                   filter is set, only agents which are 'up'
             #                   (i.e. have a recent heartbeat timestamp)
             #                   are eligible, even if active is False
-            return not agents_db.AgentDbMixin.is_agent_down(
-                agent['heartbeat_timestamp'])
+            return agent.is_active
 
     def update_agent(self, context, id, agent):
         original_agent = self.get_agent(context, id)
@@ -184,7 +184,13 @@ class DhcpAgentSchedulerDbMixin(dhcpagentscheduler
         else:
             return {'networks': []}
 
-    def list_active_networks_on_active_dhcp_agent(self, context, host):
+    def list_active_networks_on_active_dhcp_agent(self, context, host,
+                                                  limit=None, marker=None):
+        """Return the active networks hosted by the DHCP agent of a host.
+
+        When limit is given, at most limit networks following the one with
+        id marker are returned, sorted by id.
+        """
         try:
             agent = self._get_agent_by_type_and_host(
                 context, constants.AGENT_TYPE_DHCP, host)
@@ -196,13 +202,26 @@ class DhcpAgentSchedulerDbMixin(dhcpagentscheduler
             return []
         query = context.session.query(NetworkDhcpAgentBinding.network_id)
         query = query.filter(NetworkDhcpAgentBinding.dhcp_agent_id == agent.id)
+        if limit:
+            query = query.join(
+                models_v2.Network,
+                models_v2.Network.id == NetworkDhcpAgentBinding.network_id)
+            query = query.filter(models_v2.Network.admin_state_up == sa.true())
+            if marker:
+                query = query.filter(
+                    NetworkDhcpAgentBinding.network_id > marker)
+            query = query.order_by(NetworkDhcpAgentBinding.network_id)
+            query = query.limit(limit)
 
         net_ids = [item[0] for item in query]
         if net_ids:
-            return self.get_networks(
+            networks = self.get_networks(
                 context,
                 filters={'id': net_ids, 'admin_state_up': [True]}
             )
+            if limit:
+                networks.sort(key=lambda network: network['id'])
+            return networks
         else:
             return []
 
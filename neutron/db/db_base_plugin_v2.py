@@ -13,6 +13,7 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import bisect
 import random
 import weakref
 
@@ -51,6 +52,34 @@ LOG = logging.getLogger(__name__)
 # IP allocations being cleaned up by cascade.
 AUTO_DELETE_PORT_OWNERS = [constants.DEVICE_OWNER_DHCP]
 
+# Number of candidate addresses tried by the random IP allocation before
+# falling back to the sequential one.
+RANDOM_IP_ATTEMPTS = 10
+# The random IP allocation splits the free ranges of a subnet until there are
+# this many, then takes the first address of a random range.
+RANDOM_IP_RANGES = 32
+
+# Maximum number of generated MAC addresses checked by a single query
+MAC_GENERATION_CHUNK = 500
+# Counters of the MAC address generation since the process started:
+# addresses generated, candidates already in use and queries done.
+MAC_GENERATION_STATS = {'generated': 0, 'collisions': 0, 'queries': 0}
+
+# Fields of the core resources which are copied as is from the columns of
+# their model when making their dicts. Lists asking only for such fields
+# are read from the columns, without loading the objects.
+PLAIN_COLUMN_FIELDS = {
+    models_v2.Network: frozenset(['id', 'name', 'tenant_id', 'admin_state_up',
+                                  'status', 'shared']),
+    models_v2.Subnet: frozenset(['id', 'name', 'tenant_id', 'network_id',
+                                 'ip_version', 'cidr', 'gateway_ip',
+                                 'enable_dhcp', 'ipv6_ra_mode',
+                                 'ipv6_address_mode', 'shared']),
+    models_v2.Port: frozenset(['id', 'name', 'network_id', 'tenant_id',
+                               'mac_address', 'admin_state_up', 'status',
+                               'device_id', 'device_owner']),
+}
+
 
 class CommonDbMixin(object):
     """Common methods used in core and service plugins."""
@@ -66,6 +95,30 @@ class CommonDbMixin(object):
     # TODO(salvatore-orlando): Avoid using class-level variables
     _dict_extend_functions = {}
 
+    # Relationships which are loaded for all the objects of a collection by
+    # a separate query, rather than joined to the collection query as when
+    # loading a single object, by model. Joining several one-to-many
+    # relationships returns a row for each combination of their items.
+    _collection_loaders = {}
+
+    @classmethod
+    def register_collection_loaders(cls, model, relationships,
+                                    loader=orm.subqueryload):
+        """Register how relationships are loaded for collections.
+
+        :param model: the model of the collection
+        :param relationships: names of relationships of the model
+        :param loader: the SQLAlchemy loader option used to load them in
+            collection queries, orm.subqueryload unless specified.
+        """
+        model_loaders = cls._collection_loaders.setdefault(model, {})
+        for relationship in relationships:
+            model_loaders[relationship] = loader
+
+    def _get_collection_loader_options(self, model):
+        return [loader(relationship) for relationship, loader in
+                self._collection_loaders.get(model, {}).iteritems()]
+
     @classmethod
     def register_model_query_hook(cls, model, name, query_hook, filter_hook,
                                   result_filters=None):
@@ -196,6 +249,29 @@ class CommonDbMixin(object):
                                                     marker_obj=marker_obj)
         return collection
 
+    def _get_plain_columns(self, model, fields):
+        """Return the columns to query for the fields, if they are all plain.
+
+        None is returned unless each field is a column of the model found
+        as is in the dicts made for it, in which case the dicts can be
+        built from the columns only.
+        """
+        plain_fields = PLAIN_COLUMN_FIELDS.get(model)
+        if fields and plain_fields and plain_fields.issuperset(fields):
+            return [getattr(model, field) for field in set(fields)]
+
+    def _get_collection_items(self, query, model, dict_func, fields,
+                              columns):
+        if columns:
+            # Neither the objects nor their relationships are loaded, and
+            # the dict extend functions are skipped, as they only add
+            # fields which were not asked for
+            keys = [column.key for column in columns]
+            return [dict(zip(keys, row))
+                    for row in query.with_entities(*columns)]
+        query = query.options(*self._get_collection_loader_options(model))
+        return [dict_func(c, fields) for c in query]
+
     def _get_collection(self, context, model, dict_func, filters=None,
                         fields=None, sorts=None, limit=None, marker_obj=None,
                         page_reverse=False):
@@ -204,7 +280,9 @@ class CommonDbMixin(object):
                                            limit=limit,
                                            marker_obj=marker_obj,
                                            page_reverse=page_reverse)
-        items = [dict_func(c, fields) for c in query]
+        items = self._get_collection_items(
+            query, model, dict_func, fields,
+            self._get_plain_columns(model, fields))
         if limit and page_reverse:
             items.reverse()
         return items
@@ -301,32 +379,107 @@ class NeutronDbPluginV2(neutron_plugin_base_v2.NeutronPluginBaseV2,
         # a lot of stress on the db. Consider adding a cache layer
         return context.session.query(models_v2.Subnet).all()
 
+    # MAC addresses reserved for the ports of bulk requests, by session and
+    # network
+    _reserved_macs = weakref.WeakKeyDictionary()
+    # IP addresses reserved for the ports of bulk requests, by session and
+    # subnet
+    _reserved_ips = weakref.WeakKeyDictionary()
+
     @staticmethod
     def _generate_mac(context, network_id):
+        reserved_macs = NeutronDbPluginV2._reserved_macs.get(
+            context.session, {}).get(network_id)
+        if reserved_macs:
+            mac_address = reserved_macs.pop()
+            LOG.debug(_("Generated mac for network %(network_id)s "
+                        "is %(mac_address)s"),
+                      {'network_id': network_id,
+                       'mac_address': mac_address})
+            return mac_address
+        return NeutronDbPluginV2._generate_macs(context, network_id, 1)[0]
+
+    @staticmethod
+    def _random_mac(base_mac):
+        mac = [int(base_mac[0], 16), int(base_mac[1], 16),
+               int(base_mac[2], 16), random.randint(0x00, 0xff),
+               random.randint(0x00, 0xff), random.randint(0x00, 0xff)]
+        if base_mac[3] != '00':
+            mac[3] = int(base_mac[3], 16)
+        return ':'.join(map(lambda x: "%02x" % x, mac))
+
+    @staticmethod
+    def _generate_macs(context, network_id, count):
+        """Generate MAC addresses which are not in use on the network.
+
+        The candidates are checked by blocks of up to MAC_GENERATION_CHUNK
+        addresses with a single query. The candidates found in use are
+        replaced, up to mac_generation_retries times.
+        """
         base_mac = cfg.CONF.base_mac.split(':')
         max_retries = cfg.CONF.mac_generation_retries
-        for i in range(max_retries):
-            mac = [int(base_mac[0], 16), int(base_mac[1], 16),
-                   int(base_mac[2], 16), random.randint(0x00, 0xff),
-                   random.randint(0x00, 0xff), random.randint(0x00, 0xff)]
-            if base_mac[3] != '00':
-                mac[3] = int(base_mac[3], 16)
-            mac_address = ':'.join(map(lambda x: "%02x" % x, mac))
-            if NeutronDbPluginV2._check_unique_mac(context, network_id,
-                                                   mac_address):
-                LOG.debug(_("Generated mac for network %(network_id)s "
-                            "is %(mac_address)s"),
-                          {'network_id': network_id,
-                           'mac_address': mac_address})
-                return mac_address
-            else:
-                LOG.debug(_("Generated mac %(mac_address)s exists. Remaining "
-                            "attempts %(max_retries)s."),
-                          {'mac_address': mac_address,
-                           'max_retries': max_retries - (i + 1)})
-        LOG.error(_("Unable to generate mac address after %s attempts"),
-                  max_retries)
-        raise n_exc.MacAddressGenerationFailure(net_id=network_id)
+        mac_qry = context.session.query(
+            models_v2.Port.mac_address).filter_by(network_id=network_id)
+        macs = set()
+        retries = queries = collisions = 0
+        while len(macs) < count:
+            candidates = set()
+            for i in range(min(count - len(macs), MAC_GENERATION_CHUNK)):
+                candidates.add(NeutronDbPluginV2._random_mac(base_mac))
+            candidates -= macs
+            if not candidates:
+                continue
+            used = set(mac for mac, in mac_qry.filter(
+                models_v2.Port.mac_address.in_(candidates)))
+            queries += 1
+            macs |= candidates - used
+            if used:
+                collisions += len(used)
+                retries += 1
+                LOG.debug(_("Generated macs %(mac_addresses)s exist. "
+                            "Remaining attempts %(max_retries)s."),
+                          {'mac_addresses': ', '.join(used),
+                           'max_retries': max_retries - retries})
+                if retries >= max_retries:
+                    break
+        MAC_GENERATION_STATS['queries'] += queries
+        MAC_GENERATION_STATS['collisions'] += collisions
+        if len(macs) < count:
+            LOG.error(_("Unable to generate mac address after %s attempts"),
+                      max_retries)
+            raise n_exc.MacAddressGenerationFailure(net_id=network_id)
+        MAC_GENERATION_STATS['generated'] += count
+        LOG.debug(_("Generated %(count)d macs for network %(network_id)s "
+                    "with %(queries)d queries and %(collisions)d "
+                    "collisions: %(mac_addresses)s"),
+                  {'count': count, 'network_id': network_id,
+                   'queries': queries, 'collisions': collisions,
+                   'mac_addresses': ', '.join(macs)})
+        return list(macs)
+
+    @staticmethod
+    def _reserve_macs(context, ports):
+        """Reserve MAC addresses for the ports of a bulk request.
+
+        The addresses are reserved for the session of the context, in
+        which they have to be released once the ports have been created.
+        """
+        counts = {}
+        for port in ports:
+            p = port['port']
+            if p.get('mac_address') is attributes.ATTR_NOT_SPECIFIED:
+                counts[p['network_id']] = counts.get(p['network_id'], 0) + 1
+        reserved = {}
+        for network_id, count in counts.items():
+            if count > 1:
+                reserved[network_id] = NeutronDbPluginV2._generate_macs(
+                    context, network_id, count)
+        if reserved:
+            NeutronDbPluginV2._reserved_macs[context.session] = reserved
+
+    @staticmethod
+    def _release_macs(context):
+        NeutronDbPluginV2._reserved_macs.pop(context.session, None)
 
     @staticmethod
     def _check_unique_mac(context, network_id, mac_address):
@@ -360,6 +513,14 @@ class NeutronDbPluginV2(neutron_plugin_base_v2.NeutronPluginBaseV2,
 
     @staticmethod
     def _generate_ip(context, subnets):
+        if cfg.CONF.ip_allocation_strategy == 'random':
+            try:
+                return NeutronDbPluginV2._try_generate_random_ip(context,
+                                                                 subnets)
+            except n_exc.IpAddressGenerationFailure:
+                LOG.debug("Random IP allocation failed on network %s, "
+                          "trying sequential allocation",
+                          subnets[0]['network_id'])
         try:
             return NeutronDbPluginV2._try_generate_ip(context, subnets)
         except n_exc.IpAddressGenerationFailure:
@@ -401,6 +562,175 @@ class NeutronDbPluginV2(neutron_plugin_base_v2.NeutronPluginBaseV2,
             return {'ip_address': ip_address, 'subnet_id': subnet['id']}
         raise n_exc.IpAddressGenerationFailure(net_id=subnets[0]['network_id'])
 
+    @staticmethod
+    def _get_reserved_ip(context, subnets):
+        """Return an IP address reserved on one of the subnets, if any."""
+        reserved_ips = NeutronDbPluginV2._reserved_ips.get(context.session)
+        if reserved_ips:
+            for subnet in subnets:
+                if reserved_ips.get(subnet['id']):
+                    return {'ip_address': reserved_ips[subnet['id']].pop(0),
+                            'subnet_id': subnet['id']}
+
+    @staticmethod
+    def _try_generate_ips(context, subnets, count):
+        """Generate up to count IP addresses.
+
+        As _try_generate_ip does for a single address, the addresses are
+        the first free ones of the availability ranges of the subnets,
+        taken in order, but each range is updated once.
+        """
+        range_qry = context.session.query(
+            models_v2.IPAvailabilityRange).join(
+                models_v2.IPAllocationPool).with_lockmode('update')
+        ips = []
+        for subnet in subnets:
+            ranges = range_qry.filter_by(subnet_id=subnet['id']).all()
+            for ip_range in ranges:
+                first = netaddr.IPAddress(ip_range['first_ip'])
+                last = netaddr.IPAddress(ip_range['last_ip'])
+                taken = min(count - len(ips), int(last) - int(first) + 1)
+                ips.extend({'ip_address': str(first + i),
+                            'subnet_id': subnet['id']}
+                           for i in range(taken))
+                LOG.debug(_("Allocated %(count)d IPs from %(first_ip)s to "
+                            "%(last_ip)s"),
+                          {'count': taken, 'first_ip': ip_range['first_ip'],
+                           'last_ip': ip_range['last_ip']})
+                if first + taken > last:
+                    context.session.delete(ip_range)
+                else:
+                    ip_range['first_ip'] = str(first + taken)
+                if len(ips) == count:
+                    return ips
+        return ips
+
+    def _reserve_ips(self, context, ports):
+        """Reserve IP addresses for the ports of a bulk request.
+
+        The addresses of the ports whose fixed IPs are not specified are
+        taken by blocks from the availability ranges, with the sequential
+        allocation strategy. They are reserved for the transaction of the
+        context, in which they have to be released once the ports have
+        been created. The ports missing a reserved address get one as
+        usual.
+        """
+        if cfg.CONF.ip_allocation_strategy == 'random':
+            return
+        counts = {}
+        for port in ports:
+            p = port['port']
+            if p.get('fixed_ips') is attributes.ATTR_NOT_SPECIFIED:
+                counts[p['network_id']] = counts.get(p['network_id'], 0) + 1
+        reserved = {}
+        for network_id, count in counts.items():
+            if count < 2:
+                continue
+            subnets = self.get_subnets(
+                context, filters={'network_id': [network_id]})
+            v4 = [subnet for subnet in subnets if subnet['ip_version'] == 4]
+            v6 = [subnet for subnet in subnets if subnet['ip_version'] == 6
+                  and not self._check_if_subnet_uses_eui64(subnet)]
+            for version_subnets in (v4, v6):
+                if version_subnets:
+                    for ip in NeutronDbPluginV2._try_generate_ips(
+                            context, version_subnets, count):
+                        reserved.setdefault(ip['subnet_id'], []).append(
+                            ip['ip_address'])
+        if reserved:
+            NeutronDbPluginV2._reserved_ips[context.session] = reserved
+
+    @staticmethod
+    def _release_ips(context):
+        NeutronDbPluginV2._reserved_ips.pop(context.session, None)
+
+    @staticmethod
+    def _try_generate_random_ip(context, subnets):
+        """Generate an IP address picked in a random free range.
+
+        The availability ranges are not locked. The range the address is
+        taken from is only updated if it has not been changed meanwhile,
+        otherwise another address is tried. The primary key of the IP
+        allocations still prevents an address from being allocated twice.
+        """
+        range_qry = context.session.query(
+            models_v2.IPAvailabilityRange.allocation_pool_id,
+            models_v2.IPAvailabilityRange.first_ip,
+            models_v2.IPAvailabilityRange.last_ip).join(
+                models_v2.IPAllocationPool)
+        for subnet in subnets:
+            for _attempt in range(RANDOM_IP_ATTEMPTS):
+                ranges = range_qry.filter(
+                    models_v2.IPAllocationPool.subnet_id ==
+                    subnet['id']).all()
+                if not ranges:
+                    LOG.debug(_("All IPs from subnet %(subnet_id)s "
+                                "(%(cidr)s) allocated"),
+                              {'subnet_id': subnet['id'],
+                               'cidr': subnet['cidr']})
+                    break
+                pool_id, first_ip, last_ip = random.choice(ranges)
+                first = netaddr.IPAddress(first_ip)
+                last = netaddr.IPAddress(last_ip)
+                if len(ranges) < RANDOM_IP_RANGES:
+                    ip = netaddr.IPAddress(
+                        random.randint(int(first), int(last)), first.version)
+                else:
+                    ip = first
+                if NeutronDbPluginV2._remove_ip_from_range(
+                        context, pool_id, first, last, ip):
+                    LOG.debug(_("Allocated IP - %(ip_address)s from "
+                                "%(first_ip)s to %(last_ip)s"),
+                              {'ip_address': ip, 'first_ip': first_ip,
+                               'last_ip': last_ip})
+                    return {'ip_address': str(ip), 'subnet_id': subnet['id']}
+                LOG.debug(_("Availability range %(first_ip)s to %(last_ip)s "
+                            "changed concurrently"),
+                          {'first_ip': first_ip, 'last_ip': last_ip})
+        raise n_exc.IpAddressGenerationFailure(net_id=subnets[0]['network_id'])
+
+    @staticmethod
+    def _remove_ip_from_range(context, pool_id, first, last, ip):
+        """Remove an IP address from an availability range if unchanged.
+
+        Return False if the range does not exist anymore.
+        """
+        range_qry = context.session.query(
+            models_v2.IPAvailabilityRange).filter_by(
+                allocation_pool_id=pool_id,
+                first_ip=str(first),
+                last_ip=str(last))
+        if first == last:
+            return bool(range_qry.delete(synchronize_session=False))
+        if ip == first:
+            return bool(range_qry.update({'first_ip': str(ip + 1)},
+                                         synchronize_session=False))
+        if not range_qry.update({'last_ip': str(ip - 1)},
+                                synchronize_session=False):
+            return False
+        if ip != last:
+            # Split into two ranges
+            context.session.add(models_v2.IPAvailabilityRange(
+                allocation_pool_id=pool_id,
+                first_ip=str(ip + 1),
+                last_ip=str(last)))
+        return True
+
+    @staticmethod
+    def _get_free_ranges(first, last, allocations):
+        """Yield the (first, last) ranges of free integers in [first, last].
+
+        allocations is a sorted list of the integers in use.
+        """
+        for ip in allocations[bisect.bisect_left(allocations, first):]:
+            if ip > last:
+                break
+            if ip > first:
+                yield first, ip - 1
+            first = max(first, ip + 1)
+        if first <= last:
+            yield first, last
+
     @staticmethod
     def _rebuild_availability_ranges(context, subnets):
         ip_qry = context.session.query(
@@ -414,36 +744,26 @@ class NeutronDbPluginV2(neutron_plugin_base_v2.NeutronPluginBaseV2,
             LOG.debug(_("Rebuilding availability ranges for subnet %s")
                       % subnet)
 
-            # Create a set of all currently allocated addresses
+            # Sort the currently allocated addresses, the addresses of the
+            # pools are not expanded.
             ip_qry_results = ip_qry.filter_by(subnet_id=subnet['id'])
-            allocations = netaddr.IPSet([netaddr.IPAddress(i['ip_address'])
-                                        for i in ip_qry_results])
+            allocations = sorted(int(netaddr.IPAddress(i['ip_address']))
+                                 for i in ip_qry_results)
 
             for pool in pool_qry.filter_by(subnet_id=subnet['id']):
-                # Create a set of all addresses in the pool
-                poolset = netaddr.IPSet(netaddr.iter_iprange(pool['first_ip'],
-                                                             pool['last_ip']))
-
-                # Use set difference to find free addresses in the pool
-                available = poolset - allocations
-
-                # Generator compacts an ip set into contiguous ranges
-                def ipset_to_ranges(ipset):
-                    first, last = None, None
-                    for cidr in ipset.iter_cidrs():
-                        if last and last + 1 != cidr.first:
-                            yield netaddr.IPRange(first, last)
-                            first = None
-                        first, last = first if first else cidr.first, cidr.last
-                    if first:
-                        yield netaddr.IPRange(first, last)
+                pool_first = netaddr.IPAddress(pool['first_ip'])
+                pool_last = netaddr.IPAddress(pool['last_ip'])
+                free_ranges = NeutronDbPluginV2._get_free_ranges(
+                    int(pool_first), int(pool_last), allocations)
 
                 # Write the ranges to the db
-                for range in ipset_to_ranges(available):
+                for first, last in free_ranges:
                     available_range = models_v2.IPAvailabilityRange(
                         allocation_pool_id=pool['id'],
-                        first_ip=str(netaddr.IPAddress(range.first)),
-                        last_ip=str(netaddr.IPAddress(range.last)))
+                        first_ip=str(netaddr.IPAddress(first,
+                                                       pool_first.version)),
+                        last_ip=str(netaddr.IPAddress(last,
+                                                      pool_first.version)))
                     context.session.add(available_range)
 
     @staticmethod
@@ -694,7 +1014,9 @@ class NeutronDbPluginV2(neutron_plugin_base_v2.NeutronPluginBaseV2,
             version_subnets = [v4, v6]
             for subnets in version_subnets:
                 if subnets:
-                    result = NeutronDbPluginV2._generate_ip(context, subnets)
+                    result = (
+                        NeutronDbPluginV2._get_reserved_ip(context, subnets)
+                        or NeutronDbPluginV2._generate_ip(context, subnets))
                     ips.append({'ip_address': result['ip_address'],
                                 'subnet_id': result['subnet_id']})
         return ips
@@ -1393,7 +1715,16 @@ class NeutronDbPluginV2(neutron_plugin_base_v2.NeutronPluginBaseV2,
                                           filters=filters)
 
     def create_port_bulk(self, context, ports):
-        return self._create_bulk('port', context, ports)
+        # Generate the MAC addresses of the ports with a few queries
+        self._reserve_macs(context, ports['ports'])
+        try:
+            with context.session.begin(subtransactions=True):
+                # and their IP addresses by blocks
+                self._reserve_ips(context, ports['ports'])
+                return self._create_bulk('port', context, ports)
+        finally:
+            self._release_macs(context)
+            self._release_ips(context)
 
     def create_port(self, context, port):
         p = port['port']
@@ -1574,11 +1905,18 @@ class NeutronDbPluginV2(neutron_plugin_base_v2.NeutronPluginBaseV2,
                   sorts=None, limit=None, marker=None,
                   page_reverse=False):
         marker_obj = self._get_marker_obj(context, 'port', limit, marker)
+        # Filtering on fixed IPs joins the allocations, which gives several
+        # rows for a port with more than one matching IP
+        columns = None
+        if not (filters and 'fixed_ips' in filters):
+            columns = self._get_plain_columns(models_v2.Port, fields)
         query = self._get_ports_query(context, filters=filters,
                                       sorts=sorts, limit=limit,
                                       marker_obj=marker_obj,
                                       page_reverse=page_reverse)
-        items = [self._make_port_dict(c, fields) for c in query]
+        items = self._get_collection_items(query, models_v2.Port,
+                                           self._make_port_dict, fields,
+                                           columns)
         if limit and page_reverse:
             items.reverse()
         return items
@@ -1623,3 +1961,11 @@ class NeutronDbPluginV2(neutron_plugin_base_v2.NeutronPluginBaseV2,
                             device_id=device_id)
                 if tenant_id != router['tenant_id']:
                     raise n_exc.DeviceIDNotOwnedByTenant(device_id=device_id)
+
+
+# One-to-many relationships of the core resources are loaded separately for
+# collections. Mixins register those they add to the models.
+CommonDbMixin.register_collection_loaders(models_v2.Network, ['subnets'])
+CommonDbMixin.register_collection_loaders(
+    models_v2.Subnet, ['allocation_pools', 'dns_nameservers', 'routes'])
+CommonDbMixin.register_collection_loaders(models_v2.Port, ['fixed_ips'])
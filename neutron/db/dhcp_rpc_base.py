@@ -15,11 +15,13 @@
 
 from oslo.config import cfg
 from oslo.db import exception as db_exc
+import sqlalchemy as sa
 
 from neutron.api.v2 import attributes
 from neutron.common import constants
 from neutron.common import exceptions as n_exc
 from neutron.common import utils
+from neutron.db import models_v2
 from neutron.extensions import portbindings
 from neutron import manager
 from neutron.openstack.common import excutils
@@ -33,15 +35,37 @@ class DhcpRpcCallbackMixin(object):
     """A mix-in that enable DHCP agent support in plugin implementations."""
 
     def _get_active_networks(self, context, **kwargs):
-        """Retrieve and return a list of the active networks."""
+        """Retrieve and return a list of the active networks.
+
+        When limit is given, at most limit networks following the one with
+        id marker are returned, sorted by id.
+        """
         host = kwargs.get('host')
+        limit = kwargs.get('limit')
+        marker = kwargs.get('marker')
         plugin = manager.NeutronManager.get_plugin()
         if utils.is_extension_supported(
             plugin, constants.DHCP_AGENT_SCHEDULER_EXT_ALIAS):
-            if cfg.CONF.network_auto_schedule:
+            # Networks are requested in chunks after the first one, only
+            # schedule them once per synchronization
+            if cfg.CONF.network_auto_schedule and not marker:
                 plugin.auto_schedule_networks(context, host)
+            if limit:
+                return plugin.list_active_networks_on_active_dhcp_agent(
+                    context, host, limit=limit, marker=marker)
             nets = plugin.list_active_networks_on_active_dhcp_agent(
                 context, host)
+        elif limit:
+            query = context.session.query(models_v2.Network.id)
+            query = query.filter(models_v2.Network.admin_state_up == sa.true())
+            if marker:
+                query = query.filter(models_v2.Network.id > marker)
+            query = query.order_by(models_v2.Network.id).limit(limit)
+            net_ids = [item[0] for item in query]
+            if not net_ids:
+                return []
+            nets = plugin.get_networks(context, filters={'id': net_ids})
+            nets.sort(key=lambda network: network['id'])
         else:
             filters = dict(admin_state_up=[True])
             nets = plugin.get_networks(context, filters=filters)
@@ -87,21 +111,35 @@ class DhcpRpcCallbackMixin(object):
         return [net['id'] for net in nets]
 
     def get_active_networks_info(self, context, **kwargs):
-        """Returns all the networks/subnets/ports in system."""
+        """Returns all the networks/subnets/ports in system.
+
+        When limit is given, networks are sorted by id and at most limit
+        networks following the one with id marker are returned, so that the
+        networks can be retrieved in several calls.
+        """
         host = kwargs.get('host')
-        LOG.debug(_('get_active_networks_info from %s'), host)
+        limit = kwargs.get('limit')
+        marker = kwargs.get('marker')
+        LOG.debug(_('get_active_networks_info from %(host)s, limit '
+                    '%(limit)s, marker %(marker)s'),
+                  {'host': host, 'limit': limit, 'marker': marker})
         networks = self._get_active_networks(context, **kwargs)
-        plugin = manager.NeutronManager.get_plugin()
-        filters = {'network_id': [network['id'] for network in networks]}
-        ports = plugin.get_ports(context, filters=filters)
-        filters['enable_dhcp'] = [True]
-        subnets = plugin.get_subnets(context, filters=filters)
+        if not networks:
+            return []
 
+        plugin = manager.NeutronManager.get_plugin()
+        networks_by_id = {}
         for network in networks:
-            network['subnets'] = [subnet for subnet in subnets
-                                  if subnet['network_id'] == network['id']]
-            network['ports'] = [port for port in ports
-                                if port['network_id'] == network['id']]
+            network['subnets'] = []
+            network['ports'] = []
+            networks_by_id[network['id']] = network
+        network_ids = list(networks_by_id)
+        for port in plugin.get_ports(context,
+                                     filters={'network_id': network_ids}):
+            networks_by_id[port['network_id']]['ports'].append(port)
+        filters = {'network_id': network_ids, 'enable_dhcp': [True]}
+        for subnet in plugin.get_subnets(context, filters=filters):
+            networks_by_id[subnet['network_id']]['subnets'].append(subnet)
 
         return networks
 
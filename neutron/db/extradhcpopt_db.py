@@ -125,3 +125,5 @@ class ExtraDhcpOptMixin(object):
 
     db_base_plugin_v2.NeutronDbPluginV2.register_dict_extend_funcs(
         attributes.PORTS, ['_extend_port_dict_extra_dhcp_opt'])
+    db_base_plugin_v2.NeutronDbPluginV2.register_collection_loaders(
+        models_v2.Port, ['dhcp_opts'])
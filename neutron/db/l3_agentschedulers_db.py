@@ -27,6 +27,9 @@ from neutron.db import model_base
 from neutron.db import models_v2
 from neutron.extensions import l3agentscheduler
 
+# Number of routers whose sync data is queried at once
+SYNC_DATA_CHUNK_SIZE = 256
+
 
 L3_AGENTS_SCHEDULER_OPTS = [
     cfg.StrOpt('router_scheduler_driver',
@@ -153,8 +156,7 @@ class L3AgentSchedulerDbMixin(l3agentscheduler.L3AgentSchedulerPluginBase,
         else:
             return {'routers': []}
 
-    def list_active_sync_routers_on_active_l3_agent(
-            self, context, host, router_ids):
+    def list_router_ids_on_host(self, context, host, router_ids=None):
         agent = self._get_agent_by_type_and_host(
             context, constants.AGENT_TYPE_L3, host)
         if not agent.admin_state_up:
@@ -163,17 +165,21 @@ class L3AgentSchedulerDbMixin(l3agentscheduler.L3AgentSchedulerPluginBase,
         query = query.filter(
             RouterL3AgentBinding.l3_agent_id == agent.id)
 
-        if not router_ids:
-            pass
-        else:
+        if router_ids:
             query = query.filter(
                 RouterL3AgentBinding.router_id.in_(router_ids))
-        router_ids = [item[0] for item in query]
-        if router_ids:
-            return self.get_sync_data(context, router_ids=router_ids,
-                                      active=True)
-        else:
-            return []
+        return [item[0] for item in query]
+
+    def list_active_sync_routers_on_active_l3_agent(
+            self, context, host, router_ids):
+        router_ids = self.list_router_ids_on_host(context, host, router_ids)
+        # Each chunk is queried in its own transaction
+        routers = []
+        for i in range(0, len(router_ids), SYNC_DATA_CHUNK_SIZE):
+            routers.extend(self.get_sync_data(
+                context, router_ids=router_ids[i:i + SYNC_DATA_CHUNK_SIZE],
+                active=True))
+        return routers
 
     def get_l3_agents_hosting_routers(self, context, router_ids,
                                       admin_state_up=None,
@@ -192,10 +198,8 @@ class L3AgentSchedulerDbMixin(l3agentscheduler.L3AgentSchedulerPluginBase,
                                   admin_state_up))
         l3_agents = [binding.l3_agent for binding in query]
         if active is not None:
-            l3_agents = [l3_agent for l3_agent in
-                         l3_agents if not
-                         agents_db.AgentDbMixin.is_agent_down(
-                             l3_agent['heartbeat_timestamp'])]
+            l3_agents = [l3_agent for l3_agent in l3_agents
+                         if l3_agent.is_active]
         return l3_agents
 
     def _get_l3_bindings_hosting_routers(self, context, router_ids):
@@ -13,6 +13,8 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import hashlib
+
 from oslo.config import cfg
 
 from neutron.common import constants
@@ -61,10 +63,73 @@ class L3RpcCallbackMixin(object):
         if utils.is_extension_supported(
             plugin, constants.PORT_BINDING_EXT_ALIAS):
             self._ensure_host_set_on_ports(context, plugin, host, routers)
+        for router in routers:
+            router['revision'] = self._get_router_revision(router)
         LOG.debug(_("Routers returned to l3 agent:\n %s"),
                   jsonutils.dumps(routers, indent=5))
         return routers
 
+    def get_router_ids(self, context, **kwargs):
+        """Return the ids of the routers to sync to a specific agent.
+
+        The agent then fetches the routers themselves in chunks with
+        sync_routers, instead of building one reply for all of them.
+
+        @param context: contain user information
+        @param kwargs: host
+        @return: a list of router ids
+        """
+        host = kwargs.get('host')
+        context = neutron_context.get_admin_context()
+        l3plugin = manager.NeutronManager.get_service_plugins()[
+            plugin_constants.L3_ROUTER_NAT]
+        if not l3plugin:
+            LOG.error(_('No plugin for L3 routing registered! Will reply '
+                        'to l3 agent with empty router id list.'))
+            return []
+        if utils.is_extension_supported(
+                l3plugin, constants.L3_AGENT_SCHEDULER_EXT_ALIAS):
+            if cfg.CONF.router_auto_schedule:
+                l3plugin.auto_schedule_routers(context, host, None)
+            return l3plugin.list_router_ids_on_host(context, host)
+        return [router['id'] for router in
+                l3plugin.get_routers(context, fields=['id'])]
+
+    def get_changed_routers(self, context, **kwargs):
+        """Sync the routers which changed since the agent got them.
+
+        @param context: contain user information
+        @param kwargs: host, router_revisions, a dict of the revision of
+                       each router known by the agent, None if unknown
+        @return: a dict with the routers whose revision changed and the
+                 ids of the unchanged ones. The routers in neither list
+                 are not to be hosted by the agent anymore.
+        """
+        revisions = kwargs.get('router_revisions')
+        if not revisions:
+            return {'routers': [], 'unchanged': []}
+        routers = self.sync_routers(context, host=kwargs.get('host'),
+                                    router_ids=list(revisions))
+        changed = [router for router in routers
+                   if router['revision'] != revisions[router['id']]]
+        unchanged = [router['id'] for router in routers
+                     if router['revision'] == revisions[router['id']]]
+        return {'routers': changed, 'unchanged': unchanged}
+
+    @staticmethod
+    def _get_router_revision(router):
+        """Return a digest of the data synced for a router.
+
+        The interfaces and floating IPs are sorted, as the order they are
+        queried in does not matter to the agent.
+        """
+        router = dict(router)
+        for key in (constants.INTERFACE_KEY, constants.FLOATINGIP_KEY):
+            if key in router:
+                router[key] = sorted(router[key], key=lambda x: x['id'])
+        data = jsonutils.dumps(router, sort_keys=True)
+        return hashlib.sha1(data).hexdigest()
+
     def _ensure_host_set_on_ports(self, context, plugin, host, routers):
         for router in routers:
             LOG.debug(_("Checking router: %(id)s for host: %(host)s"),
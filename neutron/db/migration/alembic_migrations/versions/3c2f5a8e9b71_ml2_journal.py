@@ -0,0 +1,62 @@
+# Copyright 2014 OpenStack Foundation
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+#
+
+"""ml2_journal
+
+Revision ID: 3c2f5a8e9b71
+Revises: 2db5203cb7a9
+Create Date: 2014-06-16 10:21:37.512348
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '3c2f5a8e9b71'
+down_revision = '2db5203cb7a9'
+
+migration_for_plugins = [
+    'neutron.plugins.ml2.plugin.Ml2Plugin'
+]
+
+from alembic import op
+import sqlalchemy as sa
+
+from neutron.db import migration
+
+
+def upgrade(active_plugins=None, options=None):
+    if not migration.should_run(active_plugins, migration_for_plugins):
+        return
+
+    op.create_table(
+        'ml2_journal',
+        sa.Column('id', sa.Integer(), nullable=False, autoincrement=True),
+        sa.Column('driver', sa.String(length=64), nullable=False),
+        sa.Column('object_type', sa.String(length=36), nullable=False),
+        sa.Column('object_id', sa.String(length=36), nullable=False),
+        sa.Column('operation', sa.String(length=36), nullable=False),
+        sa.Column('data', sa.Text(), nullable=False),
+        sa.Column('state', sa.String(length=16), nullable=False),
+        sa.Column('retry_count', sa.Integer(), nullable=False),
+        sa.Column('next_attempt', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_ml2_journal_driver', 'ml2_journal', ['driver'])
+
+
+def downgrade(active_plugins=None, options=None):
+    if not migration.should_run(active_plugins, migration_for_plugins):
+        return
+
+    op.drop_table('ml2_journal')
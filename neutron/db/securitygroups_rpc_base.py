@@ -35,6 +35,17 @@ DIRECTION_IP_PREFIX = {'ingress': 'source_ip_prefix',
                        'egress': 'dest_ip_prefix'}
 
 
+def _unique(items):
+    """Return the items of a list without duplicates, in order."""
+    unique_items = []
+    seen = set()
+    for item in items:
+        if item not in seen:
+            seen.add(item)
+            unique_items.append(item)
+    return unique_items
+
+
 class SecurityGroupServerRpcMixin(sg_db.SecurityGroupDbMixin):
 
     def create_security_group_rule(self, context, security_group_rule):
@@ -115,18 +126,36 @@ class SecurityGroupServerRpcMixin(sg_db.SecurityGroupDbMixin):
         security_groups_provider_updated() just notifies that an event
         occurs and the plugin agent fetches the update provider
         rule in the other RPC call (security_group_rules_for_devices).
+        Only the ports of the network of the port are affected.
         """
-        if port['device_owner'] == q_const.DEVICE_OWNER_DHCP:
-            self.notifier.security_groups_provider_updated(context)
-        # For IPv6, provider rule need to be updated in case router
-        # interface is created or updated after VM port is created.
-        elif port['device_owner'] == q_const.DEVICE_OWNER_ROUTER_INTF:
-            if any(netaddr.IPAddress(fixed_ip['ip_address']).version == 6
-                   for fixed_ip in port['fixed_ips']):
-                self.notifier.security_groups_provider_updated(context)
-        else:
+        self.notify_security_groups_member_updated_bulk(context, [port])
+
+    def notify_security_groups_member_updated_bulk(self, context, ports):
+        """Notify update event of security group members for ports.
+
+        The events of all the ports are sent together: a single provider
+        update for their networks, and a single member update for their
+        security groups.
+        """
+        network_ids = []
+        security_groups = []
+        for port in ports:
+            if port['device_owner'] == q_const.DEVICE_OWNER_DHCP:
+                network_ids.append(port['network_id'])
+            # For IPv6, provider rule need to be updated in case router
+            # interface is created or updated after VM port is created.
+            elif port['device_owner'] == q_const.DEVICE_OWNER_ROUTER_INTF:
+                if any(netaddr.IPAddress(fixed_ip['ip_address']).version == 6
+                       for fixed_ip in port['fixed_ips']):
+                    network_ids.append(port['network_id'])
+            else:
+                security_groups.extend(port.get(ext_sg.SECURITYGROUPS) or [])
+        if network_ids:
+            self.notifier.security_groups_provider_updated(
+                context, network_ids=_unique(network_ids))
+        if security_groups:
             self.notifier.security_groups_member_updated(
-                context, port.get(ext_sg.SECURITYGROUPS))
+                context, _unique(security_groups))
 
 
 class SecurityGroupServerRpcCallbackMixin(object):
@@ -144,7 +173,28 @@ class SecurityGroupServerRpcCallbackMixin(object):
         :returns: port correspond to the devices with security group rules
         """
         devices = kwargs.get('devices')
+        ports = self._get_ports_for_devices(devices)
+        return self._security_group_rules_for_ports(context, ports)
+
+    def security_group_info_for_devices(self, context, **kwargs):
+        """Return security group information for each port.
+
+        Unlike security_group_rules_for_devices, the rules of each
+        security group and the IP addresses of each remote group are
+        sent once, instead of being copied into every port.
+
+        :params devices: list of devices
+        :returns: dict with
+          devices: port correspond to the devices, with the ids of their
+                   security groups and their provider rules
+          security_groups: {security_group_id: [rule, rule]}
+          sg_member_ips: {remote_group_id: {ethertype: [ip, ip]}}
+        """
+        devices = kwargs.get('devices')
+        ports = self._get_ports_for_devices(devices)
+        return self._security_group_info_for_ports(context, ports)
 
+    def _get_ports_for_devices(self, devices):
         ports = {}
         for device in devices:
             port = self.get_port_from_device(device)
@@ -153,7 +203,7 @@ class SecurityGroupServerRpcCallbackMixin(object):
             if port['device_owner'].startswith('network:'):
                 continue
             ports[port['id']] = port
-        return self._security_group_rules_for_ports(context, ports)
+        return ports
 
     def _select_rules_for_ports(self, context, ports):
         if not ports:
@@ -354,25 +404,67 @@ class SecurityGroupServerRpcCallbackMixin(object):
             self._add_ingress_ra_rule(port, ips_ra)
             self._add_ingress_dhcp_rule(port, ips_dhcp)
 
+    def _make_rule_dict(self, rule_in_db):
+        direction = rule_in_db['direction']
+        rule_dict = {
+            'security_group_id': rule_in_db['security_group_id'],
+            'direction': direction,
+            'ethertype': rule_in_db['ethertype'],
+        }
+        for key in ('protocol', 'port_range_min', 'port_range_max',
+                    'remote_ip_prefix', 'remote_group_id'):
+            if rule_in_db.get(key):
+                if key == 'remote_ip_prefix':
+                    direction_ip_prefix = DIRECTION_IP_PREFIX[direction]
+                    rule_dict[direction_ip_prefix] = rule_in_db[key]
+                    continue
+                rule_dict[key] = rule_in_db[key]
+        return rule_dict
+
     def _security_group_rules_for_ports(self, context, ports):
         rules_in_db = self._select_rules_for_ports(context, ports)
         for (binding, rule_in_db) in rules_in_db:
-            port_id = binding['port_id']
-            port = ports[port_id]
-            direction = rule_in_db['direction']
-            rule_dict = {
-                'security_group_id': rule_in_db['security_group_id'],
-                'direction': direction,
-                'ethertype': rule_in_db['ethertype'],
-            }
-            for key in ('protocol', 'port_range_min', 'port_range_max',
-                        'remote_ip_prefix', 'remote_group_id'):
-                if rule_in_db.get(key):
-                    if key == 'remote_ip_prefix':
-                        direction_ip_prefix = DIRECTION_IP_PREFIX[direction]
-                        rule_dict[direction_ip_prefix] = rule_in_db[key]
-                        continue
-                    rule_dict[key] = rule_in_db[key]
-            port['security_group_rules'].append(rule_dict)
+            port = ports[binding['port_id']]
+            port['security_group_rules'].append(
+                self._make_rule_dict(rule_in_db))
         self._apply_provider_rule(context, ports)
         return self._convert_remote_group_id_to_ip_prefix(context, ports)
+
+    def _security_group_info_for_ports(self, context, ports):
+        # groups without rules are sent too, so that agents drop the rules
+        # they received for them before
+        security_groups = {}
+        for port in ports.values():
+            for security_group_id in port.get(ext_sg.SECURITYGROUPS, []):
+                security_groups[security_group_id] = {}
+        for (binding, rule_in_db) in self._select_rules_for_ports(context,
+                                                                  ports):
+            port = ports[binding['port_id']]
+            remote_group_id = rule_in_db['remote_group_id']
+            if (remote_group_id and remote_group_id not in
+                    port['security_group_source_groups']):
+                port['security_group_source_groups'].append(remote_group_id)
+            # the rules of a group are selected once for each of its ports
+            security_group_id = rule_in_db['security_group_id']
+            rules = security_groups.setdefault(security_group_id, {})
+            if rule_in_db['id'] not in rules:
+                rules[rule_in_db['id']] = self._make_rule_dict(rule_in_db)
+        # provider rules do not belong to any group, they stay in the ports
+        self._apply_provider_rule(context, ports)
+
+        remote_group_ids = set()
+        for port in ports.values():
+            remote_group_ids.update(port['security_group_source_groups'])
+        ips = self._select_ips_for_remote_group(context, remote_group_ids)
+        sg_member_ips = {}
+        for remote_group_id, group_ips in ips.items():
+            member_ips = {q_const.IPv4: [], q_const.IPv6: []}
+            for ip in group_ips:
+                ethertype = 'IPv%s' % netaddr.IPNetwork(ip).version
+                member_ips[ethertype].append(ip)
+            sg_member_ips[remote_group_id] = member_ips
+        return {'devices': ports,
+                'security_groups': dict(
+                    (security_group_id, rules.values())
+                    for security_group_id, rules in security_groups.items()),
+                'sg_member_ips': sg_member_ips}
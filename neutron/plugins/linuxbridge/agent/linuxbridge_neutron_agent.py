@@ -777,16 +777,22 @@ class LinuxBridgeNeutronAgentRPC(sg_rpc.SecurityGroupAgentRpcMixin):
             'configurations': configurations,
             'agent_type': constants.AGENT_TYPE_LINUXBRIDGE,
             'start_flag': True}
+        self.metrics_report = agent_rpc.MetricsReport()
 
         # stores received port_updates for processing by the main loop
         self.updated_devices = set()
-        self.setup_rpc(interface_mappings.values())
+        # The firewall is initialized first, as _report_state() may run as
+        # soon as the RPC is set up
         self.init_firewall()
+        self.setup_rpc(interface_mappings.values())
 
     def _report_state(self):
         try:
             devices = len(self.br_mgr.get_tap_devices())
             self.agent_state.get('configurations')['devices'] = devices
+            if self.metrics_report.due():
+                self.agent_state.get('configurations')[
+                    'firewall_refreshes'] = dict(self.firewall_refresh_counts)
             self.state_rpc.report_state(self.context,
                                         self.agent_state)
             self.agent_state.pop('start_flag', None)
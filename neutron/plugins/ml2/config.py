@@ -30,6 +30,28 @@ ml2_opts = [
                 help=_("An ordered list of networking mechanism driver "
                        "entrypoints to be loaded from the "
                        "neutron.ml2.mechanism_drivers namespace.")),
+    cfg.ListOpt('journal_mechanism_drivers',
+                default=[],
+                help=_("Mechanism drivers whose postcommit operations are "
+                       "recorded in a journal within the transaction and "
+                       "processed by a background worker, instead of "
+                       "being called during the API request.")),
+    cfg.IntOpt('journal_batch_size', default=50,
+               help=_("Maximum number of journal entries processed at once "
+                      "by a mechanism driver.")),
+    cfg.IntOpt('journal_interval', default=5,
+               help=_("Seconds between two checks of the journal by the "
+                      "worker, which is also woken up by new entries.")),
+    cfg.IntOpt('journal_retry_interval', default=2,
+               help=_("Seconds before the first retry of journal entries "
+                      "which failed, doubled on each retry.")),
+    cfg.IntOpt('journal_max_retries', default=8,
+               help=_("Number of failures after which a journal entry is "
+                      "marked as failed and no longer processed.")),
+    cfg.IntOpt('journal_processing_timeout', default=300,
+               help=_("Seconds after which journal entries claimed by a "
+                      "worker which did not process them may be claimed "
+                      "again.")),
 ]
 
 
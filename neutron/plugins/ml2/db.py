@@ -13,6 +13,7 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import sqlalchemy as sa
 from sqlalchemy.orm import exc
 
 from neutron.db import api as db_api
@@ -27,6 +28,9 @@ from neutron.plugins.ml2 import models
 
 LOG = log.getLogger(__name__)
 
+# Maximum number of networks whose segments are fetched by a single query
+SEGMENTS_QUERY_CHUNK_SIZE = 500
+
 
 def add_network_segment(session, network_id, segment):
     with session.begin(subtransactions=True):
@@ -56,6 +60,30 @@ def get_network_segments(session, network_id):
                 for record in records]
 
 
+def get_networks_segments(session, network_ids):
+    """Return a dict mapping each of the given networks to its segments.
+
+    The segments are fetched by chunks of SEGMENTS_QUERY_CHUNK_SIZE
+    networks, to keep the queries within the limits of the databases.
+    """
+    segments = dict((network_id, []) for network_id in network_ids)
+    if not network_ids:
+        return segments
+    network_ids = list(segments)
+    with session.begin(subtransactions=True):
+        for i in range(0, len(network_ids), SEGMENTS_QUERY_CHUNK_SIZE):
+            chunk = network_ids[i:i + SEGMENTS_QUERY_CHUNK_SIZE]
+            records = (session.query(models.NetworkSegment).
+                       filter(models.NetworkSegment.network_id.in_(chunk)))
+            for record in records:
+                segments[record.network_id].append(
+                    {api.ID: record.id,
+                     api.NETWORK_TYPE: record.network_type,
+                     api.PHYSICAL_NETWORK: record.physical_network,
+                     api.SEGMENTATION_ID: record.segmentation_id})
+        return segments
+
+
 def ensure_port_binding(session, port_id):
     with session.begin(subtransactions=True):
         try:
@@ -87,6 +115,60 @@ def get_port(session, port_id):
             return
 
 
+def ensure_port_bindings(session, port_ids):
+    """Return a dict of the bindings of the given ports.
+
+    Like ensure_port_binding, an unbound binding is created for each port
+    which does not have one yet.
+    """
+    with session.begin(subtransactions=True):
+        bindings = {}
+        if port_ids:
+            records = (session.query(models.PortBinding).
+                       filter(models.PortBinding.port_id.in_(port_ids)))
+            bindings = dict((record.port_id, record) for record in records)
+        for port_id in set(port_ids) - set(bindings):
+            record = models.PortBinding(
+                port_id=port_id,
+                vif_type=portbindings.VIF_TYPE_UNBOUND)
+            session.add(record)
+            bindings[port_id] = record
+        return bindings
+
+
+def get_ports(session, port_ids):
+    """Get port records for update within transaction.
+
+    As with get_port, each id may be a prefix of the actual port id. The
+    returned dict maps each requested id to its port; ids matching no port
+    or several ports are left out.
+    """
+    if not port_ids:
+        return {}
+    with session.begin(subtransactions=True):
+        full_ids = set(port_id for port_id in port_ids
+                       if uuidutils.is_uuid_like(port_id))
+        prefixes = set(port_ids) - full_ids
+        criteria = [models_v2.Port.id.startswith(prefix)
+                    for prefix in prefixes]
+        if full_ids:
+            criteria.append(models_v2.Port.id.in_(full_ids))
+        records = (session.query(models_v2.Port).
+                   filter(sa.or_(*criteria)).all())
+
+        ports = dict((record.id, record) for record in records
+                     if record.id in full_ids)
+        for port_id in prefixes:
+            matches = [record for record in records
+                       if record.id.startswith(port_id)]
+            if len(matches) == 1:
+                ports[port_id] = matches[0]
+            elif matches:
+                LOG.error(_("Multiple ports have port_id starting with %s"),
+                          port_id)
+        return ports
+
+
 def get_port_from_device_mac(device_mac):
     LOG.debug(_("get_port_from_device_mac() called for mac %s"), device_mac)
     session = db_api.get_session()
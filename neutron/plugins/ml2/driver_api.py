@@ -522,6 +522,37 @@ class MechanismDriver(object):
         """
         pass
 
+    def create_port_bulk_precommit(self, contexts):
+        """Allocate resources for the new ports of a bulk request.
+
+        :param contexts: list of PortContext instances describing the
+        ports.
+
+        Called inside transaction context on session, once all the ports
+        of the request have been created in the database. By default,
+        create_port_precommit is called for each of them. Drivers which
+        can handle the ports together may override this method. Raising
+        an exception will result in a rollback of the current
+        transaction.
+        """
+        for context in contexts:
+            self.create_port_precommit(context)
+
+    def create_port_bulk_postcommit(self, contexts):
+        """Create the ports of a bulk request.
+
+        :param contexts: list of PortContext instances describing the
+        ports.
+
+        Called after the transaction completes. By default,
+        create_port_postcommit is called for each of the ports. Drivers
+        which can create the ports with fewer calls to a backend may
+        override this method. Raising an exception will result in the
+        deletion of all the ports of the request.
+        """
+        for context in contexts:
+            self.create_port_postcommit(context)
+
     def update_port_precommit(self, context):
         """Update resources of a port.
 
@@ -595,3 +626,27 @@ class MechanismDriver(object):
         details.
         """
         pass
+
+    def process_journal_entries(self, context, object_type, operation,
+                                resources):
+        """Process postcommit operations recorded in the journal.
+
+        :param context: MechanismDriverContext giving the plugin and an
+        admin plugin context
+        :param object_type: 'network', 'subnet' or 'port'
+        :param operation: 'create', 'update' or 'delete'
+        :param resources: list of the dictionaries of the resources, as
+        given by the current property of the context of the operations
+
+        Drivers listed in the journal_mechanism_drivers option must
+        override this method, called by the journal worker instead of
+        their _postcommit methods after the transaction of the
+        operations has completed. The resources do not depend on each
+        other, and the operations of earlier entries they depend on,
+        such as the creation of their network, have been processed. If
+        an exception is raised, all the operations are retried later,
+        so they must be idempotent. The operations still failing after
+        journal_max_retries attempts are given up, along with the later
+        ones depending on them.
+        """
+        pass
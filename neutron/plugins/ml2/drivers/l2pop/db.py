@@ -41,8 +41,8 @@ class L2populationDbMixin(base_db.CommonDbMixin):
         return configuration.get('tunneling_ip')
 
     def get_agent_uptime(self, agent):
-        return timeutils.delta_seconds(agent.started_at,
-                                       agent.heartbeat_timestamp)
+        return timeutils.delta_seconds(
+            agent.started_at, agents_db.HEARTBEATS.get_heartbeat(agent))
 
     def get_agent_tunnel_types(self, agent):
         configuration = jsonutils.loads(agent.configurations)
@@ -172,6 +172,24 @@ class OpenDaylightMechanismDriver(api.MechanismDriver):
     def create_port_postcommit(self, context):
         self.synchronize('create', ODL_PORTS, context)
 
+    def create_port_bulk_postcommit(self, contexts):
+        """Create the ports of a bulk request with a single request."""
+        context = contexts[0]
+        if self.out_of_sync:
+            self.sync_full(context)
+            return
+        dbcontext = context._plugin_context
+        port_ids = [port_context.current['id'] for port_context in contexts]
+        ports = context._plugin.get_ports(dbcontext,
+                                          filters={'id': port_ids})
+        if not ports:
+            return
+        try:
+            self.create_resources(ODL_PORT, ports, context)
+        except Exception:
+            with excutils.save_and_reraise_exception():
+                self.out_of_sync = True
+
     def update_port_postcommit(self, context):
         self.synchronize('update', ODL_PORTS, context)
 
@@ -318,6 +336,43 @@ class OpenDaylightMechanismDriver(api.MechanismDriver):
                                   self.create_object_map[object_type],
                                   self.update_object_map[object_type])
 
+    def create_resources(self, object_type, resources, context):
+        """Create resources in ODL with a single request."""
+        dbcontext = context._plugin_context
+        collection_name = object_type + 's'
+        for resource in resources:
+            self.create_object_map[collection_name](self, resource,
+                                                    context, dbcontext)
+        if len(resources) == 1:
+            obj = {object_type: resources[0]}
+        else:
+            obj = {collection_name: resources}
+        # 400 errors are returned if an object exists, which we ignore.
+        self.sendjson('post', collection_name, obj, [400])
+
+    def process_journal_entries(self, context, object_type, operation,
+                                resources):
+        """Synchronize a batch of journaled records to ODL.
+
+        Created records are sent in a single request.
+        """
+        if self.out_of_sync:
+            self.sync_full(context)
+        dbcontext = context._plugin_context
+        collection_name = object_type + 's'
+        if operation == 'create':
+            self.create_resources(object_type, resources, context)
+            return
+        for resource in resources:
+            urlpath = collection_name + '/' + resource['id']
+            if operation == 'delete':
+                # 404 errors are returned if an object was already deleted.
+                self.sendjson('delete', urlpath, None, [404])
+            else:
+                self.update_object_map[collection_name](self, resource,
+                                                        context, dbcontext)
+                self.sendjson('put', urlpath, {object_type: resource}, [400])
+
     def add_security_groups(self, context, dbcontext, port):
         """Populate the 'security_groups' field with entire records."""
         groups = [context._plugin.get_security_group(dbcontext, sg)
@@ -0,0 +1,297 @@
+# Copyright (c) 2014 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import datetime
+
+import eventlet
+from oslo.config import cfg
+
+from neutron import context as n_context
+from neutron import manager
+from neutron.openstack.common import jsonutils
+from neutron.openstack.common import log
+from neutron.openstack.common import timeutils
+from neutron.plugins.ml2 import driver_context
+from neutron.plugins.ml2 import models
+
+LOG = log.getLogger(__name__)
+
+PENDING = 'pending'
+PROCESSING = 'processing'
+FAILED = 'failed'
+
+# The entries considered to select a batch, in number of batches. Entries
+# further in the journal wait for the next selection.
+SELECTION_WINDOW = 10
+
+
+def get_dependencies(object_type, resource):
+    """Return the ids of the resources a resource depends on."""
+    if object_type == 'subnet':
+        return set([resource['network_id']])
+    if object_type == 'port':
+        dependencies = set(ip['subnet_id']
+                           for ip in resource.get('fixed_ips') or [])
+        dependencies.add(resource['network_id'])
+        return dependencies
+    return set()
+
+
+class _ResourceSet(object):
+    """The resources of journal entries and the ones they depend on."""
+
+    def __init__(self):
+        self.objects = set()
+        self.dependencies = set()
+
+    def add(self, object_id, dependencies):
+        self.objects.add(object_id)
+        self.dependencies |= dependencies
+
+    def conflicts(self, object_id, dependencies):
+        """Whether an entry must be processed after those of the set."""
+        return (object_id in self.objects or
+                object_id in self.dependencies or
+                not self.objects.isdisjoint(dependencies))
+
+
+def select_batch(entries, now, batch_size):
+    """Select the next journal entries to process together.
+
+    :param entries: list of (JournalEntry, resource dict) tuples, ordered
+    by entry id
+
+    The entries selected are ready, are for the operation and object type
+    of the first of them, and depend neither on each other nor on an
+    earlier entry which is not selected, so that they can be processed
+    together and in any order.
+    """
+    batch = []
+    selected = _ResourceSet()
+    waiting = _ResourceSet()
+    for entry, resource in entries:
+        dependencies = get_dependencies(entry.object_type, resource)
+        if ((entry.next_attempt is None or entry.next_attempt <= now) and
+            (not batch or
+             (entry.object_type, entry.operation) ==
+             (batch[0][0].object_type, batch[0][0].operation)) and
+            not waiting.conflicts(entry.object_id, dependencies) and
+            not selected.conflicts(entry.object_id, dependencies)):
+            batch.append((entry, resource))
+            selected.add(entry.object_id, dependencies)
+            if len(batch) == batch_size:
+                break
+        else:
+            waiting.add(entry.object_id, dependencies)
+    return batch
+
+
+def select_dependents(failed, entries):
+    """Select the journal entries to give up along with failed ones.
+
+    :param failed: list of (JournalEntry, resource dict) tuples given up
+    :param entries: list of (JournalEntry, resource dict) tuples following
+    them, ordered by entry id
+
+    The resources whose creation failed do not exist for the driver, so
+    the later operations on them and the creation of the resources
+    depending on them, such as the ports of a network, are given up too.
+    """
+    missing = set(entry.object_id for entry, resource in failed
+                  if entry.operation == 'create')
+    dependents = []
+    for entry, resource in entries:
+        dependencies = get_dependencies(entry.object_type, resource)
+        if ((entry.object_id in missing or
+             entry.operation == 'create' and
+             not missing.isdisjoint(dependencies))):
+            dependents.append((entry, resource))
+            if entry.operation == 'create':
+                missing.add(entry.object_id)
+    return dependents
+
+
+class Journal(object):
+    """Postcommit operations of mechanism drivers processed in background.
+
+    The operations are recorded in the ml2_journal table within the
+    transaction of the plugin, for each of the drivers. A worker
+    greenthread, started with the plugin, passes them in batches
+    to the process_journal_entries method of the drivers. Every server
+    process has a worker, the entries are claimed in the database before
+    being processed.
+    """
+
+    def __init__(self, drivers):
+        # Ordered list of the mechanism drivers using the journal
+        self.drivers = drivers
+        self._worker = None
+        self._wakeup = eventlet.event.Event()
+
+    def record(self, context, object_type, operation):
+        """Record an operation in the transaction of its driver context."""
+        resource = context.current
+        data = jsonutils.dumps(resource)
+        session = context._plugin_context.session
+        for driver in self.drivers:
+            session.add(models.JournalEntry(driver=driver.name,
+                                            object_type=object_type,
+                                            object_id=resource['id'],
+                                            operation=operation,
+                                            data=data,
+                                            state=PENDING))
+
+    def start(self):
+        """Start the worker, processing the entries left by a restart."""
+        if not self._worker:
+            self._worker = eventlet.spawn(self._run)
+
+    def wake(self):
+        """Have the worker process the journal, once committed."""
+        self.start()
+        if not self._wakeup.ready():
+            self._wakeup.send()
+
+    def _run(self):
+        while True:
+            with eventlet.Timeout(cfg.CONF.ml2.journal_interval, False):
+                self._wakeup.wait()
+            self._wakeup = eventlet.event.Event()
+            try:
+                self.process(n_context.get_admin_context())
+            except Exception:
+                LOG.exception(_("Failed processing the ML2 journal"))
+
+    def process(self, context):
+        """Process the ready entries of the journal.
+
+        Returns the number of entries processed successfully. The entries
+        of a driver are no longer processed once one of its batches
+        failed.
+        """
+        processed = 0
+        for driver in self.drivers:
+            while True:
+                batch = self._claim_batch(context.session, driver.name)
+                if not batch:
+                    break
+                if not self._process_batch(context, driver, batch):
+                    break
+                processed += len(batch)
+        return processed
+
+    def _claim_batch(self, session, driver_name):
+        now = timeutils.utcnow()
+        batch_size = cfg.CONF.ml2.journal_batch_size
+        query = (session.query(models.JournalEntry).
+                 filter(models.JournalEntry.driver == driver_name,
+                        models.JournalEntry.state != FAILED).
+                 order_by(models.JournalEntry.id).
+                 limit(batch_size * SELECTION_WINDOW).
+                 populate_existing())
+        entries = [(entry, jsonutils.loads(entry.data)) for entry in query]
+        batch = select_batch(entries, now, batch_size)
+
+        # Another worker may have claimed some of the entries since they
+        # were read, changing their next attempt.
+        claimed = []
+        expiry = now + datetime.timedelta(
+            seconds=cfg.CONF.ml2.journal_processing_timeout)
+        with session.begin(subtransactions=True):
+            for entry, resource in batch:
+                count = (session.query(models.JournalEntry).
+                         filter_by(id=entry.id,
+                                   next_attempt=entry.next_attempt).
+                         update({'state': PROCESSING,
+                                 'next_attempt': expiry},
+                                synchronize_session=False))
+                if count:
+                    claimed.append((entry, resource))
+        return claimed
+
+    def _process_batch(self, context, driver, batch):
+        object_type = batch[0][0].object_type
+        operation = batch[0][0].operation
+        mech_context = driver_context.MechanismDriverContext(
+            manager.NeutronManager.get_plugin(), context)
+        try:
+            driver.obj.process_journal_entries(
+                mech_context, object_type, operation,
+                [resource for entry, resource in batch])
+        except Exception:
+            LOG.exception(_("Mechanism driver '%(name)s' failed processing "
+                            "%(count)d journal entries to %(operation)s "
+                            "%(object_type)ss"),
+                          {'name': driver.name, 'count': len(batch),
+                           'operation': operation,
+                           'object_type': object_type})
+            self._retry_later(context.session, batch)
+            return False
+
+        ids = [entry.id for entry, resource in batch]
+        with context.session.begin(subtransactions=True):
+            (context.session.query(models.JournalEntry).
+             filter(models.JournalEntry.id.in_(ids)).
+             delete(synchronize_session=False))
+        return True
+
+    def _log_given_up(self, entry):
+        LOG.error(_("Giving up on journal entry %(id)s of mechanism driver "
+                    "'%(driver)s' to %(operation)s %(object_type)s "
+                    "%(object_id)s"),
+                  {'id': entry.id, 'driver': entry.driver,
+                   'operation': entry.operation,
+                   'object_type': entry.object_type,
+                   'object_id': entry.object_id})
+
+    def _give_up_dependents(self, session, failed):
+        """Give up the pending entries depending on failed ones."""
+        driver_name = failed[0][0].driver
+        query = (session.query(models.JournalEntry).
+                 filter(models.JournalEntry.driver == driver_name,
+                        models.JournalEntry.state == PENDING,
+                        models.JournalEntry.id > min(
+                            entry.id for entry, resource in failed)).
+                 order_by(models.JournalEntry.id))
+        entries = [(entry, jsonutils.loads(entry.data)) for entry in query]
+        for entry, resource in select_dependents(failed, entries):
+            self._log_given_up(entry)
+            (session.query(models.JournalEntry).
+             filter_by(id=entry.id).
+             update({'state': FAILED, 'next_attempt': None},
+                    synchronize_session=False))
+
+    def _retry_later(self, session, batch):
+        now = timeutils.utcnow()
+        failed = []
+        with session.begin(subtransactions=True):
+            for entry, resource in batch:
+                retry_count = entry.retry_count + 1
+                if retry_count >= cfg.CONF.ml2.journal_max_retries:
+                    self._log_given_up(entry)
+                    failed.append((entry, resource))
+                    values = {'state': FAILED, 'next_attempt': None}
+                else:
+                    interval = (cfg.CONF.ml2.journal_retry_interval *
+                                2 ** (retry_count - 1))
+                    values = {'state': PENDING,
+                              'next_attempt': now + datetime.timedelta(
+                                  seconds=interval)}
+                values['retry_count'] = retry_count
+                (session.query(models.JournalEntry).
+                 filter_by(id=entry.id).
+                 update(values, synchronize_session=False))
+            if failed:
+                self._give_up_dependents(session, failed)
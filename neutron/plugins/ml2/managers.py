@@ -21,6 +21,7 @@ from neutron.extensions import portbindings
 from neutron.openstack.common import log
 from neutron.plugins.ml2.common import exceptions as ml2_exc
 from neutron.plugins.ml2 import driver_api as api
+from neutron.plugins.ml2 import journal
 
 
 LOG = log.getLogger(__name__)
@@ -120,6 +121,8 @@ class MechanismManager(stevedore.named.NamedExtensionManager):
         # Ordered list of mechanism drivers, defining
         # the order in which the drivers are called.
         self.ordered_mech_drivers = []
+        # Journal of the postcommit operations of the drivers which use it
+        self.journal = None
 
         LOG.info(_("Configured mechanism driver names: %s"),
                  cfg.CONF.ml2.mechanism_drivers)
@@ -150,20 +153,67 @@ class MechanismManager(stevedore.named.NamedExtensionManager):
             driver.obj.initialize()
             self.native_bulk_support &= getattr(driver.obj,
                                                 'native_bulk_support', True)
+        self._initialize_journal(cfg.CONF.ml2.journal_mechanism_drivers)
+
+    def _initialize_journal(self, names):
+        for name in names:
+            if name not in self.mech_drivers:
+                msg = _("Journal mechanism driver '%s' is not a loaded "
+                        "mechanism driver. Service terminated!") % name
+                LOG.error(msg)
+                raise SystemExit(1)
+        if not names:
+            return
+        journal_drivers = [driver for driver in self.ordered_mech_drivers
+                           if driver.name in names]
+        base_method = api.MechanismDriver.process_journal_entries.im_func
+        for driver in journal_drivers:
+            method = getattr(type(driver.obj), 'process_journal_entries',
+                             None)
+            if getattr(method, 'im_func', base_method) is base_method:
+                msg = _("Journal mechanism driver '%s' does not implement "
+                        "process_journal_entries. Service "
+                        "terminated!") % driver.name
+                LOG.error(msg)
+                raise SystemExit(1)
+        LOG.info(_("Mechanism drivers using the journal: %s"),
+                 [driver.name for driver in journal_drivers])
+        # The drivers whose postcommit methods are still called
+        self.postcommit_drivers = [driver for driver
+                                   in self.ordered_mech_drivers
+                                   if driver.name not in names]
+        self.journal = journal.Journal(journal_drivers)
+        self.journal.start()
 
     def _call_on_drivers(self, method_name, context,
                          continue_on_failure=False):
         """Helper method for calling a method across all mechanism drivers.
 
         :param method_name: name of the method to call
-        :param context: context parameter to pass to each method call
+        :param context: context parameter to pass to each method call,
+        the list of the contexts of the resources for bulk methods
         :param continue_on_failure: whether or not to continue to call
         all mechanism drivers once one has raised an exception
         :raises: neutron.plugins.ml2.common.MechanismDriverError
         if any mechanism driver call fails.
+
+        The precommit operations are recorded in the journal, if any,
+        for the drivers which use it, and their postcommit methods are
+        replaced by waking up the journal worker.
         """
+        drivers = self.ordered_mech_drivers
+        if self.journal:
+            operation, object_type = method_name.split('_')[:2]
+            if method_name.endswith('_precommit'):
+                bulk = '_bulk_' in method_name
+                for resource_context in (context if bulk else [context]):
+                    self.journal.record(resource_context, object_type,
+                                        operation)
+            else:
+                self.journal.wake()
+                drivers = self.postcommit_drivers
         error = False
-        for driver in self.ordered_mech_drivers:
+        for driver in drivers:
             try:
                 getattr(driver.obj, method_name)(context)
             except Exception:
@@ -376,6 +426,32 @@ class MechanismManager(stevedore.named.NamedExtensionManager):
         """
         self._call_on_drivers("create_port_postcommit", context)
 
+    def create_port_bulk_precommit(self, contexts):
+        """Notify all mechanism drivers during the creation of ports.
+
+        :param contexts: list of the PortContext instances of the ports
+        :raises: neutron.plugins.ml2.common.MechanismDriverError
+        if any mechanism driver create_port_bulk_precommit call fails.
+
+        Called within the database transaction of a bulk request, once
+        the ports have been created. Errors are handled as for
+        create_port_precommit.
+        """
+        self._call_on_drivers("create_port_bulk_precommit", contexts)
+
+    def create_port_bulk_postcommit(self, contexts):
+        """Notify all mechanism drivers of the creation of ports.
+
+        :param contexts: list of the PortContext instances of the ports
+        :raises: neutron.plugins.ml2.common.MechanismDriverError
+        if any mechanism driver create_port_bulk_postcommit call fails.
+
+        Called after the database transaction of a bulk request. Errors
+        raised by mechanism drivers are left to propagate to the caller,
+        where all the ports will be deleted.
+        """
+        self._call_on_drivers("create_port_bulk_postcommit", contexts)
+
     def update_port_precommit(self, context):
         """Notify all mechanism drivers during port update.
 
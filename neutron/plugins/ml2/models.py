@@ -74,3 +74,27 @@ class PortBinding(model_base.BASEV2):
         backref=orm.backref("port_binding",
                             lazy='joined', uselist=False,
                             cascade='delete'))
+
+
+class JournalEntry(model_base.BASEV2):
+    """Represent a postcommit operation recorded for a mechanism driver.
+
+    Entries are recorded within the transaction of the operation and
+    processed in the order of their id by the journal worker, which
+    deletes them once the driver has processed them. Before it is
+    processed, next_attempt is the time before which the entry must not
+    be processed again, either to retry it or because it was claimed by
+    a worker.
+    """
+
+    __tablename__ = 'ml2_journal'
+
+    id = sa.Column(sa.Integer, primary_key=True, autoincrement=True)
+    driver = sa.Column(sa.String(64), nullable=False, index=True)
+    object_type = sa.Column(sa.String(36), nullable=False)
+    object_id = sa.Column(sa.String(36), nullable=False)
+    operation = sa.Column(sa.String(36), nullable=False)
+    data = sa.Column(sa.Text, nullable=False)
+    state = sa.Column(sa.String(16), nullable=False, default='pending')
+    retry_count = sa.Column(sa.Integer, nullable=False, default=0)
+    next_attempt = sa.Column(sa.DateTime)
@@ -184,9 +184,10 @@ class Ml2Plugin(db_base_plugin_v2.NeutronDbPluginV2,
             value = None
         return value
 
-    def _extend_network_dict_provider(self, context, network):
+    def _extend_network_dict_provider(self, context, network, segments=None):
         id = network['id']
-        segments = db.get_network_segments(context.session, id)
+        if segments is None:
+            segments = db.get_network_segments(context.session, id)
         if not segments:
             LOG.error(_("Network %s has no segments"), id)
             network[provider.NETWORK_TYPE] = None
@@ -204,10 +205,6 @@ class Ml2Plugin(db_base_plugin_v2.NeutronDbPluginV2,
             network[provider.PHYSICAL_NETWORK] = segment[api.PHYSICAL_NETWORK]
             network[provider.SEGMENTATION_ID] = segment[api.SEGMENTATION_ID]
 
-    def _filter_nets_provider(self, context, nets, filters):
-        # TODO(rkukura): Implement filtering.
-        return nets
-
     def _process_port_binding(self, mech_context, attrs):
         binding = mech_context._binding
         port = mech_context.current
@@ -345,6 +342,27 @@ class Ml2Plugin(db_base_plugin_v2.NeutronDbPluginV2,
         None,
         '_ml2_port_result_filter_hook')
 
+    def _ml2_network_result_filter_hook(self, query, filters):
+        # Keep the networks with a segment matching all the provider filters
+        conditions = [column.in_(filters[key]) for key, column in (
+            (provider.NETWORK_TYPE, models.NetworkSegment.network_type),
+            (provider.PHYSICAL_NETWORK,
+             models.NetworkSegment.physical_network),
+            (provider.SEGMENTATION_ID, models.NetworkSegment.segmentation_id))
+            if filters and filters.get(key)]
+        if not conditions:
+            return query
+        segments = (query.session.query(models.NetworkSegment.network_id).
+                    filter(*conditions))
+        return query.filter(models_v2.Network.id.in_(segments.subquery()))
+
+    db_base_plugin_v2.NeutronDbPluginV2.register_model_query_hook(
+        models_v2.Network,
+        "ml2_network_segments",
+        None,
+        None,
+        '_ml2_network_result_filter_hook')
+
     def _notify_port_updated(self, mech_context):
         port = mech_context._port
         segment = mech_context.bound_segment
@@ -437,10 +455,12 @@ class Ml2Plugin(db_base_plugin_v2.NeutronDbPluginV2,
             nets = super(Ml2Plugin,
                          self).get_networks(context, filters, None, sorts,
                                             limit, marker, page_reverse)
+            segments = db.get_networks_segments(
+                session, [net['id'] for net in nets])
             for net in nets:
-                self._extend_network_dict_provider(context, net)
+                self._extend_network_dict_provider(context, net,
+                                                   segments[net['id']])
 
-            nets = self._filter_nets_provider(context, nets, filters)
             nets = self._filter_nets_l3(context, nets, filters)
 
         return [self._fields(net, fields) for net in nets]
@@ -632,7 +652,11 @@ class Ml2Plugin(db_base_plugin_v2.NeutronDbPluginV2,
             # the fact that an error occurred.
             LOG.error(_("mechanism_manager.delete_subnet_postcommit failed"))
 
-    def create_port(self, context, port):
+    def _create_port_db(self, context, port, networks):
+        """Create a port in the database, returning its PortContext.
+
+        networks caches the networks of the ports by id.
+        """
         attrs = port['port']
         attrs['status'] = const.PORT_STATUS_DOWN
 
@@ -643,7 +667,10 @@ class Ml2Plugin(db_base_plugin_v2.NeutronDbPluginV2,
             dhcp_opts = port['port'].get(edo_ext.EXTRADHCPOPTS, [])
             result = super(Ml2Plugin, self).create_port(context, port)
             self._process_port_create_security_group(context, result, sgids)
-            network = self.get_network(context, result['network_id'])
+            network = networks.get(result['network_id'])
+            if not network:
+                network = self.get_network(context, result['network_id'])
+                networks[network['id']] = network
             mech_context = driver_context.PortContext(self, context, result,
                                                       network)
             self._process_port_binding(mech_context, attrs)
@@ -653,7 +680,50 @@ class Ml2Plugin(db_base_plugin_v2.NeutronDbPluginV2,
                     attrs.get(addr_pair.ADDRESS_PAIRS)))
             self._process_port_create_extra_dhcp_opts(context, result,
                                                       dhcp_opts)
+        return mech_context
+
+    def create_port_bulk(self, context, ports):
+        """Create the ports of a bulk request in a single transaction.
+
+        The mechanism drivers are called once for all the ports, and the
+        security group agents are notified once.
+        """
+        items = ports['ports']
+        session = context.session
+        # Generate the MAC addresses of the ports with a few queries
+        self._reserve_macs(context, items)
+        try:
+            with session.begin(subtransactions=True):
+                # and their IP addresses by blocks
+                self._reserve_ips(context, items)
+                networks = {}
+                mech_contexts = [self._create_port_db(context, item, networks)
+                                 for item in items]
+                self.mechanism_manager.create_port_bulk_precommit(
+                    mech_contexts)
+        finally:
+            self._release_macs(context)
+            self._release_ips(context)
+        results = [mech_context.current for mech_context in mech_contexts]
+
+        try:
+            self.mechanism_manager.create_port_bulk_postcommit(mech_contexts)
+        except ml2_exc.MechanismDriverError:
+            with excutils.save_and_reraise_exception():
+                LOG.error(_("mechanism_manager.create_port_bulk_postcommit "
+                            "failed, deleting ports %s"),
+                          [result['id'] for result in results])
+                for result in results:
+                    self.delete_port(context, result['id'])
+        self.notify_security_groups_member_updated_bulk(context, results)
+        return results
+
+    def create_port(self, context, port):
+        session = context.session
+        with session.begin(subtransactions=True):
+            mech_context = self._create_port_db(context, port, {})
             self.mechanism_manager.create_port_precommit(mech_context)
+        result = mech_context.current
 
         try:
             self.mechanism_manager.create_port_postcommit(mech_context)
@@ -763,33 +833,48 @@ class Ml2Plugin(db_base_plugin_v2.NeutronDbPluginV2,
         self.notify_security_groups_member_updated(context, port)
 
     def update_port_status(self, context, port_id, status):
-        updated = False
+        return port_id in self.update_port_statuses(context,
+                                                    {port_id: status})
+
+    def update_port_statuses(self, context, port_statuses):
+        """Update the status of several ports in a single transaction.
+
+        port_statuses maps port ids to their new status. Returns the ids
+        of the ports which were found.
+        """
+        updated = []
         session = context.session
         # REVISIT: Serialize this operation with a semaphore to prevent
         # undesired eventlet yields leading to 'lock wait timeout' errors
         with contextlib.nested(lockutils.lock('db-access'),
                                session.begin(subtransactions=True)):
-            port = db.get_port(session, port_id)
-            if not port:
-                LOG.warning(_("Port %(port)s updated up by agent not found"),
-                            {'port': port_id})
-                return False
-            if port.status != status:
+            ports = db.get_ports(session, port_statuses.keys())
+            networks = {}
+            for port_id, status in port_statuses.iteritems():
+                port = ports.get(port_id)
+                if not port:
+                    LOG.warning(_("Port %(port)s updated up by agent not "
+                                  "found"), {'port': port_id})
+                    continue
+                if port.status == status:
+                    continue
                 original_port = self._make_port_dict(port)
                 port.status = status
                 updated_port = self._make_port_dict(port)
-                network = self.get_network(context,
-                                           original_port['network_id'])
+                network_id = original_port['network_id']
+                if network_id not in networks:
+                    networks[network_id] = self.get_network(context,
+                                                            network_id)
                 mech_context = driver_context.PortContext(
-                    self, context, updated_port, network,
+                    self, context, updated_port, networks[network_id],
                     original_port=original_port)
                 self.mechanism_manager.update_port_precommit(mech_context)
-                updated = True
+                updated.append(mech_context)
 
-        if updated:
+        for mech_context in updated:
             self.mechanism_manager.update_port_postcommit(mech_context)
 
-        return True
+        return set(ports)
 
     def port_bound_to_host(self, port_id, host):
         port_host = db.get_port_binding_host(port_id)
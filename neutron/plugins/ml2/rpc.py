@@ -40,11 +40,12 @@ class RpcCallbacks(n_rpc.RpcCallback,
                    sg_db_rpc.SecurityGroupServerRpcCallbackMixin,
                    type_tunnel.TunnelRpcCallbackMixin):
 
-    RPC_API_VERSION = '1.2'
+    RPC_API_VERSION = '1.3'
     # history
     #   1.0 Initial version (from openvswitch/linuxbridge)
     #   1.1 Support Security Group RPC
     #   1.2 Support get_devices_details_list
+    #   1.3 Support security_group_info_for_devices
 
     def __init__(self, notifier, type_manager):
         self.setup_tunnel_callback_mixin(notifier, type_manager)
@@ -87,70 +88,126 @@ class RpcCallbacks(n_rpc.RpcCallback,
         with session.begin(subtransactions=True):
             port = db.get_port(session, port_id)
             if not port:
-                LOG.warning(_("Device %(device)s requested by agent "
-                              "%(agent_id)s not found in database"),
-                            {'device': device, 'agent_id': agent_id})
-                return {'device': device}
+                return self._get_device_entry(device, agent_id, None)
 
             segments = db.get_network_segments(session, port.network_id)
-            if not segments:
-                LOG.warning(_("Device %(device)s requested by agent "
-                              "%(agent_id)s has network %(network_id)s with "
-                              "no segments"),
-                            {'device': device,
-                             'agent_id': agent_id,
-                             'network_id': port.network_id})
-                return {'device': device}
-
-            binding = db.ensure_port_binding(session, port.id)
-            if not binding.segment:
-                LOG.warning(_("Device %(device)s requested by agent "
-                              "%(agent_id)s on network %(network_id)s not "
-                              "bound, vif_type: %(vif_type)s"),
-                            {'device': device,
-                             'agent_id': agent_id,
-                             'network_id': port.network_id,
-                             'vif_type': binding.vif_type})
-                return {'device': device}
-
-            segment = self._find_segment(segments, binding.segment)
-            if not segment:
-                LOG.warning(_("Device %(device)s requested by agent "
-                              "%(agent_id)s on network %(network_id)s "
-                              "invalid segment, vif_type: %(vif_type)s"),
-                            {'device': device,
-                             'agent_id': agent_id,
-                             'network_id': port.network_id,
-                             'vif_type': binding.vif_type})
-                return {'device': device}
-
-            new_status = (q_const.PORT_STATUS_BUILD if port.admin_state_up
-                          else q_const.PORT_STATUS_DOWN)
-            if port.status != new_status:
+            binding = None
+            if segments:
+                binding = db.ensure_port_binding(session, port.id)
+            entry = self._get_device_entry(device, agent_id, port,
+                                           segments, binding)
+            new_status = self._get_new_port_status(port, entry)
+            if new_status:
                 plugin = manager.NeutronManager.get_plugin()
                 plugin.update_port_status(rpc_context,
                                           port_id,
                                           new_status)
                 port.status = new_status
-            entry = {'device': device,
-                     'network_id': port.network_id,
-                     'port_id': port.id,
-                     'admin_state_up': port.admin_state_up,
-                     'network_type': segment[api.NETWORK_TYPE],
-                     'segmentation_id': segment[api.SEGMENTATION_ID],
-                     'physical_network': segment[api.PHYSICAL_NETWORK]}
             LOG.debug(_("Returning: %s"), entry)
             return entry
 
     def get_devices_details_list(self, rpc_context, **kwargs):
-        return [
-            self.get_device_details(
-                rpc_context,
-                device=device,
-                **kwargs
-            )
-            for device in kwargs.pop('devices', [])
-        ]
+        """Agent requests details of several devices.
+
+        Ports, segments and bindings of all devices are fetched with a
+        constant number of queries, and all port status changes are done
+        in a single transaction.
+        """
+        agent_id = kwargs.get('agent_id')
+        devices = kwargs.pop('devices', [])
+        LOG.debug(_("Details of %(count)d devices requested by agent "
+                    "%(agent_id)s"),
+                  {'count': len(devices), 'agent_id': agent_id})
+        port_ids = dict((device, self._device_to_port_id(device))
+                        for device in devices)
+
+        session = db_api.get_session()
+        with session.begin(subtransactions=True):
+            ports = db.get_ports(session, set(port_ids.values()))
+            segments = db.get_networks_segments(
+                session, set(port.network_id for port in ports.values()))
+            bindings = db.ensure_port_bindings(
+                session, [port.id for port in ports.values()
+                          if segments[port.network_id]])
+
+            entries = []
+            new_statuses = {}
+            for device in devices:
+                port = ports.get(port_ids[device])
+                if not port:
+                    entries.append(
+                        self._get_device_entry(device, agent_id, None))
+                    continue
+                entry = self._get_device_entry(
+                    device, agent_id, port, segments[port.network_id],
+                    bindings.get(port.id))
+                new_status = self._get_new_port_status(port, entry)
+                if new_status:
+                    new_statuses[port.id] = new_status
+                entries.append(entry)
+
+            if new_statuses:
+                plugin = manager.NeutronManager.get_plugin()
+                plugin.update_port_statuses(rpc_context, new_statuses)
+                for port in ports.values():
+                    port.status = new_statuses.get(port.id, port.status)
+            LOG.debug(_("Returning: %s"), entries)
+            return entries
+
+    def _get_device_entry(self, device, agent_id, port, segments=None,
+                          binding=None):
+        if not port:
+            LOG.warning(_("Device %(device)s requested by agent "
+                          "%(agent_id)s not found in database"),
+                        {'device': device, 'agent_id': agent_id})
+            return {'device': device}
+
+        if not segments:
+            LOG.warning(_("Device %(device)s requested by agent "
+                          "%(agent_id)s has network %(network_id)s with "
+                          "no segments"),
+                        {'device': device,
+                         'agent_id': agent_id,
+                         'network_id': port.network_id})
+            return {'device': device}
+
+        if not binding.segment:
+            LOG.warning(_("Device %(device)s requested by agent "
+                          "%(agent_id)s on network %(network_id)s not "
+                          "bound, vif_type: %(vif_type)s"),
+                        {'device': device,
+                         'agent_id': agent_id,
+                         'network_id': port.network_id,
+                         'vif_type': binding.vif_type})
+            return {'device': device}
+
+        segment = self._find_segment(segments, binding.segment)
+        if not segment:
+            LOG.warning(_("Device %(device)s requested by agent "
+                          "%(agent_id)s on network %(network_id)s "
+                          "invalid segment, vif_type: %(vif_type)s"),
+                        {'device': device,
+                         'agent_id': agent_id,
+                         'network_id': port.network_id,
+                         'vif_type': binding.vif_type})
+            return {'device': device}
+
+        return {'device': device,
+                'network_id': port.network_id,
+                'port_id': port.id,
+                'admin_state_up': port.admin_state_up,
+                'network_type': segment[api.NETWORK_TYPE],
+                'segmentation_id': segment[api.SEGMENTATION_ID],
+                'physical_network': segment[api.PHYSICAL_NETWORK]}
+
+    def _get_new_port_status(self, port, entry):
+        """Return the status the port should move to, if it changes."""
+        if 'port_id' not in entry:
+            return
+        new_status = (q_const.PORT_STATUS_BUILD if port.admin_state_up
+                      else q_const.PORT_STATUS_DOWN)
+        if port.status != new_status:
+            return new_status
 
     def _find_segment(self, segments, segment_id):
         for segment in segments:
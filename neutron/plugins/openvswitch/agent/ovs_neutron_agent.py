@@ -14,6 +14,7 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import contextlib
 import hashlib
 import signal
 import sys
@@ -29,6 +30,7 @@ from six import moves
 from neutron.agent import l2population_rpc
 from neutron.agent.linux import ip_lib
 from neutron.agent.linux import ovs_lib
+from neutron.agent.linux import ovsdb_monitor
 from neutron.agent.linux import polling
 from neutron.agent.linux import utils
 from neutron.agent import rpc as agent_rpc
@@ -177,9 +179,13 @@ class OVSNeutronAgent(n_rpc.RpcCallback,
                                self.arp_responder_enabled},
             'agent_type': q_const.AGENT_TYPE_OVS,
             'start_flag': True}
+        self.metrics_report = agent_rpc.MetricsReport()
 
         # Keep track of int_br's device count for use by _report_state()
         self.int_br_device_count = 0
+        # The security group agent is created once the bridges are set up,
+        # after the first state report may have been sent
+        self.sg_agent = None
 
         self.int_br = ovs_lib.OVSBridge(integ_br, self.root_helper)
         self.setup_integration_br()
@@ -195,6 +201,7 @@ class OVSNeutronAgent(n_rpc.RpcCallback,
         self.polling_interval = polling_interval
         self.minimize_polling = minimize_polling
         self.ovsdb_monitor_respawn_interval = ovsdb_monitor_respawn_interval
+        self.full_port_scan_interval = cfg.CONF.AGENT.full_port_scan_interval
 
         if tunnel_types:
             self.enable_tunneling = True
@@ -233,10 +240,15 @@ class OVSNeutronAgent(n_rpc.RpcCallback,
         return supported
 
     def _report_state(self):
-        # How many devices are likely used by a VM
-        self.agent_state.get('configurations')['devices'] = (
-            self.int_br_device_count)
         try:
+            # How many devices are likely used by a VM
+            self.agent_state.get('configurations')['devices'] = (
+                self.int_br_device_count)
+            # The first reports may be sent before the firewall is set up
+            if self.sg_agent and self.metrics_report.due():
+                self.agent_state.get('configurations')[
+                    'firewall_refreshes'] = dict(
+                        self.sg_agent.firewall_refresh_counts)
             self.state_rpc.report_state(self.context,
                                         self.agent_state)
             self.agent_state.pop('start_flag', None)
@@ -994,6 +1006,63 @@ class OVSNeutronAgent(n_rpc.RpcCallback,
         port_info['removed'] = registered_ports - cur_ports
         return port_info
 
+    def _get_event_vif_id(self, event):
+        external_ids = event['external_ids']
+        if 'attached-mac' not in external_ids:
+            return
+        if 'iface-id' in external_ids:
+            return external_ids['iface-id']
+        if 'xs-vif-uuid' in external_ids:
+            return self.int_br.get_xapi_iface_id(external_ids['xs-vif-uuid'])
+
+    def process_port_events(self, events, registered_ports,
+                            updated_ports=None):
+        """Return the port changes reported by ovsdb Interface events.
+
+        This is the counterpart of scan_ports() used when the interface
+        changes are known, only the interfaces concerned by the events
+        are looked at. Lost vlan tags are only detected by scan_ports().
+        """
+        added = {}
+        removed = set()
+        for event in events:
+            vif_id = self._get_event_vif_id(event)
+            if not vif_id:
+                continue
+            try:
+                ready = int(event['ofport']) > 0
+            except (ValueError, TypeError):
+                ready = False
+            if ready and event['action'] != ovsdb_monitor.OVSDB_ACTION_DELETE:
+                # A registered port added again (e.g. with a new ofport)
+                # is wired again.
+                removed.discard(vif_id)
+                added[vif_id] = event['name']
+            else:
+                added.pop(vif_id, None)
+                if vif_id in registered_ports:
+                    removed.add(vif_id)
+        # The events are reported for the interfaces of all the bridges
+        for vif_id, name in added.items():
+            if vif_id in registered_ports:
+                continue
+            bridge = self.int_br.get_bridge_name_for_port_name(name)
+            if (bridge or '').strip() != self.int_br.br_name:
+                del added[vif_id]
+        added = set(added)
+
+        cur_ports = (registered_ports - removed) | added
+        self.int_br_device_count = len(cur_ports)
+        port_info = {'current': cur_ports}
+        if updated_ports:
+            updated_ports &= cur_ports
+            if updated_ports:
+                port_info['updated'] = updated_ports
+        if added or removed:
+            port_info['added'] = added
+            port_info['removed'] = removed
+        return port_info
+
     def check_changed_vlans(self, registered_ports):
         """Return ports which have lost their vlan tag.
 
@@ -1105,6 +1174,17 @@ class OVSNeutronAgent(n_rpc.RpcCallback,
                     self.tun_br.delete_flows(in_port=ofport)
                     self.tun_br_ofports[tunnel_type].pop(remote_ip, None)
 
+    def _get_bridges(self):
+        bridges = [self.int_br] + self.phys_brs.values()
+        if self.enable_tunneling:
+            bridges.append(self.tun_br)
+        return bridges
+
+    def deferred_flows(self):
+        """Defer the flows programmed on all the bridges of the agent."""
+        return contextlib.nested(*[br.deferred()
+                                   for br in self._get_bridges()])
+
     def treat_devices_added_or_updated(self, devices, ovs_restarted):
         try:
             devices_details_list = self.plugin_rpc.get_devices_details_list(
@@ -1116,42 +1196,54 @@ class OVSNeutronAgent(n_rpc.RpcCallback,
                       {'devices': devices, 'e': e})
             # resync is needed
             return True
-        for details in devices_details_list:
-            device = details['device']
-            LOG.debug("Processing port: %s", device)
-            port = self.int_br.get_vif_port_by_id(device)
-            if not port:
-                # The port has disappeared and should not be processed
-                # There is no need to put the port DOWN in the plugin as
-                # it never went up in the first place
-                LOG.info(_("Port %s was not found on the integration bridge "
-                           "and will therefore not be processed"), device)
-                continue
+        # The flows and the OVSDB writes of all the devices are applied at
+        # once, before their status is reported to the plugin. The writes
+        # are committed first, so that the ports are tagged when their
+        # flows are applied.
+        wired_devices = []
+        with contextlib.nested(self.deferred_flows(),
+                               self.int_br.ovsdb_transaction()):
+            for details in devices_details_list:
+                device = details['device']
+                LOG.debug("Processing port: %s", device)
+                port = self.int_br.get_vif_port_by_id(device)
+                if not port:
+                    # The port has disappeared and should not be processed
+                    # There is no need to put the port DOWN in the plugin as
+                    # it never went up in the first place
+                    LOG.info(_("Port %s was not found on the integration "
+                               "bridge and will therefore not be processed"),
+                             device)
+                    continue
 
-            if 'port_id' in details:
-                LOG.info(_("Port %(device)s updated. Details: %(details)s"),
-                         {'device': device, 'details': details})
-                self.treat_vif_port(port, details['port_id'],
-                                    details['network_id'],
-                                    details['network_type'],
-                                    details['physical_network'],
-                                    details['segmentation_id'],
-                                    details['admin_state_up'],
-                                    ovs_restarted)
-                # update plugin about port status
-                if details.get('admin_state_up'):
-                    LOG.debug(_("Setting status for %s to UP"), device)
-                    self.plugin_rpc.update_device_up(
-                        self.context, device, self.agent_id, cfg.CONF.host)
+                if 'port_id' in details:
+                    LOG.info(_("Port %(device)s updated. "
+                               "Details: %(details)s"),
+                             {'device': device, 'details': details})
+                    self.treat_vif_port(port, details['port_id'],
+                                        details['network_id'],
+                                        details['network_type'],
+                                        details['physical_network'],
+                                        details['segmentation_id'],
+                                        details['admin_state_up'],
+                                        ovs_restarted)
+                    wired_devices.append(details)
                 else:
-                    LOG.debug(_("Setting status for %s to DOWN"), device)
-                    self.plugin_rpc.update_device_down(
-                        self.context, device, self.agent_id, cfg.CONF.host)
-                LOG.info(_("Configuration for device %s completed."), device)
+                    LOG.warn(_("Device %s not defined on plugin"), device)
+                    if (port and port.ofport != -1):
+                        self.port_dead(port)
+        for details in wired_devices:
+            device = details['device']
+            # update plugin about port status
+            if details.get('admin_state_up'):
+                LOG.debug(_("Setting status for %s to UP"), device)
+                self.plugin_rpc.update_device_up(
+                    self.context, device, self.agent_id, cfg.CONF.host)
             else:
-                LOG.warn(_("Device %s not defined on plugin"), device)
-                if (port and port.ofport != -1):
-                    self.port_dead(port)
+                LOG.debug(_("Setting status for %s to DOWN"), device)
+                self.plugin_rpc.update_device_down(
+                    self.context, device, self.agent_id, cfg.CONF.host)
+            LOG.info(_("Configuration for device %s completed."), device)
         return False
 
     def treat_ancillary_devices_added(self, devices):
@@ -1180,19 +1272,20 @@ class OVSNeutronAgent(n_rpc.RpcCallback,
     def treat_devices_removed(self, devices):
         resync = False
         self.sg_agent.remove_devices_filter(devices)
-        for device in devices:
-            LOG.info(_("Attachment %s removed"), device)
-            try:
-                self.plugin_rpc.update_device_down(self.context,
-                                                   device,
-                                                   self.agent_id,
-                                                   cfg.CONF.host)
-            except Exception as e:
-                LOG.debug(_("port_removed failed for %(device)s: %(e)s"),
-                          {'device': device, 'e': e})
-                resync = True
-                continue
-            self.port_unbound(device)
+        with self.deferred_flows():
+            for device in devices:
+                LOG.info(_("Attachment %s removed"), device)
+                try:
+                    self.plugin_rpc.update_device_down(self.context,
+                                                       device,
+                                                       self.agent_id,
+                                                       cfg.CONF.host)
+                except Exception as e:
+                    LOG.debug(_("port_removed failed for %(device)s: %(e)s"),
+                              {'device': device, 'e': e})
+                    resync = True
+                    continue
+                self.port_unbound(device)
         return resync
 
     def treat_ancillary_devices_removed(self, devices):
@@ -1342,6 +1435,7 @@ class OVSNeutronAgent(n_rpc.RpcCallback,
         ancillary_ports = set()
         tunnel_sync = True
         ovs_restarted = False
+        last_full_scan = None
         while self.run_daemon_loop:
             start = time.time()
             port_stats = {'regular': {'added': 0,
@@ -1356,6 +1450,12 @@ class OVSNeutronAgent(n_rpc.RpcCallback,
                 ports.clear()
                 ancillary_ports.clear()
                 sync = False
+                last_full_scan = None
+                polling_manager.force_polling()
+            elif (last_full_scan is None or
+                  start - last_full_scan >= self.full_port_scan_interval):
+                # Do not rely only on the ovsdb monitor events
+                last_full_scan = None
                 polling_manager.force_polling()
             ovs_restarted = self.check_ovs_restart()
             if ovs_restarted:
@@ -1385,7 +1485,16 @@ class OVSNeutronAgent(n_rpc.RpcCallback,
                     updated_ports_copy = self.updated_ports
                     self.updated_ports = set()
                     reg_ports = (set() if ovs_restarted else ports)
-                    port_info = self.scan_ports(reg_ports, updated_ports_copy)
+                    # Always consume the events to not process them later
+                    port_events = polling_manager.get_events()
+                    if (port_events is None or ovs_restarted or
+                            last_full_scan is None):
+                        port_info = self.scan_ports(reg_ports,
+                                                    updated_ports_copy)
+                        last_full_scan = start
+                    else:
+                        port_info = self.process_port_events(
+                            port_events, reg_ports, updated_ports_copy)
                     ports = port_info['current']
                     LOG.debug(_("Agent rpc_loop - iteration:%(iter_num)d - "
                                 "port information retrieved. "
@@ -1448,9 +1557,11 @@ class OVSNeutronAgent(n_rpc.RpcCallback,
             elapsed = (time.time() - start)
             LOG.debug(_("Agent rpc_loop - iteration:%(iter_num)d "
                         "completed. Processed ports statistics: "
-                        "%(port_stats)s. Elapsed:%(elapsed).3f"),
+                        "%(port_stats)s. Flow statistics: %(flow_stats)s. "
+                        "Elapsed:%(elapsed).3f"),
                       {'iter_num': self.iter_num,
                        'port_stats': port_stats,
+                       'flow_stats': ovs_lib.reset_flow_stats(),
                        'elapsed': elapsed})
             if (elapsed < self.polling_interval):
                 time.sleep(self.polling_interval - elapsed)
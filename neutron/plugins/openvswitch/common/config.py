@@ -71,6 +71,11 @@ agent_opts = [
                default=constants.DEFAULT_OVSDBMON_RESPAWN,
                help=_("The number of seconds to wait before respawning the "
                       "ovsdb monitor after losing communication with it")),
+    cfg.IntOpt('full_port_scan_interval', default=60,
+               help=_("When minimizing polling, only the interfaces reported "
+                      "as changed by the ovsdb monitor are processed. All the "
+                      "ports of the integration bridge are still scanned at "
+                      "least once in this number of seconds.")),
     cfg.ListOpt('tunnel_types', default=DEFAULT_TUNNEL_TYPES,
                 help=_("Network types supported by the agent "
                        "(gre and/or vxlan)")),
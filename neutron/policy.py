@@ -33,6 +33,10 @@ from neutron.openstack.common import policy
 LOG = logging.getLogger(__name__)
 _POLICY_PATH = None
 _POLICY_CACHE = {}
+# Match rules built for (action, enforced attributes), valid as long as the
+# rules they were built for are the ones loaded in the policy engine
+_MATCH_RULES = {}
+_MATCH_RULES_SOURCE = None
 ADMIN_CTX_POLICY = 'context_is_admin'
 # Maps deprecated 'extension' policies to new-style policies
 DEPRECATED_POLICY_MAP = {
@@ -59,6 +63,7 @@ def reset():
     global _POLICY_CACHE
     _POLICY_PATH = None
     _POLICY_CACHE = {}
+    _MATCH_RULES.clear()
     policy.reset()
 
 
@@ -149,6 +154,53 @@ def _build_subattr_match_rule(attr_name, attr, action, target):
     return policy.AndCheck(sub_attr_rules)
 
 
+def _has_subattr_rules(attribute):
+    validate = attribute.get('validate')
+    return bool(validate and any([k.startswith('type:dict') and v
+                                  for (k, v) in validate.iteritems()]))
+
+
+def _get_enforced_attributes(action, target):
+    """Return the attributes of the target the action is checked on.
+
+    Each item is a tuple with the attribute name and, for attributes with
+    sub-attribute policies, the names of the sub-attributes in the target,
+    or None if the attribute is not a dict.
+    """
+    resource, is_write = get_resource_and_action(action)
+    # Attribute-based checks shall not be enforced on GETs
+    res_map = attributes.RESOURCE_ATTRIBUTE_MAP.get(resource)
+    if not (is_write and res_map):
+        return ()
+    enforced = []
+    for attribute_name, attribute in res_map.iteritems():
+        if ('enforce_policy' in attribute and
+            _is_attribute_explicitly_set(attribute_name, res_map, target)):
+            sub_attrs = ()
+            if _has_subattr_rules(attribute):
+                sub_attrs = None
+                if isinstance(target[attribute_name], dict):
+                    sub_attrs = tuple(sorted(target[attribute_name]))
+            enforced.append((attribute_name, sub_attrs))
+    return tuple(enforced)
+
+
+def _compile_match_rule(action, enforced, target):
+    resource = get_resource_and_action(action)[0]
+    match_rule = policy.RuleCheck('rule', action)
+    for attribute_name, sub_attrs in enforced:
+        attribute = attributes.RESOURCE_ATTRIBUTE_MAP[resource][attribute_name]
+        attr_rule = policy.RuleCheck('rule', '%s:%s' %
+                                     (action, attribute_name))
+        # Build match entries for sub-attributes, if present
+        if _has_subattr_rules(attribute):
+            attr_rule = policy.AndCheck(
+                [attr_rule, _build_subattr_match_rule(
+                    attribute_name, attribute, action, target)])
+        match_rule = policy.AndCheck([match_rule, attr_rule])
+    return match_rule
+
+
 def _build_match_rule(action, target):
     """Create the rule to match for a given action.
 
@@ -160,32 +212,24 @@ def _build_match_rule(action, target):
     4) add an entry for sub-attributes of a resource for which the
        action is being executed
        (e.g.: create_router:external_gateway_info:network_id)
+
+    Rules only depend on the action and on the attributes set in the
+    target, so they are built once for each of them until the policies
+    are reloaded.
     """
-    match_rule = policy.RuleCheck('rule', action)
-    resource, is_write = get_resource_and_action(action)
-    # Attribute-based checks shall not be enforced on GETs
-    if is_write:
-        # assigning to variable with short name for improving readability
-        res_map = attributes.RESOURCE_ATTRIBUTE_MAP
-        if resource in res_map:
-            for attribute_name in res_map[resource]:
-                if _is_attribute_explicitly_set(attribute_name,
-                                                res_map[resource],
-                                                target):
-                    attribute = res_map[resource][attribute_name]
-                    if 'enforce_policy' in attribute:
-                        attr_rule = policy.RuleCheck('rule', '%s:%s' %
-                                                     (action, attribute_name))
-                        # Build match entries for sub-attributes, if present
-                        validate = attribute.get('validate')
-                        if (validate and any([k.startswith('type:dict') and v
-                                              for (k, v) in
-                                              validate.iteritems()])):
-                            attr_rule = policy.AndCheck(
-                                [attr_rule, _build_subattr_match_rule(
-                                    attribute_name, attribute,
-                                    action, target)])
-                        match_rule = policy.AndCheck([match_rule, attr_rule])
+    global _MATCH_RULES_SOURCE
+    enforced = _get_enforced_attributes(action, target)
+    if any(sub_attrs is None for _name, sub_attrs in enforced):
+        return _compile_match_rule(action, enforced, target)
+    if _MATCH_RULES_SOURCE is not policy._rules:
+        # Policies were reloaded since these rules were built
+        _MATCH_RULES.clear()
+        _MATCH_RULES_SOURCE = policy._rules
+    key = (action, enforced)
+    match_rule = _MATCH_RULES.get(key)
+    if match_rule is None:
+        match_rule = _MATCH_RULES[key] = _compile_match_rule(
+            action, enforced, target)
     return match_rule
 
 
@@ -346,6 +390,38 @@ def check(context, action, target, plugin=None, might_not_exist=False):
     return policy.check(*(_prepare_check(context, action, target)))
 
 
+def check_many(context, action, targets, plugin=None, might_not_exist=False):
+    """Verifies that the action is valid on each of the targets.
+
+    This is equivalent to calling check for each target, but the
+    credentials are only built once from the context.
+
+    :param context: neutron context
+    :param action: string representing the action to be checked
+        this should be colon separated for clarity.
+    :param targets: list of dictionaries representing the objects of the
+        action.
+    :param plugin: currently unused and deprecated.
+        Kept for backward compatibility.
+    :param might_not_exist: If True the policy check is skipped (and the
+        function returns True for every target) if the specified policy
+        does not exist. Defaults to false.
+
+    :return: Returns a list with, for each target, True if access is
+        permitted else False.
+    """
+    if might_not_exist and not (policy._rules and action in policy._rules):
+        return [True] * len(targets)
+    credentials = context.to_dict()
+    results = []
+    for target in targets:
+        if target is None:
+            target = {}
+        results.append(policy.check(_build_match_rule(action, target),
+                                    target, credentials))
+    return results
+
+
 def enforce(context, action, target, plugin=None):
     """Verifies that the action is valid on the target in this context.
 
@@ -80,9 +80,7 @@ class ChanceScheduler(object):
                 return
             active_dhcp_agents = [
                 agent for agent in set(enabled_dhcp_agents)
-                if not agents_db.AgentDbMixin.is_agent_down(
-                    agent['heartbeat_timestamp'])
-                and agent not in dhcp_agents
+                if agent.is_active and agent not in dhcp_agents
             ]
             if not active_dhcp_agents:
                 LOG.warn(_('No more DHCP agents'))
@@ -114,8 +112,7 @@ class ChanceScheduler(object):
                                  agents_db.Agent.admin_state_up == sql.true())
             dhcp_agents = query.all()
             for dhcp_agent in dhcp_agents:
-                if agents_db.AgentDbMixin.is_agent_down(
-                    dhcp_agent.heartbeat_timestamp):
+                if not dhcp_agent.is_active:
                     LOG.warn(_('DHCP agent %s is not active'), dhcp_agent.id)
                     continue
                 for net_id in net_ids:
@@ -63,8 +63,7 @@ class L3Scheduler(object):
                 LOG.debug(_('No enabled L3 agent on host %s'),
                           host)
                 return False
-            if agents_db.AgentDbMixin.is_agent_down(
-                l3_agent.heartbeat_timestamp):
+            if not l3_agent.is_active:
                 LOG.warn(_('L3 agent %s is not active'), l3_agent.id)
             # check if each of the specified routers is hosted
             if router_ids:
@@ -31,6 +31,8 @@ cfg.CONF.register_opts(vpn_agent_opts, 'vpnagent')
 class VPNAgent(l3_agent.L3NATAgentWithStateReport):
     """VPNAgent class which can handle vpn service drivers."""
     def __init__(self, host, conf=None):
+        # Routers processed since the devices were last synced
+        self.routers_to_sync = []
         super(VPNAgent, self).__init__(host=host, conf=conf)
         self.setup_device_drivers(host)
 
@@ -135,8 +137,15 @@ class VPNAgent(l3_agent.L3NATAgentWithStateReport):
 
         This method overwrites parent class method.
         :param routers: list of routers
+        The routers are processed one by one by the L3 agent, the devices
+        are synced with the routers processed meanwhile once no router
+        update is pending, rather than for each router.
         """
         super(VPNAgent, self)._process_routers(routers, all_routers)
+        self.routers_to_sync.extend(routers)
+        if len(self._queue):
+            return
+        routers, self.routers_to_sync = self.routers_to_sync, []
         for device in self.devices:
             device.sync(self.context, routers)
 
@@ -494,6 +494,44 @@ class OVS_Lib_Test(base.BaseTestCase):
             mock.call('mod-flows', ['-'], 'modified_flow_2\n')
         ])
 
+    def test_defer_apply_flows_merges_flows(self):
+        run_ofctl = mock.patch.object(self.br, 'run_ofctl').start()
+        ovs_lib.reset_flow_stats()
+
+        with self.br.deferred():
+            self.br.add_flow(priority=2, in_port=1, actions='drop')
+            self.br.add_flow(priority=2, in_port=1, actions='drop')
+            self.br.add_flow(priority=2, in_port=2, actions='drop')
+            with self.br.deferred():
+                self.br.delete_flows(in_port=1)
+            self.br.mod_flow(in_port=3, actions='normal')
+            self.br.add_flow(priority=2, in_port=3, actions='drop')
+            self.br.delete_flows(in_port=3)
+            self.assertFalse(run_ofctl.called)
+
+        drop = 'hard_timeout=0,idle_timeout=0,priority=2,in_port=%d,' \
+               'actions=drop\n'
+        run_ofctl.assert_has_calls([
+            mock.call('add-flows', ['-'], drop % 2),
+            mock.call('del-flows', ['-'], 'in_port=1\n'),
+            mock.call('mod-flows', ['-'], 'in_port=3,actions=normal\n'),
+            mock.call('del-flows', ['-'], 'in_port=3\n')
+        ])
+        self.assertEqual(4, run_ofctl.call_count)
+        self.assertEqual({self.BR_NAME: {'requested': 7, 'applied': 4,
+                                         'ofctl_calls': 4}},
+                         ovs_lib.reset_flow_stats())
+        self.assertEqual({}, ovs_lib.reset_flow_stats())
+
+    def test_deferred_applies_flows_on_error(self):
+        run_ofctl = mock.patch.object(self.br, 'run_ofctl').start()
+        with testtools.ExpectedException(ValueError):
+            with self.br.deferred():
+                self.br.delete_flows(in_port=1)
+                raise ValueError()
+        run_ofctl.assert_called_once_with('del-flows', ['-'], 'in_port=1\n')
+        self.assertFalse(self.br.defer_apply_flows)
+
     def test_add_tunnel_port(self):
         pname = "tap99"
         local_ip = "1.1.1.1"
@@ -964,3 +1002,56 @@ class OVS_Lib_Test(base.BaseTestCase):
                            'br-test-test'], root_helper=self.root_helper)
             ])
             self.assertFalse(supported)
+
+
+class TestNativeOVSDB(base.BaseTestCase):
+
+    def setUp(self):
+        super(TestNativeOVSDB, self).setUp()
+        self.config(ovsdb_interface='native')
+        self.ovsdb = mock.Mock()
+        mock.patch.object(ovs_lib.ovsdb_native, 'get_connection',
+                          return_value=self.ovsdb).start()
+        self.execute = mock.patch.object(utils, "execute").start()
+        self.br = ovs_lib.OVSBridge('br-int', 'sudo')
+
+    def test_bridge_exists(self):
+        self.ovsdb.bridge_exists.return_value = True
+        self.assertTrue(self.br.bridge_exists('br-int'))
+        self.ovsdb.bridge_exists.assert_called_once_with('br-int')
+        self.assertFalse(self.execute.called)
+
+    def test_get_vif_port_set(self):
+        self.ovsdb.get_bridge_interfaces.return_value = [
+            {'name': 'tap1', 'ofport': 1,
+             'external_ids': {'iface-id': 'port1', 'attached-mac': 'ca:fe'}},
+            {'name': 'tap2', 'ofport': -1,
+             'external_ids': {'iface-id': 'port2', 'attached-mac': 'ca:fe'}},
+            {'name': 'patch-tun', 'ofport': 2, 'external_ids': {}}]
+        self.assertEqual(set(['port1']), self.br.get_vif_port_set())
+        self.assertFalse(self.execute.called)
+
+    def test_set_db_attribute_monitored_column(self):
+        self.ovsdb.is_monitored.return_value = True
+        self.br.set_db_attribute('Port', 'tap1', 'tag', 5)
+        self.ovsdb.set_value.assert_called_once_with('Port', 'tap1',
+                                                     'tag', 5)
+        self.assertFalse(self.execute.called)
+
+    def test_set_db_attribute_unmonitored_column(self):
+        self.ovsdb.is_monitored.return_value = False
+        self.br.set_db_attribute('Bridge', 'br-int', 'stp_enable', True)
+        self.assertFalse(self.ovsdb.set_value.called)
+        self.assertTrue(self.execute.called)
+
+    def test_native_errors_are_logged(self):
+        self.ovsdb.get_bridge_port_tags.side_effect = RuntimeError()
+        with testtools.ExpectedException(RuntimeError):
+            self.br.get_port_tag_dict()
+        self.ovsdb.is_monitored.return_value = True
+        self.ovsdb.clear_value.side_effect = RuntimeError()
+        self.br.clear_db_attribute('Port', 'tap1', 'tag')
+
+    def test_ovsdb_transaction(self):
+        self.assertEqual(self.ovsdb.transaction.return_value,
+                         self.br.ovsdb_transaction())
@@ -12,6 +12,8 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import contextlib
+
 import eventlet.event
 import mock
 
@@ -101,3 +103,46 @@ class TestSimpleInterfaceMonitor(base.BaseTestCase):
                 return_value=output):
             self.monitor._read_stdout()
         self.assertFalse(self.monitor.data_received)
+
+    def _get_events(self, lines, is_active=True):
+        target = ('neutron.agent.linux.ovsdb_monitor.SimpleInterfaceMonitor'
+                  '.is_active')
+        with contextlib.nested(
+            mock.patch(target,
+                       new_callable=mock.PropertyMock(return_value=is_active)),
+            mock.patch.object(self.monitor, 'iter_stdout',
+                              return_value=lines)):
+            return self.monitor.get_events()
+
+    def test_get_events_returns_none_if_not_active(self):
+        self.assertIsNone(self._get_events([], is_active=False))
+
+    def test_get_events_returns_rows(self):
+        headings = '"headings":["row","action","name","ofport","external_ids"]'
+        lines = [
+            '{"data":[["1","insert","tap1",["set",[]],'
+            '["map",[["iface-id","port1"]]]]],%s}' % headings,
+            '{"data":[["1","old",null,["set",[]],null],'
+            '["","new","tap1",5,["map",[["iface-id","port1"]]]]],%s}' %
+            headings,
+            '{"data":[["2","delete","tap2",3,["map",[]]]],%s}' % headings]
+        expected = [
+            {'action': 'insert', 'name': 'tap1', 'ofport': None,
+             'external_ids': {'iface-id': 'port1'}},
+            {'action': 'new', 'name': 'tap1', 'ofport': 5,
+             'external_ids': {'iface-id': 'port1'}},
+            {'action': 'delete', 'name': 'tap2', 'ofport': 3,
+             'external_ids': {}}]
+        self.assertEqual(expected, self._get_events(lines))
+        self.assertEqual([], self._get_events([]))
+
+    def test_get_events_returns_none_after_invalid_output(self):
+        self.assertIsNone(self._get_events(['invalid']))
+        self.assertEqual([], self._get_events([]))
+
+    def test_get_events_returns_none_after_respawn(self):
+        with mock.patch(
+                'neutron.agent.linux.ovsdb_monitor.OvsdbMonitor._kill'):
+            self.monitor._kill()
+        self.assertIsNone(self._get_events([]))
+        self.assertEqual([], self._get_events([]))
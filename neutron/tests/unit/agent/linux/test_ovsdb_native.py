@@ -0,0 +1,344 @@
+# Copyright 2014 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import copy
+import json
+import os
+
+import eventlet
+from eventlet.green import socket
+import fixtures
+import testtools
+
+from neutron.agent.linux import ovsdb_native
+from neutron.openstack.common import jsonutils
+from neutron.tests import base
+
+
+def _optional(key_type):
+    return {'type': {'key': key_type, 'min': 0, 'max': 1}}
+
+
+def _set(key_type, min=0):
+    return {'type': {'key': key_type, 'min': min, 'max': 'unlimited'}}
+
+
+STRING_MAP = {'type': {'key': 'string', 'value': 'string',
+                       'min': 0, 'max': 'unlimited'}}
+
+SCHEMA = {
+    'name': 'Open_vSwitch',
+    'tables': {
+        'Bridge': {'columns': {'name': {'type': 'string'},
+                               'ports': _set({'type': 'uuid',
+                                              'refTable': 'Port'}),
+                               'datapath_id': _optional('string'),
+                               'external_ids': STRING_MAP}},
+        'Port': {'columns': {'name': {'type': 'string'},
+                             'interfaces': _set({'type': 'uuid',
+                                                 'refTable': 'Interface'},
+                                                min=1),
+                             'tag': _optional({'type': 'integer',
+                                               'minInteger': 0,
+                                               'maxInteger': 4095})}},
+        'Interface': {'columns': {'name': {'type': 'string'},
+                                  'external_ids': STRING_MAP,
+                                  'ofport': _optional('integer'),
+                                  'type': {'type': 'string'},
+                                  'options': STRING_MAP}},
+    }
+}
+
+TABLES = {
+    'Bridge': {
+        'b1': {'name': 'br-int',
+               'ports': ['set', [['uuid', 'p0'], ['uuid', 'p1'],
+                                 ['uuid', 'p2']]],
+               'datapath_id': '0000f6e3a4c2b54a',
+               'external_ids': ['map', []]}},
+    'Port': {
+        'p0': {'name': 'br-int', 'interfaces': ['uuid', 'i0'],
+               'tag': ['set', []]},
+        'p1': {'name': 'tap1', 'interfaces': ['uuid', 'i1'], 'tag': 1},
+        'p2': {'name': 'patch-tun', 'interfaces': ['uuid', 'i2'],
+               'tag': ['set', []]}},
+    'Interface': {
+        'i0': {'name': 'br-int', 'external_ids': ['map', []],
+               'ofport': 65534, 'type': 'internal',
+               'options': ['map', []]},
+        'i1': {'name': 'tap1',
+               'external_ids': ['map', [['iface-id', 'port-1'],
+                                        ['attached-mac', 'fa:16:3e:00:00:01'],
+                                        ['iface-status', 'active']]],
+               'ofport': 1, 'type': '', 'options': ['map', []]},
+        'i2': {'name': 'patch-tun', 'external_ids': ['map', []],
+               'ofport': 2, 'type': 'patch',
+               'options': ['map', [['peer', 'patch-int']]]}},
+}
+
+
+class FakeOvsdbServer(object):
+    """A minimal ovsdb-server listening on a unix socket."""
+
+    def __init__(self, path):
+        self.tables = copy.deepcopy(TABLES)
+        self.transactions = []
+        self.replies = {}
+        self.clients = []
+        self.connections = 0
+        self.sock = eventlet.listen(path, family=socket.AF_UNIX)
+        self.server = eventlet.spawn(self._serve)
+
+    def stop(self):
+        self.server.kill()
+        self.disconnect_clients()
+        self.sock.close()
+
+    def disconnect_clients(self):
+        # Handlers close their socket when they see the end of the stream
+        for client in self.clients:
+            client.shutdown(socket.SHUT_RDWR)
+        self.clients = []
+
+    def _serve(self):
+        while True:
+            client, _addr = self.sock.accept()
+            self.clients.append(client)
+            self.connections += 1
+            eventlet.spawn_n(self._handle, client)
+
+    def _handle(self, client):
+        decoder = json.JSONDecoder()
+        buf = ''
+        while True:
+            try:
+                data = client.recv(65536)
+            except (IOError, EOFError):
+                data = ''
+            if not data:
+                if client in self.clients:
+                    self.clients.remove(client)
+                client.close()
+                return
+            buf += data
+            while buf.strip():
+                buf = buf.lstrip()
+                try:
+                    message, end = decoder.raw_decode(buf)
+                except ValueError:
+                    break
+                buf = buf[end:]
+                self._handle_message(client, message)
+
+    def _send(self, client, message):
+        client.sendall(jsonutils.dumps(message))
+
+    def _handle_message(self, client, message):
+        method = message.get('method')
+        if method is None:
+            self.replies[message['id']] = message
+            return
+        if method == 'get_schema':
+            result = SCHEMA
+        elif method == 'monitor':
+            result = dict((table, dict((uuid, {'new': row})
+                                       for uuid, row in rows.items()))
+                          for table, rows in self.tables.items())
+        elif method == 'transact':
+            result = self._transact(message['params'][1:])
+        self._send(client, {'id': message['id'], 'result': result,
+                            'error': None})
+
+    def _transact(self, operations):
+        self.transactions.append(operations)
+        updates = {}
+        for operation in operations:
+            table = operation['table']
+            uuid = operation['where'][0][2][1]
+            row = self.tables[table][uuid]
+            if operation['op'] == 'update':
+                row.update(operation['row'])
+            else:
+                deleted, inserted = operation['mutations']
+                column = deleted[0]
+                items = dict(row[column][1])
+                for key in deleted[2][1]:
+                    items.pop(key, None)
+                items.update(dict(inserted[2][1]))
+                row[column] = ['map', sorted(items.items())]
+            updates.setdefault(table, {})[uuid] = {'new': row}
+        self.notify(updates)
+        return [{'count': 1}] * len(operations)
+
+    def notify(self, updates):
+        for client in self.clients:
+            self._send(client, {'method': 'update', 'id': None,
+                                'params': [ovsdb_native.MONITOR_ID,
+                                           updates]})
+
+    def add_interface(self, name, iface_id):
+        port_uuid = 'p-' + name
+        iface_uuid = 'i-' + name
+        bridge = self.tables['Bridge']['b1']
+        bridge['ports'][1].append(['uuid', port_uuid])
+        port = {'name': name, 'interfaces': ['uuid', iface_uuid],
+                'tag': ['set', []]}
+        iface = {'name': name, 'ofport': 3, 'type': '',
+                 'options': ['map', []],
+                 'external_ids': ['map', [['iface-id', iface_id],
+                                          ['attached-mac', 'fa:16:3e:ff']]]}
+        self.notify({'Bridge': {'b1': {'new': bridge}},
+                     'Port': {port_uuid: {'new': port}},
+                     'Interface': {iface_uuid: {'new': iface}}})
+
+
+class TestOvsdbConnection(base.BaseTestCase):
+
+    def setUp(self):
+        super(TestOvsdbConnection, self).setUp()
+        temp_dir = self.useFixture(fixtures.TempDir()).path
+        path = os.path.join(temp_dir, 'db.sock')
+        # Let the readers see their sockets closed before the next test
+        self.addCleanup(eventlet.sleep, 0.01)
+        self.server = FakeOvsdbServer(path)
+        self.addCleanup(self.server.stop)
+        self.conn = ovsdb_native.OvsdbConnection('unix:%s' % path, 5)
+        self.addCleanup(self.conn.stop)
+
+    def test_start_loads_tables(self):
+        self.assertEqual(['br-int'], self.conn.get_bridges())
+        self.assertTrue(self.conn.bridge_exists('br-int'))
+        self.assertFalse(self.conn.bridge_exists('br-tun'))
+        self.assertEqual(['patch-tun', 'tap1'],
+                         sorted(self.conn.get_bridge_ports('br-int')))
+        self.assertEqual(1, self.server.connections)
+
+    def test_get_value(self):
+        self.assertEqual(1, self.conn.get_value('Interface', 'tap1',
+                                                'ofport'))
+        self.assertEqual([], self.conn.get_value('Port', 'patch-tun',
+                                                 'tag'))
+        self.assertEqual('patch-int',
+                         self.conn.get_value('interface', 'patch-tun',
+                                             'options:peer'))
+        self.assertEqual('active',
+                         self.conn.get_value('Interface', 'i1',
+                                             'external_ids')['iface-status'])
+
+    def test_get_value_missing_row_or_key(self):
+        self.assertRaises(RuntimeError, self.conn.get_value,
+                          'Interface', 'tap2', 'ofport')
+        self.assertRaises(RuntimeError, self.conn.get_value,
+                          'Interface', 'tap1', 'options:peer')
+
+    def test_lookups(self):
+        iface = self.conn.find_interface_by_iface_id('port-1')
+        self.assertEqual('tap1', iface['name'])
+        self.assertIsNone(self.conn.find_interface_by_iface_id('port-2'))
+        self.assertEqual('br-int', self.conn.get_interface_bridge('tap1'))
+        self.assertEqual('br-int', self.conn.get_port_bridge('patch-tun'))
+        self.assertIsNone(self.conn.get_interface_bridge('tap2'))
+        self.assertEqual({'tap1': 1, 'patch-tun': []},
+                         self.conn.get_bridge_port_tags('br-int'))
+
+    def test_update_notification(self):
+        self.conn.start()
+        self.server.add_interface('tap2', 'port-2')
+        eventlet.sleep(0.1)
+        iface = self.conn.find_interface_by_iface_id('port-2')
+        self.assertEqual('tap2', iface['name'])
+        self.assertEqual('br-int', self.conn.get_interface_bridge('tap2'))
+        self.assertEqual(1, self.server.connections)
+
+    def test_set_value(self):
+        self.conn.set_value('Port', 'tap1', 'tag', '5')
+        self.assertEqual(5, self.conn.get_value('Port', 'tap1', 'tag'))
+        self.assertEqual(5, self.server.tables['Port']['p1']['tag'])
+        self.assertEqual(1, len(self.server.transactions))
+
+    def test_set_map_key(self):
+        self.conn.set_value('Interface', 'patch-tun', 'options:peer', 'x')
+        self.assertEqual('x', self.conn.get_value('Interface', 'patch-tun',
+                                                  'options:peer'))
+        self.assertEqual(['map', [('peer', 'x')]],
+                         self.server.tables['Interface']['i2']['options'])
+
+    def test_clear_value(self):
+        self.conn.clear_value('Port', 'tap1', 'tag')
+        self.assertEqual([], self.conn.get_value('Port', 'tap1', 'tag'))
+        self.assertEqual(['set', []], self.server.tables['Port']['p1']['tag'])
+
+    def test_transaction_batches_writes(self):
+        with self.conn.transaction():
+            self.conn.set_value('Port', 'tap1', 'tag', 5)
+            with self.conn.transaction():
+                self.conn.set_value('Port', 'patch-tun', 'tag', 6)
+            self.assertEqual([], self.server.transactions)
+        self.assertEqual(1, len(self.server.transactions))
+        self.assertEqual(2, len(self.server.transactions[0]))
+        self.assertEqual(6, self.conn.get_value('Port', 'patch-tun', 'tag'))
+
+    def test_transaction_only_batches_own_writes(self):
+        with self.conn.transaction():
+            self.conn.set_value('Port', 'tap1', 'tag', 5)
+            eventlet.spawn(self.conn.set_value, 'Port', 'patch-tun', 'tag',
+                           6).wait()
+            self.assertEqual(1, len(self.server.transactions))
+        self.assertEqual(2, len(self.server.transactions))
+        self.assertEqual(1, len(self.server.transactions[1]))
+
+    def test_transaction_not_sent_on_error(self):
+        with testtools.ExpectedException(ValueError):
+            with self.conn.transaction():
+                self.conn.set_value('Port', 'tap1', 'tag', 5)
+                raise ValueError()
+        self.assertEqual([], self.server.transactions)
+        self.assertEqual(1, self.conn.get_value('Port', 'tap1', 'tag'))
+
+    def test_reconnect(self):
+        self.conn.start()
+        self.server.disconnect_clients()
+        eventlet.sleep(0.1)
+        self.assertFalse(self.conn.connected)
+        self.assertEqual(['br-int'], self.conn.get_bridges())
+        self.assertEqual(2, self.server.connections)
+
+    def test_echo(self):
+        self.conn.start()
+        self.server._send(self.server.clients[0],
+                          {'method': 'echo', 'params': ['ping'], 'id': 'e'})
+        eventlet.sleep(0.1)
+        self.assertEqual(['ping'], self.server.replies['e']['result'])
+
+    def test_connect_failure(self):
+        conn = ovsdb_native.OvsdbConnection('unix:/nonexistent/db.sock', 5)
+        self.assertRaises(RuntimeError, conn.start)
+
+
+class TestVsctlFormat(base.BaseTestCase):
+
+    def test_to_vsctl_str(self):
+        self.assertEqual('5', ovsdb_native.to_vsctl_str(5))
+        self.assertEqual('[]', ovsdb_native.to_vsctl_str([]))
+        self.assertEqual('true', ovsdb_native.to_vsctl_str(True))
+        self.assertEqual('internal', ovsdb_native.to_vsctl_str('internal'))
+        self.assertEqual('"tap1"', ovsdb_native.to_vsctl_str('tap1'))
+        self.assertEqual('"0000f6e3a4c2b54a"',
+                         ovsdb_native.to_vsctl_str('0000f6e3a4c2b54a'))
+        self.assertEqual('""', ovsdb_native.to_vsctl_str(''))
+        self.assertEqual('{attached-mac="fa:16:3e:00:00:01", peer=x}',
+                         ovsdb_native.to_vsctl_str(
+                             {'peer': 'x',
+                              'attached-mac': 'fa:16:3e:00:00:01'}))
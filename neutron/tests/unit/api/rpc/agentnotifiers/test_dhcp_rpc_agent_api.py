@@ -152,3 +152,36 @@ class TestDhcpAgentNotifyAPI(base.BaseTestCase):
     def test__cast_message(self):
         self.notifier._cast_message(mock.ANY, mock.ANY, mock.ANY)
         self.assertEqual(1, self.mock_cast.call_count)
+
+    def test_notify_bulk_once_per_network(self):
+        ports = [{'id': 'p1', 'network_id': 'n1'},
+                 {'id': 'p2', 'network_id': 'n2'},
+                 {'id': 'p3', 'network_id': 'n1'}]
+        with mock.patch.object(self.notifier, '_notify_agents_bulk') as f:
+            self.notifier.notify_bulk(mock.ANY, 'port', ports,
+                                      'port.create.end')
+        self.assertEqual(
+            [mock.call(mock.ANY, 'port_create_end',
+                       [{'port': ports[0]}, {'port': ports[2]}], 'n1'),
+             mock.call(mock.ANY, 'port_create_end',
+                       [{'port': ports[1]}], 'n2')],
+            f.call_args_list)
+
+    def test_notify_bulk_delete(self):
+        with mock.patch.object(self.notifier, '_notify_agents_bulk') as f:
+            self.notifier.notify_bulk(mock.ANY, 'port',
+                                      [{'id': 'p1', 'network_id': 'n1'}],
+                                      'port.delete.end')
+        f.assert_called_once_with(mock.ANY, 'port_delete_end',
+                                  [{'port_id': 'p1'}], 'n1')
+
+    def test__notify_agents_bulk_schedules_once(self):
+        with mock.patch.object(self.notifier, '_schedule_network') as f:
+            with mock.patch.object(self.notifier, '_get_enabled_agents') as g:
+                g.return_value = [agents_db.Agent(), agents_db.Agent()]
+                self.notifier._notify_agents_bulk(
+                    mock.Mock(), 'port_create_end',
+                    [{'port': {}}] * 3, 'foo_network_id')
+        self.assertEqual(1, f.call_count)
+        self.assertEqual(1, self.notifier.plugin.get_network.call_count)
+        self.assertEqual(6, self.mock_cast.call_count)
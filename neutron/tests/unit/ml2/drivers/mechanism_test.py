@@ -23,6 +23,7 @@ class TestMechanismDriver(api.MechanismDriver):
 
     def initialize(self):
         self.bound_ports = set()
+        self.journal_batches = []
 
     def _check_network_context(self, context, original_expected):
         assert(isinstance(context, api.NetworkContext))
@@ -169,3 +170,12 @@ class TestMechanismDriver(api.MechanismDriver):
                                 {portbindings.CAP_PORT_FILTER: True},
                                 status=const.PORT_STATUS_ACTIVE)
             self.bound_ports.add(context.current['id'])
+
+    def process_journal_entries(self, context, object_type, operation,
+                                resources):
+        assert(object_type in ('network', 'subnet', 'port'))
+        assert(operation in ('create', 'update', 'delete'))
+        assert(context._plugin_context.is_admin)
+        self.journal_batches.append(
+            (object_type, operation,
+             [resource['id'] for resource in resources]))
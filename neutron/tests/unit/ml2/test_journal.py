@@ -0,0 +1,274 @@
+# Copyright (c) 2014 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import contextlib
+import datetime
+
+import mock
+
+from neutron import context
+from neutron import manager
+from neutron.openstack.common import timeutils
+from neutron.plugins.ml2 import config
+from neutron.plugins.ml2 import journal
+from neutron.plugins.ml2 import models
+from neutron.plugins.ml2 import plugin
+from neutron.tests import base
+from neutron.tests.unit import test_db_plugin as test_plugin
+
+PLUGIN_NAME = 'neutron.plugins.ml2.plugin.Ml2Plugin'
+
+
+class TestSelectBatch(base.BaseTestCase):
+
+    def setUp(self):
+        super(TestSelectBatch, self).setUp()
+        self.now = timeutils.utcnow()
+
+    def _entry(self, object_type, operation, resource, next_attempt=None):
+        return (models.JournalEntry(object_type=object_type,
+                                    object_id=resource['id'],
+                                    operation=operation,
+                                    next_attempt=next_attempt),
+                resource)
+
+    def _port(self, port_id, network_id, subnet_id='subnet'):
+        return {'id': port_id, 'network_id': network_id,
+                'fixed_ips': [{'subnet_id': subnet_id,
+                               'ip_address': '10.0.0.2'}]}
+
+    def test_independent_entries_selected(self):
+        entries = [self._entry('port', 'create', self._port('p1', 'n1')),
+                   self._entry('port', 'update', self._port('p1', 'n1')),
+                   self._entry('port', 'create', self._port('p2', 'n1')),
+                   self._entry('network', 'delete', {'id': 'n1'}),
+                   self._entry('port', 'create', self._port('p3', 'n2'))]
+        batch = journal.select_batch(entries, self.now, 10)
+        self.assertEqual([entries[0], entries[2], entries[4]], batch)
+
+    def test_batch_size(self):
+        entries = [self._entry('port', 'create', self._port('p1', 'n1')),
+                   self._entry('port', 'create', self._port('p2', 'n1'))]
+        self.assertEqual(entries[:1],
+                         journal.select_batch(entries, self.now, 1))
+
+    def test_dependent_entries_wait(self):
+        later = self.now + datetime.timedelta(seconds=1)
+        entries = [self._entry('network', 'create', {'id': 'n1'}, later),
+                   self._entry('subnet', 'create',
+                               {'id': 's1', 'network_id': 'n1'}),
+                   self._entry('port', 'create',
+                               self._port('p1', 'n1', subnet_id='s1')),
+                   self._entry('network', 'create', {'id': 'n2'})]
+        self.assertEqual(entries[3:],
+                         journal.select_batch(entries, self.now, 10))
+
+    def test_deletion_waits_for_dependent_entries(self):
+        entries = [self._entry('port', 'delete', self._port('p1', 'n1')),
+                   self._entry('network', 'delete', {'id': 'n1'})]
+        self.assertEqual(entries[:1],
+                         journal.select_batch(entries, self.now, 10))
+
+
+class TestSelectDependents(base.BaseTestCase):
+
+    def _entry(self, object_type, operation, resource):
+        return (models.JournalEntry(object_type=object_type,
+                                    object_id=resource['id'],
+                                    operation=operation),
+                resource)
+
+    def _port(self, port_id, network_id):
+        return {'id': port_id, 'network_id': network_id, 'fixed_ips': []}
+
+    def test_dependents_of_failed_creation(self):
+        failed = [self._entry('network', 'create', {'id': 'n1'})]
+        entries = [self._entry('port', 'create', self._port('p1', 'n1')),
+                   self._entry('port', 'update', self._port('p1', 'n1')),
+                   self._entry('port', 'create', self._port('p2', 'n2')),
+                   self._entry('network', 'update', {'id': 'n1'}),
+                   self._entry('network', 'create', {'id': 'n2'})]
+        self.assertEqual([entries[0], entries[1], entries[3]],
+                         journal.select_dependents(failed, entries))
+
+    def test_no_dependents_of_failed_update(self):
+        failed = [self._entry('network', 'update', {'id': 'n1'})]
+        entries = [self._entry('port', 'create', self._port('p1', 'n1')),
+                   self._entry('network', 'delete', {'id': 'n1'})]
+        self.assertEqual([], journal.select_dependents(failed, entries))
+
+
+class Ml2JournalTestCase(test_plugin.NeutronDbPluginV2TestCase):
+
+    def setUp(self):
+        config.cfg.CONF.set_override('mechanism_drivers',
+                                     ['logger', 'test'], 'ml2')
+        config.cfg.CONF.set_override('journal_mechanism_drivers',
+                                     ['test'], 'ml2')
+        # The tests process the journal rather than a worker
+        self.start = mock.patch.object(journal.Journal, 'start').start()
+        super(Ml2JournalTestCase, self).setUp(PLUGIN_NAME)
+        self.port_create_status = 'DOWN'
+        self.plugin = manager.NeutronManager.get_plugin()
+        self.journal = self.plugin.mechanism_manager.journal
+        self.mech = self.plugin.mechanism_manager.mech_drivers['test'].obj
+        self.context = context.get_admin_context()
+        self.wake = mock.patch.object(self.journal, 'wake').start()
+        timeutils.set_time_override()
+        self.addCleanup(timeutils.clear_time_override)
+
+    def _get_entries(self):
+        return (self.context.session.query(models.JournalEntry).
+                order_by(models.JournalEntry.id).all())
+
+    def test_worker_started_with_plugin(self):
+        self.start.assert_called_once_with()
+
+    def test_operations_recorded(self):
+        with mock.patch.object(self.mech,
+                               'create_network_postcommit') as postcommit:
+            network = self._make_network(self.fmt, 'net', True)['network']
+        self._update('networks', network['id'],
+                     {'network': {'name': 'new'}})
+        self._delete('networks', network['id'])
+        self.assertFalse(postcommit.called)
+        self.assertEqual(3, self.wake.call_count)
+        entries = self._get_entries()
+        self.assertEqual([('network', network['id'], 'create'),
+                          ('network', network['id'], 'update'),
+                          ('network', network['id'], 'delete')],
+                         [(entry.object_type, entry.object_id,
+                           entry.operation) for entry in entries])
+        self.assertEqual(['pending'] * 3,
+                         [entry.state for entry in entries])
+
+    def test_bulk_operations_recorded(self):
+        with self.network() as network:
+            network_id = network['network']['id']
+            with mock.patch.object(
+                    self.mech, 'create_port_bulk_postcommit') as postcommit:
+                res = self._create_port_bulk(self.fmt, 2, network_id,
+                                             'test', True)
+            ports = self.deserialize(self.fmt, res)['ports']
+            self.assertFalse(postcommit.called)
+            self.assertEqual(2, self.wake.call_count)
+            self.assertEqual([('port', port['id'], 'create')
+                              for port in ports],
+                             [(entry.object_type, entry.object_id,
+                               entry.operation)
+                              for entry in self._get_entries()[1:]])
+            for port in ports:
+                self._delete('ports', port['id'])
+
+    def test_process(self):
+        with self.port() as port:
+            port = port['port']
+            self.assertEqual(3, self.journal.process(self.context))
+            self.assertEqual(
+                [('network', 'create', [port['network_id']]),
+                 ('subnet', 'create', [port['fixed_ips'][0]['subnet_id']]),
+                 ('port', 'create', [port['id']])],
+                self.mech.journal_batches)
+            self.assertEqual([], self._get_entries())
+
+    def test_process_batches(self):
+        config.cfg.CONF.set_override('journal_batch_size', 2, 'ml2')
+        with self.subnet() as subnet:
+            with contextlib.nested(self.port(subnet=subnet),
+                                   self.port(subnet=subnet),
+                                   self.port(subnet=subnet)) as ports:
+                self.assertEqual(5, self.journal.process(self.context))
+                port_ids = [port['port']['id'] for port in ports]
+                self.assertEqual([('port', 'create', port_ids[:2]),
+                                  ('port', 'create', port_ids[2:])],
+                                 self.mech.journal_batches[2:])
+
+    def test_failed_batch_retried_later(self):
+        with self.subnet() as subnet:
+            subnet = subnet['subnet']
+            with mock.patch.object(self.mech, 'process_journal_entries',
+                                   side_effect=ValueError):
+                self.assertEqual(0, self.journal.process(self.context))
+            entries = self._get_entries()
+            self.assertEqual([1, 0], [entry.retry_count
+                                      for entry in entries])
+            self.assertEqual(timeutils.utcnow() +
+                             datetime.timedelta(seconds=2),
+                             entries[0].next_attempt)
+            # The subnet waits for its network
+            self.assertEqual(0, self.journal.process(self.context))
+            timeutils.advance_time_seconds(2)
+            self.assertEqual(2, self.journal.process(self.context))
+            self.assertEqual([('network', 'create', [subnet['network_id']]),
+                              ('subnet', 'create', [subnet['id']])],
+                             self.mech.journal_batches)
+
+    def test_entry_failed_after_max_retries(self):
+        config.cfg.CONF.set_override('journal_max_retries', 1, 'ml2')
+        config.cfg.CONF.set_override('journal_batch_size', 1, 'ml2')
+        with contextlib.nested(self.subnet(), self.network()) as (subnet,
+                                                                  network):
+            network = network['network']
+            with mock.patch.object(self.mech, 'process_journal_entries',
+                                   side_effect=ValueError):
+                self.journal.process(self.context)
+            # The subnet is given up with its network
+            self.assertEqual(1, self.journal.process(self.context))
+            self.assertEqual([('network', 'create', [network['id']])],
+                             self.mech.journal_batches)
+            entries = self._get_entries()
+            self.assertEqual([('network', 'failed'), ('subnet', 'failed')],
+                             [(entry.object_type, entry.state)
+                              for entry in entries])
+
+    def test_claimed_entries_not_processed(self):
+        with self.network():
+            entry = self._get_entries()[0]
+            self.assertTrue(self.journal._claim_batch(self.context.session,
+                                                      'test'))
+            self.assertEqual(0, self.journal.process(self.context))
+            timeutils.advance_time_seconds(300)
+            self.assertEqual(1, self.journal.process(self.context))
+            self.assertEqual([('network', 'create', [entry.object_id])],
+                             self.mech.journal_batches)
+
+
+class JournalWorkerTestCase(base.BaseTestCase):
+
+    def test_wake_starts_worker_once(self):
+        worker = journal.Journal([])
+        with mock.patch.object(journal.eventlet, 'spawn') as spawn:
+            worker.start()
+            worker.wake()
+        spawn.assert_called_once_with(worker._run)
+
+
+class Ml2JournalConfigTestCase(base.BaseTestCase):
+
+    def test_unknown_journal_driver(self):
+        self.config_parse()
+        config.cfg.CONF.set_override('mechanism_drivers',
+                                     ['logger', 'test'], 'ml2')
+        config.cfg.CONF.set_override('journal_mechanism_drivers',
+                                     ['test', 'unknown'], 'ml2')
+        self.assertRaises(SystemExit, plugin.Ml2Plugin)
+
+    def test_journal_driver_without_process_journal_entries(self):
+        self.config_parse()
+        config.cfg.CONF.set_override('mechanism_drivers',
+                                     ['logger', 'test'], 'ml2')
+        config.cfg.CONF.set_override('journal_mechanism_drivers',
+                                     ['logger'], 'ml2')
+        self.assertRaises(SystemExit, plugin.Ml2Plugin)
@@ -14,13 +14,26 @@
 #    under the License.
 # @author: Kyle Mestery, Cisco Systems, Inc.
 
+import contextlib
+
+import mock
+import webob.dec
+import webob.exc
+
+from neutron import context
+from neutron import manager
+from neutron.openstack.common import jsonutils
+from neutron.openstack.common import timeutils
 from neutron.plugins.common import constants
 from neutron.plugins.ml2 import config as config
 from neutron.plugins.ml2 import driver_api as api
 from neutron.plugins.ml2.drivers import mechanism_odl
+from neutron.plugins.ml2 import journal
+from neutron.plugins.ml2 import models
 from neutron.plugins.ml2 import plugin
 from neutron.tests import base
 from neutron.tests.unit import test_db_plugin as test_plugin
+from neutron import wsgi
 
 PLUGIN_NAME = 'neutron.plugins.ml2.plugin.Ml2Plugin'
 
@@ -44,8 +57,8 @@ class OpenDaylightTestCase(test_plugin.NeutronDbPluginV2TestCase):
         self.port_create_status = 'DOWN'
         self.segment = {'api.NETWORK_TYPE': ""}
         self.mech = mechanism_odl.OpenDaylightMechanismDriver()
-        mechanism_odl.OpenDaylightMechanismDriver.sendjson = (
-            self.check_sendjson)
+        mock.patch.object(mechanism_odl.OpenDaylightMechanismDriver,
+                          'sendjson', new=self.check_sendjson).start()
 
     def check_sendjson(self, method, urlpath, obj, ignorecodes=[]):
         self.assertFalse(urlpath.startswith("http://"))
@@ -115,3 +128,146 @@ class OpenDaylightMechanismTestSubnetsV2(test_plugin.TestSubnetsV2,
 class OpenDaylightMechanismTestPortsV2(test_plugin.TestPortsV2,
                                        OpenDaylightTestCase):
     pass
+
+
+class StubController(object):
+    """WSGI application standing for the REST interface of OpenDaylight."""
+
+    def __init__(self):
+        self.requests = []
+        self.status = 200
+
+    @webob.dec.wsgify
+    def __call__(self, request):
+        body = jsonutils.loads(request.body) if request.body else None
+        self.requests.append((request.method, request.path, body))
+        return webob.Response(status=self.status)
+
+
+class OpenDaylightStubTestCase(test_plugin.NeutronDbPluginV2TestCase):
+
+    _journal_mechanism_drivers = []
+
+    def setUp(self):
+        self.controller = StubController()
+        server = wsgi.Server('odl-stub')
+        server.start(self.controller, 0, host='127.0.0.1')
+        self.addCleanup(server.stop)
+
+        config.cfg.CONF.set_override('mechanism_drivers',
+                                     ['logger', 'opendaylight'], 'ml2')
+        config.cfg.CONF.set_override('journal_mechanism_drivers',
+                                     self._journal_mechanism_drivers, 'ml2')
+        config.cfg.CONF.set_override(
+            'url', 'http://127.0.0.1:%d/neutron' % server.port, 'ml2_odl')
+        config.cfg.CONF.set_override('username', 'someuser', 'ml2_odl')
+        config.cfg.CONF.set_override('password', 'somepass', 'ml2_odl')
+        super(OpenDaylightStubTestCase, self).setUp(PLUGIN_NAME)
+        self.port_create_status = 'DOWN'
+        self.mechanism_manager = manager.NeutronManager.get_plugin(
+        ).mechanism_manager
+        self.mech = self.mechanism_manager.mech_drivers['opendaylight'].obj
+        self.mech.out_of_sync = False
+        self.context = context.get_admin_context()
+
+    def _get_requests(self):
+        # Leave out the requests getting the authentication cookies
+        requests = [request for request in self.controller.requests
+                    if request[0] != 'GET']
+        self.controller.requests = []
+        return requests
+
+
+class OpenDaylightBulkTestCase(OpenDaylightStubTestCase):
+
+    def test_ports_created_in_one_request(self):
+        with self.network() as network:
+            network_id = network['network']['id']
+            self._get_requests()
+            res = self._create_port_bulk(self.fmt, 3, network_id,
+                                         'test', True)
+            ports = self.deserialize(self.fmt, res)['ports']
+            requests = self._get_requests()
+            self.assertEqual([('POST', '/neutron/ports')],
+                             [request[:2] for request in requests])
+            self.assertEqual(set(port['id'] for port in ports),
+                             set(port['id'] for port
+                                 in requests[0][2]['ports']))
+            for port in ports:
+                self._delete('ports', port['id'])
+
+    def test_bulk_create_failure_deletes_ports(self):
+        with self.network() as network:
+            self.controller.status = 503
+            res = self._create_port_bulk(self.fmt, 2,
+                                         network['network']['id'],
+                                         'test', True)
+            self.controller.status = 200
+            self._validate_behavior_on_bulk_failure(
+                res, 'ports', webob.exc.HTTPServerError.code)
+            self.assertTrue(self.mech.out_of_sync)
+
+
+class OpenDaylightJournalTestCase(OpenDaylightStubTestCase):
+
+    _journal_mechanism_drivers = ['opendaylight']
+
+    def setUp(self):
+        # The tests process the journal rather than a worker
+        mock.patch.object(journal.Journal, 'start').start()
+        super(OpenDaylightJournalTestCase, self).setUp()
+        self.journal = self.mechanism_manager.journal
+        mock.patch.object(self.journal, 'wake').start()
+
+    def test_create_sent_by_journal(self):
+        with self.port() as port:
+            port = port['port']
+            self.assertEqual([], self.controller.requests)
+            self.assertEqual(3, self.journal.process(self.context))
+            requests = self._get_requests()
+            self.assertEqual([('POST', '/neutron/networks'),
+                              ('POST', '/neutron/subnets'),
+                              ('POST', '/neutron/ports')],
+                             [request[:2] for request in requests])
+            self.assertEqual(port['id'], requests[2][2]['port']['id'])
+            self.assertEqual(port['mac_address'].upper(),
+                             requests[2][2]['port']['mac_address'])
+
+    def test_ports_created_in_one_request(self):
+        with self.subnet() as subnet:
+            self.journal.process(self.context)
+            self._get_requests()
+            with contextlib.nested(self.port(subnet=subnet),
+                                   self.port(subnet=subnet),
+                                   self.port(subnet=subnet)) as ports:
+                self.assertEqual(3, self.journal.process(self.context))
+                requests = self._get_requests()
+                self.assertEqual([('POST', '/neutron/ports')],
+                                 [request[:2] for request in requests])
+                self.assertEqual([port['port']['id'] for port in ports],
+                                 [port['id'] for port
+                                  in requests[0][2]['ports']])
+
+    def test_update_and_delete_sent_by_journal(self):
+        with self.network() as network:
+            network = network['network']
+            self._update('networks', network['id'],
+                         {'network': {'name': 'new'}})
+            self.assertEqual(2, self.journal.process(self.context))
+            self._get_requests()
+        self.assertEqual(1, self.journal.process(self.context))
+        self.assertEqual([('DELETE', '/neutron/networks/' + network['id'],
+                           None)],
+                         self._get_requests())
+
+    def test_journal_retried_when_controller_fails(self):
+        timeutils.set_time_override()
+        self.addCleanup(timeutils.clear_time_override)
+        with self.network():
+            self.controller.status = 503
+            self.assertEqual(0, self.journal.process(self.context))
+            entry = self.context.session.query(models.JournalEntry).one()
+            self.assertEqual(1, entry.retry_count)
+            self.controller.status = 200
+            timeutils.advance_time_seconds(2)
+            self.assertEqual(1, self.journal.process(self.context))
@@ -28,6 +28,7 @@ from neutron import manager
 from neutron.plugins.common import constants as service_constants
 from neutron.plugins.ml2.common import exceptions as ml2_exc
 from neutron.plugins.ml2 import config
+from neutron.plugins.ml2 import db as ml2_db
 from neutron.plugins.ml2 import driver_api
 from neutron.plugins.ml2 import plugin as ml2_plugin
 from neutron.tests.unit import _test_extension_portbindings as test_bindings
@@ -118,6 +119,24 @@ class TestMl2PortsV2(test_plugin.TestPortsV2, Ml2PluginV2TestCase):
             self.assertEqual('DOWN', port['port']['status'])
             self.assertEqual('DOWN', self.port_create_status)
 
+    def test_update_port_statuses(self):
+        ctx = context.get_admin_context()
+        plugin = manager.NeutronManager.get_plugin()
+        with self.subnet() as subnet, contextlib.nested(
+            self.port(subnet=subnet),
+            self.port(subnet=subnet)
+        ) as (port1, port2):
+            port_ids = [port1['port']['id'], port2['port']['id']]
+            with mock.patch.object(plugin.mechanism_manager,
+                                   'update_port_postcommit') as postcommit:
+                found = plugin.update_port_statuses(
+                    ctx, {port_ids[0]: 'ACTIVE', port_ids[1]: 'DOWN',
+                          'invalid-uuid': 'ACTIVE'})
+            self.assertEqual(set(port_ids), found)
+            self.assertEqual(1, postcommit.call_count)
+            port = self._show('ports', port_ids[0])
+            self.assertEqual('ACTIVE', port['port']['status'])
+
     def test_update_non_existent_port(self):
         ctx = context.get_admin_context()
         plugin = manager.NeutronManager.get_plugin()
@@ -171,6 +190,53 @@ class TestMl2PortsV2(test_plugin.TestPortsV2, Ml2PluginV2TestCase):
             # by the called method
             self.assertIsNone(l3plugin.disassociate_floatingips(ctx, port_id))
 
+    def test_create_ports_bulk_calls_drivers_once(self):
+        plugin = manager.NeutronManager.get_plugin()
+        mech_manager = plugin.mechanism_manager
+        mech = mech_manager.mech_drivers['test'].obj
+        with self.subnet() as subnet:
+            with contextlib.nested(
+                mock.patch.object(mech_manager, 'create_port_precommit'),
+                mock.patch.object(mech_manager, 'create_port_postcommit'),
+                mock.patch.object(mech, 'create_port_bulk_precommit',
+                                  wraps=mech.create_port_bulk_precommit),
+                mock.patch.object(mech, 'create_port_postcommit'),
+                mock.patch.object(plugin.notifier,
+                                  'security_groups_member_updated')
+            ) as (precommit, postcommit, bulk_precommit, driver_postcommit,
+                  sg_member_updated):
+                res = self._create_port_bulk(self.fmt, 3,
+                                             subnet['subnet']['network_id'],
+                                             'test', True)
+                ports = self.deserialize(self.fmt, res)['ports']
+            self.assertFalse(precommit.called)
+            self.assertFalse(postcommit.called)
+            self.assertEqual(1, bulk_precommit.call_count)
+            self.assertEqual([port['id'] for port in ports],
+                             [port_context.current['id'] for port_context
+                              in bulk_precommit.call_args[0][0]])
+            # The driver does not handle the ports together
+            self.assertEqual(3, driver_postcommit.call_count)
+            self.assertEqual(1, sg_member_updated.call_count)
+            self.assertEqual(['10.0.0.2', '10.0.0.3', '10.0.0.4'],
+                             [port['fixed_ips'][0]['ip_address']
+                              for port in ports])
+            for port in ports:
+                self._delete('ports', port['id'])
+
+    def test_create_ports_bulk_postcommit_failure(self):
+        plugin = manager.NeutronManager.get_plugin()
+        with self.network() as net:
+            with mock.patch.object(plugin.mechanism_manager,
+                                   'create_port_bulk_postcommit',
+                                   side_effect=ml2_exc.MechanismDriverError(
+                                       method='create_port_bulk_postcommit')):
+                res = self._create_port_bulk(self.fmt, 2,
+                                             net['network']['id'],
+                                             'test', True)
+            self._validate_behavior_on_bulk_failure(
+                res, 'ports', webob.exc.HTTPServerError.code)
+
 
 class TestMl2PortBinding(Ml2PluginV2TestCase,
                          test_bindings.PortBindingsTestCase):
@@ -376,6 +442,54 @@ class TestMultiSegmentNetworks(Ml2PluginV2TestCase):
             with testtools.ExpectedException(ml2_exc.MechanismDriverError):
                 self.driver.create_network(self.context, data)
 
+    def _create_vlan_networks(self):
+        networks = []
+        for segmentation_ids in ([1], [2], [3, 4]):
+            segments = [{pnet.NETWORK_TYPE: 'vlan',
+                         pnet.PHYSICAL_NETWORK: 'physnet1',
+                         pnet.SEGMENTATION_ID: segmentation_id}
+                        for segmentation_id in segmentation_ids]
+            data = {'network': {'name': 'net%d' % len(networks),
+                                'admin_state_up': True,
+                                'shared': False,
+                                mpnet.SEGMENTS: segments,
+                                'tenant_id': 'tenant_one'}}
+            networks.append(
+                self.driver.create_network(self.context, data)['id'])
+        return networks
+
+    def _get_network_ids(self, filters):
+        return sorted(network['id'] for network in
+                      self.driver.get_networks(self.context, filters=filters))
+
+    def test_get_networks_provider_filters(self):
+        networks = self._create_vlan_networks()
+        self.assertEqual(sorted(networks), self._get_network_ids(
+            {pnet.NETWORK_TYPE: ['vlan']}))
+        self.assertEqual([networks[1]], self._get_network_ids(
+            {pnet.NETWORK_TYPE: ['vlan'], pnet.SEGMENTATION_ID: [2]}))
+        self.assertEqual([networks[2]], self._get_network_ids(
+            {pnet.PHYSICAL_NETWORK: ['physnet1'], pnet.SEGMENTATION_ID: [4]}))
+        self.assertEqual(sorted(networks[:2]), self._get_network_ids(
+            {pnet.SEGMENTATION_ID: [1, 2]}))
+        self.assertEqual([], self._get_network_ids(
+            {pnet.NETWORK_TYPE: ['flat']}))
+
+    def test_get_networks_fetches_segments_once(self):
+        networks = self._create_vlan_networks()
+        with contextlib.nested(
+            mock.patch.object(ml2_db, 'get_network_segments'),
+            mock.patch.object(ml2_db, 'get_networks_segments',
+                              wraps=ml2_db.get_networks_segments)
+        ) as (get_network_segments, get_networks_segments):
+            nets = self.driver.get_networks(self.context)
+        self.assertFalse(get_network_segments.called)
+        self.assertEqual(1, get_networks_segments.call_count)
+        nets = dict((net['id'], net) for net in nets)
+        self.assertEqual(2, nets[networks[1]][pnet.SEGMENTATION_ID])
+        self.assertEqual([3, 4], [segment[pnet.SEGMENTATION_ID] for segment
+                                  in nets[networks[2]][mpnet.SEGMENTS]])
+
     def test_extend_dictionary_no_segments(self):
         network = dict(name='net_no_segment', id='5', tenant_id='tenant_one')
         self.driver._extend_network_dict_provider(self.context, network)
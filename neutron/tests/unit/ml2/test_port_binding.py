@@ -13,6 +13,8 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import contextlib
+
 import mock
 
 from neutron import context
@@ -94,6 +96,35 @@ class PortBindingTestCase(test_plugin.NeutronDbPluginV2TestCase):
                                 portbindings.VIF_TYPE_OVS,
                                 True, True, 'ACTIVE')
 
+    def test_get_devices_details_list(self):
+        host_arg = {portbindings.HOST_ID: 'host-ovs-no_filter'}
+        with contextlib.nested(
+            self.subnet(cidr='10.0.0.0/24'),
+            self.subnet(cidr='10.0.1.0/24')
+        ) as (subnet1, subnet2), contextlib.nested(
+            self.port(subnet=subnet1, arg_list=(portbindings.HOST_ID,),
+                      **host_arg),
+            self.port(subnet=subnet2, arg_list=(portbindings.HOST_ID,),
+                      **host_arg),
+            self.port(subnet=subnet1)
+        ) as (port1, port2, unbound):
+            devices = [port1['port']['id'], port2['port']['id'][:11],
+                       unbound['port']['id'], 'fake_device']
+            neutron_context = context.get_admin_context()
+            callbacks = self.plugin.endpoints[0]
+            details = callbacks.get_devices_details_list(
+                neutron_context, agent_id="theAgentId", devices=devices)
+            expected = [callbacks.get_device_details(
+                neutron_context, agent_id="theAgentId", device=device)
+                for device in devices]
+            self.assertEqual(expected, details)
+            self.assertEqual('local', details[0]['network_type'])
+            self.assertEqual(port2['port']['id'], details[1]['port_id'])
+            self.assertEqual({'device': unbound['port']['id']}, details[2])
+            for port in (port1, port2):
+                port = self._show('ports', port['port']['id'])
+                self.assertEqual('BUILD', port['port']['status'])
+
     def _test_update_port_binding(self, host, new_host=None):
         with mock.patch.object(self.plugin,
                                '_notify_port_updated') as notify_mock:
@@ -582,6 +582,36 @@ class OvsAgentSchedulerTestCase(OvsAgentSchedulerTestCaseBase):
             self.adminContext, host=DHCP_HOSTA)
         self.assertEqual([], nets)
 
+    def test_list_active_networks_on_dhcp_agent_in_chunks(self):
+        dhcp_hosta = {
+            'binary': 'neutron-dhcp-agent',
+            'host': DHCP_HOSTA,
+            'topic': 'DHCP_AGENT',
+            'configurations': {'dhcp_driver': 'dhcp_driver',
+                               'use_namespaces': True,
+                               },
+            'agent_type': constants.AGENT_TYPE_DHCP}
+        self._register_one_agent_state(dhcp_hosta)
+        hosta_id = self._get_agent_id(constants.AGENT_TYPE_DHCP,
+                                      DHCP_HOSTA)
+        plugin = manager.NeutronManager.get_plugin()
+        with contextlib.nested(self.network(),
+                               self.network(admin_state_up=False),
+                               self.network(),
+                               self.network()) as nets:
+            for net in nets:
+                self._add_network_to_dhcp_agent(hosta_id,
+                                                net['network']['id'])
+            net_ids = sorted(net['network']['id'] for net in nets
+                             if net['network']['admin_state_up'])
+            first = plugin.list_active_networks_on_active_dhcp_agent(
+                self.adminContext, DHCP_HOSTA, limit=2)
+            last = plugin.list_active_networks_on_active_dhcp_agent(
+                self.adminContext, DHCP_HOSTA, limit=2,
+                marker=first[-1]['id'])
+        self.assertEqual(net_ids[:2], [net['id'] for net in first])
+        self.assertEqual(net_ids[2:], [net['id'] for net in last])
+
     def test_reserved_port_after_network_remove_from_dhcp_agent(self):
         dhcp_hosta = {
             'binary': 'neutron-dhcp-agent',
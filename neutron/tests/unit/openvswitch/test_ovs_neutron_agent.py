@@ -264,6 +264,69 @@ class TestOvsNeutronAgent(base.BaseTestCase):
                                       updated_ports)
         self.assertEqual(expected, actual)
 
+    def _port_event(self, action, name, ofport, vif_id=None):
+        external_ids = {}
+        if vif_id:
+            external_ids = {'iface-id': vif_id, 'attached-mac': 'ca:fe'}
+        return {'action': action, 'name': name, 'ofport': ofport,
+                'external_ids': external_ids}
+
+    def mock_process_port_events(self, events, registered_ports,
+                                 updated_ports=None, bridge='br-int'):
+        with mock.patch.object(self.agent.int_br,
+                               'get_bridge_name_for_port_name',
+                               return_value=bridge + '\n') as get_bridge:
+            port_info = self.agent.process_port_events(
+                events, registered_ports, updated_ports)
+        return port_info, get_bridge
+
+    def test_process_port_events_added_and_removed(self):
+        self.agent.int_br.br_name = 'br-int'
+        events = [self._port_event('insert', 'tap3', None, 'port3'),
+                  self._port_event('new', 'tap3', 3, 'port3'),
+                  self._port_event('delete', 'tap2', 2, 'port2'),
+                  self._port_event('insert', 'patch-tun', 4)]
+        port_info, get_bridge = self.mock_process_port_events(
+            events, set(['port1', 'port2']), set(['port1', 'port2']))
+        self.assertEqual({'current': set(['port1', 'port3']),
+                          'added': set(['port3']),
+                          'removed': set(['port2']),
+                          'updated': set(['port1'])}, port_info)
+        get_bridge.assert_called_once_with('tap3')
+
+    def test_process_port_events_no_changes(self):
+        port_info, get_bridge = self.mock_process_port_events(
+            [], set(['port1']), set(['port1']))
+        self.assertEqual({'current': set(['port1']),
+                          'updated': set(['port1'])}, port_info)
+        self.assertFalse(get_bridge.called)
+
+    def test_process_port_events_ignores_other_bridges(self):
+        self.agent.int_br.br_name = 'br-int'
+        events = [self._port_event('insert', 'tap3', 3, 'port3')]
+        port_info, _get_bridge = self.mock_process_port_events(
+            events, set(), bridge='br-ex')
+        self.assertEqual({'current': set()}, port_info)
+
+    def test_process_port_events_failed_port_is_removed(self):
+        events = [self._port_event('new', 'tap1', -1, 'port1'),
+                  self._port_event('new', 'tap2', -1, 'port2')]
+        port_info, _get_bridge = self.mock_process_port_events(
+            events, set(['port1']))
+        self.assertEqual({'current': set(),
+                          'added': set(),
+                          'removed': set(['port1'])}, port_info)
+
+    def test_process_port_events_readded_port(self):
+        events = [self._port_event('delete', 'tap1', 1, 'port1'),
+                  self._port_event('insert', 'tap1', 7, 'port1')]
+        port_info, get_bridge = self.mock_process_port_events(
+            events, set(['port1']))
+        self.assertEqual({'current': set(['port1']),
+                          'added': set(['port1']),
+                          'removed': set()}, port_info)
+        self.assertFalse(get_bridge.called)
+
     def test_update_ports_returns_changed_vlan(self):
         br = ovs_lib.OVSBridge('br-int', 'sudo')
         mac = "ca:fe:de:ad:be:ef"
@@ -283,6 +346,32 @@ class TestOvsNeutronAgent(base.BaseTestCase):
                 vif_port_set, registered_ports, port_tags_dict=port_tags_dict)
         self.assertEqual(expected, actual)
 
+    def test_treat_devices_added_updates_status_after_flows(self):
+        details = {'device': 'port1', 'port_id': 'port1',
+                   'network_id': 'net1', 'network_type': 'vlan',
+                   'physical_network': 'physnet1', 'segmentation_id': 1,
+                   'admin_state_up': True}
+        parent = mock.Mock()
+        with contextlib.nested(
+            mock.patch.object(self.agent.plugin_rpc,
+                              'get_devices_details_list',
+                              return_value=[details]),
+            mock.patch.object(self.agent.int_br, 'get_vif_port_by_id',
+                              return_value=mock.Mock()),
+            mock.patch.object(self.agent.int_br, 'defer_apply_off'),
+            mock.patch.object(self.agent, 'treat_vif_port'),
+            mock.patch.object(self.agent.plugin_rpc, 'update_device_up')
+        ) as (get_dev_fn, get_vif_func, defer_off, treat_vif_port,
+              upd_dev_up):
+            parent.attach_mock(treat_vif_port, 'treat_vif_port')
+            parent.attach_mock(defer_off, 'defer_apply_off')
+            parent.attach_mock(upd_dev_up, 'update_device_up')
+            self.assertFalse(self.agent.treat_devices_added_or_updated(
+                ['port1'], False))
+        self.assertEqual(['treat_vif_port', 'defer_apply_off',
+                          'update_device_up'],
+                         [call[0] for call in parent.mock_calls])
+
     def test_treat_devices_added_returns_true_for_missing_device(self):
         with contextlib.nested(
             mock.patch.object(self.agent.plugin_rpc,
@@ -365,6 +454,40 @@ class TestOvsNeutronAgent(base.BaseTestCase):
             self.assertTrue(treat_vif_port.called)
             self.assertTrue(upd_dev_down.called)
 
+    def test_treat_devices_added_updated_commits_ovsdb_writes_first(self):
+        details = {'admin_state_up': True,
+                   'port_id': 'xxx',
+                   'device': 'xxx',
+                   'network_id': 'yyy',
+                   'physical_network': 'foo',
+                   'segmentation_id': 'bar',
+                   'network_type': 'baz'}
+
+        def treat_vif_port(*args):
+            self.assertTrue(transaction.return_value.__enter__.called)
+            self.assertFalse(transaction.return_value.__exit__.called)
+
+        def update_device_up(*args):
+            self.assertTrue(transaction.return_value.__exit__.called)
+
+        with contextlib.nested(
+            mock.patch.object(self.agent.plugin_rpc,
+                              'get_devices_details_list',
+                              return_value=[details]),
+            mock.patch.object(self.agent.int_br, 'get_vif_port_by_id',
+                              return_value=mock.MagicMock()),
+            mock.patch.object(self.agent.int_br, 'ovsdb_transaction'),
+            mock.patch.object(self.agent.plugin_rpc, 'update_device_up',
+                              side_effect=update_device_up),
+            mock.patch.object(self.agent, 'treat_vif_port',
+                              side_effect=treat_vif_port)
+        ) as (get_dev_fn, get_vif_func, transaction, upd_dev_up,
+              treat_vif_port_fn):
+            self.assertFalse(self.agent.treat_devices_added_or_updated(
+                ['xxx'], False))
+            self.assertTrue(treat_vif_port_fn.called)
+            self.assertTrue(upd_dev_up.called)
+
     def test_treat_devices_removed_returns_true_for_missing_device(self):
         with mock.patch.object(self.agent.plugin_rpc, 'update_device_down',
                                side_effect=Exception()):
@@ -417,6 +540,8 @@ class TestOvsNeutronAgent(base.BaseTestCase):
         with mock.patch.object(self.agent.state_rpc,
                                "report_state") as report_st:
             self.agent.int_br_device_count = 5
+            self.agent.sg_agent.firewall_refresh_counts = {'global': 1,
+                                                           'targeted': 2}
             self.agent._report_state()
             report_st.assert_called_with(self.agent.context,
                                          self.agent.agent_state)
@@ -425,6 +550,17 @@ class TestOvsNeutronAgent(base.BaseTestCase):
                 self.agent.agent_state["configurations"]["devices"],
                 self.agent.int_br_device_count
             )
+            self.assertEqual(
+                {'global': 1, 'targeted': 2},
+                self.agent.agent_state["configurations"]["firewall_refreshes"])
+
+    def test_report_state_before_security_group_agent(self):
+        with mock.patch.object(self.agent.state_rpc,
+                               "report_state") as report_st:
+            self.agent.sg_agent = None
+            self.agent._report_state()
+            report_st.assert_called_with(self.agent.context,
+                                         self.agent.agent_state)
 
     def test_network_delete(self):
         with contextlib.nested(
@@ -951,6 +1087,44 @@ class TestOvsNeutronAgent(base.BaseTestCase):
         setup_int_br.assert_has_calls([mock.call()])
         setup_phys_br.assert_has_calls([mock.call({})])
 
+    def test_rpc_loop_processes_port_events(self):
+        reply1 = {'current': set(['tap0'])}
+        reply2 = {'current': set(['tap0', 'tap1']),
+                  'added': set(['tap1']),
+                  'removed': set()}
+        events = [{'action': 'insert', 'name': 'tap1', 'ofport': 1,
+                   'external_ids': {}}]
+        polling_manager = mock.Mock()
+        polling_manager.get_events.side_effect = [None, events]
+        self.agent.polling_interval = 0
+
+        with contextlib.nested(
+            mock.patch.object(log.ContextAdapter, 'exception'),
+            mock.patch.object(self.agent, 'scan_ports',
+                              return_value=reply1),
+            mock.patch.object(self.agent, 'process_port_events',
+                              return_value=reply2),
+            mock.patch.object(self.agent, 'process_network_ports'),
+            mock.patch.object(self.agent, 'check_ovs_restart',
+                              return_value=False)
+        ) as (log_exception, scan_ports, process_port_events,
+              process_network_ports, check_ovs_restart):
+            log_exception.side_effect = Exception(
+                'Fake exception to get out of the loop')
+            process_network_ports.side_effect = [
+                False, Exception('Fake exception to get out of the loop')]
+            # This will exit after the second loop
+            try:
+                self.agent.rpc_loop(polling_manager=polling_manager)
+            except Exception:
+                pass
+
+        scan_ports.assert_called_once_with(set(), set())
+        process_port_events.assert_called_once_with(
+            events, set(['tap0']), set())
+        process_network_ports.assert_has_calls([
+            mock.call(reply1, False), mock.call(reply2, False)])
+
 
 class AncillaryBridgesTest(base.BaseTestCase):
 
@@ -192,3 +192,20 @@ class TestVPNAgent(base.BaseTestCase):
         self.agent.devices = [device]
         self.agent._process_routers(routers, False)
         device.sync.assert_called_once_with(mock.ANY, routers)
+
+    def test_process_routers_synced_once_updates_processed(self):
+        self.plugin_api.get_external_network_id.return_value = None
+        routers = [
+            {'id': _uuid(),
+             'admin_state_up': True,
+             'routes': [],
+             'external_gateway_info': {}} for i in range(2)]
+        device = mock.Mock()
+        self.agent.devices = [device]
+        self.agent._queue.add(l3_agent.RouterUpdate(routers[1]['id'], 0))
+        self.agent._process_routers(routers[:1], False)
+        self.assertFalse(device.sync.called)
+
+        self.agent._queue.get()
+        self.agent._process_routers(routers[1:], False)
+        device.sync.assert_called_once_with(mock.ANY, routers)
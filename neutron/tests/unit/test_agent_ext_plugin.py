@@ -16,16 +16,20 @@
 import copy
 import time
 
+import mock
 from oslo.config import cfg
 from webob import exc
 
 from neutron.api.v2 import attributes
 from neutron.common import constants
+from neutron.common import exceptions as n_exc
 from neutron.common import topics
 from neutron import context
 from neutron.db import agents_db
+from neutron.db import agentschedulers_db
 from neutron.db import db_base_plugin_v2
 from neutron.extensions import agent
+from neutron import manager
 from neutron.openstack.common import log as logging
 from neutron.openstack.common import timeutils
 from neutron.openstack.common import uuidutils
@@ -252,6 +256,108 @@ class AgentDBTestCase(AgentDBTestMixIn,
             query_string='binary=neutron-l3-agent&host=' + L3_HOSTB)
         self.assertFalse(agents['agents'][0]['alive'])
 
+    def _setup_heartbeats(self):
+        cfg.CONF.set_override('agent_heartbeat_flush_interval', 10)
+        heartbeats = agents_db.AgentHeartbeats()
+        mock.patch.object(agents_db, 'HEARTBEATS', heartbeats).start()
+        mock.patch.object(agents_db.loopingcall,
+                          'FixedIntervalLoopingCall').start()
+        timeutils.set_time_override(timeutils.utcnow())
+        self.addCleanup(timeutils.clear_time_override)
+        return heartbeats
+
+    def _get_agent_db(self):
+        self.adminContext.session.expire_all()
+        return self.adminContext.session.query(agents_db.Agent).one()
+
+    def test_report_state_keeps_heartbeat(self):
+        heartbeats = self._setup_heartbeats()
+        self._register_one_dhcp_agent()
+        first_heartbeat = self._get_agent_db().heartbeat_timestamp
+        timeutils.advance_time_seconds(5)
+        with mock.patch.object(agents_db.Agent, 'update') as update:
+            self._register_one_dhcp_agent()
+        self.assertFalse(update.called)
+        agent_db = self._get_agent_db()
+        self.assertEqual(first_heartbeat, agent_db.heartbeat_timestamp)
+        plugin = manager.NeutronManager.get_plugin()
+        agent = plugin._make_agent_dict(agent_db)
+        self.assertEqual(timeutils.utcnow(), agent['heartbeat_timestamp'])
+        self.assertEqual(1, heartbeats.flush(self.adminContext))
+        self.assertEqual(timeutils.utcnow(),
+                         self._get_agent_db().heartbeat_timestamp)
+        self.assertEqual(0, heartbeats.flush(self.adminContext))
+
+    def test_report_state_writes_changed_configurations(self):
+        self._setup_heartbeats()
+        dhcp_host = self._register_one_dhcp_agent()[0]
+        timeutils.advance_time_seconds(5)
+        dhcp_host['configurations']['networks'] = 1
+        callback = agents_db.AgentExtRpcCallback()
+        callback.report_state(self.adminContext,
+                              agent_state={'agent_state': dhcp_host},
+                              time=timeutils.strtime())
+        agent_db = self._get_agent_db()
+        self.assertEqual(timeutils.utcnow(), agent_db.heartbeat_timestamp)
+        plugin = manager.NeutronManager.get_plugin()
+        self.assertEqual(1, plugin.get_configuration_dict(
+            agent_db)['networks'])
+
+    def test_report_state_after_start_is_written(self):
+        self._setup_heartbeats()
+        dhcp_host = self._register_one_dhcp_agent()[0]
+        timeutils.advance_time_seconds(5)
+        dhcp_host['start_flag'] = True
+        callback = agents_db.AgentExtRpcCallback()
+        callback.report_state(self.adminContext,
+                              agent_state={'agent_state': dhcp_host},
+                              time=timeutils.strtime())
+        agent_db = self._get_agent_db()
+        self.assertEqual(timeutils.utcnow(), agent_db.started_at)
+        self.assertEqual(timeutils.utcnow(), agent_db.heartbeat_timestamp)
+
+    def test_flush_forgets_deleted_agents(self):
+        heartbeats = self._setup_heartbeats()
+        self._register_one_dhcp_agent()
+        self._register_one_dhcp_agent()
+        # Deleted by another server worker
+        with self.adminContext.session.begin():
+            self.adminContext.session.query(agents_db.Agent).delete()
+        heartbeats.flush(self.adminContext)
+        self._register_one_dhcp_agent()
+        self.assertEqual(timeutils.utcnow(),
+                         self._get_agent_db().created_at)
+
+    def test_kept_heartbeat_keeps_agent_eligible(self):
+        self._setup_heartbeats()
+        self._register_one_dhcp_agent()
+        timeutils.advance_time_seconds(60)
+        self._register_one_dhcp_agent()
+        timeutils.advance_time_seconds(30)
+        agent_db = self._get_agent_db()
+        self.assertTrue(agents_db.AgentDbMixin.is_agent_down(
+            agent_db.heartbeat_timestamp))
+        self.assertTrue(agent_db.is_active)
+        self.assertTrue(agentschedulers_db.AgentSchedulerDbMixin.
+                        is_eligible_agent(True, agent_db))
+
+    def test_flush_interval_above_agent_down_time_rejected(self):
+        cfg.CONF.set_override('agent_heartbeat_flush_interval', 45)
+        self.assertRaises(n_exc.InvalidConfigurationOption,
+                          agents_db.AgentExtRpcCallback)
+        cfg.CONF.set_override('agent_heartbeat_flush_interval', 44)
+        agents_db.AgentExtRpcCallback()
+
+    def test_report_state_without_flush_interval(self):
+        heartbeats = self._setup_heartbeats()
+        cfg.CONF.set_override('agent_heartbeat_flush_interval', 0)
+        self._register_one_dhcp_agent()
+        timeutils.advance_time_seconds(5)
+        self._register_one_dhcp_agent()
+        self.assertEqual(timeutils.utcnow(),
+                         self._get_agent_db().heartbeat_timestamp)
+        self.assertEqual(0, heartbeats.flush(self.adminContext))
+
 
 class AgentDBTestCaseXML(AgentDBTestCase):
     fmt = 'xml'
@@ -14,8 +14,10 @@
 
 import fixtures
 import mock
+from oslo.config import cfg
 import testtools
 
+from neutron.agent.common import config
 from neutron.agent.linux import utils
 from neutron.tests import base
 
@@ -110,6 +112,78 @@ class AgentUtilsExecuteTest(base.BaseTestCase):
                 utils.execute(['ls'])
                 self.assertTrue(log.debug.called)
 
+    def test_execute_records_stats(self):
+        self.mock_popen.return_value = ["", ""]
+        utils.EXECUTE_STATS.reset()
+        utils.execute(["ls", self.test_file])
+        self.assertEqual(1, utils.EXECUTE_STATS.calls)
+
+
+class AgentUtilsExecuteRootwrapDaemonTest(base.BaseTestCase):
+    def setUp(self):
+        super(AgentUtilsExecuteRootwrapDaemonTest, self).setUp()
+        config.register_root_helper(cfg.CONF)
+        cfg.CONF.set_override('root_helper_daemon', 'sudo rootwrap-daemon',
+                              'AGENT')
+        self.client_p = mock.patch.object(utils.rootwrap_client, 'Client')
+        self.client = self.client_p.start().return_value
+        self.client.execute.return_value = 0, 'out', ''
+        self.create_process_p = mock.patch.object(utils, 'create_process')
+        self.create_process = self.create_process_p.start()
+        self.addCleanup(utils._rootwrap_clients.clear)
+
+    def test_execute_with_root_helper_uses_daemon(self):
+        result = utils.execute(['ip', 'link'], 'sudo', process_input='in')
+        self.assertEqual('out', result)
+        self.client.execute.assert_called_once_with(['ip', 'link'],
+                                                    stdin='in')
+        self.assertFalse(self.create_process.called)
+        utils.rootwrap_client.Client.assert_called_once_with(
+            ['sudo', 'rootwrap-daemon'])
+
+    def test_execute_reuses_daemon(self):
+        utils.execute(['ip', 'link'], 'sudo')
+        utils.execute(['ip', 'addr'], 'sudo')
+        self.assertEqual(1, utils.rootwrap_client.Client.call_count)
+        self.assertEqual(2, self.client.execute.call_count)
+
+    def test_execute_with_addl_env(self):
+        utils.execute(['dnsmasq'], 'sudo', addl_env={'FOO': 'bar'})
+        self.client.execute.assert_called_once_with(
+            ['env', 'FOO=bar', 'dnsmasq'], stdin=None)
+
+    def test_execute_without_root_helper_does_not_use_daemon(self):
+        self.create_process.return_value = FakeCreateProcess(0), ['ls']
+        utils.execute(['ls'])
+        self.assertFalse(self.client.execute.called)
+        self.assertTrue(self.create_process.called)
+
+    def test_execute_raises_on_daemon_error(self):
+        self.client.execute.return_value = 1, '', 'error'
+        self.assertRaises(RuntimeError, utils.execute, ['ip', 'link'],
+                          'sudo')
+
+
+class TestExecuteStats(base.BaseTestCase):
+    def test_pop_state(self):
+        stats = utils.ExecuteStats()
+        for elapsed in (0.001, 0.02, 0.03, 7):
+            stats.record(elapsed)
+        with mock.patch('time.time', return_value=stats.started + 2):
+            state = stats.pop_state()
+        self.assertEqual(4, state['execute_calls'])
+        self.assertEqual(2, state['execute_calls_per_sec'])
+        self.assertEqual(1.763, state['execute_avg_latency'])
+        self.assertEqual({'<=0.01s': 1, '<=0.05s': 2, '<=0.1s': 0,
+                          '<=0.5s': 0, '<=1s': 0, '<=5s': 0, '>5s': 1},
+                         state['execute_latency_histogram'])
+        self.assertEqual(0, stats.calls)
+
+    def test_pop_state_without_calls(self):
+        state = utils.ExecuteStats().pop_state()
+        self.assertEqual(0, state['execute_calls'])
+        self.assertEqual(0, state['execute_avg_latency'])
+
 
 class AgentUtilsGetInterfaceMAC(base.BaseTestCase):
     def test_get_interface_mac(self):
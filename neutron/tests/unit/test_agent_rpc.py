@@ -14,8 +14,10 @@
 #    under the License.
 
 import mock
+from oslo.config import cfg
 from oslo import messaging
 
+from neutron.agent.common import config
 from neutron.agent import rpc
 from neutron.openstack.common import context
 from neutron.tests import base
@@ -95,6 +97,23 @@ class AgentPluginReportState(base.BaseTestCase):
             self.assertEqual(cast.call_args[1]['topic'], topic)
 
 
+class AgentMetricsReport(base.BaseTestCase):
+
+    def setUp(self):
+        super(AgentMetricsReport, self).setUp()
+        config.register_agent_state_opts_helper(cfg.CONF)
+
+    def test_metrics_due_every_interval(self):
+        self.config(metrics_report_interval=3, group='AGENT')
+        metrics_report = rpc.MetricsReport()
+        self.assertEqual([True, False, False, True],
+                         [metrics_report.due() for i in range(4)])
+
+    def test_metrics_disabled(self):
+        self.config(metrics_report_interval=0, group='AGENT')
+        self.assertFalse(rpc.MetricsReport().due())
+
+
 class AgentRPCMethods(base.BaseTestCase):
     def test_create_consumers(self):
         endpoints = [mock.Mock()]
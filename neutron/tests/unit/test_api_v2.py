@@ -1336,7 +1336,16 @@ class DHCPNotificationTest(APIv2TestBase):
                                'tenant_id': _uuid()},
                               {'name': 'net2',
                                'tenant_id': _uuid()}]}
-        self._test_dhcp_notifier('create', 'network', input)
+        instance = self.plugin.return_value
+        instance.get_networks_count.return_value = 0
+        with mock.patch.object(dhcp_rpc_agent_api.DhcpAgentNotifyAPI,
+                               'notify_bulk') as dhcp_notifier:
+            res = self.api.post_json(_get_path('networks'), input)
+        self.assertEqual(exc.HTTPCreated.code, res.status_int)
+        # The networks are notified together
+        dhcp_notifier.assert_called_once_with(mock.ANY, 'network', mock.ANY,
+                                              'network.create.end')
+        self.assertEqual(2, len(dhcp_notifier.call_args[0][2]))
 
 
 class QuotaTest(APIv2TestBase):
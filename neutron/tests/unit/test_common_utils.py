@@ -375,6 +375,61 @@ class TestCachingDecorator(base.BaseTestCase):
         self.assertEqual(self.decor.func_retval, retval)
 
 
+class TestLRUCache(base.BaseTestCase):
+    def setUp(self):
+        super(TestLRUCache, self).setUp()
+        self.utcnow = mock.patch(
+            'neutron.openstack.common.timeutils.utcnow_ts',
+            return_value=0).start()
+
+    def test_get_set(self):
+        cache = utils.LRUCache(10)
+        self.assertIsNone(cache.get('a'))
+        cache.set('a', 1)
+        self.assertEqual(1, cache.get('a'))
+        self.assertEqual({'hits': 1, 'misses': 1, 'evictions': 0,
+                          'entries': 1}, cache.stats())
+
+    def test_evicts_least_recently_used(self):
+        cache = utils.LRUCache(2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+        self.assertEqual(1, cache.get('a'))
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(3, cache.get('c'))
+        self.assertEqual(1, cache.evictions)
+
+    def test_ttl(self):
+        cache = utils.LRUCache(10, ttl=5)
+        cache.set('a', 1)
+        self.utcnow.return_value = 4
+        self.assertEqual(1, cache.get('a'))
+        self.utcnow.return_value = 5
+        self.assertIsNone(cache.get('a'))
+
+    def test_negative_ttl(self):
+        cache = utils.LRUCache(10, ttl=5, negative_ttl=1)
+        cache.set('a', [])
+        self.assertEqual([], cache.get('a', 'missing'))
+        self.utcnow.return_value = 1
+        self.assertEqual('missing', cache.get('a', 'missing'))
+
+    def test_negative_results_not_cached(self):
+        cache = utils.LRUCache(10, ttl=5, negative_ttl=0)
+        cache.set('a', [])
+        self.assertEqual('missing', cache.get('a', 'missing'))
+
+    def test_cache_method_results(self):
+        decorated = _CachingDecorator()
+        decorated._cache = utils.LRUCache(10)
+        self.assertEqual('bar', decorated.func(1))
+        decorated.func_retval = 'baz'
+        self.assertEqual('bar', decorated.func(1))
+        self.assertEqual('baz', decorated.func(2))
+
+
 class TestDict2Tuples(base.BaseTestCase):
     def test_dict(self):
         input_dict = {'foo': 'bar', 42: 'baz', 'aaa': 'zzz'}
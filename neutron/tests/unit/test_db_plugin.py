@@ -884,6 +884,13 @@ class TestPortsV2(NeutronDbPluginV2TestCase):
             ports = self.deserialize(self.fmt, res)
             self.assertEqual(len(ports['ports']), 0)
 
+    def _get_port_creator(self, plugin):
+        """Return the name of the method creating each port of a bulk."""
+        # The ML2 plugin does not call create_port for bulk requests
+        if hasattr(plugin, '_create_port_db'):
+            return '_create_port_db'
+        return 'create_port'
+
     def test_create_ports_bulk_emulated_plugin_failure(self):
         real_has_attr = hasattr
 
@@ -893,11 +900,12 @@ class TestPortsV2(NeutronDbPluginV2TestCase):
                 return False
             return real_has_attr(item, attr)
 
+        plugin = manager.NeutronManager.get_plugin()
+        creator = self._get_port_creator(plugin)
         with mock.patch('__builtin__.hasattr',
                         new=fakehasattr):
-            orig = manager.NeutronManager.get_plugin().create_port
-            with mock.patch.object(manager.NeutronManager.get_plugin(),
-                                   'create_port') as patched_plugin:
+            orig = getattr(plugin, creator)
+            with mock.patch.object(plugin, creator) as patched_plugin:
 
                 def side_effect(*args, **kwargs):
                     return self._fail_second_call(patched_plugin, orig,
@@ -914,14 +922,36 @@ class TestPortsV2(NeutronDbPluginV2TestCase):
                         res, 'ports', webob.exc.HTTPServerError.code
                     )
 
+    def test_create_ports_bulk_ips_from_several_ranges(self):
+        if self._skip_native_bulk:
+            self.skipTest("Plugin does not support native bulk port create")
+        allocation_pools = [{'start': '10.0.0.2', 'end': '10.0.0.3'},
+                            {'start': '10.0.0.5', 'end': '10.0.0.6'}]
+        with self.subnet(allocation_pools=allocation_pools) as subnet:
+            res = self._create_port_bulk(self.fmt, 4,
+                                         subnet['subnet']['network_id'],
+                                         'test', True)
+            ports = self.deserialize(self.fmt, res)['ports']
+            self.assertEqual(['10.0.0.2', '10.0.0.3', '10.0.0.5', '10.0.0.6'],
+                             sorted(port['fixed_ips'][0]['ip_address']
+                                    for port in ports))
+            self.assertFalse(
+                db_base_plugin_v2.NeutronDbPluginV2._reserved_ips)
+            # The pools are exhausted
+            res = self._create_port(self.fmt, subnet['subnet']['network_id'])
+            self.assertEqual(webob.exc.HTTPConflict.code, res.status_int)
+            for port in ports:
+                self._delete('ports', port['id'])
+
     def test_create_ports_bulk_native_plugin_failure(self):
         if self._skip_native_bulk:
             self.skipTest("Plugin does not support native bulk port create")
         ctx = context.get_admin_context()
         with self.network() as net:
             plugin = manager.NeutronManager.get_plugin()
-            orig = plugin.create_port
-            with mock.patch.object(plugin, 'create_port') as patched_plugin:
+            creator = self._get_port_creator(plugin)
+            orig = getattr(plugin, creator)
+            with mock.patch.object(plugin, creator) as patched_plugin:
 
                 def side_effect(*args, **kwargs):
                     return self._fail_second_call(patched_plugin, orig,
@@ -942,6 +972,20 @@ class TestPortsV2(NeutronDbPluginV2TestCase):
                                self.port()) as ports:
             self._test_list_resources('port', ports)
 
+    def test_list_ports_with_fields(self):
+        cfg.CONF.set_default('allow_overlapping_ips', True)
+        with contextlib.nested(self.port(device_id='dev1'),
+                               self.port(device_id='dev2')) as ports:
+            req = self.new_list_request('ports',
+                                        params='fields=id&fields=device_id')
+            res = self.deserialize(self.fmt, req.get_response(self.api))
+            self.assertEqual(
+                sorted((p['port']['id'], p['port']['device_id'])
+                       for p in ports),
+                sorted((p['id'], p['device_id']) for p in res['ports']))
+            for port in res['ports']:
+                self.assertEqual(set(['id', 'device_id']), set(port))
+
     def test_list_ports_filtered_by_fixed_ip(self):
         # for this test we need to enable overlapping ips
         cfg.CONF.set_default('allow_overlapping_ips', True)
@@ -1269,6 +1313,26 @@ fixed_ips=ip_address%%3D%s&fixed_ips=ip_address%%3D%s&fixed_ips=subnet_id%%3D%s
             return
         self.fail("No exception for illegal base_mac format")
 
+    def test_create_ports_bulk_generates_macs_at_once(self):
+        plugin = manager.NeutronManager.get_plugin()
+        base_bulk = db_base_plugin_v2.NeutronDbPluginV2.create_port_bulk
+        if (self._skip_native_bulk or
+                plugin.create_port_bulk.im_func is not base_bulk.im_func):
+            self.skipTest("Plugin does not use the base bulk port create")
+        with self.network() as net:
+            with mock.patch.object(db_base_plugin_v2.NeutronDbPluginV2,
+                                   '_generate_macs',
+                                   wraps=plugin._generate_macs) as gen:
+                res = self._create_port_bulk(self.fmt, 3,
+                                             net['network']['id'],
+                                             'test', True)
+            ports = self.deserialize(self.fmt, res)['ports']
+            gen.assert_called_once_with(mock.ANY, net['network']['id'], 3)
+            self.assertEqual(3, len(set(p['mac_address'] for p in ports)))
+            self.assertFalse(plugin._reserved_macs)
+            for port in ports:
+                self._delete('ports', port['id'])
+
     def test_mac_exhaustion(self):
         # rather than actually consuming all MAC (would take a LONG time)
         # we just raise the exception that would result.
@@ -1414,6 +1478,24 @@ fixed_ips=ip_address%%3D%s&fixed_ips=ip_address%%3D%s&fixed_ips=subnet_id%%3D%s
                                                          port_mac))
         self.assertEqual(port['port']['fixed_ips'][0]['ip_address'], eui_addr)
 
+    def test_random_range_allocation(self):
+        cfg.CONF.set_override('ip_allocation_strategy', 'random')
+        with self.subnet(gateway_ip='10.0.0.3',
+                         cidr='10.0.0.0/29') as subnet:
+            net_id = subnet['subnet']['network_id']
+            kwargs = {"fixed_ips": [{'subnet_id': subnet['subnet']['id']}]}
+            ports = []
+            for i in range(5):
+                res = self._create_port(self.fmt, net_id=net_id, **kwargs)
+                ports.append(self.deserialize(self.fmt, res)['port'])
+            ips = set(port['fixed_ips'][0]['ip_address'] for port in ports)
+            self.assertEqual(set(['10.0.0.1', '10.0.0.2', '10.0.0.4',
+                                  '10.0.0.5', '10.0.0.6']), ips)
+            res = self._create_port(self.fmt, net_id=net_id, **kwargs)
+            self.assertEqual(webob.exc.HTTPConflict.code, res.status_int)
+            for port in ports:
+                self._delete('ports', port['id'])
+
     def test_range_allocation(self):
         with self.subnet(gateway_ip='10.0.0.3',
                          cidr='10.0.0.0/29') as subnet:
@@ -3876,6 +3958,108 @@ class TestNeutronDbPluginV2(base.BaseTestCase):
         self.assertEqual(2, generate.call_count)
         rebuild.assert_called_once_with('c', 's')
 
+    def test_generate_ip_random(self):
+        cfg.CONF.set_override('ip_allocation_strategy', 'random')
+        with contextlib.nested(
+            mock.patch.object(db_base_plugin_v2.NeutronDbPluginV2,
+                              '_try_generate_random_ip'),
+            mock.patch.object(db_base_plugin_v2.NeutronDbPluginV2,
+                              '_try_generate_ip')
+        ) as (generate_random, generate):
+            db_base_plugin_v2.NeutronDbPluginV2._generate_ip('c', 's')
+
+        generate_random.assert_called_once_with('c', 's')
+        self.assertFalse(generate.called)
+
+    def test_generate_ip_random_falls_back_to_sequential(self):
+        cfg.CONF.set_override('ip_allocation_strategy', 'random')
+        with contextlib.nested(
+            mock.patch.object(db_base_plugin_v2.NeutronDbPluginV2,
+                              '_try_generate_random_ip',
+                              side_effect=n_exc.IpAddressGenerationFailure(
+                                  net_id='n')),
+            mock.patch.object(db_base_plugin_v2.NeutronDbPluginV2,
+                              '_try_generate_ip')
+        ) as (generate_random, generate):
+            db_base_plugin_v2.NeutronDbPluginV2._generate_ip(
+                'c', [{'network_id': 'n'}])
+
+        generate.assert_called_once_with('c', [{'network_id': 'n'}])
+
+    def test_try_generate_random_ip_retries_changed_range(self):
+        context = mock.Mock()
+        range_qry = context.session.query.return_value.join.return_value
+        range_qry.filter.return_value.all.return_value = [
+            ('pool', '10.0.0.2', '10.0.0.2')]
+        subnets = [{'id': 'subnet', 'cidr': '10.0.0.0/24',
+                    'network_id': 'net'}]
+        with mock.patch.object(db_base_plugin_v2.NeutronDbPluginV2,
+                               '_remove_ip_from_range',
+                               side_effect=[False, True]) as remove:
+            ip = db_base_plugin_v2.NeutronDbPluginV2._try_generate_random_ip(
+                context, subnets)
+        self.assertEqual({'ip_address': '10.0.0.2', 'subnet_id': 'subnet'},
+                         ip)
+        self.assertEqual(2, remove.call_count)
+
+    def test_get_free_ranges(self):
+        free_ranges = db_base_plugin_v2.NeutronDbPluginV2._get_free_ranges(
+            10, 20, [1, 10, 12, 12, 13, 17, 20, 25])
+        self.assertEqual([(11, 11), (14, 16), (18, 19)], list(free_ranges))
+
+    def test_generate_macs_replaces_used_macs(self):
+        context = mock.Mock()
+        mac_qry = context.session.query.return_value.filter_by.return_value
+        mac_qry.filter.side_effect = [[('fa:16:3e:00:00:01',)], []]
+        macs = ['fa:16:3e:00:00:0%d' % i for i in range(1, 5)]
+        stats = dict(db_base_plugin_v2.MAC_GENERATION_STATS)
+        with mock.patch.object(db_base_plugin_v2.NeutronDbPluginV2,
+                               '_random_mac', side_effect=macs):
+            generated = db_base_plugin_v2.NeutronDbPluginV2._generate_macs(
+                context, 'net', 3)
+        self.assertEqual(set(macs[1:]), set(generated))
+        self.assertEqual(2, mac_qry.filter.call_count)
+        self.assertEqual(
+            {'generated': stats['generated'] + 3,
+             'collisions': stats['collisions'] + 1,
+             'queries': stats['queries'] + 2},
+            db_base_plugin_v2.MAC_GENERATION_STATS)
+
+    def test_generate_macs_exhausted(self):
+        cfg.CONF.set_override('mac_generation_retries', 2)
+        context = mock.Mock()
+        mac_qry = context.session.query.return_value.filter_by.return_value
+        mac_qry.filter.return_value = [('fa:16:3e:00:00:01',)]
+        with mock.patch.object(db_base_plugin_v2.NeutronDbPluginV2,
+                               '_random_mac',
+                               return_value='fa:16:3e:00:00:01'):
+            self.assertRaises(
+                n_exc.MacAddressGenerationFailure,
+                db_base_plugin_v2.NeutronDbPluginV2._generate_macs,
+                context, 'net', 1)
+        self.assertEqual(2, mac_qry.filter.call_count)
+
+    def test_generate_mac_uses_reserved_macs(self):
+        context = mock.Mock()
+        reserved = {context.session: {'net': ['fa:16:3e:00:00:01']}}
+        plugin = db_base_plugin_v2.NeutronDbPluginV2
+        with mock.patch.dict(plugin._reserved_macs, reserved):
+            self.assertEqual(
+                'fa:16:3e:00:00:01', plugin._generate_mac(context, 'net'))
+
+    def test_generate_mac_ignores_macs_reserved_by_other_sessions(self):
+        context = mock.Mock()
+        reserved = {mock.Mock(): {'net': ['fa:16:3e:00:00:01']}}
+        plugin = db_base_plugin_v2.NeutronDbPluginV2
+        with contextlib.nested(
+                mock.patch.dict(plugin._reserved_macs, reserved),
+                mock.patch.object(plugin, '_generate_macs',
+                                  return_value=['fa:16:3e:00:00:02'])):
+            self.assertEqual(
+                'fa:16:3e:00:00:02', plugin._generate_mac(context, 'net'))
+            self.assertEqual(['fa:16:3e:00:00:01'],
+                             reserved.values()[0]['net'])
+
     def test_rebuild_availability_ranges(self):
         pools = [{'id': 'a',
                   'first_ip': '192.168.1.3',
@@ -3959,6 +4143,48 @@ class NeutronDbPluginV2AsMixinTestCase(base.BaseTestCase):
         net = self.plugin.create_network(self.context, self.net_data)
         self.assertEqual(net['status'], 'BUILD')
 
+    def test_register_collection_loaders(self):
+        loaders = copy.deepcopy(self.plugin._collection_loaders)
+        self.addCleanup(setattr, db_base_plugin_v2.CommonDbMixin,
+                        '_collection_loaders', loaders)
+        loader = mock.Mock()
+        self.plugin.register_collection_loaders(models_v2.Network,
+                                                ['fake'], loader)
+        options = self.plugin._get_collection_loader_options(
+            models_v2.Network)
+        self.assertIn(loader.return_value, options)
+        loader.assert_called_once_with('fake')
+
+    def test_get_networks_uses_collection_loaders(self):
+        self.plugin.create_network(self.context, self.net_data)
+        with mock.patch.object(
+            self.plugin, '_get_collection_loader_options',
+            wraps=self.plugin._get_collection_loader_options) as options:
+            self.plugin.get_network(self.context, 'fake-id')
+            self.assertFalse(options.called)
+            nets = self.plugin.get_networks(self.context)
+        options.assert_called_once_with(models_v2.Network)
+        self.assertEqual(['fake-id'], [net['id'] for net in nets])
+
+    def test_get_networks_plain_fields_reads_columns(self):
+        self.plugin.create_network(self.context, self.net_data)
+        with mock.patch.object(self.plugin,
+                               '_make_network_dict') as make_network_dict:
+            nets = self.plugin.get_networks(self.context,
+                                            fields=['id', 'name'])
+        self.assertEqual([{'id': 'fake-id', 'name': 'net1'}], nets)
+        self.assertFalse(make_network_dict.called)
+
+    def test_get_networks_other_fields_makes_dicts(self):
+        self.plugin.create_network(self.context, self.net_data)
+        with mock.patch.object(
+            self.plugin, '_make_network_dict',
+            wraps=self.plugin._make_network_dict) as make_network_dict:
+            nets = self.plugin.get_networks(self.context,
+                                            fields=['id', 'subnets'])
+        self.assertEqual([{'id': 'fake-id', 'subnets': []}], nets)
+        self.assertEqual(1, make_network_dict.call_count)
+
 
 class TestBasicGetXML(TestBasicGet):
     fmt = 'xml'
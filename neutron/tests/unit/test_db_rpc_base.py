@@ -13,13 +13,17 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import contextlib
+
 import mock
 from oslo.db import exception as db_exc
 
 from neutron.common import constants
 from neutron.common import exceptions as n_exc
+from neutron import context
 from neutron.db import dhcp_rpc_base
 from neutron.tests import base
+from neutron.tests.unit import test_db_plugin
 
 
 class TestDhcpRpcCallbackMixin(base.BaseTestCase):
@@ -47,6 +51,65 @@ class TestDhcpRpcCallbackMixin(base.BaseTestCase):
 
         self.assertEqual(len(self.log.mock_calls), 1)
 
+    def _setup_active_networks_info(self):
+        self.plugin.get_networks.return_value = [dict(id='b'), dict(id='c'),
+                                                 dict(id='a')]
+        self.plugin.get_ports.return_value = [
+            dict(id='p1', network_id='a'), dict(id='p2', network_id='c'),
+            dict(id='p3', network_id='a')]
+        self.plugin.get_subnets.return_value = [
+            dict(id='s1', network_id='c'), dict(id='s2', network_id='a')]
+
+    def test_get_active_networks_info(self):
+        self._setup_active_networks_info()
+
+        networks = self.callbacks.get_active_networks_info(mock.Mock(),
+                                                           host='host')
+
+        self.assertEqual(['b', 'c', 'a'], [net['id'] for net in networks])
+        self.assertEqual([[], ['s1'], ['s2']],
+                         [[subnet['id'] for subnet in net['subnets']]
+                          for net in networks])
+        self.assertEqual([[], ['p2'], ['p1', 'p3']],
+                         [[port['id'] for port in net['ports']]
+                          for net in networks])
+        self.plugin.get_subnets.assert_called_once_with(
+            mock.ANY, filters={'network_id': mock.ANY,
+                               'enable_dhcp': [True]})
+
+    def _test_get_active_networks_info_chunk(self, chunk, marker):
+        list_networks = self.plugin.list_active_networks_on_active_dhcp_agent
+        list_networks.return_value = chunk
+        with mock.patch.object(dhcp_rpc_base.utils,
+                               'is_extension_supported', return_value=True):
+            networks = self.callbacks.get_active_networks_info(
+                mock.Mock(), host='host', limit=1, marker=marker)
+        list_networks.assert_called_once_with(mock.ANY, 'host', limit=1,
+                                              marker=marker)
+        self.assertFalse(self.plugin.get_networks.called)
+        return networks
+
+    def test_get_active_networks_info_chunk(self):
+        self._setup_active_networks_info()
+        self.plugin.get_ports.return_value = [dict(id='p2', network_id='c')]
+        self.plugin.get_subnets.return_value = [dict(id='s1',
+                                                     network_id='c')]
+
+        networks = self._test_get_active_networks_info_chunk([dict(id='c')],
+                                                             'b')
+
+        self.assertEqual(['c'], [net['id'] for net in networks])
+        self.assertEqual(['p2'], [port['id'] for port in networks[0]['ports']])
+        self.plugin.get_ports.assert_called_once_with(
+            mock.ANY, filters={'network_id': ['c']})
+
+    def test_get_active_networks_info_last_chunk(self):
+        self._setup_active_networks_info()
+        networks = self._test_get_active_networks_info_chunk([], 'c')
+
+        self.assertEqual([], networks)
+        self.assertFalse(self.plugin.get_ports.called)
+
     def _test__port_action_with_failures(self, exc=None, action=None):
         port = {
             'network_id': 'foo_network_id',
@@ -231,3 +294,22 @@ class TestDhcpRpcCallbackMixin(base.BaseTestCase):
                                                        device_id=['devid'])),
             mock.call.update_port(mock.ANY, 'port_id',
                                   dict(port=port_update))])
+
+
+class TestDhcpRpcCallbackMixinDb(test_db_plugin.NeutronDbPluginV2TestCase):
+
+    def test_get_active_networks_info_in_chunks(self):
+        callbacks = dhcp_rpc_base.DhcpRpcCallbackMixin()
+        ctx = context.get_admin_context()
+        with contextlib.nested(self.network(),
+                               self.network(admin_state_up=False),
+                               self.network(),
+                               self.network()) as nets:
+            net_ids = sorted(net['network']['id'] for net in nets
+                             if net['network']['admin_state_up'])
+            first = callbacks.get_active_networks_info(ctx, host='host',
+                                                       limit=2)
+            last = callbacks.get_active_networks_info(
+                ctx, host='host', limit=2, marker=first[-1]['id'])
+        self.assertEqual(net_ids[:2], [net['id'] for net in first])
+        self.assertEqual(net_ids[2:], [net['id'] for net in last])
@@ -291,6 +291,72 @@ class TestDhcpAgent(base.BaseTestCase):
             self._test_sync_state_helper(known_networks, active_networks)
             w.assert_called_once_with()
 
+    def test_sync_state_chunks(self):
+        cfg.CONF.set_override('sync_networks_chunk_size', 2)
+        nets = [dhcp.NetModel(True, {'id': net_id}) for net_id in 'abc']
+        with mock.patch(DHCP_PLUGIN) as plug:
+            mock_plugin = mock.Mock()
+            mock_plugin.get_active_networks_info.side_effect = [
+                nets[:2], nets[2:]]
+            plug.return_value = mock_plugin
+
+            agent = dhcp_agent.DhcpAgent(HOSTNAME)
+            attrs_to_mock = dict(
+                [(a, mock.DEFAULT) for a in
+                 ['safe_configure_dhcp_for_network', 'disable_dhcp_helper',
+                  'cache']])
+            with mock.patch.multiple(agent, **attrs_to_mock) as mocks:
+                mocks['cache'].get_network_ids.return_value = ['a', 'd']
+                agent.sync_state()
+
+                mock_plugin.get_active_networks_info.assert_has_calls(
+                    [mock.call(limit=2, marker=None),
+                     mock.call(limit=2, marker='b')])
+                self.assertEqual(
+                    ['a', 'b', 'c'],
+                    [c[0][0].id for c in
+                     mocks['safe_configure_dhcp_for_network'].call_args_list])
+                mocks['disable_dhcp_helper'].assert_called_once_with('d')
+
+    def test_sync_state_chunks_unsupported_by_server(self):
+        cfg.CONF.set_override('sync_networks_chunk_size', 2)
+        nets = [dhcp.NetModel(True, {'id': net_id}) for net_id in 'ab']
+        with mock.patch(DHCP_PLUGIN) as plug:
+            mock_plugin = mock.Mock()
+            mock_plugin.get_active_networks_info.return_value = nets
+            plug.return_value = mock_plugin
+
+            agent = dhcp_agent.DhcpAgent(HOSTNAME)
+            with mock.patch.object(
+                    agent, 'safe_configure_dhcp_for_network') as configure:
+                agent.sync_state()
+
+            self.assertEqual(
+                2, mock_plugin.get_active_networks_info.call_count)
+            self.assertEqual(2, configure.call_count)
+
+    def test_sync_state_chunk_error(self):
+        cfg.CONF.set_override('sync_networks_chunk_size', 1)
+        with mock.patch(DHCP_PLUGIN) as plug:
+            mock_plugin = mock.Mock()
+            mock_plugin.get_active_networks_info.side_effect = [
+                [dhcp.NetModel(True, {'id': 'a'})], Exception]
+            plug.return_value = mock_plugin
+
+            agent = dhcp_agent.DhcpAgent(HOSTNAME)
+            attrs_to_mock = dict(
+                [(a, mock.DEFAULT) for a in
+                 ['safe_configure_dhcp_for_network', 'disable_dhcp_helper',
+                  'schedule_resync', 'cache']])
+            with mock.patch.multiple(agent, **attrs_to_mock) as mocks:
+                mocks['cache'].get_network_ids.return_value = ['b']
+                agent.sync_state()
+
+                self.assertEqual(
+                    1, mocks['safe_configure_dhcp_for_network'].call_count)
+                self.assertFalse(mocks['disable_dhcp_helper'].called)
+                self.assertTrue(mocks['schedule_resync'].called)
+
     def test_sync_state_plugin_error(self):
         with mock.patch(DHCP_PLUGIN) as plug:
             mock_plugin = mock.Mock()
@@ -816,6 +882,33 @@ class TestDhcpAgentEventHandler(base.BaseTestCase):
         self.call_driver.assert_has_calls(
             [mock.call.call_driver('reload_allocations', fake_network)])
 
+    def test_port_events_coalesced(self):
+        cfg.CONF.set_override('port_reload_delay', 1)
+        payload = dict(port=fake_port2)
+        self.cache.get_network_by_id.return_value = fake_network
+        with mock.patch.object(dhcp_agent.eventlet,
+                               'spawn_after') as spawn_after:
+            self.dhcp.port_update_end(None, payload)
+            self.dhcp.port_update_end(None, payload)
+            self.dhcp.port_delete_end(None, dict(port_id=fake_port2.id))
+
+        spawn_after.assert_called_once_with(
+            1, self.dhcp._reload_pending_allocations, fake_network.id)
+        self.assertFalse(self.call_driver.called)
+        self.assertEqual(2, self.dhcp.coalesced_reloads)
+
+        self.dhcp._reload_pending_allocations(fake_network.id)
+        self.call_driver.assert_called_once_with('reload_allocations',
+                                                 fake_network)
+        self.assertEqual({}, self.dhcp._pending_reloads)
+
+    def test_reload_pending_allocations_deleted_network(self):
+        self.dhcp._pending_reloads[fake_network.id] = 1
+        self.cache.get_network_by_id.return_value = None
+        self.dhcp._reload_pending_allocations(fake_network.id)
+        self.assertFalse(self.call_driver.called)
+        self.assertEqual({}, self.dhcp._pending_reloads)
+
     def test_port_delete_end_unknown_port(self):
         payload = dict(port_id='unknown')
         self.cache.get_port_by_id.return_value = None
@@ -865,6 +958,12 @@ class TestDhcpPluginApiProxy(base.BaseTestCase):
         self.make_msg.assert_called_once_with('get_active_networks_info',
                                               host='foo')
 
+    def test_get_active_networks_info_chunk(self):
+        self.proxy.get_active_networks_info(limit=10, marker='netid')
+        self.make_msg.assert_called_once_with('get_active_networks_info',
+                                              host='foo', limit=10,
+                                              marker='netid')
+
     def test_create_dhcp_port(self):
         port_body = (
             {'port':
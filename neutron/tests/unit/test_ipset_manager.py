@@ -0,0 +1,92 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import mock
+
+from neutron.agent.linux import ipset_manager
+from neutron.tests import base
+
+SG_ID = 'fake-sg-id-0123456789abcdef0123'
+NAME = ipset_manager.IpsetManager.get_name(SG_ID, 'IPv4')
+SWAP_NAME = 'T' + NAME[1:]
+
+
+class IpsetManagerTestCase(base.BaseTestCase):
+    def setUp(self):
+        super(IpsetManagerTestCase, self).setUp()
+        self.execute = mock.Mock(return_value='')
+        self.ipset = ipset_manager.IpsetManager(root_helper='sudo',
+                                                execute=self.execute)
+
+    def _restored(self):
+        args, kwargs = self.execute.call_args
+        self.assertEqual((['ipset', 'restore', '-exist'], 'sudo'), args)
+        return kwargs['process_input'].splitlines()
+
+    def test_get_name(self):
+        self.assertEqual('NIPv4fakesgid0123456789abcdef01', NAME)
+        self.assertEqual(ipset_manager.MAX_NAME_LENGTH, len(NAME))
+
+    def test_set_members_first_update_swaps(self):
+        self.ipset.set_members(NAME, 'IPv4', ['10.0.0.1', '10.0.0.2'])
+        commands = self._restored()
+        self.assertEqual(['create %s hash:net family inet' % SWAP_NAME,
+                          'flush %s' % SWAP_NAME],
+                         commands[:2])
+        self.assertEqual(['add %s 10.0.0.1' % SWAP_NAME,
+                          'add %s 10.0.0.2' % SWAP_NAME],
+                         sorted(commands[2:4]))
+        self.assertEqual(['create %s hash:net family inet' % NAME,
+                          'swap %s %s' % (SWAP_NAME, NAME),
+                          'destroy %s' % SWAP_NAME],
+                         commands[4:])
+        self.assertTrue(self.ipset.set_exists(NAME))
+
+    def test_set_members_ipv6_family(self):
+        name = self.ipset.get_name(SG_ID, 'IPv6')
+        self.ipset.set_members(name, 'IPv6', ['fe80::1'])
+        self.assertIn('create %s hash:net family inet6' % name,
+                      self._restored())
+
+    def test_set_members_small_change_adds_and_deletes(self):
+        self.ipset.set_members(NAME, 'IPv4',
+                               ['10.0.0.1', '10.0.0.2', '10.0.0.3'])
+        self.ipset.set_members(NAME, 'IPv4',
+                               ['10.0.0.1', '10.0.0.2', '10.0.0.4'])
+        self.assertEqual(['add %s 10.0.0.4' % NAME,
+                          'del %s 10.0.0.3' % NAME],
+                         self._restored())
+
+    def test_set_members_large_change_swaps(self):
+        self.ipset.set_members(NAME, 'IPv4', ['10.0.0.1', '10.0.0.2'])
+        self.ipset.set_members(NAME, 'IPv4', ['10.0.0.3'])
+        commands = self._restored()
+        self.assertEqual('swap %s %s' % (SWAP_NAME, NAME), commands[-2])
+        self.assertIn('add %s 10.0.0.3' % SWAP_NAME, commands)
+
+    def test_set_members_unchanged(self):
+        self.ipset.set_members(NAME, 'IPv4', ['10.0.0.1'])
+        self.execute.reset_mock()
+        self.ipset.set_members(NAME, 'IPv4', ['10.0.0.1'])
+        self.assertFalse(self.execute.called)
+
+    def test_destroy(self):
+        self.ipset.set_members(NAME, 'IPv4', ['10.0.0.1'])
+        self.ipset.destroy(NAME)
+        self.execute.assert_called_with(['ipset', 'destroy', NAME], 'sudo')
+        self.assertFalse(self.ipset.set_exists(NAME))
+
+    def test_destroy_failure_is_logged(self):
+        self.execute.side_effect = RuntimeError()
+        with mock.patch.object(ipset_manager.LOG, 'exception') as log:
+            self.ipset.destroy(NAME)
+        self.assertTrue(log.called)
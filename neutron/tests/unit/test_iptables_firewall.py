@@ -63,7 +63,6 @@ class IptablesFirewallTestCase(base.BaseTestCase):
         self.firewall.prepare_port_filter(port)
         calls = [mock.call.add_chain('sg-fallback'),
                  mock.call.add_rule('sg-fallback', '-j DROP'),
-                 mock.call.ensure_remove_chain('sg-chain'),
                  mock.call.add_chain('sg-chain'),
                  mock.call.add_chain('ifake_dev'),
                  mock.call.add_rule('FORWARD',
@@ -816,7 +815,6 @@ class IptablesFirewallTestCase(base.BaseTestCase):
         self.firewall.prepare_port_filter(port)
         calls = [mock.call.add_chain('sg-fallback'),
                  mock.call.add_rule('sg-fallback', '-j DROP'),
-                 mock.call.ensure_remove_chain('sg-chain'),
                  mock.call.add_chain('sg-chain'),
                  mock.call.add_chain('ifake_dev'),
                  mock.call.add_rule('FORWARD',
@@ -901,7 +899,6 @@ class IptablesFirewallTestCase(base.BaseTestCase):
         self.firewall.remove_port_filter({'device': 'no-exist-device'})
         calls = [mock.call.add_chain('sg-fallback'),
                  mock.call.add_rule('sg-fallback', '-j DROP'),
-                 mock.call.ensure_remove_chain('sg-chain'),
                  mock.call.add_chain('sg-chain'),
                  mock.call.add_chain('ifake_dev'),
                  mock.call.add_rule(
@@ -952,10 +949,18 @@ class IptablesFirewallTestCase(base.BaseTestCase):
                      '-m state --state RELATED,ESTABLISHED -j RETURN'),
                  mock.call.add_rule('ofake_dev', '-j $sg-fallback'),
                  mock.call.add_rule('sg-chain', '-j ACCEPT'),
+                 mock.call.remove_rule(
+                     'FORWARD',
+                     '-m physdev --physdev-out tapfake_dev '
+                     '--physdev-is-bridged -j $sg-chain'),
+                 mock.call.remove_rule(
+                     'FORWARD',
+                     '-m physdev --physdev-in tapfake_dev '
+                     '--physdev-is-bridged -j $sg-chain'),
                  mock.call.ensure_remove_chain('ifake_dev'),
                  mock.call.ensure_remove_chain('ofake_dev'),
                  mock.call.ensure_remove_chain('sfake_dev'),
-                 mock.call.ensure_remove_chain('sg-chain'),
+                 mock.call.remove_rule('sg-chain', '-j ACCEPT'),
                  mock.call.add_chain('sg-chain'),
                  mock.call.add_chain('ifake_dev'),
                  mock.call.add_rule(
@@ -1007,11 +1012,18 @@ class IptablesFirewallTestCase(base.BaseTestCase):
                  mock.call.add_rule('ofake_dev', '-j RETURN'),
                  mock.call.add_rule('ofake_dev', '-j $sg-fallback'),
                  mock.call.add_rule('sg-chain', '-j ACCEPT'),
+                 mock.call.remove_rule(
+                     'FORWARD',
+                     '-m physdev --physdev-out tapfake_dev '
+                     '--physdev-is-bridged -j $sg-chain'),
+                 mock.call.remove_rule(
+                     'FORWARD',
+                     '-m physdev --physdev-in tapfake_dev '
+                     '--physdev-is-bridged -j $sg-chain'),
                  mock.call.ensure_remove_chain('ifake_dev'),
                  mock.call.ensure_remove_chain('ofake_dev'),
                  mock.call.ensure_remove_chain('sfake_dev'),
-                 mock.call.ensure_remove_chain('sg-chain'),
-                 mock.call.add_chain('sg-chain')]
+                 mock.call.remove_rule('sg-chain', '-j ACCEPT')]
 
         self.v4filter_inst.assert_has_calls(calls)
 
@@ -1046,39 +1058,59 @@ class IptablesFirewallTestCase(base.BaseTestCase):
                 args = copy.deepcopy(args)
                 kwargs = copy.deepcopy(kwargs)
                 return super(CopyingMock, self).__call__(*args, **kwargs)
-        # Need to use CopyingMock because _{setup,remove}_chains_apply are
-        # usually called with that's modified between calls (i.e.,
-        # self.firewall.filtered_ports).
+        # Need to use CopyingMock because the ports may be modified between
+        # calls.
         chain_applies = CopyingMock()
-        self.firewall._setup_chains_apply = chain_applies.setup
-        self.firewall._remove_chains_apply = chain_applies.remove
+        self.firewall._setup_chain = chain_applies.setup
+        self.firewall._remove_port_chains = chain_applies.remove
         return chain_applies
 
+    def _port_setup_calls(self, port):
+        return [mock.call.setup(port, 'ingress'),
+                mock.call.setup(port, 'egress')]
+
     def test_mock_chain_applies(self):
         chain_applies = self._mock_chain_applies()
-        port_prepare = {'device': 'd1', 'mac_address': 'prepare'}
-        port_update = {'device': 'd1', 'mac_address': 'update'}
+        port_prepare = {'device': 'd1', 'mac_address': 'prepare',
+                        'fixed_ips': []}
+        port_update = {'device': 'd1', 'mac_address': 'update',
+                       'fixed_ips': []}
         self.firewall.prepare_port_filter(port_prepare)
         self.firewall.update_port_filter(port_update)
         self.firewall.remove_port_filter(port_update)
-        chain_applies.assert_has_calls([mock.call.remove({}),
-                                        mock.call.setup({'d1': port_prepare}),
-                                        mock.call.remove({'d1': port_prepare}),
-                                        mock.call.setup({'d1': port_update}),
-                                        mock.call.remove({'d1': port_update}),
-                                        mock.call.setup({})])
-
-    def test_defer_chain_apply_need_pre_defer_copy(self):
+        self.assertEqual(self._port_setup_calls(port_prepare) +
+                         [mock.call.remove(port_prepare)] +
+                         self._port_setup_calls(port_update) +
+                         [mock.call.remove(port_update)],
+                         chain_applies.mock_calls)
+
+    def test_update_port_filter_unchanged(self):
+        chain_applies = self._mock_chain_applies()
+        port = self._fake_port()
+        self.firewall.prepare_port_filter(port)
+        chain_applies.reset_mock()
+        self.firewall.update_port_filter(self._fake_port())
+        self.assertEqual([], chain_applies.mock_calls)
+
+    def test_prepare_port_filter_keeps_other_ports(self):
+        chain_applies = self._mock_chain_applies()
+        port1 = {'device': 'd1', 'mac_address': 'mac1', 'fixed_ips': []}
+        port2 = {'device': 'd2', 'mac_address': 'mac2', 'fixed_ips': []}
+        self.firewall.prepare_port_filter(port1)
+        chain_applies.reset_mock()
+        self.firewall.prepare_port_filter(port2)
+        self.assertEqual(self._port_setup_calls(port2),
+                         chain_applies.mock_calls)
+
+    def test_defer_chain_apply_remove_port(self):
         chain_applies = self._mock_chain_applies()
         port = self._fake_port()
-        device2port = {port['device']: port}
         self.firewall.prepare_port_filter(port)
         with self.firewall.defer_apply():
             self.firewall.remove_port_filter(port)
-        chain_applies.assert_has_calls([mock.call.remove({}),
-                                        mock.call.setup(device2port),
-                                        mock.call.remove(device2port),
-                                        mock.call.setup({})])
+        self.assertEqual(self._port_setup_calls(port) +
+                         [mock.call.remove(port)],
+                         chain_applies.mock_calls)
 
     def test_defer_chain_apply_coalesce_simple(self):
         chain_applies = self._mock_chain_applies()
@@ -1087,19 +1119,21 @@ class IptablesFirewallTestCase(base.BaseTestCase):
             self.firewall.prepare_port_filter(port)
             self.firewall.update_port_filter(port)
             self.firewall.remove_port_filter(port)
-        chain_applies.assert_has_calls([mock.call.remove({}),
-                                        mock.call.setup({})])
+        self.assertEqual([], chain_applies.mock_calls)
 
     def test_defer_chain_apply_coalesce_multiple_ports(self):
         chain_applies = self._mock_chain_applies()
-        port1 = {'device': 'd1', 'mac_address': 'mac1'}
-        port2 = {'device': 'd2', 'mac_address': 'mac2'}
-        device2port = {'d1': port1, 'd2': port2}
+        port1 = {'device': 'd1', 'mac_address': 'mac1', 'fixed_ips': []}
+        port2 = {'device': 'd2', 'mac_address': 'mac2', 'fixed_ips': []}
         with self.firewall.defer_apply():
             self.firewall.prepare_port_filter(port1)
             self.firewall.prepare_port_filter(port2)
-        chain_applies.assert_has_calls([mock.call.remove({}),
-                                        mock.call.setup(device2port)])
+        self.assertEqual(4, chain_applies.setup.call_count)
+        chain_applies.assert_has_calls(self._port_setup_calls(port1),
+                                       any_order=True)
+        chain_applies.assert_has_calls(self._port_setup_calls(port2),
+                                       any_order=True)
+        self.assertFalse(chain_applies.remove.called)
 
     def test_ip_spoofing_filter_with_multiple_ips(self):
         port = {'device': 'tapfake_dev',
@@ -1108,7 +1142,6 @@ class IptablesFirewallTestCase(base.BaseTestCase):
         self.firewall.prepare_port_filter(port)
         calls = [mock.call.add_chain('sg-fallback'),
                  mock.call.add_rule('sg-fallback', '-j DROP'),
-                 mock.call.ensure_remove_chain('sg-chain'),
                  mock.call.add_chain('sg-chain'),
                  mock.call.add_chain('ifake_dev'),
                  mock.call.add_rule('FORWARD',
@@ -1171,7 +1204,6 @@ class IptablesFirewallTestCase(base.BaseTestCase):
         self.firewall.prepare_port_filter(port)
         calls = [mock.call.add_chain('sg-fallback'),
                  mock.call.add_rule('sg-fallback', '-j DROP'),
-                 mock.call.ensure_remove_chain('sg-chain'),
                  mock.call.add_chain('sg-chain'),
                  mock.call.add_chain('ifake_dev'),
                  mock.call.add_rule('FORWARD',
@@ -1221,3 +1253,108 @@ class IptablesFirewallTestCase(base.BaseTestCase):
                  mock.call.add_rule('ofake_dev', '-j $sg-fallback'),
                  mock.call.add_rule('sg-chain', '-j ACCEPT')]
         self.v4filter_inst.assert_has_calls(calls)
+
+    def _prepare_port_with_security_group_info(self):
+        port = self._fake_port()
+        port['security_groups'] = ['sg1']
+        self.firewall.update_security_group_rules(
+            'sg1', [{'ethertype': 'IPv4',
+                     'direction': 'ingress',
+                     'protocol': 'tcp',
+                     'port_range_min': 22,
+                     'port_range_max': 22,
+                     'remote_group_id': 'sg2'}])
+        self.firewall.update_security_group_members(
+            'sg2', {'IPv4': [FAKE_IP['IPv4'], '10.0.0.2', '10.0.0.3'],
+                    'IPv6': []})
+        self.firewall.prepare_port_filter(port)
+
+    def test_prepare_port_filter_with_security_group_info(self):
+        self._prepare_port_with_security_group_info()
+        # the own address of the port is not allowed
+        self.assertNotIn('-s %s/32' % FAKE_IP['IPv4'],
+                         str(self.v4filter_inst.mock_calls))
+        self.v4filter_inst.assert_has_calls(
+            [mock.call.add_rule('ifake_dev',
+                                '-s 10.0.0.2/32 -p tcp -m tcp --dport 22 '
+                                '-j RETURN'),
+             mock.call.add_rule('ifake_dev',
+                                '-s 10.0.0.3/32 -p tcp -m tcp --dport 22 '
+                                '-j RETURN')])
+
+
+class IptablesFirewallIpsetTestCase(IptablesFirewallTestCase):
+    def setUp(self):
+        cfg.CONF.set_override('enable_ipset', True, 'SECURITYGROUP')
+        super(IptablesFirewallIpsetTestCase, self).setUp()
+        self.firewall.ipset = mock.Mock()
+        self.firewall.ipset.get_name.side_effect = (
+            lambda sg_id, ethertype: 'N%s%s' % (ethertype, sg_id))
+        self.firewall.ipset.ipsets = {}
+
+    def _fake_port_with_remote_group(self, members):
+        port = self._fake_port()
+        port['security_group_rules'] = [
+            {'ethertype': 'IPv4',
+             'direction': 'ingress',
+             'protocol': 'tcp',
+             'port_range_min': 22,
+             'port_range_max': 22,
+             'remote_group_id': 'sg1',
+             'source_ip_prefix': member} for member in members]
+        return port
+
+    def test_prepare_port_filter_remote_group_uses_ipset(self):
+        members = ['10.0.0.%d/32' % i for i in range(2, 5)]
+        port = self._fake_port_with_remote_group(members)
+        self.firewall.prepare_port_filter(port)
+
+        self.firewall.ipset.set_members.assert_called_once_with(
+            'NIPv4sg1', 'IPv4', set(members))
+        rule = mock.call.add_rule('ifake_dev',
+                                  '-p tcp -m tcp --dport 22 '
+                                  '-m set --match-set NIPv4sg1 src '
+                                  '-j RETURN')
+        self.assertEqual(1, self.v4filter_inst.add_rule.mock_calls.count(
+            rule))
+        for member in members:
+            self.assertNotIn(member, str(self.v4filter_inst.mock_calls))
+
+    def test_egress_remote_group_matches_destination(self):
+        port = self._fake_port()
+        port['security_group_rules'] = [
+            {'ethertype': 'IPv4',
+             'direction': 'egress',
+             'remote_group_id': 'sg1',
+             'dest_ip_prefix': '10.0.0.2/32'}]
+        self.firewall.prepare_port_filter(port)
+        self.v4filter_inst.add_rule.assert_any_call(
+            'ofake_dev', '-m set --match-set NIPv4sg1 dst -j RETURN')
+
+    def test_remove_port_filter_destroys_unused_ipsets(self):
+        port = self._fake_port_with_remote_group(['10.0.0.2/32'])
+        self.firewall.prepare_port_filter(port)
+        self.assertFalse(self.firewall.ipset.destroy.called)
+
+        self.firewall.ipset.ipsets = {'NIPv4sg1': set(['10.0.0.2/32'])}
+        self.firewall.remove_port_filter(port)
+        self.firewall.ipset.destroy.assert_called_once_with('NIPv4sg1')
+
+    def test_ipsets_destroyed_after_deferred_apply(self):
+        port = self._fake_port_with_remote_group(['10.0.0.2/32'])
+        self.firewall.prepare_port_filter(port)
+        self.firewall.ipset.ipsets = {'NIPv4sg1': set(['10.0.0.2/32'])}
+        with self.firewall.defer_apply():
+            self.firewall.remove_port_filter(port)
+            self.assertFalse(self.firewall.ipset.destroy.called)
+        self.firewall.ipset.destroy.assert_called_once_with('NIPv4sg1')
+
+    def test_prepare_port_filter_with_security_group_info(self):
+        self._prepare_port_with_security_group_info()
+        self.firewall.ipset.set_members.assert_called_once_with(
+            'NIPv4sg2', 'IPv4',
+            set([FAKE_IP['IPv4'], '10.0.0.2', '10.0.0.3']))
+        self.v4filter_inst.add_rule.assert_any_call(
+            'ifake_dev',
+            '-p tcp -m tcp --dport 22 -m set --match-set NIPv4sg2 src '
+            '-j RETURN')
@@ -701,3 +701,127 @@ class IptablesManagerStateLessTestCase(base.BaseTestCase):
 
     def test_nat_not_found(self):
         self.assertNotIn('nat', self.iptables.ipv4)
+
+
+class IptablesManagerIncrementalTestCase(base.BaseTestCase):
+
+    def setUp(self):
+        super(IptablesManagerIncrementalTestCase, self).setUp()
+        self.root_helper = 'sudo'
+        self.config(iptables_incremental_apply=True)
+        self.iptables = (iptables_manager.
+                         IptablesManager(root_helper=self.root_helper,
+                                         state_less=True))
+        self.execute = mock.patch.object(self.iptables, "execute").start()
+
+    def _full_apply_calls(self):
+        return [
+            (mock.call(['iptables-save', '-c'],
+                       root_helper=self.root_helper),
+             ''),
+            (mock.call(['iptables-restore', '-c'],
+                       process_input=mock.ANY,
+                       root_helper=self.root_helper),
+             None),
+        ]
+
+    def test_first_apply_is_full(self):
+        expected_calls_and_values = self._full_apply_calls()
+        tools.setup_mock_calls(self.execute, expected_calls_and_values)
+
+        self.iptables.apply()
+
+        tools.verify_mock_calls(self.execute, expected_calls_and_values)
+
+    def test_apply_without_changes_does_nothing(self):
+        self.iptables.apply()
+        self.execute.reset_mock()
+
+        self.iptables.apply()
+
+        self.assertFalse(self.execute.called)
+
+    def test_add_and_remove_chain(self):
+        self.iptables.apply()
+        self.execute.reset_mock()
+
+        self.iptables.ipv4['filter'].add_chain('filter')
+        self.iptables.ipv4['filter'].add_rule('filter',
+                                              '-s 0/0 -d 192.168.0.2')
+        self.iptables.ipv4['filter'].add_rule('INPUT', '-j $filter')
+        self.iptables.apply()
+
+        self.iptables.ipv4['filter'].remove_chain('filter')
+        self.iptables.apply()
+
+        add_input = ('*filter\n'
+                     ':%(bn)s-INPUT - [0:0]\n'
+                     ':%(bn)s-filter - [0:0]\n'
+                     '-A %(bn)s-INPUT -j %(bn)s-filter\n'
+                     '-A %(bn)s-filter -s 0/0 -d 192.168.0.2\n'
+                     'COMMIT\n' % IPTABLES_ARG)
+        remove_input = ('*filter\n'
+                        ':%(bn)s-INPUT - [0:0]\n'
+                        ':%(bn)s-filter - [0:0]\n'
+                        '-X %(bn)s-filter\n'
+                        'COMMIT\n' % IPTABLES_ARG)
+        self.execute.assert_has_calls([
+            mock.call(['iptables-restore', '--noflush'],
+                      process_input=add_input,
+                      root_helper=self.root_helper),
+            mock.call(['iptables-restore', '--noflush'],
+                      process_input=remove_input,
+                      root_helper=self.root_helper)])
+        self.assertEqual(2, self.execute.call_count)
+
+    def test_unwrapped_rule_change_falls_back_to_full_apply(self):
+        self.iptables.apply()
+        expected_calls_and_values = self._full_apply_calls()
+        tools.setup_mock_calls(self.execute, expected_calls_and_values)
+
+        self.iptables.ipv4['filter'].add_rule('FORWARD', '-j DROP',
+                                              wrap=False)
+        self.iptables.apply()
+
+        tools.verify_mock_calls(self.execute, expected_calls_and_values)
+
+    def test_full_apply_after_interval(self):
+        self.config(iptables_full_apply_interval=2)
+        self.iptables.apply()
+        self.iptables.apply()
+        self.iptables.apply()
+        expected_calls_and_values = self._full_apply_calls()
+        tools.setup_mock_calls(self.execute, expected_calls_and_values)
+
+        self.iptables.apply()
+
+        tools.verify_mock_calls(self.execute, expected_calls_and_values)
+        self.execute.reset_mock()
+        self.iptables.apply()
+        self.assertFalse(self.execute.called)
+
+    def test_incremental_failure_falls_back_to_full_apply(self):
+        self.iptables.apply()
+
+        expected_calls_and_values = [
+            (mock.call(['iptables-restore', '--noflush'],
+                       process_input=mock.ANY,
+                       root_helper=self.root_helper),
+             RuntimeError('iptables-restore: line 2 failed'))
+        ] + self._full_apply_calls()
+        tools.setup_mock_calls(self.execute, expected_calls_and_values)
+
+        self.iptables.ipv4['filter'].add_rule('INPUT', '-j DROP')
+        self.iptables.apply()
+
+        tools.verify_mock_calls(self.execute, expected_calls_and_values)
+
+    def test_unwrapped_chain_change_falls_back_to_full_apply(self):
+        self.iptables.apply()
+        expected_calls_and_values = self._full_apply_calls()
+        tools.setup_mock_calls(self.execute, expected_calls_and_values)
+
+        self.iptables.ipv4['filter'].add_chain('shared', wrap=False)
+        self.iptables.apply()
+
+        tools.verify_mock_calls(self.execute, expected_calls_and_values)
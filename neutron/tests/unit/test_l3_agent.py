@@ -15,6 +15,7 @@
 
 import contextlib
 import copy
+import datetime
 
 import mock
 import netaddr
@@ -93,19 +94,183 @@ class TestBasicRouterOperations(base.BaseTestCase):
 
     def test__sync_routers_task_raise_exception(self):
         agent = l3_agent.L3NATAgent(HOSTNAME, self.conf)
-        self.plugin_api.get_routers.side_effect = Exception()
+        self.plugin_api.get_router_ids.return_value = [FAKE_ID]
+        self.plugin_api.get_changed_routers.side_effect = Exception()
         with mock.patch.object(agent, '_cleanup_namespaces') as f:
             agent._sync_routers_task(agent.context)
         self.assertFalse(f.called)
+        self.assertTrue(agent.fullsync)
 
     def test__sync_routers_task_call_clean_stale_namespaces(self):
         agent = l3_agent.L3NATAgent(HOSTNAME, self.conf)
-        self.plugin_api.get_routers.return_value = mock.ANY
+        routers = [{'id': FAKE_ID}]
+        self.plugin_api.get_router_ids.return_value = [FAKE_ID]
+        self.plugin_api.get_changed_routers.return_value = {
+            'routers': routers, 'unchanged': []}
         with mock.patch.object(agent, '_cleanup_namespaces') as f:
-            with mock.patch.object(agent, '_process_routers') as g:
-                agent._sync_routers_task(agent.context)
-        self.assertTrue(f.called)
-        g.assert_called_with(mock.ANY, all_routers=True)
+            agent._sync_routers_task(agent.context)
+        f.assert_called_once_with(routers)
+        self.assertFalse(agent.fullsync)
+
+    def test__sync_routers_task_fetches_routers_in_chunks(self):
+        self.conf.set_override('sync_routers_chunk_size', 2)
+        agent = l3_agent.L3NATAgent(HOSTNAME, self.conf)
+        router_ids = [_uuid() for i in range(5)]
+        self.plugin_api.get_router_ids.return_value = router_ids
+        self.plugin_api.get_changed_routers.side_effect = (
+            l3_agent.messaging.UnsupportedVersion('1.3'))
+        self.plugin_api.get_routers.side_effect = (
+            lambda context, ids: [{'id': router_id} for router_id in ids])
+        agent._sync_routers_task(agent.context)
+        self.plugin_api.get_routers.assert_has_calls(
+            [mock.call(agent.context, router_ids[0:2]),
+             mock.call(agent.context, router_ids[2:4]),
+             mock.call(agent.context, router_ids[4:5])])
+        self.assertEqual(1, self.plugin_api.get_changed_routers.call_count)
+        self.assertFalse(agent.use_router_revisions)
+        self.assertEqual(5, len(agent._queue))
+        update = agent._queue.get()
+        self.assertEqual(l3_agent.PRIORITY_SYNC_ROUTERS_TASK, update.priority)
+        self.assertEqual({'id': update.id}, update.router)
+
+    def test__sync_routers_task_without_remote_get_changed_routers(self):
+        agent = l3_agent.L3NATAgent(HOSTNAME, self.conf)
+        self.plugin_api.get_router_ids.return_value = [FAKE_ID]
+        self.plugin_api.get_changed_routers.side_effect = (
+            l3_agent.n_rpc.RemoteError(exc_type='UnsupportedVersion'))
+        self.plugin_api.get_routers.return_value = [{'id': FAKE_ID}]
+        agent._sync_routers_task(agent.context)
+        self.plugin_api.get_routers.assert_called_once_with(agent.context,
+                                                            [FAKE_ID])
+        self.assertFalse(agent.use_router_revisions)
+        self.assertFalse(agent.fullsync)
+        self.assertEqual(FAKE_ID, agent._queue.get().id)
+
+    def test__sync_routers_task_fetches_changed_routers(self):
+        self.conf.set_override('sync_routers_chunk_size', 2)
+        agent = l3_agent.L3NATAgent(HOSTNAME, self.conf)
+        router_ids = [_uuid() for i in range(3)]
+        for router_id in router_ids[:2]:
+            agent.router_info[router_id] = l3_agent.RouterInfo(
+                router_id, self.conf.root_helper, self.conf.use_namespaces,
+                {'id': router_id, 'revision': 'rev-' + router_id})
+        changed = {'id': router_ids[1], 'revision': 'new'}
+        new = {'id': router_ids[2], 'revision': 'rev'}
+        self.plugin_api.get_router_ids.return_value = router_ids
+        self.plugin_api.get_changed_routers.side_effect = [
+            {'routers': [changed], 'unchanged': [router_ids[0]]},
+            {'routers': [new], 'unchanged': []}]
+        agent._sync_routers_task(agent.context)
+        self.plugin_api.get_changed_routers.assert_has_calls(
+            [mock.call(agent.context,
+                       {router_ids[0]: 'rev-' + router_ids[0],
+                        router_ids[1]: 'rev-' + router_ids[1]}),
+             mock.call(agent.context, {router_ids[2]: None})])
+        self.assertFalse(self.plugin_api.get_routers.called)
+        # the unchanged router is neither processed nor removed
+        self.assertEqual(2, len(agent._queue))
+        self.assertEqual([changed, new],
+                         [agent._queue.get().router for i in range(2)])
+
+    def test__sync_routers_task_without_get_router_ids(self):
+        agent = l3_agent.L3NATAgent(HOSTNAME, self.conf)
+        self.plugin_api.get_router_ids.side_effect = (
+            l3_agent.messaging.UnsupportedVersion('1.2'))
+        self.plugin_api.get_routers.return_value = [{'id': FAKE_ID}]
+        agent._sync_routers_task(agent.context)
+        self.plugin_api.get_routers.assert_called_once_with(agent.context)
+        self.assertFalse(agent.use_router_ids)
+        self.assertEqual(FAKE_ID, agent._queue.get().id)
+
+    def test__sync_routers_task_without_remote_get_router_ids(self):
+        agent = l3_agent.L3NATAgent(HOSTNAME, self.conf)
+        self.plugin_api.get_router_ids.side_effect = (
+            l3_agent.n_rpc.RemoteError(exc_type='UnsupportedVersion'))
+        self.plugin_api.get_routers.return_value = [{'id': FAKE_ID}]
+        agent._sync_routers_task(agent.context)
+        self.plugin_api.get_routers.assert_called_once_with(agent.context)
+        self.assertFalse(agent.use_router_ids)
+        self.assertFalse(agent.fullsync)
+
+    def test__sync_routers_task_get_router_ids_remote_error(self):
+        agent = l3_agent.L3NATAgent(HOSTNAME, self.conf)
+        self.plugin_api.get_router_ids.side_effect = (
+            l3_agent.n_rpc.RemoteError(exc_type='ValueError'))
+        agent._sync_routers_task(agent.context)
+        self.assertFalse(self.plugin_api.get_routers.called)
+        self.assertTrue(agent.use_router_ids)
+        self.assertTrue(agent.fullsync)
+
+    def test__sync_routers_task_queues_removed_routers(self):
+        agent = l3_agent.L3NATAgent(HOSTNAME, self.conf)
+        agent.router_info[FAKE_ID] = mock.Mock()
+        self.plugin_api.get_router_ids.return_value = []
+        agent._sync_routers_task(agent.context)
+        self.assertFalse(self.plugin_api.get_routers.called)
+        update = agent._queue.get()
+        self.assertEqual(FAKE_ID, update.id)
+        self.assertEqual(l3_agent.DELETE_ROUTER, update.action)
+
+    def test__process_router_update_fetches_router(self):
+        agent = l3_agent.L3NATAgent(HOSTNAME, self.conf)
+        router = {'id': FAKE_ID}
+        self.plugin_api.get_routers.return_value = [router]
+        agent.routers_updated(None, [FAKE_ID])
+        with mock.patch.object(agent, '_process_routers') as process:
+            agent._process_router_update()
+        self.plugin_api.get_routers.assert_called_once_with(agent.context,
+                                                            [FAKE_ID])
+        process.assert_called_once_with([router])
+        self.assertEqual(0, len(agent._queue))
+
+    def test__process_router_update_uses_synced_router(self):
+        agent = l3_agent.L3NATAgent(HOSTNAME, self.conf)
+        router = {'id': FAKE_ID}
+        agent._queue.add(l3_agent.RouterUpdate(
+            FAKE_ID, l3_agent.PRIORITY_SYNC_ROUTERS_TASK, router=router))
+        with mock.patch.object(agent, '_process_routers') as process:
+            agent._process_router_update()
+        self.assertFalse(self.plugin_api.get_routers.called)
+        process.assert_called_once_with([router])
+
+    def test__process_router_update_removes_router_not_fetched(self):
+        agent = l3_agent.L3NATAgent(HOSTNAME, self.conf)
+        self.plugin_api.get_routers.return_value = []
+        agent.routers_updated(None, [FAKE_ID])
+        with mock.patch.object(agent, '_router_removed') as removed:
+            agent._process_router_update()
+        removed.assert_called_once_with(FAKE_ID)
+
+    def test__process_router_update_failure_sets_fullsync(self):
+        agent = l3_agent.L3NATAgent(HOSTNAME, self.conf)
+        agent.fullsync = False
+        self.plugin_api.get_routers.side_effect = Exception()
+        agent.router_info[FAKE_ID] = l3_agent.RouterInfo(
+            FAKE_ID, self.conf.root_helper, self.conf.use_namespaces,
+            {'id': FAKE_ID, 'revision': 'rev'})
+        agent.routers_updated(None, [FAKE_ID])
+        agent._process_router_update()
+        self.assertTrue(agent.fullsync)
+        # the router is sent again by the full sync
+        self.assertEqual({FAKE_ID: None},
+                         agent._get_router_revisions([FAKE_ID]))
+        # the router is released for the next update
+        agent.routers_updated(None, [FAKE_ID])
+        self.assertEqual(FAKE_ID, agent._queue.get().id)
+
+    def test__process_router_update_records_time(self):
+        agent = l3_agent.L3NATAgent(HOSTNAME, self.conf)
+        self.plugin_api.get_routers.return_value = [{'id': FAKE_ID}]
+        agent.routers_updated(None, [FAKE_ID])
+        with mock.patch.object(agent, '_process_routers'):
+            agent.router_info[FAKE_ID] = mock.Mock()
+            agent._process_router_update()
+        self.assertIn(FAKE_ID, agent.router_update_times)
+        agent.router_deleted(None, FAKE_ID)
+        with mock.patch.object(agent, '_router_removed',
+                               side_effect=agent.router_info.pop):
+            agent._process_router_update()
+        self.assertNotIn(FAKE_ID, agent.router_update_times)
 
     def test_router_info_create(self):
         id = _uuid()
@@ -456,6 +621,43 @@ class TestBasicRouterOperations(base.BaseTestCase):
         self.assertFalse(agent.process_router_floating_ip_addresses.called)
         self.assertFalse(agent.process_router_floating_ip_nat_rules.called)
 
+    def test_process_router_batches_namespace_changes(self):
+        agent = l3_agent.L3NATAgent(HOSTNAME, self.conf)
+        router = self._prepare_router_data()
+        ri = l3_agent.RouterInfo(router['id'], self.conf.root_helper,
+                                 self.conf.use_namespaces, router=router)
+        with contextlib.nested(
+            mock.patch.object(l3_agent.ip_lib, 'batch'),
+            mock.patch.object(agent, '_process_router')
+        ) as (batch, _process_router):
+            agent.process_router(ri)
+        batch.assert_called_once_with(self.conf.root_helper, ri.ns_name)
+        _process_router.assert_called_once_with(ri)
+        self.assertTrue(batch.return_value.__exit__.called)
+
+    def test_process_router_adds_floating_ip_addresses_unbatched(self):
+        agent = l3_agent.L3NATAgent(HOSTNAME, self.conf)
+        router = self._prepare_router_data()
+        ri = l3_agent.RouterInfo(router['id'], self.conf.root_helper,
+                                 self.conf.use_namespaces, router=router)
+        agent.external_gateway_added = mock.Mock()
+
+        def process_addresses(ri, ex_gw_port):
+            unbatched_block = unbatched.return_value
+            self.assertTrue(unbatched_block.__enter__.called)
+            self.assertFalse(unbatched_block.__exit__.called)
+            return {}
+
+        with contextlib.nested(
+            mock.patch.object(l3_agent.ip_lib, 'unbatched'),
+            mock.patch.object(agent, 'process_router_floating_ip_addresses',
+                              side_effect=process_addresses)
+        ) as (unbatched, process_router_floating_ip_addresses):
+            agent.process_router(ri)
+        unbatched.assert_called_once_with(ri.ns_name)
+        self.assertTrue(process_router_floating_ip_addresses.called)
+        self.assertTrue(unbatched.return_value.__exit__.called)
+
     @mock.patch('neutron.agent.linux.ip_lib.IPDevice')
     def test_process_router_floating_ip_addresses_add(self, IPDevice):
         fip_id = _uuid()
@@ -593,6 +795,29 @@ class TestBasicRouterOperations(base.BaseTestCase):
         self.assertEqual({fip_id: l3_constants.FLOATINGIP_STATUS_ERROR},
                          fip_statuses)
 
+    @mock.patch('neutron.agent.linux.ip_lib.IPDevice')
+    def test_process_router_floating_ip_with_ip_command_error(self, IPDevice):
+        IPDevice.return_value = device = mock.Mock()
+        device.addr.add.side_effect = RuntimeError
+        device.addr.list.return_value = []
+        fip_id = _uuid()
+        fip = {
+            'id': fip_id, 'port_id': _uuid(),
+            'floating_ip_address': '15.1.2.3',
+            'fixed_ip_address': '192.168.0.2'
+        }
+        ri = mock.MagicMock()
+        ri.router.get.return_value = [fip]
+
+        agent = l3_agent.L3NATAgent(HOSTNAME, self.conf)
+
+        fip_statuses = agent.process_router_floating_ip_addresses(
+            ri, {'id': _uuid()})
+
+        self.assertEqual({fip_id: l3_constants.FLOATINGIP_STATUS_ERROR},
+                         fip_statuses)
+        self.assertFalse(self.send_arp.called)
+
     def test_process_router_snat_disabled(self):
         agent = l3_agent.L3NATAgent(HOSTNAME, self.conf)
         router = self._prepare_router_data(enable_snat=True)
@@ -803,8 +1028,8 @@ class TestBasicRouterOperations(base.BaseTestCase):
             # The unexpected exception has been fixed manually
             internal_network_added.side_effect = None
 
-            # _sync_routers_task finds out that _rpc_loop failed to process the
-            # router last time, it will retry in the next run.
+            # _sync_routers_task finds out that the router failed to be
+            # processed last time, it will retry in the next run.
             agent.process_router(ri)
             # We were able to add the port to ri.internal_ports
             self.assertIn(
@@ -834,8 +1059,8 @@ class TestBasicRouterOperations(base.BaseTestCase):
             # The unexpected exception has been fixed manually
             internal_net_removed.side_effect = None
 
-            # _sync_routers_task finds out that _rpc_loop failed to process the
-            # router last time, it will retry in the next run.
+            # _sync_routers_task finds out that the router failed to be
+            # processed last time, it will retry in the next run.
             agent.process_router(ri)
             # We were able to remove the port from ri.internal_ports
             self.assertNotIn(
@@ -1022,29 +1247,31 @@ class TestBasicRouterOperations(base.BaseTestCase):
             namespace=ri.ns_name,
             prefix=l3_agent.EXTERNAL_DEV_PREFIX)
 
+    def _assert_queued(self, agent, action=None):
+        update = agent._queue.get()
+        self.assertEqual(FAKE_ID, update.id)
+        self.assertEqual(l3_agent.PRIORITY_RPC, update.priority)
+        self.assertEqual(action, update.action)
+
     def test_router_deleted(self):
         agent = l3_agent.L3NATAgent(HOSTNAME, self.conf)
         agent.router_deleted(None, FAKE_ID)
-        # verify that will set fullsync
-        self.assertIn(FAKE_ID, agent.removed_routers)
+        self._assert_queued(agent, l3_agent.DELETE_ROUTER)
 
     def test_routers_updated(self):
         agent = l3_agent.L3NATAgent(HOSTNAME, self.conf)
         agent.routers_updated(None, [FAKE_ID])
-        # verify that will set fullsync
-        self.assertIn(FAKE_ID, agent.updated_routers)
+        self._assert_queued(agent)
 
     def test_removed_from_agent(self):
         agent = l3_agent.L3NATAgent(HOSTNAME, self.conf)
         agent.router_removed_from_agent(None, {'router_id': FAKE_ID})
-        # verify that will set fullsync
-        self.assertIn(FAKE_ID, agent.removed_routers)
+        self._assert_queued(agent, l3_agent.DELETE_ROUTER)
 
     def test_added_to_agent(self):
         agent = l3_agent.L3NATAgent(HOSTNAME, self.conf)
         agent.router_added_to_agent(None, [FAKE_ID])
-        # verify that will set fullsync
-        self.assertIn(FAKE_ID, agent.updated_routers)
+        self._assert_queued(agent)
 
     def test_process_router_delete(self):
         agent = l3_agent.L3NATAgent(HOSTNAME, self.conf)
@@ -1061,8 +1288,9 @@ class TestBasicRouterOperations(base.BaseTestCase):
             'gw_port': ex_gw_port}
         agent._router_added(router['id'], router)
         agent.router_deleted(None, router['id'])
-        agent._process_router_delete()
-        self.assertFalse(list(agent.removed_routers))
+        agent._process_router_update()
+        self.assertNotIn(router['id'], agent.router_info)
+        self.assertEqual(0, len(agent._queue))
 
     def test_destroy_router_namespace_skips_ns_removal(self):
         agent = l3_agent.L3NATAgent(HOSTNAME, self.conf)
@@ -1321,6 +1549,73 @@ class TestBasicRouterOperations(base.BaseTestCase):
                                      other_namespaces)
 
 
+class TestRouterProcessingQueue(base.BaseTestCase):
+
+    def setUp(self):
+        super(TestRouterProcessingQueue, self).setUp()
+        self.queue = l3_agent.RouterProcessingQueue()
+        self.now = datetime.datetime(2014, 7, 1, 12, 0, 0)
+
+    def _update(self, router_id, priority=l3_agent.PRIORITY_RPC, seconds=0,
+                **kwargs):
+        return l3_agent.RouterUpdate(
+            router_id, priority,
+            timestamp=self.now + datetime.timedelta(seconds=seconds),
+            **kwargs)
+
+    def test_rpc_updates_before_sync_updates(self):
+        self.queue.add(self._update('r1', l3_agent.PRIORITY_SYNC_ROUTERS_TASK))
+        self.queue.add(self._update('r2', seconds=2))
+        self.queue.add(self._update('r3', seconds=1))
+        self.assertEqual(['r3', 'r2', 'r1'],
+                         [self.queue.get().id for i in range(3)])
+
+    def test_later_update_replaces_pending_update(self):
+        self.queue.add(self._update('r1', router={'id': 'r1'}))
+        self.queue.add(self._update('r1', l3_agent.PRIORITY_SYNC_ROUTERS_TASK,
+                                    seconds=1, action=l3_agent.DELETE_ROUTER))
+        self.assertEqual(1, len(self.queue))
+        update = self.queue.get()
+        self.assertEqual(l3_agent.PRIORITY_RPC, update.priority)
+        self.assertEqual(l3_agent.DELETE_ROUTER, update.action)
+        self.assertEqual(0, len(self.queue))
+
+    def test_older_router_data_does_not_replace_pending_update(self):
+        self.queue.add(self._update('r1', seconds=1))
+        self.queue.add(self._update('r1', l3_agent.PRIORITY_SYNC_ROUTERS_TASK,
+                                    router={'id': 'r1'}))
+        self.assertIsNone(self.queue.get().router)
+
+    def test_update_waits_for_router_being_processed(self):
+        self.queue.add(self._update('r1'))
+        self.queue.add(self._update('r2', l3_agent.PRIORITY_SYNC_ROUTERS_TASK))
+        update = self.queue.get()
+        self.queue.add(self._update('r1', seconds=1))
+        self.assertEqual('r2', self.queue.get().id)
+        self.queue.done(update)
+        self.assertEqual('r1', self.queue.get().id)
+
+    def test_stale_update_is_dropped(self):
+        update = self._update('r1', seconds=2)
+        self.queue.add(update)
+        self.queue.get()
+        self.queue.add(self._update('r1', l3_agent.PRIORITY_SYNC_ROUTERS_TASK,
+                                    seconds=1, router={'id': 'r1'}))
+        self.queue.done(update)
+        self.queue.add(self._update('r2', l3_agent.PRIORITY_SYNC_ROUTERS_TASK,
+                                    seconds=3))
+        self.assertEqual('r2', self.queue.get().id)
+        self.assertEqual(0, len(self.queue))
+
+    def test_update_is_not_dropped_after_failure(self):
+        update = self._update('r1', seconds=2)
+        self.queue.add(update)
+        self.queue.get()
+        self.queue.done(update, processed=False)
+        self.queue.add(self._update('r1', seconds=1))
+        self.assertEqual('r1', self.queue.get().id)
+
+
 class TestL3AgentEventHandler(base.BaseTestCase):
 
     def setUp(self):
@@ -2012,6 +2012,35 @@ class L3NatDBIntAgentSchedulingTestCase(L3BaseForIntTests,
                 r['router']['id'],
                 s2['subnet']['network_id'])
 
+    def test_get_router_ids_schedules_routers(self):
+        with contextlib.nested(self.router(),
+                               self.router()) as (r1, r2):
+            l3_rpc = l3_rpc_base.L3RpcCallbackMixin()
+            self._register_one_l3_agent(host='host1')
+            router_ids = l3_rpc.get_router_ids(self.adminContext,
+                                               host='host1')
+            self.assertEqual(
+                sorted([r1['router']['id'], r2['router']['id']]),
+                sorted(router_ids))
+            self._assert_router_on_agent(r1['router']['id'], 'host1')
+
+    def test_get_changed_routers(self):
+        with contextlib.nested(self.router(),
+                               self.router()) as (r1, r2):
+            r1_id, r2_id = r1['router']['id'], r2['router']['id']
+            l3_rpc = l3_rpc_base.L3RpcCallbackMixin()
+            self._register_one_l3_agent(host='host1')
+            routers = l3_rpc.sync_routers(self.adminContext, host='host1')
+            revisions = dict((r['id'], r['revision']) for r in routers)
+            self._update('routers', r2_id, {'router': {'name': 'new'}})
+            reply = l3_rpc.get_changed_routers(self.adminContext,
+                                               host='host1',
+                                               router_revisions=revisions)
+            self.assertEqual([r1_id], reply['unchanged'])
+            self.assertEqual([r2_id], [r['id'] for r in reply['routers']])
+            self.assertNotEqual(revisions[r2_id],
+                                reply['routers'][0]['revision'])
+
     def test_router_update_gateway_no_eligible_l3_agent(self):
         with self.router() as r:
             with self.subnet() as s1:
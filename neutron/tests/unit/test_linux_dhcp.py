@@ -442,6 +442,10 @@ class TestBase(base.BaseTestCase):
         self.execute_p = mock.patch('neutron.agent.linux.utils.execute')
         self.safe = self.replace_p.start()
         self.execute = self.execute_p.start()
+        for cache in (dhcp.Dnsmasq._conf_files, dhcp.Dnsmasq._hosts_leases):
+            cache_p = mock.patch.dict(cache, clear=True)
+            cache_p.start()
+            self.addCleanup(cache_p.stop)
 
 
 class TestDhcpBase(TestBase):
@@ -1140,6 +1144,32 @@ tag:tag0,option:router""".lstrip()
         self.execute.assert_called_once_with(exp_args, 'sudo')
         device_manager.update.assert_called_with(fake_net, 'tap12345678-12')
 
+    def test_reload_allocations_unchanged(self):
+        fake_net = FakeDualNetwork()
+
+        with contextlib.nested(
+            mock.patch('os.path.isdir', return_value=True),
+            mock.patch('os.path.exists',
+                       side_effect=lambda f: f in dhcp.Dnsmasq._conf_files),
+            mock.patch.object(dhcp.Dnsmasq, 'active'),
+            mock.patch.object(dhcp.Dnsmasq, 'pid'),
+            mock.patch.object(dhcp.Dnsmasq, 'interface_name'),
+            mock.patch.object(dhcp.Dnsmasq, '_make_subnet_interface_ip_map',
+                              return_value={}),
+            mock.patch.object(dhcp.Dnsmasq, '_release_lease')
+        ) as (isdir, exists, active, pid, interface_name, ip_map, release):
+            active.__get__ = mock.Mock(return_value=True)
+            pid.__get__ = mock.Mock(return_value=5)
+            interface_name.__get__ = mock.Mock(return_value='tap12345678-12')
+            for i in range(2):
+                dm = dhcp.Dnsmasq(self.conf, fake_net, version=float(2.59))
+                dm.device_manager = mock.Mock()
+                dm.reload_allocations()
+                self.assertTrue(dm.device_manager.update.called)
+
+        self.assertEqual(3, self.safe.call_count)
+        self.execute.assert_called_once_with(['kill', '-HUP', 5], 'sudo')
+
     def test_reload_allocations_stale_pid(self):
         (exp_host_name, exp_host_data,
          exp_addn_name, exp_addn_data,
@@ -1227,6 +1257,30 @@ tag:tag0,option:router""".lstrip()
         mock_exists.assert_called_once_with(filename)
         mock_open.assert_called_once_with(filename)
 
+    def test_read_hosts_file_leases_cached(self):
+        filename = '/path/to/file'
+        leases = set([("192.168.0.1", "00:00:80:aa:bb:cc")])
+        dhcp.Dnsmasq._hosts_leases[filename] = leases
+        with contextlib.nested(
+            mock.patch('os.path.exists', return_value=True),
+            mock.patch('__builtin__.open')
+        ) as (mock_exists, mock_open):
+            dnsmasq = dhcp.Dnsmasq(self.conf, FakeDualNetwork())
+            self.assertEqual(leases,
+                             dnsmasq._read_hosts_file_leases(filename))
+        self.assertFalse(mock_open.called)
+
+    def test_remove_config_files_clears_caches(self):
+        dnsmasq = dhcp.Dnsmasq(self.conf, FakeDualNetwork())
+        host_file = dnsmasq.get_conf_file_name('host')
+        other_file = '/other/network/host'
+        dhcp.Dnsmasq._conf_files.update({host_file: 'a', other_file: 'b'})
+        dhcp.Dnsmasq._hosts_leases[host_file] = set()
+        with mock.patch('shutil.rmtree'):
+            dnsmasq._remove_config_files()
+        self.assertEqual({other_file: 'b'}, dhcp.Dnsmasq._conf_files)
+        self.assertEqual({}, dhcp.Dnsmasq._hosts_leases)
+
     def test_make_subnet_interface_ip_map(self):
         with mock.patch('neutron.agent.linux.ip_lib.IPDevice') as ip_dev:
             ip_dev.return_value.addr.list.return_value = [
@@ -13,7 +13,11 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import contextlib
+
 import mock
+from oslo.config import cfg
+import testtools
 
 from neutron.agent.linux import ip_lib
 from neutron.common import exceptions
@@ -192,6 +196,148 @@ class TestSubProcessBase(base.BaseTestCase):
                           [], 'link', ('list',))
 
 
+class TestBatch(base.BaseTestCase):
+    def setUp(self):
+        super(TestBatch, self).setUp()
+        self.execute_p = mock.patch('neutron.agent.linux.utils.execute')
+        self.execute = self.execute_p.start()
+        cfg.CONF.register_opts(ip_lib.OPTS)
+        cfg.CONF.set_override('ip_lib_backend', 'batch')
+        self.device = ip_lib.IPDevice('tap0', 'sudo', 'ns')
+
+    def _batch_call(self, namespace, *lines):
+        if namespace:
+            ip_cmd = ['ip', 'netns', 'exec', namespace, 'ip']
+        else:
+            ip_cmd = ['ip']
+        return mock.call(ip_cmd + ['-force', '-batch', '-'],
+                         root_helper='sudo',
+                         process_input=''.join(line + '\n'
+                                               for line in lines))
+
+    def test_batch_runs_changes_on_exit(self):
+        with ip_lib.batch('sudo', 'ns'):
+            self.device.link.set_up()
+            self.device.addr.add(4, '10.0.0.1/24', '10.0.0.255')
+            self.device.route.add_gateway('10.0.0.254')
+            self.assertFalse(self.execute.called)
+        self.execute.assert_called_once_with(
+            ['ip', 'netns', 'exec', 'ns', 'ip', '-force', '-batch', '-'],
+            root_helper='sudo',
+            process_input='link set tap0 up\n'
+                          'addr add 10.0.0.1/24 brd 10.0.0.255 scope global '
+                          'dev tap0\n'
+                          'route replace default via 10.0.0.254 dev tap0\n')
+
+    def test_batch_runs_changes_before_query(self):
+        with ip_lib.batch('sudo', 'ns'):
+            self.device.addr.add(4, '10.0.0.1/24', '10.0.0.255')
+            self.device.addr.list()
+            self.device.addr.delete(4, '10.0.0.2/24')
+        self.assertEqual(
+            [self._batch_call('ns', 'addr add 10.0.0.1/24 brd 10.0.0.255 '
+                                    'scope global dev tap0'),
+             mock.call(['ip', 'netns', 'exec', 'ns', 'ip', 'addr', 'show',
+                        'tap0'], root_helper='sudo'),
+             self._batch_call('ns', 'addr del 10.0.0.2/24 dev tap0')],
+            self.execute.call_args_list)
+
+    def test_batch_runs_changes_before_netns_execute(self):
+        with ip_lib.batch('sudo', 'ns'):
+            self.device.addr.add(4, '10.0.0.1/24', '10.0.0.255')
+            ip_lib.IPWrapper('sudo', 'ns').netns.execute(['arping'])
+        self.assertEqual(
+            [self._batch_call('ns', 'addr add 10.0.0.1/24 brd 10.0.0.255 '
+                                    'scope global dev tap0'),
+             mock.call(['ip', 'netns', 'exec', 'ns', 'arping'],
+                       root_helper='sudo', check_exit_code=True)],
+            self.execute.call_args_list)
+
+    def test_batch_does_not_queue_namespace_changes(self):
+        with ip_lib.batch('sudo', 'ns'):
+            self.device.link.set_netns('ns2')
+            self.device.addr.add(4, '10.0.0.1/24', '10.0.0.255')
+        self.assertEqual(
+            [mock.call(['ip', 'netns', 'exec', 'ns', 'ip', 'link', 'set',
+                        'tap0', 'netns', 'ns2'], root_helper='sudo'),
+             mock.call(['ip', 'netns', 'exec', 'ns2', 'ip', '-4', 'addr',
+                        'add', '10.0.0.1/24', 'brd', '10.0.0.255', 'scope',
+                        'global', 'dev', 'tap0'], root_helper='sudo')],
+            self.execute.call_args_list)
+
+    def test_nested_batch_runs_changes_on_outer_exit(self):
+        with ip_lib.batch('sudo', 'ns'):
+            with ip_lib.batch('sudo', 'ns'):
+                self.device.link.set_up()
+            self.assertFalse(self.execute.called)
+        self.assertEqual([self._batch_call('ns', 'link set tap0 up')],
+                         self.execute.call_args_list)
+
+    def test_batch_runs_changes_on_error(self):
+        with testtools.ExpectedException(ValueError):
+            with ip_lib.batch('sudo', 'ns'):
+                self.device.link.set_up()
+                raise ValueError()
+        self.assertEqual([self._batch_call('ns', 'link set tap0 up')],
+                         self.execute.call_args_list)
+        self.assertEqual({}, ip_lib._batches)
+
+    def test_batch_failure_closes_batch(self):
+        self.execute.side_effect = RuntimeError
+        with testtools.ExpectedException(RuntimeError):
+            with ip_lib.batch('sudo', 'ns'):
+                self.device.link.set_up()
+        self.assertEqual({}, ip_lib._batches)
+
+    def test_batch_failure_names_failed_changes(self):
+        self.execute.side_effect = RuntimeError(
+            "\nCommand: ['ip', '-force', '-batch', '-']\nExit code: 1\n"
+            "Stdout: ''\nStderr: 'RTNETLINK answers: File exists\\n"
+            "Command failed -:2\\n'")
+        with testtools.ExpectedException(
+                RuntimeError, '.*ns: addr add 10.0.0.1/24 brd 10.0.0.255 '
+                              'scope global dev tap0\n.*'):
+            with ip_lib.batch('sudo', 'ns'):
+                self.device.link.set_up()
+                self.device.addr.add(4, '10.0.0.1/24', '10.0.0.255')
+                self.device.link.set_mtu(1400)
+
+    def test_unbatched_runs_changes_at_once(self):
+        with ip_lib.batch('sudo', 'ns'):
+            self.device.link.set_up()
+            with ip_lib.unbatched('ns'):
+                self.device.addr.add(4, '10.0.0.1/24', '10.0.0.255')
+            self.device.link.set_mtu(1400)
+        self.assertEqual(
+            [self._batch_call('ns', 'link set tap0 up'),
+             mock.call(['ip', 'netns', 'exec', 'ns', 'ip', '-4', 'addr',
+                        'add', '10.0.0.1/24', 'brd', '10.0.0.255', 'scope',
+                        'global', 'dev', 'tap0'], root_helper='sudo'),
+             self._batch_call('ns', 'link set tap0 mtu 1400')],
+            self.execute.call_args_list)
+
+    def test_unbatched_error_keeps_batch(self):
+        with testtools.ExpectedException(RuntimeError):
+            with ip_lib.batch('sudo', 'ns'):
+                with testtools.ExpectedException(ValueError):
+                    with ip_lib.unbatched('ns'):
+                        raise ValueError()
+                self.assertIn('ns', ip_lib._batches)
+                raise RuntimeError()
+        self.assertEqual({}, ip_lib._batches)
+
+    def test_unbatched_without_batch(self):
+        with ip_lib.unbatched('ns'):
+            self.device.link.set_up()
+        self.assertEqual(1, self.execute.call_count)
+
+    def test_batch_with_command_backend(self):
+        cfg.CONF.set_override('ip_lib_backend', 'command')
+        with ip_lib.batch('sudo', 'ns'):
+            self.device.link.set_up()
+            self.assertEqual(1, self.execute.call_count)
+
+
 class TestIpWrapper(base.BaseTestCase):
     def setUp(self):
         super(TestIpWrapper, self).setUp()
@@ -828,6 +974,32 @@ class TestDeviceExists(base.BaseTestCase):
             _execute.side_effect = RuntimeError
             self.assertFalse(ip_lib.device_exists('eth0'))
 
+    def _test_device_exists_in_sysfs(self, device_type):
+        cfg.CONF.register_opts(ip_lib.OPTS)
+        cfg.CONF.set_override('ip_lib_backend', 'batch')
+        with contextlib.nested(
+            mock.patch.object(ip_lib.IPDevice, '_execute'),
+            mock.patch('__builtin__.open')
+        ) as (_execute, _open):
+            if device_type is None:
+                _open.side_effect = IOError
+            else:
+                _open.return_value.__enter__.return_value.read.return_value = (
+                    device_type + '\n')
+            exists = ip_lib.device_exists('eth0')
+            _open.assert_called_once_with('/sys/class/net/eth0/type')
+            self.assertFalse(_execute.called)
+        return exists
+
+    def test_device_exists_in_sysfs(self):
+        self.assertTrue(self._test_device_exists_in_sysfs('1'))
+
+    def test_device_exists_in_sysfs_not_ethernet(self):
+        self.assertFalse(self._test_device_exists_in_sysfs('772'))
+
+    def test_device_does_not_exist_in_sysfs(self):
+        self.assertFalse(self._test_device_exists_in_sysfs(None))
+
     def test_ensure_device_is_ready(self):
         ip_lib_mock = mock.Mock()
         with mock.patch.object(ip_lib, 'IPDevice', return_value=ip_lib_mock):
@@ -45,6 +45,8 @@ class FakeConf(object):
     nova_client_cert = 'nova_cert'
     nova_client_priv_key = 'nova_priv_key'
     cache_url = ''
+    metadata_cache_size = 10
+    metadata_cache_negative_ttl = 2
 
 
 class FakeConfCache(FakeConf):
@@ -227,18 +229,18 @@ class TestMetadataProxyHandlerCache(base.BaseTestCase):
 
         if router_id:
             expected.extend([
-                new_qclient_call,
                 mock.call().list_ports(
                     device_id=router_id,
                     device_owner=constants.DEVICE_OWNER_ROUTER_INTF
-                )
+                ),
+                mock.call().get_auth_info()
             ])
 
         expected.extend([
-            new_qclient_call,
             mock.call().list_ports(
                 network_id=networks or tuple(),
-                fixed_ips=['ip_address=192.168.1.1'])
+                fixed_ips=['ip_address=192.168.1.1']),
+            mock.call().get_auth_info()
         ])
 
         self.qclient.assert_has_calls(expected)
@@ -383,6 +385,14 @@ class TestMetadataProxyHandlerCache(base.BaseTestCase):
         with testtools.ExpectedException(Exception):
             self._proxy_request_test_helper(302)
 
+    def test_neutron_client_reused(self):
+        self.handler._get_ports_for_remote_address('192.168.1.1', ('net',))
+        self.handler._get_ports_for_remote_address('192.168.1.2', ('net',))
+        self.assertEqual(1, self.qclient.call_count)
+        self.assertEqual(2, self.qclient.return_value.list_ports.call_count)
+        self.assertEqual(self.qclient.return_value.get_auth_info.return_value,
+                         self.handler.auth_info)
+
     def test_sign_instance_id(self):
         self.assertEqual(
             self.handler._sign_instance_id('foo'),
@@ -390,6 +400,26 @@ class TestMetadataProxyHandlerCache(base.BaseTestCase):
         )
 
 
+class TestMetadataProxyHandlerLRUCache(TestMetadataProxyHandlerCache):
+
+    def test_cache_is_lru(self):
+        self.assertIsInstance(self.handler._cache, utils.LRUCache)
+        self.assertEqual(5, self.handler._cache.ttl)
+        self.assertEqual(10, self.handler._cache.size)
+
+    def test_get_ports_for_remote_address_negative_ttl(self):
+        mock_list_ports = self.qclient.return_value.list_ports
+        mock_list_ports.return_value = {'ports': []}
+        with mock.patch('neutron.openstack.common.timeutils.utcnow_ts',
+                        return_value=0) as utcnow:
+            for now in (0, 1, 2):
+                utcnow.return_value = now
+                self.handler._get_ports_for_remote_address('192.168.1.1',
+                                                           ('net',))
+        self.assertEqual(2, mock_list_ports.call_count)
+        self.assertEqual(1, self.handler._cache.hits)
+
+
 class TestMetadataProxyHandlerNoCache(TestMetadataProxyHandlerCache):
     fake_conf = FakeConf
 
@@ -116,6 +116,26 @@ class PolicyTestCase(base.BaseTestCase):
                                 might_not_exist=True)
         self.assertTrue(result_2)
 
+    def test_check_many(self):
+        targets = [{'tenant_id': 'fake'}, {'tenant_id': 'other'}]
+        result = policy.check_many(self.context, "example:my_file", targets)
+        self.assertEqual([True, False], result)
+
+    def test_check_many_non_existent_action(self):
+        action = "example:idonotexist"
+        targets = [{}, {}]
+        self.assertEqual([False, False],
+                         policy.check_many(self.context, action, targets))
+        self.assertEqual([True, True],
+                         policy.check_many(self.context, action, targets,
+                                           might_not_exist=True))
+
+    def test_check_many_builds_credentials_once(self):
+        with mock.patch.object(self.context, 'to_dict',
+                               wraps=self.context.to_dict) as to_dict:
+            policy.check_many(self.context, "example:allowed", [{}] * 3)
+        self.assertEqual(1, to_dict.call_count)
+
     def test_enforce_good_action(self):
         action = "example:allowed"
         result = policy.enforce(self.context, action, self.target)
@@ -391,6 +411,37 @@ class NeutronPolicyTestCase(base.BaseTestCase):
         self.assertRaises(exceptions.PolicyNotAuthorized, policy.enforce,
                           self.context, action, target, None)
 
+    def test_build_match_rule_cached_by_attributes(self):
+        action = "create_something"
+        rule_1 = policy._build_match_rule(
+            action, {'tenant_id': 'fake', 'attr': {'sub_attr_1': 'x'}})
+        rule_2 = policy._build_match_rule(
+            action, {'tenant_id': 'other', 'attr': {'sub_attr_1': 'y'}})
+        rule_3 = policy._build_match_rule(
+            action, {'tenant_id': 'fake', 'attr': {'sub_attr_1': 'x',
+                                                   'sub_attr_2': 'y'}})
+        self.assertIs(rule_1, rule_2)
+        self.assertIsNot(rule_1, rule_3)
+        self.assertIn('create_something:attr:sub_attr_2', str(rule_3))
+
+    def test_build_match_rule_cache_invalidated_on_reload(self):
+        action = "create_something"
+        target = {'tenant_id': 'fake', 'attr': {'sub_attr_1': 'x'}}
+        policy.init()
+        rule = policy._build_match_rule(action, target)
+        self.assertIs(rule, policy._build_match_rule(action, target))
+        policy.init()
+        self.assertIsNot(rule, policy._build_match_rule(action, target))
+
+    def test_enforce_subattribute_after_cached_rule(self):
+        action = "create_something"
+        policy.enforce(self.context, action,
+                       {'tenant_id': 'fake', 'attr': {'sub_attr_1': 'x'}})
+        self.assertRaises(exceptions.PolicyNotAuthorized, policy.enforce,
+                          self.context, action,
+                          {'tenant_id': 'fake', 'attr': {'sub_attr_1': 'x',
+                                                         'sub_attr_2': 'y'}})
+
     def test_enforce_regularuser_on_read(self):
         action = "get_network"
         target = {'shared': True, 'tenant_id': 'somebody_else'}
@@ -17,6 +17,7 @@ import contextlib
 
 import mock
 from oslo.config import cfg
+from oslo import messaging
 from testtools import matchers
 import webob.exc
 
@@ -103,6 +104,7 @@ class SGServerRpcCallBackMixinTestCase(test_sg.SecurityGroupDBTestCase):
             6,
             '2001:0db8::1')
         self.assertTrue(mock_notifier.called)
+        mock_notifier.assert_called_with(mock.ANY, network_ids=[mock.ANY])
 
     def test_notify_security_group_ipv6_normal_port_added(self):
         if getattr(self, "notifier", None) is None:
@@ -382,6 +384,92 @@ class SGServerRpcCallBackMixinTestCase(test_sg.SecurityGroupDBTestCase):
                 self._delete('ports', port_id1)
                 self._delete('ports', port_id2)
 
+    def test_security_group_info_for_devices_ipv4_source_group(self):
+
+        with self.network() as n:
+            with contextlib.nested(self.subnet(n),
+                                   self.security_group(),
+                                   self.security_group()) as (subnet_v4,
+                                                              sg1,
+                                                              sg2):
+                sg1_id = sg1['security_group']['id']
+                sg2_id = sg2['security_group']['id']
+                rule1 = self._build_security_group_rule(
+                    sg1_id,
+                    'ingress', const.PROTO_NAME_TCP, '24',
+                    '25', remote_group_id=sg2['security_group']['id'])
+                rules = {
+                    'security_group_rules': [rule1['security_group_rule']]}
+                res = self._create_security_group_rule(self.fmt, rules)
+                self.deserialize(self.fmt, res)
+                self.assertEqual(res.status_int, webob.exc.HTTPCreated.code)
+
+                res1 = self._create_port(
+                    self.fmt, n['network']['id'],
+                    security_groups=[sg1_id])
+                ports_rest1 = self.deserialize(self.fmt, res1)
+                port_id1 = ports_rest1['port']['id']
+                self.rpc.devices = {port_id1: ports_rest1['port']}
+                devices = [port_id1, 'no_exist_device']
+
+                res2 = self._create_port(
+                    self.fmt, n['network']['id'],
+                    security_groups=[sg2_id])
+                ports_rest2 = self.deserialize(self.fmt, res2)
+                port_id2 = ports_rest2['port']['id']
+                ctx = context.get_admin_context()
+                sg_info = self.rpc.security_group_info_for_devices(
+                    ctx, devices=devices)
+                self.assertEqual([port_id1], sg_info['devices'].keys())
+                port_rpc = sg_info['devices'][port_id1]
+                self.assertEqual([], port_rpc['security_group_rules'])
+                self.assertEqual([sg2_id],
+                                 port_rpc['security_group_source_groups'])
+                expected = [{'direction': 'egress', 'ethertype': const.IPv4,
+                             'security_group_id': sg1_id},
+                            {'direction': 'egress', 'ethertype': const.IPv6,
+                             'security_group_id': sg1_id},
+                            {'direction': u'ingress',
+                             'protocol': const.PROTO_NAME_TCP,
+                             'ethertype': const.IPv4,
+                             'port_range_max': 25, 'port_range_min': 24,
+                             'remote_group_id': sg2_id,
+                             'security_group_id': sg1_id},
+                            ]
+                self.assertEqual([sg1_id], sg_info['security_groups'].keys())
+                self.assertEqual(sorted(expected),
+                                 sorted(sg_info['security_groups'][sg1_id]))
+                self.assertEqual(
+                    {sg2_id: {const.IPv4: [u'10.0.0.3'], const.IPv6: []}},
+                    sg_info['sg_member_ips'])
+                self._delete('ports', port_id1)
+                self._delete('ports', port_id2)
+
+    def test_security_group_info_for_devices_group_without_rules(self):
+        with self.network() as n:
+            with contextlib.nested(self.subnet(n),
+                                   self.security_group()) as (subnet_v4,
+                                                              sg1):
+                sg1_id = sg1['security_group']['id']
+                self._delete('security-group-rules',
+                             sg1['security_group']['security_group_rules'][0]
+                             ['id'])
+                self._delete('security-group-rules',
+                             sg1['security_group']['security_group_rules'][1]
+                             ['id'])
+                res1 = self._create_port(
+                    self.fmt, n['network']['id'],
+                    security_groups=[sg1_id])
+                ports_rest1 = self.deserialize(self.fmt, res1)
+                port_id1 = ports_rest1['port']['id']
+                self.rpc.devices = {port_id1: ports_rest1['port']}
+                ctx = context.get_admin_context()
+                sg_info = self.rpc.security_group_info_for_devices(
+                    ctx, devices=[port_id1])
+                self.assertEqual({sg1_id: []}, sg_info['security_groups'])
+                self.assertEqual({}, sg_info['sg_member_ips'])
+                self._delete('ports', port_id1)
+
     def test_security_group_rules_for_devices_ipv6_ingress(self):
         fake_prefix = FAKE_PREFIX[const.IPv6]
         fake_gateway = FAKE_IP[const.IPv6]
@@ -854,7 +942,13 @@ class SGAgentRpcCallBackMixinTestCase(base.BaseTestCase):
     def test_security_groups_provider_updated(self):
         self.rpc.security_groups_provider_updated(None)
         self.rpc.sg_agent.assert_has_calls(
-            [mock.call.security_groups_provider_updated()])
+            [mock.call.security_groups_provider_updated(None)])
+
+    def test_security_groups_provider_updated_networks(self):
+        self.rpc.security_groups_provider_updated(None,
+                                                  network_ids=['fake_net'])
+        self.rpc.sg_agent.assert_has_calls(
+            [mock.call.security_groups_provider_updated(['fake_net'])])
 
 
 class SecurityGroupAgentRpcTestCaseForNoneDriver(base.BaseTestCase):
@@ -886,6 +980,7 @@ class SecurityGroupAgentRpcTestCase(base.BaseTestCase):
         rpc = mock.Mock()
         self.agent.plugin_rpc = rpc
         self.fake_device = {'device': 'fake_device',
+                            'network_id': 'fake_net',
                             'security_groups': ['fake_sgid1', 'fake_sgid2'],
                             'security_group_source_groups': ['fake_sgid2'],
                             'security_group_rules': [{'security_group_id':
@@ -940,6 +1035,34 @@ class SecurityGroupAgentRpcTestCase(base.BaseTestCase):
         self.agent.refresh_firewall.assert_has_calls(
             [mock.call.refresh_firewall()])
 
+    def test_security_groups_provider_updated_networks(self):
+        self.agent.refresh_firewall = mock.Mock()
+        self.agent.prepare_devices_filter(['fake_device'])
+        self.agent.security_groups_provider_updated(['fake_net',
+                                                     'fake_net2'])
+        self.agent.refresh_firewall.assert_called_once_with(['fake_device'])
+
+    def test_security_groups_provider_updated_other_networks(self):
+        self.agent.refresh_firewall = mock.Mock()
+        self.agent.prepare_devices_filter(['fake_device'])
+        self.agent.security_groups_provider_updated(['fake_net2'])
+        self.assertFalse(self.agent.refresh_firewall.called)
+
+    def test_security_groups_member_updated_removed_device(self):
+        self.agent.refresh_firewall = mock.Mock()
+        self.agent.prepare_devices_filter(['fake_device'])
+        self.agent.remove_devices_filter(['fake_device'])
+        self.agent.security_groups_member_updated(['fake_sgid2'])
+        self.assertFalse(self.agent.refresh_firewall.called)
+        self.assertEqual({}, self.agent.devices_by_network)
+
+    def test_refresh_firewall_counts(self):
+        self.agent.prepare_devices_filter(['fake_device'])
+        self.agent.refresh_firewall()
+        self.agent.refresh_firewall(['fake_device'])
+        self.assertEqual({'global': 1, 'targeted': 1},
+                         self.agent.firewall_refresh_counts)
+
     def test_refresh_firewall(self):
         self.agent.prepare_devices_filter(['fake_port_id'])
         self.agent.refresh_firewall()
@@ -962,6 +1085,70 @@ class SecurityGroupAgentRpcTestCase(base.BaseTestCase):
         self.agent.refresh_firewall([])
         self.firewall.assert_has_calls([])
 
+    def _use_security_group_info(self):
+        self.agent.use_security_group_info = True
+        self.agent.plugin_rpc.security_group_info_for_devices.return_value = {
+            'devices': {'fake_device': self.fake_device},
+            'security_groups': {'fake_sgid1': [{'direction': 'ingress'}]},
+            'sg_member_ips': {'fake_sgid2': {const.IPv4: ['10.0.0.2'],
+                                             const.IPv6: []}}}
+
+    def test_prepare_devices_filter_with_security_group_info(self):
+        self._use_security_group_info()
+        self.agent.prepare_devices_filter(['fake_device'])
+        self.firewall.assert_has_calls(
+            [mock.call.update_security_group_rules(
+                'fake_sgid1', [{'direction': 'ingress'}]),
+             mock.call.update_security_group_members(
+                 'fake_sgid2', {const.IPv4: ['10.0.0.2'], const.IPv6: []}),
+             mock.call.defer_apply(),
+             mock.call.prepare_port_filter(self.fake_device)])
+        self.assertFalse(
+            self.agent.plugin_rpc.security_group_rules_for_devices.called)
+
+    def test_refresh_firewall_with_security_group_info(self):
+        self._use_security_group_info()
+        self.agent.refresh_firewall(['fake_device'])
+        rpc = self.agent.plugin_rpc
+        rpc.security_group_info_for_devices.assert_called_once_with(
+            None, ['fake_device'])
+        self.firewall.assert_has_calls(
+            [mock.call.defer_apply(),
+             mock.call.update_port_filter(self.fake_device)])
+
+    def _test_security_group_info_not_supported_by_server(self, error):
+        self._use_security_group_info()
+        rpc = self.agent.plugin_rpc
+        rpc.security_group_info_for_devices.side_effect = error
+        self.agent.prepare_devices_filter(['fake_device'])
+        self.agent.refresh_firewall(['fake_device'])
+        self.assertFalse(self.agent.use_security_group_info)
+        self.assertEqual(1, rpc.security_group_info_for_devices.call_count)
+        self.assertEqual(2, rpc.security_group_rules_for_devices.call_count)
+        self.firewall.assert_has_calls(
+            [mock.call.defer_apply(),
+             mock.call.prepare_port_filter(self.fake_device),
+             mock.call.defer_apply(),
+             mock.call.update_port_filter(self.fake_device)])
+
+    def test_security_group_info_not_supported_by_server(self):
+        self._test_security_group_info_not_supported_by_server(
+            messaging.UnsupportedVersion('1.3'))
+
+    def test_security_group_info_not_supported_by_remote_server(self):
+        self._test_security_group_info_not_supported_by_server(
+            messaging.RemoteError(exc_type='UnsupportedVersion'))
+
+    def test_security_group_info_remote_error(self):
+        self._use_security_group_info()
+        rpc = self.agent.plugin_rpc
+        rpc.security_group_info_for_devices.side_effect = (
+            messaging.RemoteError(exc_type='ValueError'))
+        self.assertRaises(messaging.RemoteError,
+                          self.agent.prepare_devices_filter, ['fake_device'])
+        self.assertTrue(self.agent.use_security_group_info)
+        self.assertFalse(rpc.security_group_rules_for_devices.called)
+
 
 class SecurityGroupAgentRpcWithDeferredRefreshTestCase(
     SecurityGroupAgentRpcTestCase):
@@ -969,18 +1156,26 @@ class SecurityGroupAgentRpcWithDeferredRefreshTestCase(
     def setUp(self):
         super(SecurityGroupAgentRpcWithDeferredRefreshTestCase, self).setUp(
             defer_refresh_firewall=True)
+        self.agent.prepare_devices_filter(['fake_device'])
+        self.agent.plugin_rpc.reset_mock()
+        self.firewall.reset_mock()
 
     @contextlib.contextmanager
     def add_fake_device(self, device, sec_groups, source_sec_groups=None):
         fake_device = {'device': device,
+                       'network_id': 'fake_net2',
                        'security_groups': sec_groups,
                        'security_group_source_groups': source_sec_groups or [],
                        'security_group_rules': [{'security_group_id':
                                                  'fake_sgid1',
                                                  'remote_group_id':
                                                  'fake_sgid2'}]}
+        self.agent.plugin_rpc.security_group_rules_for_devices.return_value = (
+            {device: fake_device})
+        self.agent.prepare_devices_filter([device])
         self.firewall.ports[device] = fake_device
         yield
+        self.agent.remove_devices_filter([device])
         del self.firewall.ports[device]
 
     def test_security_groups_rule_updated(self):
@@ -1051,6 +1246,14 @@ class SecurityGroupAgentRpcWithDeferredRefreshTestCase(
         self.agent.security_groups_provider_updated()
         self.assertTrue(self.agent.global_refresh_firewall)
 
+    def test_security_groups_provider_updated_networks(self):
+        with self.add_fake_device(device='fake_device_2',
+                                  sec_groups=['fake_sgid1']):
+            self.agent.security_groups_provider_updated(['fake_net2'])
+            self.assertFalse(self.agent.global_refresh_firewall)
+            self.assertEqual(set(['fake_device_2']),
+                             self.agent.devices_to_refilter)
+
     def test_setup_port_filters_new_ports_only(self):
         self.agent.prepare_devices_filter = mock.Mock()
         self.agent.refresh_firewall = mock.Mock()
@@ -1187,6 +1390,17 @@ class SecurityGroupServerRpcApiTestCase(base.BaseTestCase):
              version=sg_rpc.SG_RPC_VERSION,
              topic='fake_topic')])
 
+    def test_security_group_info_for_devices(self):
+        self.rpc.security_group_info_for_devices(None, ['fake_device'])
+        self.rpc.call.assert_has_calls(
+            [mock.call(None,
+             {'args':
+                 {'devices': ['fake_device']},
+              'method': 'security_group_info_for_devices',
+              'namespace': None},
+             version=sg_rpc.SG_INFO_RPC_VERSION,
+             topic='fake_topic')])
+
 
 class FakeSGNotifierAPI(n_rpc.RpcProxy,
                         sg_rpc.SecurityGroupAgentRpcApiMixin):
@@ -1224,6 +1438,18 @@ class SecurityGroupAgentRpcApiTestCase(base.BaseTestCase):
                        version=sg_rpc.SG_RPC_VERSION,
                        topic='fake-security_group-update')])
 
+    def test_security_groups_provider_updated(self):
+        self.notifier.security_groups_provider_updated(
+            None, network_ids=['fake_net'])
+        self.notifier.fanout_cast.assert_has_calls(
+            [mock.call(None,
+                       {'args':
+                           {'network_ids': ['fake_net']},
+                           'method': 'security_groups_provider_updated',
+                           'namespace': None},
+                       version=sg_rpc.SG_RPC_VERSION,
+                       topic='fake-security_group-update')])
+
     def test_security_groups_rule_not_updated(self):
         self.notifier.security_groups_rule_updated(
             None, security_groups=[])
@@ -1619,6 +1845,86 @@ COMMIT
 # Completed by iptables_manager
 """ % IPTABLES_ARG
 
+IPTABLES_FILTER_2_4 = """# Generated by iptables_manager
+*filter
+:neutron-filter-top - [0:0]
+:%(bn)s-(%(chains)s) - [0:0]
+:%(bn)s-(%(chains)s) - [0:0]
+:%(bn)s-(%(chains)s) - [0:0]
+:%(bn)s-(%(chains)s) - [0:0]
+:%(bn)s-(%(chains)s) - [0:0]
+:%(bn)s-(%(chains)s) - [0:0]
+:%(bn)s-(%(chains)s) - [0:0]
+:%(bn)s-(%(chains)s) - [0:0]
+:%(bn)s-(%(chains)s) - [0:0]
+:%(bn)s-(%(chains)s) - [0:0]
+:%(bn)s-(%(chains)s) - [0:0]
+:%(bn)s-(%(chains)s) - [0:0]
+[0:0] -A FORWARD -j neutron-filter-top
+[0:0] -A OUTPUT -j neutron-filter-top
+[0:0] -A neutron-filter-top -j %(bn)s-local
+[0:0] -A INPUT -j %(bn)s-INPUT
+[0:0] -A OUTPUT -j %(bn)s-OUTPUT
+[0:0] -A FORWARD -j %(bn)s-FORWARD
+[0:0] -A %(bn)s-sg-fallback -j DROP
+[0:0] -A %(bn)s-FORWARD %(physdev_mod)s --physdev-INGRESS tap_port2 \
+%(physdev_is_bridged)s -j %(bn)s-sg-chain
+[0:0] -A %(bn)s-sg-chain %(physdev_mod)s --physdev-INGRESS tap_port2 \
+%(physdev_is_bridged)s -j %(bn)s-i_port2
+[0:0] -A %(bn)s-i_port2 -m state --state INVALID -j DROP
+[0:0] -A %(bn)s-i_port2 -m state --state RELATED,ESTABLISHED -j RETURN
+[0:0] -A %(bn)s-i_port2 -s 10.0.0.2 -p udp -m udp --sport 67 --dport 68 -j \
+RETURN
+[0:0] -A %(bn)s-i_port2 -p tcp -m tcp --dport 22 -j RETURN
+[0:0] -A %(bn)s-i_port2 -s 10.0.0.3 -j RETURN
+[0:0] -A %(bn)s-i_port2 -j %(bn)s-sg-fallback
+[0:0] -A %(bn)s-FORWARD %(physdev_mod)s --physdev-EGRESS tap_port2 \
+%(physdev_is_bridged)s -j %(bn)s-sg-chain
+[0:0] -A %(bn)s-sg-chain %(physdev_mod)s --physdev-EGRESS tap_port2 \
+%(physdev_is_bridged)s -j %(bn)s-o_port2
+[0:0] -A %(bn)s-INPUT %(physdev_mod)s --physdev-EGRESS tap_port2 \
+%(physdev_is_bridged)s -j %(bn)s-o_port2
+[0:0] -A %(bn)s-s_port2 -m mac --mac-source 12:34:56:78:9a:bd -s 10.0.0.4 -j \
+RETURN
+[0:0] -A %(bn)s-s_port2 -j DROP
+[0:0] -A %(bn)s-o_port2 -p udp -m udp --sport 68 --dport 67 -j RETURN
+[0:0] -A %(bn)s-o_port2 -j %(bn)s-s_port2
+[0:0] -A %(bn)s-o_port2 -p udp -m udp --sport 67 --dport 68 -j DROP
+[0:0] -A %(bn)s-o_port2 -m state --state INVALID -j DROP
+[0:0] -A %(bn)s-o_port2 -m state --state RELATED,ESTABLISHED -j RETURN
+[0:0] -A %(bn)s-o_port2 -j RETURN
+[0:0] -A %(bn)s-o_port2 -j %(bn)s-sg-fallback
+[0:0] -A %(bn)s-FORWARD %(physdev_mod)s --physdev-INGRESS tap_port1 \
+%(physdev_is_bridged)s -j %(bn)s-sg-chain
+[0:0] -A %(bn)s-sg-chain %(physdev_mod)s --physdev-INGRESS tap_port1 \
+%(physdev_is_bridged)s -j %(bn)s-i_port1
+[0:0] -A %(bn)s-i_port1 -m state --state INVALID -j DROP
+[0:0] -A %(bn)s-i_port1 -m state --state RELATED,ESTABLISHED -j RETURN
+[0:0] -A %(bn)s-i_port1 -s 10.0.0.2 -p udp -m udp --sport 67 --dport 68 -j \
+RETURN
+[0:0] -A %(bn)s-i_port1 -p tcp -m tcp --dport 22 -j RETURN
+[0:0] -A %(bn)s-i_port1 -j %(bn)s-sg-fallback
+[0:0] -A %(bn)s-FORWARD %(physdev_mod)s --physdev-EGRESS tap_port1 \
+%(physdev_is_bridged)s -j %(bn)s-sg-chain
+[0:0] -A %(bn)s-sg-chain %(physdev_mod)s --physdev-EGRESS tap_port1 \
+%(physdev_is_bridged)s -j %(bn)s-o_port1
+[0:0] -A %(bn)s-INPUT %(physdev_mod)s --physdev-EGRESS tap_port1 \
+%(physdev_is_bridged)s -j %(bn)s-o_port1
+[0:0] -A %(bn)s-s_port1 -m mac --mac-source 12:34:56:78:9a:bc -s 10.0.0.3 -j \
+RETURN
+[0:0] -A %(bn)s-s_port1 -j DROP
+[0:0] -A %(bn)s-o_port1 -p udp -m udp --sport 68 --dport 67 -j RETURN
+[0:0] -A %(bn)s-o_port1 -j %(bn)s-s_port1
+[0:0] -A %(bn)s-o_port1 -p udp -m udp --sport 67 --dport 68 -j DROP
+[0:0] -A %(bn)s-o_port1 -m state --state INVALID -j DROP
+[0:0] -A %(bn)s-o_port1 -m state --state RELATED,ESTABLISHED -j RETURN
+[0:0] -A %(bn)s-o_port1 -j RETURN
+[0:0] -A %(bn)s-o_port1 -j %(bn)s-sg-fallback
+[0:0] -A %(bn)s-sg-chain -j ACCEPT
+COMMIT
+# Completed by iptables_manager
+""" % IPTABLES_ARG
+
 
 IPTABLES_ARG['chains'] = CHAINS_EMPTY
 IPTABLES_FILTER_EMPTY = """# Generated by iptables_manager
@@ -1765,6 +2071,79 @@ COMMIT
 # Completed by iptables_manager
 """ % IPTABLES_ARG
 
+IPTABLES_FILTER_V6_2_2 = """# Generated by iptables_manager
+*filter
+:neutron-filter-top - [0:0]
+:%(bn)s-(%(chains)s) - [0:0]
+:%(bn)s-(%(chains)s) - [0:0]
+:%(bn)s-(%(chains)s) - [0:0]
+:%(bn)s-(%(chains)s) - [0:0]
+:%(bn)s-(%(chains)s) - [0:0]
+:%(bn)s-(%(chains)s) - [0:0]
+:%(bn)s-(%(chains)s) - [0:0]
+:%(bn)s-(%(chains)s) - [0:0]
+:%(bn)s-(%(chains)s) - [0:0]
+:%(bn)s-(%(chains)s) - [0:0]
+[0:0] -A FORWARD -j neutron-filter-top
+[0:0] -A OUTPUT -j neutron-filter-top
+[0:0] -A neutron-filter-top -j %(bn)s-local
+[0:0] -A INPUT -j %(bn)s-INPUT
+[0:0] -A OUTPUT -j %(bn)s-OUTPUT
+[0:0] -A FORWARD -j %(bn)s-FORWARD
+[0:0] -A %(bn)s-sg-fallback -j DROP
+[0:0] -A %(bn)s-FORWARD %(physdev_mod)s --physdev-INGRESS tap_port2 \
+%(physdev_is_bridged)s -j %(bn)s-sg-chain
+[0:0] -A %(bn)s-sg-chain %(physdev_mod)s --physdev-INGRESS tap_port2 \
+%(physdev_is_bridged)s -j %(bn)s-i_port2
+[0:0] -A %(bn)s-i_port2 -p icmpv6 --icmpv6-type 130 -j RETURN
+[0:0] -A %(bn)s-i_port2 -p icmpv6 --icmpv6-type 131 -j RETURN
+[0:0] -A %(bn)s-i_port2 -p icmpv6 --icmpv6-type 132 -j RETURN
+[0:0] -A %(bn)s-i_port2 -p icmpv6 --icmpv6-type 135 -j RETURN
+[0:0] -A %(bn)s-i_port2 -p icmpv6 --icmpv6-type 136 -j RETURN
+[0:0] -A %(bn)s-i_port2 -m state --state INVALID -j DROP
+[0:0] -A %(bn)s-i_port2 -m state --state RELATED,ESTABLISHED -j RETURN
+[0:0] -A %(bn)s-i_port2 -j %(bn)s-sg-fallback
+[0:0] -A %(bn)s-FORWARD %(physdev_mod)s --physdev-EGRESS tap_port2 \
+%(physdev_is_bridged)s -j %(bn)s-sg-chain
+[0:0] -A %(bn)s-sg-chain %(physdev_mod)s --physdev-EGRESS tap_port2 \
+%(physdev_is_bridged)s -j %(bn)s-o_port2
+[0:0] -A %(bn)s-INPUT %(physdev_mod)s --physdev-EGRESS tap_port2 \
+%(physdev_is_bridged)s -j %(bn)s-o_port2
+[0:0] -A %(bn)s-o_port2 -p icmpv6 -j RETURN
+[0:0] -A %(bn)s-o_port2 -p udp -m udp --sport 546 --dport 547 -j RETURN
+[0:0] -A %(bn)s-o_port2 -p udp -m udp --sport 547 --dport 546 -j DROP
+[0:0] -A %(bn)s-o_port2 -m state --state INVALID -j DROP
+[0:0] -A %(bn)s-o_port2 -m state --state RELATED,ESTABLISHED -j RETURN
+[0:0] -A %(bn)s-o_port2 -j %(bn)s-sg-fallback
+[0:0] -A %(bn)s-FORWARD %(physdev_mod)s --physdev-INGRESS tap_port1 \
+%(physdev_is_bridged)s -j %(bn)s-sg-chain
+[0:0] -A %(bn)s-sg-chain %(physdev_mod)s --physdev-INGRESS tap_port1 \
+%(physdev_is_bridged)s -j %(bn)s-i_port1
+[0:0] -A %(bn)s-i_port1 -p icmpv6 --icmpv6-type 130 -j RETURN
+[0:0] -A %(bn)s-i_port1 -p icmpv6 --icmpv6-type 131 -j RETURN
+[0:0] -A %(bn)s-i_port1 -p icmpv6 --icmpv6-type 132 -j RETURN
+[0:0] -A %(bn)s-i_port1 -p icmpv6 --icmpv6-type 135 -j RETURN
+[0:0] -A %(bn)s-i_port1 -p icmpv6 --icmpv6-type 136 -j RETURN
+[0:0] -A %(bn)s-i_port1 -m state --state INVALID -j DROP
+[0:0] -A %(bn)s-i_port1 -m state --state RELATED,ESTABLISHED -j RETURN
+[0:0] -A %(bn)s-i_port1 -j %(bn)s-sg-fallback
+[0:0] -A %(bn)s-FORWARD %(physdev_mod)s --physdev-EGRESS tap_port1 \
+%(physdev_is_bridged)s -j %(bn)s-sg-chain
+[0:0] -A %(bn)s-sg-chain %(physdev_mod)s --physdev-EGRESS tap_port1 \
+%(physdev_is_bridged)s -j %(bn)s-o_port1
+[0:0] -A %(bn)s-INPUT %(physdev_mod)s --physdev-EGRESS tap_port1 \
+%(physdev_is_bridged)s -j %(bn)s-o_port1
+[0:0] -A %(bn)s-o_port1 -p icmpv6 -j RETURN
+[0:0] -A %(bn)s-o_port1 -p udp -m udp --sport 546 --dport 547 -j RETURN
+[0:0] -A %(bn)s-o_port1 -p udp -m udp --sport 547 --dport 546 -j DROP
+[0:0] -A %(bn)s-o_port1 -m state --state INVALID -j DROP
+[0:0] -A %(bn)s-o_port1 -m state --state RELATED,ESTABLISHED -j RETURN
+[0:0] -A %(bn)s-o_port1 -j %(bn)s-sg-fallback
+[0:0] -A %(bn)s-sg-chain -j ACCEPT
+COMMIT
+# Completed by iptables_manager
+""" % IPTABLES_ARG
+
 IPTABLES_ARG['chains'] = CHAINS_EMPTY
 IPTABLES_FILTER_V6_EMPTY = """# Generated by iptables_manager
 *filter
@@ -1832,6 +2211,7 @@ class TestSecurityGroupAgentWithIptables(base.BaseTestCase):
 
         self.rpc = mock.Mock()
         self.agent.plugin_rpc = self.rpc
+        self.agent.use_security_group_info = False
         rule1 = [{'direction': 'ingress',
                   'protocol': const.PROTO_NAME_UDP,
                   'ethertype': const.IPv4,
@@ -1965,7 +2345,7 @@ class TestSecurityGroupAgentWithIptables(base.BaseTestCase):
         self._replay_iptables(IPTABLES_FILTER_1, IPTABLES_FILTER_V6_1)
         self._replay_iptables(IPTABLES_FILTER_1_2, IPTABLES_FILTER_V6_1)
         self._replay_iptables(IPTABLES_FILTER_2, IPTABLES_FILTER_V6_2)
-        self._replay_iptables(IPTABLES_FILTER_2_2, IPTABLES_FILTER_V6_2)
+        self._replay_iptables(IPTABLES_FILTER_2_4, IPTABLES_FILTER_V6_2_2)
         self._replay_iptables(IPTABLES_FILTER_1, IPTABLES_FILTER_V6_1)
         self._replay_iptables(IPTABLES_FILTER_EMPTY, IPTABLES_FILTER_V6_EMPTY)
 
@@ -1992,6 +2372,98 @@ class TestSecurityGroupAgentWithIptables(base.BaseTestCase):
         self._verify_mock_calls()
 
 
+class TestSecurityGroupAgentWithIptablesSGInfo(
+        TestSecurityGroupAgentWithIptables):
+    """Same rules, received through security_group_info_for_devices.
+
+    The tests set the expected payload as the return value of
+    security_group_rules_for_devices, which is not called anymore.
+    """
+
+    def setUp(self, defer_refresh_firewall=False):
+        super(TestSecurityGroupAgentWithIptablesSGInfo, self).setUp(
+            defer_refresh_firewall)
+        self.agent.use_security_group_info = True
+        self.rpc.security_group_info_for_devices.side_effect = (
+            lambda context, devices: (
+                self.rpc.security_group_rules_for_devices.return_value))
+
+        provider_rules = [{'direction': 'ingress',
+                           'protocol': const.PROTO_NAME_UDP,
+                           'ethertype': const.IPv4,
+                           'source_ip_prefix': '10.0.0.2',
+                           'source_port_range_min': 67,
+                           'source_port_range_max': 67,
+                           'port_range_min': 68,
+                           'port_range_max': 68}]
+        sg_rules1 = [{'direction': 'ingress',
+                      'protocol': const.PROTO_NAME_TCP,
+                      'ethertype': const.IPv4,
+                      'port_range_min': 22,
+                      'port_range_max': 22},
+                     {'direction': 'egress',
+                      'ethertype': const.IPv4}]
+        sg_rules2 = sg_rules1 + [{'direction': 'ingress',
+                                  'remote_group_id': 'security_group1',
+                                  'ethertype': const.IPv4}]
+        sg_rules3 = sg_rules2 + [{'direction': 'ingress',
+                                  'protocol': const.PROTO_NAME_ICMP,
+                                  'ethertype': const.IPv4}]
+        member_ips = {'security_group1': {const.IPv4: ['10.0.0.3',
+                                                       '10.0.0.4'],
+                                          const.IPv6: []}}
+        port1 = self._device('tap_port1', '10.0.0.3', '12:34:56:78:9a:bc',
+                             provider_rules)
+        port2 = self._device('tap_port2', '10.0.0.4', '12:34:56:78:9a:bd',
+                             provider_rules)
+        self.devices1 = {'devices': {'tap_port1': port1},
+                         'security_groups': {'security_group1': sg_rules1},
+                         'sg_member_ips': {}}
+        self.devices2 = {'devices': {'tap_port1': port1,
+                                     'tap_port2': port2},
+                         'security_groups': {'security_group1': sg_rules2},
+                         'sg_member_ips': member_ips}
+        self.devices3 = {'devices': {'tap_port1': port1,
+                                     'tap_port2': port2},
+                         'security_groups': {'security_group1': sg_rules3},
+                         'sg_member_ips': member_ips}
+        self.devices4 = {'devices': {'tap_port1': port1,
+                                     'tap_port2': port2},
+                         'security_groups': {'security_group1': sg_rules2},
+                         'sg_member_ips': {'security_group1': {
+                             const.IPv4: ['10.0.0.3'], const.IPv6: []}}}
+
+    def test_security_group_member_updated(self):
+        # The rules of a group are shared by its ports, so the members
+        # leaving the group are removed from the rules of all the ports
+        self.rpc.security_group_rules_for_devices.return_value = self.devices1
+        self._replay_iptables(IPTABLES_FILTER_1, IPTABLES_FILTER_V6_1)
+        self._replay_iptables(IPTABLES_FILTER_1_2, IPTABLES_FILTER_V6_1)
+        self._replay_iptables(IPTABLES_FILTER_2, IPTABLES_FILTER_V6_2)
+        self._replay_iptables(IPTABLES_FILTER_2_4, IPTABLES_FILTER_V6_2_2)
+        self._replay_iptables(IPTABLES_FILTER_1, IPTABLES_FILTER_V6_1)
+        self._replay_iptables(IPTABLES_FILTER_EMPTY, IPTABLES_FILTER_V6_EMPTY)
+
+        self.agent.prepare_devices_filter(['tap_port1'])
+        self.rpc.security_group_rules_for_devices.return_value = self.devices2
+        self.agent.security_groups_member_updated(['security_group1'])
+        self.agent.prepare_devices_filter(['tap_port2'])
+        self.rpc.security_group_rules_for_devices.return_value = self.devices4
+        self.agent.security_groups_member_updated(['security_group1'])
+        self.agent.remove_devices_filter(['tap_port2'])
+        self.agent.remove_devices_filter(['tap_port1'])
+
+        self._verify_mock_calls()
+
+    def _regex(self, value):
+        # the agent expands the remote group members to prefixes
+        for chain, ip in (('i_port1', '10.0.0.4'), ('i_port2', '10.0.0.3')):
+            value = value.replace('%s -s %s ' % (chain, ip),
+                                  '%s -s %s/32 ' % (chain, ip))
+        return super(TestSecurityGroupAgentWithIptablesSGInfo,
+                     self)._regex(value)
+
+
 class SGNotificationTestMixin():
     def test_security_group_rule_updated(self):
         name = 'webservers'
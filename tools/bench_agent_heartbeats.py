@@ -0,0 +1,128 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Measure the database load of the agent state reports.
+
+Agents report their state to one server worker, which first registers
+them. Then each agent reports again for a number of rounds, some of them
+with changed configurations. This measures the time the worker spends
+handling the reports of a round, and the number of SQL statements issued,
+when every report is written at once and when the heartbeats are kept and
+flushed at the end of each round. The agents table is in a temporary SQLite
+database unless another connection URL is given.
+
+Usage: PYTHONPATH=. python tools/bench_agent_heartbeats.py
+           [--connection URL] [--agents N] [--rounds N] [--changed PCT]
+"""
+
+from __future__ import print_function
+
+import argparse
+import os
+import tempfile
+import time
+
+from oslo.config import cfg
+import sqlalchemy as sa
+
+from neutron.common import config  # noqa
+from neutron import context
+from neutron.db import agents_db
+from neutron.db import api as db_api
+from neutron.db import db_base_plugin_v2
+
+
+class AgentPlugin(db_base_plugin_v2.CommonDbMixin, agents_db.AgentDbMixin):
+    pass
+
+
+class StatementCounter(object):
+    def __init__(self, engine):
+        self.statements = 0
+        sa.event.listen(engine, 'before_cursor_execute', self.count)
+
+    def count(self, *args, **kwargs):
+        self.statements += 1
+
+
+def make_state(index, devices, start=False):
+    state = {'binary': 'neutron-openvswitch-agent',
+             'host': 'compute-%05d' % index,
+             'topic': 'N/A',
+             'agent_type': 'Open vSwitch agent',
+             'configurations': {'bridge_mappings': {'physnet1': 'br-eth1'},
+                                'tunnel_types': ['vxlan'],
+                                'tunneling_ip': '10.0.%d.%d' % (
+                                    index >> 8 & 255, index & 255),
+                                'l2_population': True,
+                                'devices': devices}}
+    if start:
+        state['start_flag'] = True
+    return state
+
+
+def run(plugin, ctx, counter, args, flush_interval):
+    cfg.CONF.set_override('agent_heartbeat_flush_interval', flush_interval)
+    agents_db.HEARTBEATS = heartbeats = agents_db.AgentHeartbeats()
+    # Flushed at the end of each round rather than by a looping call
+    heartbeats._flush_loop = True
+    ctx.session.query(agents_db.Agent).delete()
+    devices = [10] * args.agents
+    for i in range(args.agents):
+        plugin.create_or_update_agent(ctx, make_state(i, devices[i], True))
+
+    changed = args.agents * args.changed // 100
+    elapsed = 0
+    statements = 0
+    for r in range(args.rounds):
+        for i in range(r * changed, (r + 1) * changed):
+            devices[i % args.agents] += 1
+        start = time.time()
+        counter.statements = 0
+        for i in range(args.agents):
+            plugin.create_or_update_agent(ctx, make_state(i, devices[i]))
+        heartbeats.flush(ctx)
+        elapsed += time.time() - start
+        statements += counter.statements
+    return elapsed / args.rounds, statements / float(args.rounds)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--connection')
+    parser.add_argument('--agents', type=int, default=5000)
+    parser.add_argument('--rounds', type=int, default=1)
+    parser.add_argument('--changed', type=int, default=1,
+                        help='percentage of agents changing configurations '
+                             'in each round')
+    args = parser.parse_args()
+
+    connection = args.connection
+    if not connection:
+        fd, path = tempfile.mkstemp(suffix='.sqlite')
+        os.close(fd)
+        connection = 'sqlite:///%s' % path
+    cfg.CONF.set_override('connection', connection, group='database')
+    db_api.configure_db()
+    counter = StatementCounter(db_api.get_engine())
+    plugin = AgentPlugin()
+    ctx = context.get_admin_context()
+
+    print('%16s %16s %22s' % ('flush interval', 'round time (s)',
+                              'statements by round'))
+    for flush_interval in (0, 10):
+        elapsed, statements = run(plugin, ctx, counter, args, flush_interval)
+        print('%16d %16.2f %22d' % (flush_interval, elapsed, statements))
+
+
+if __name__ == '__main__':
+    main()
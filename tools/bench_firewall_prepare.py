@@ -0,0 +1,105 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Measure the latency of filtering one more port on a busy host.
+
+The firewall already filters a number of ports, each one with a few rules,
+when ports are plugged one by one. For each new port, this measures the
+time prepare_port_filter takes and the number of iptables rules that were
+added or removed to set it up. The iptables commands are replaced by an
+in-memory fake, so the numbers only cover the work done by the agent.
+
+Usage: PYTHONPATH=. python tools/bench_firewall_prepare.py
+           [--existing N[,N...]] [--new N]
+"""
+
+from __future__ import print_function
+
+import argparse
+import tempfile
+import time
+
+from oslo.config import cfg
+
+from neutron.agent.common import config
+from neutron.agent.linux import iptables_firewall
+from neutron.agent.linux import utils
+
+
+class FakeExecute(object):
+    def __call__(self, args, root_helper=None, process_input=None, **kwargs):
+        return ''
+
+
+class CountingTable(object):
+    """Counts the rules added to and removed from an iptables table."""
+
+    def __init__(self, table):
+        self.table = table
+        self.changes = 0
+
+    def __getattr__(self, name):
+        attr = getattr(self.table, name)
+        if name in ('add_rule', 'remove_rule'):
+            def count(*args, **kwargs):
+                self.changes += 1
+                return attr(*args, **kwargs)
+            return count
+        return attr
+
+
+def make_port(index):
+    rules = [{'ethertype': 'IPv4', 'direction': 'egress'},
+             {'ethertype': 'IPv4', 'direction': 'ingress',
+              'protocol': 'tcp', 'port_range_min': 22, 'port_range_max': 22},
+             {'ethertype': 'IPv4', 'direction': 'ingress',
+              'protocol': 'icmp'}]
+    return {'device': 'tap%08d' % index,
+            'mac_address': 'fa:16:3e:00:%02x:%02x' % (index >> 8 & 255,
+                                                     index & 255),
+            'fixed_ips': ['192.168.%d.%d' % (index >> 8 & 255, index & 255)],
+            'security_group_rules': rules}
+
+
+def run(existing, new):
+    firewall = iptables_firewall.IptablesFirewallDriver()
+    with firewall.defer_apply():
+        for i in range(existing):
+            firewall.prepare_port_filter(make_port(i))
+    table = CountingTable(firewall.iptables.ipv4['filter'])
+    firewall.iptables.ipv4['filter'] = table
+
+    start = time.time()
+    for i in range(existing, existing + new):
+        firewall.prepare_port_filter(make_port(i))
+    return (time.time() - start) / new, table.changes / float(new)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--existing', default='10,100,500',
+                        help='comma separated numbers of filtered ports')
+    parser.add_argument('--new', type=int, default=10,
+                        help='ports to filter after the existing ones')
+    args = parser.parse_args()
+
+    config.register_root_helper(cfg.CONF)
+    cfg.CONF.set_override('lock_path', tempfile.mkdtemp())
+    utils.execute = FakeExecute()
+    print('%10s %16s %16s' % ('existing', 'per port (ms)', 'IPv4 changes'))
+    for existing in args.existing.split(','):
+        latency, changes = run(int(existing), args.new)
+        print('%10s %16.2f %16.1f' % (existing, latency * 1000, changes))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,171 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Compare the time the L3 agent takes to wire routers with each backend.
+
+Each router has a gateway with floating IPs and internal interfaces, all
+plugged in OVS. The commands run by the agent are replaced by a fake which
+counts them and sleeps for the given time, about what spawning a command
+through rootwrap costs, so the numbers show how many commands each backend
+needs rather than the time the kernel spends applying them.
+
+Usage: PYTHONPATH=. python tools/bench_ip_lib_backend.py
+           [--routers N] [--interfaces N] [--floatingips N] [--spawn-ms MS]
+"""
+
+from __future__ import print_function
+
+import argparse
+import os
+import tempfile
+import time
+
+from oslo.config import cfg
+from oslo import messaging
+
+from neutron.agent.common import config
+from neutron.agent import l3_agent
+from neutron.agent.linux import interface
+from neutron.agent.linux import ip_lib
+from neutron.agent.linux import utils
+from neutron.common import config as common_config
+from neutron.common import constants as l3_constants
+from neutron.common import rpc as n_rpc
+from neutron.openstack.common import uuidutils
+
+BRIDGES = ('br-int', 'br-ex')
+LINK = ('%d: %s: <BROADCAST,MULTICAST,UP,LOWER_UP> mtu 1500 qdisc noqueue '
+        'state UNKNOWN \\    link/ether fa:16:3e:00:00:0%d brd '
+        'ff:ff:ff:ff:ff:ff')
+
+
+class FakeExecute(object):
+    """Counts the commands run, which only find bridges and namespaces."""
+
+    def __init__(self, spawn_delay):
+        self.spawn_delay = spawn_delay
+        self.commands = 0
+        self.namespaces = set()
+
+    def __call__(self, args, root_helper=None, process_input=None, **kwargs):
+        self.commands += 1
+        time.sleep(self.spawn_delay)
+        if args[1:3] == ['netns', 'add']:
+            self.namespaces.add(args[3])
+        elif args[-2:] == ['netns', 'list']:
+            return '\n'.join(self.namespaces)
+        elif args[-3:-1] == ['link', 'show'] and args[-1] in BRIDGES:
+            return LINK % (BRIDGES.index(args[-1]) + 1, args[-1],
+                           BRIDGES.index(args[-1]))
+        return ''
+
+
+def make_sysfs():
+    sysfs = tempfile.mkdtemp()
+    for bridge in BRIDGES:
+        os.mkdir(os.path.join(sysfs, bridge))
+        with open(os.path.join(sysfs, bridge, 'type'), 'w') as f:
+            f.write(ip_lib.ARPHRD_ETHER + '\n')
+    return sysfs
+
+
+def make_port(cidr, index):
+    prefix = cidr.rsplit('.', 1)[0]
+    return {'id': uuidutils.generate_uuid(),
+            'network_id': uuidutils.generate_uuid(),
+            'admin_state_up': True,
+            'fixed_ips': [{'ip_address': '%s.%d' % (prefix, index),
+                           'subnet_id': uuidutils.generate_uuid()}],
+            'mac_address': 'fa:16:3e:01:%02x:%02x' % (index >> 8 & 255,
+                                                     index & 255),
+            'subnet': {'cidr': cidr, 'gateway_ip': prefix + '.1'}}
+
+
+def make_router(index, args):
+    ex_cidr = '172.16.%d.0/24' % index
+    router = {'id': uuidutils.generate_uuid(),
+              'admin_state_up': True,
+              'routes': [],
+              'gw_port': make_port(ex_cidr, 2),
+              l3_constants.INTERFACE_KEY: [
+                  make_port('10.%d.%d.0/24' % (index, i), 1)
+                  for i in range(args.interfaces)],
+              l3_constants.FLOATINGIP_KEY: [
+                  {'id': uuidutils.generate_uuid(),
+                   'floating_ip_address': '172.16.%d.%d' % (index, j + 10),
+                   'fixed_ip_address': '10.%d.0.%d' % (index, j + 10),
+                   'port_id': uuidutils.generate_uuid()}
+                  for j in range(args.floatingips)]}
+    return router
+
+
+def make_agent():
+    conf = cfg.ConfigOpts()
+    conf.register_opts(common_config.core_opts)
+    conf.register_opts(l3_agent.L3NATAgent.OPTS)
+    config.register_interface_driver_opts_helper(conf)
+    config.register_use_namespaces_opts_helper(conf)
+    config.register_root_helper(conf)
+    conf.register_opts(interface.OPTS)
+    conf.set_override('interface_driver',
+                      'neutron.agent.linux.interface.OVSInterfaceDriver')
+    conf.set_override('root_helper', 'sudo', 'AGENT')
+    conf.set_override('enable_metadata_proxy', False)
+    conf.set_override('send_arp_for_ha', 0)
+    agent = l3_agent.L3NATAgent('bench', conf)
+    agent.plugin_rpc = FakePluginApi()
+    return agent
+
+
+class FakePluginApi(object):
+    def update_floatingip_statuses(self, context, router_id, fip_statuses):
+        pass
+
+
+def run(backend, args):
+    cfg.CONF.set_override('ip_lib_backend', backend)
+    utils.execute = fake = FakeExecute(args.spawn_ms / 1000.0)
+    agent = make_agent()
+    routers = [make_router(i, args) for i in range(args.routers)]
+    start = time.time()
+    for router in routers:
+        agent._router_added(router['id'], router)
+        agent.process_router(agent.router_info[router['id']])
+    return time.time() - start, fake.commands
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--routers', type=int, default=100)
+    parser.add_argument('--interfaces', type=int, default=2,
+                        help='internal interfaces of each router')
+    parser.add_argument('--floatingips', type=int, default=10,
+                        help='floating IPs of each router')
+    parser.add_argument('--spawn-ms', type=float, default=10,
+                        help='time to run each command')
+    args = parser.parse_args()
+
+    config.register_root_helper(cfg.CONF)
+    cfg.CONF.register_opts(ip_lib.OPTS)
+    cfg.CONF.set_override('lock_path', tempfile.mkdtemp())
+    n_rpc.TRANSPORT = messaging.get_transport(cfg.CONF, 'fake:/')
+    ip_lib.SYS_CLASS_NET = make_sysfs()
+    print('%8s %10s %10s %20s' % ('backend', 'time (s)', 'commands',
+                                  'commands by router'))
+    for backend in ('command', 'batch'):
+        elapsed, commands = run(backend, args)
+        print('%8s %10.2f %10d %20.1f' % (backend, elapsed, commands,
+                                          commands / float(args.routers)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,121 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Compare the sequential and random IP allocation strategies.
+
+Greenthreads concurrently create ports on a network with a single /16
+subnet, with each allocation strategy in turn. The database defaults to a
+temporary SQLite file, which serializes all the transactions; pass a MySQL
+connection URL (with a green driver such as PyMySQL) to measure lock
+contention.
+
+Usage: PYTHONPATH=. python tools/bench_ipam_allocate.py
+           [--connection URL] [--threads N] [--ports N]
+"""
+
+from __future__ import print_function
+
+import eventlet
+eventlet.monkey_patch()
+
+import argparse
+import os
+import tempfile
+import time
+
+from oslo.config import cfg
+
+from neutron.api.v2 import attributes
+from neutron.common import config  # noqa
+from neutron import context
+from neutron.db import api as db_api
+from neutron.db import db_base_plugin_v2
+from neutron.db import models_v2
+
+TENANT = 'bench'
+
+
+def create_network(plugin, ctx, name):
+    network = plugin.create_network(ctx, {'network': {
+        'name': name, 'admin_state_up': True, 'shared': False,
+        'tenant_id': TENANT}})
+    plugin.create_subnet(ctx, {'subnet': {
+        'name': name, 'network_id': network['id'], 'tenant_id': TENANT,
+        'ip_version': 4, 'cidr': '10.0.0.0/16', 'enable_dhcp': False,
+        'gateway_ip': attributes.ATTR_NOT_SPECIFIED,
+        'allocation_pools': attributes.ATTR_NOT_SPECIFIED,
+        'dns_nameservers': attributes.ATTR_NOT_SPECIFIED,
+        'host_routes': attributes.ATTR_NOT_SPECIFIED,
+        'ipv6_ra_mode': attributes.ATTR_NOT_SPECIFIED,
+        'ipv6_address_mode': attributes.ATTR_NOT_SPECIFIED}})
+    return network['id']
+
+
+def create_ports(plugin, network_id, count, errors):
+    ctx = context.get_admin_context()
+    for i in range(count):
+        try:
+            plugin.create_port(ctx, {'port': {
+                'name': '', 'network_id': network_id, 'tenant_id': TENANT,
+                'admin_state_up': True, 'device_id': '', 'device_owner': '',
+                'mac_address': attributes.ATTR_NOT_SPECIFIED,
+                'fixed_ips': attributes.ATTR_NOT_SPECIFIED}})
+        except Exception as e:
+            errors.append(e)
+
+
+def run(plugin, strategy, threads, ports):
+    cfg.CONF.set_override('ip_allocation_strategy', strategy)
+    ctx = context.get_admin_context()
+    network_id = create_network(plugin, ctx, strategy)
+    errors = []
+    pool = eventlet.GreenPool(threads)
+    start = time.time()
+    for i in range(threads):
+        pool.spawn_n(create_ports, plugin, network_id, ports, errors)
+    pool.waitall()
+    elapsed = time.time() - start
+    ranges = ctx.session.query(models_v2.IPAvailabilityRange).join(
+        models_v2.IPAllocationPool).join(models_v2.Subnet).filter(
+            models_v2.Subnet.network_id == network_id).count()
+    return elapsed, threads * ports - len(errors), len(errors), ranges
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--connection')
+    parser.add_argument('--threads', type=int, default=20)
+    parser.add_argument('--ports', type=int, default=25,
+                        help='ports created by each thread')
+    args = parser.parse_args()
+
+    connection = args.connection
+    if not connection:
+        fd, path = tempfile.mkstemp(suffix='.sqlite')
+        os.close(fd)
+        connection = 'sqlite:///%s' % path
+    cfg.CONF.set_override('connection', connection, group='database')
+    cfg.CONF.set_override('allow_overlapping_ips', True)
+    db_api.configure_db()
+    plugin = db_base_plugin_v2.NeutronDbPluginV2()
+
+    print('%10s %10s %10s %8s %8s' % ('strategy', 'time (s)', 'ports/s',
+                                     'errors', 'ranges'))
+    for strategy in ('sequential', 'random'):
+        elapsed, created, errors, ranges = run(plugin, strategy,
+                                               args.threads, args.ports)
+        print('%10s %10.2f %10.1f %8d %8d' % (
+            strategy, elapsed, created / elapsed, errors, ranges))
+
+
+if __name__ == '__main__':
+    main()
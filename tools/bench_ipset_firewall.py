@@ -0,0 +1,123 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Compare remote group rules expanded in iptables with ipset matches.
+
+Every port is in a security group allowing ssh from all the members of a
+remote group. The ports are filtered once, then a member joins the group
+and all the ports are refreshed. The iptables and ipset commands are
+replaced by an in-memory fake, so the numbers only cover the work done by
+the agent itself and the size of the ruleset it would have loaded.
+
+Usage: PYTHONPATH=. python tools/bench_ipset_firewall.py
+           [--ports N] [--members N]
+"""
+
+from __future__ import print_function
+
+import argparse
+import tempfile
+import time
+
+from oslo.config import cfg
+
+from neutron.agent.common import config
+from neutron.agent.linux import iptables_firewall
+from neutron.agent.linux import utils
+
+
+class FakeExecute(object):
+    """Remembers the last iptables ruleset restored."""
+
+    def __init__(self):
+        self.dump = ''
+
+    def __call__(self, args, root_helper=None, process_input=None, **kwargs):
+        if args[0].endswith('-save'):
+            return self.dump
+        if args[0] == 'iptables-restore' and '--noflush' not in args:
+            self.dump = process_input
+        return ''
+
+    def rule_count(self):
+        return sum(1 for line in self.dump.splitlines()
+                   if line.startswith('[0:0] -A'))
+
+
+def make_port(index, members):
+    rules = [{'ethertype': 'IPv4',
+              'direction': 'ingress',
+              'protocol': 'tcp',
+              'port_range_min': 22,
+              'port_range_max': 22,
+              'remote_group_id': 'remote-sg',
+              'source_ip_prefix': member} for member in members]
+    return {'device': 'tap%08d' % index,
+            'mac_address': 'fa:16:3e:00:%02x:%02x' % (index >> 8 & 255,
+                                                     index & 255),
+            'fixed_ips': ['192.168.%d.%d' % (index >> 8 & 255, index & 255)],
+            'security_group_rules': rules}
+
+
+def member(index):
+    return '10.%d.%d.%d/32' % (index >> 16 & 255, index >> 8 & 255,
+                               index & 255)
+
+
+def refresh(firewall, ports):
+    with firewall.defer_apply():
+        for port in ports:
+            if port['device'] in firewall.ports:
+                firewall.update_port_filter(port)
+            else:
+                firewall.prepare_port_filter(port)
+
+
+def run(enable_ipset, args):
+    cfg.CONF.set_override('enable_ipset', enable_ipset, 'SECURITYGROUP')
+    utils.execute = fake = FakeExecute()
+    firewall = iptables_firewall.IptablesFirewallDriver()
+
+    members = [member(i) for i in range(args.members)]
+    ports = [make_port(i, members) for i in range(args.ports)]
+    start = time.time()
+    refresh(firewall, ports)
+    setup_time = time.time() - start
+    rules = fake.rule_count()
+
+    members.append(member(args.members))
+    ports = [make_port(i, members) for i in range(args.ports)]
+    start = time.time()
+    refresh(firewall, ports)
+    update_time = time.time() - start
+    return setup_time, update_time, rules
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--ports', type=int, default=50)
+    parser.add_argument('--members', type=int, default=1000,
+                        help='members of the remote security group')
+    args = parser.parse_args()
+
+    config.register_root_helper(cfg.CONF)
+    cfg.CONF.set_override('lock_path', tempfile.mkdtemp())
+    print('%8s %12s %12s %10s' % ('ipset', 'setup (s)', 'update (s)',
+                                  'rules'))
+    for enable_ipset in (False, True):
+        setup_time, update_time, rules = run(enable_ipset, args)
+        print('%8s %12.3f %12.3f %10d' % (enable_ipset, setup_time,
+                                          update_time, rules))
+
+
+if __name__ == '__main__':
+    main()
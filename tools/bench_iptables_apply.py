@@ -0,0 +1,89 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Compare full and incremental IptablesManager applies.
+
+A ruleset of the given size is applied once, then a single chain is
+changed and applied again several times. The iptables commands are
+replaced by an in-memory fake, so the numbers only cover the work done
+by the agent itself plus the number of processes it would have spawned.
+
+Usage: PYTHONPATH=. python tools/bench_iptables_apply.py [rules ...]
+"""
+
+from __future__ import print_function
+
+import sys
+import tempfile
+import time
+
+from oslo.config import cfg
+
+from neutron.agent.linux import iptables_manager
+
+RULES_PER_CHAIN = 10
+ITERATIONS = 5
+
+
+class FakeIptables(object):
+    """Remembers the last full restore so that save can return it."""
+
+    def __init__(self):
+        self.dump = ''
+        self.calls = 0
+
+    def execute(self, args, process_input=None, root_helper=None):
+        self.calls += 1
+        if args[0].endswith('-save'):
+            return self.dump
+        if '--noflush' not in args:
+            self.dump = process_input
+        return ''
+
+
+def run(num_rules, incremental):
+    cfg.CONF.set_override('iptables_incremental_apply', incremental)
+    fake = FakeIptables()
+    manager = iptables_manager.IptablesManager(_execute=fake.execute)
+    table = manager.ipv4['filter']
+    for i in range(num_rules):
+        chain = 'c%d' % (i // RULES_PER_CHAIN)
+        if not i % RULES_PER_CHAIN:
+            table.add_chain(chain)
+            table.add_rule('FORWARD', '-j $%s' % chain)
+        table.add_rule(chain, '-s 10.%d.%d.%d/32 -j RETURN' %
+                       (i >> 16 & 255, i >> 8 & 255, i & 255))
+    manager.apply()
+
+    fake.calls = 0
+    start = time.time()
+    for i in range(ITERATIONS):
+        table.add_rule('c0', '-p tcp --dport %d -j RETURN' % i)
+        manager.apply()
+    elapsed = (time.time() - start) / ITERATIONS
+    return elapsed, float(fake.calls) / ITERATIONS
+
+
+def main(argv):
+    sizes = [int(arg) for arg in argv] or [1000, 5000, 20000]
+    cfg.CONF.set_override('lock_path', tempfile.mkdtemp())
+    print('%8s %12s %10s %12s %10s' % ('rules', 'full (s)', 'full procs',
+                                       'incr (s)', 'incr procs'))
+    for size in sizes:
+        full_time, full_calls = run(size, False)
+        incr_time, incr_calls = run(size, True)
+        print('%8d %12.4f %10.1f %12.4f %10.1f' % (
+            size, full_time, full_calls, incr_time, incr_calls))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,136 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Measure how long a router update waits during a full resync.
+
+The L3 agent starts with a number of routers to sync. Shortly after the
+resync started, a new router is notified by the server. This measures the
+time until the new router is set up, and until all the routers are. The
+server and the commands run by the agent are replaced by fakes, which
+sleep for the given time for each router fetched or processed.
+
+Usage: PYTHONPATH=. python tools/bench_l3_router_queue.py
+           [--routers N] [--workers N[,N...]] [--fetch-ms MS]
+           [--process-ms MS]
+"""
+
+from __future__ import print_function
+
+import argparse
+import tempfile
+import time
+
+import eventlet
+from oslo.config import cfg
+from oslo import messaging
+
+from neutron.agent.common import config
+from neutron.agent import l3_agent
+from neutron.agent.linux import interface
+from neutron.agent.linux import utils
+from neutron.common import config as common_config
+from neutron.common import rpc as n_rpc
+
+
+class FakeExecute(object):
+    def __call__(self, args, root_helper=None, process_input=None, **kwargs):
+        return ''
+
+
+def make_router(router_id):
+    return {'id': router_id, 'admin_state_up': True, 'routes': [],
+            'external_gateway_info': None}
+
+
+class FakePluginApi(object):
+    def __init__(self, router_ids, fetch_delay):
+        self.router_ids = router_ids
+        self.fetch_delay = fetch_delay
+
+    def get_router_ids(self, context):
+        return list(self.router_ids)
+
+    def get_routers(self, context, router_ids=None):
+        if router_ids is None:
+            router_ids = self.router_ids
+        eventlet.sleep(self.fetch_delay * len(router_ids))
+        return [make_router(router_id) for router_id in router_ids]
+
+    def get_external_network_id(self, context):
+        return None
+
+
+def make_agent(workers):
+    conf = cfg.ConfigOpts()
+    conf.register_opts(common_config.core_opts)
+    conf.register_opts(l3_agent.L3NATAgent.OPTS)
+    config.register_interface_driver_opts_helper(conf)
+    config.register_use_namespaces_opts_helper(conf)
+    config.register_root_helper(conf)
+    conf.register_opts(interface.OPTS)
+    conf.set_override('interface_driver',
+                      'neutron.agent.linux.interface.NullDriver')
+    conf.set_override('external_network_bridge', '')
+    conf.set_override('enable_metadata_proxy', False)
+    conf.set_override('router_processing_workers', workers)
+    return l3_agent.L3NATAgent('bench', conf)
+
+
+def run(args, workers):
+    agent = make_agent(workers)
+    router_ids = ['router-%d' % i for i in range(args.routers)]
+    agent.plugin_rpc = FakePluginApi(router_ids, args.fetch_ms / 1000.0)
+    process_router = agent.process_router
+
+    def slow_process_router(ri):
+        eventlet.sleep(args.process_ms / 1000.0)
+        process_router(ri)
+    agent.process_router = slow_process_router
+
+    start = time.time()
+    eventlet.spawn_n(agent._process_routers_loop)
+    eventlet.spawn_n(agent.periodic_sync_routers_task, agent.context)
+    eventlet.sleep(0.1)
+    router_ids.append('new-router')
+    agent.routers_updated(None, ['new-router'])
+    notified = time.time()
+    while 'new-router' not in agent.router_info:
+        eventlet.sleep(0.001)
+    update_latency = time.time() - notified
+    while len(agent.router_info) < len(router_ids):
+        eventlet.sleep(0.001)
+    return update_latency, time.time() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--routers', type=int, default=1000)
+    parser.add_argument('--workers', default='1,8,32',
+                        help='comma separated numbers of workers')
+    parser.add_argument('--fetch-ms', type=float, default=5,
+                        help='server time to fetch each router')
+    parser.add_argument('--process-ms', type=float, default=20,
+                        help='agent time to process each router')
+    args = parser.parse_args()
+
+    config.register_root_helper(cfg.CONF)
+    cfg.CONF.set_override('lock_path', tempfile.mkdtemp())
+    n_rpc.TRANSPORT = messaging.get_transport(cfg.CONF, 'fake:/')
+    utils.execute = FakeExecute()
+    print('%8s %18s %18s' % ('workers', 'new router (s)', 'full resync (s)'))
+    for workers in args.workers.split(','):
+        latency, total = run(args, int(workers))
+        print('%8s %18.3f %18.3f' % (workers, latency, total))
+
+
+if __name__ == '__main__':
+    main()
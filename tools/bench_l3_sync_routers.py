@@ -0,0 +1,230 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Compare the ways an L3 agent can sync all its routers.
+
+An agent hosts routers, each with a gateway, an interface on its own
+network and floating IPs. The rows are inserted directly in a temporary
+SQLite database. This measures the time the server spends replying and
+the size of the replies when the agent fetches all the routers at once,
+fetches them in chunks, and fetches only the routers which changed since
+its last sync, in which case the agent only has the routers which changed
+to process.
+
+Usage: PYTHONPATH=. python tools/bench_l3_sync_routers.py
+           [--connection URL] [--routers N] [--floatingips N]
+           [--chunk-size N] [--changed N]
+"""
+
+from __future__ import print_function
+
+import argparse
+import os
+import tempfile
+import time
+
+from oslo.config import cfg
+from oslo import messaging
+
+from neutron.common import config  # noqa
+from neutron.common import constants
+from neutron.common import rpc as n_rpc
+from neutron import context
+from neutron.db import agents_db
+from neutron.db import api as db_api
+from neutron.db import l3_agentschedulers_db
+from neutron.db import l3_db
+from neutron.db import models_v2
+from neutron import manager
+from neutron.openstack.common import jsonutils
+from neutron.openstack.common import timeutils
+from neutron.openstack.common import uuidutils
+from neutron.services.l3_router import l3_router_plugin
+
+HOST = 'bench-host'
+TENANT = 'bench'
+
+
+class Rows(object):
+    """Rows to insert, by table."""
+
+    def __init__(self):
+        self.tables = {}
+        self.macs = 0
+
+    def add(self, model, **row):
+        self.tables.setdefault(model, []).append(row)
+        return row.get('id')
+
+    def network(self, cidr):
+        network_id = self.add(models_v2.Network, id=uuidutils.generate_uuid(),
+                              tenant_id=TENANT, name='', status='ACTIVE',
+                              admin_state_up=True, shared=False)
+        subnet_id = self.add(models_v2.Subnet, id=uuidutils.generate_uuid(),
+                             tenant_id=TENANT, name='', network_id=network_id,
+                             ip_version=4, cidr=cidr,
+                             gateway_ip=cidr.split('/')[0][:-1] + '1',
+                             enable_dhcp=False, shared=False)
+        return network_id, subnet_id
+
+    def port(self, network, ip_address, device_owner='', device_id=''):
+        self.macs += 1
+        port_id = self.add(models_v2.Port, id=uuidutils.generate_uuid(),
+                           tenant_id=TENANT, name='', network_id=network[0],
+                           mac_address='fa:16:3e:%02x:%02x:%02x' % (
+                               self.macs >> 16 & 255, self.macs >> 8 & 255,
+                               self.macs & 255),
+                           admin_state_up=True, status='ACTIVE',
+                           device_id=device_id, device_owner=device_owner)
+        self.add(models_v2.IPAllocation, port_id=port_id,
+                 ip_address=ip_address, subnet_id=network[1],
+                 network_id=network[0])
+        return port_id
+
+    def insert(self, session):
+        with session.begin():
+            for model in (models_v2.Network, models_v2.Subnet,
+                          models_v2.Port, models_v2.IPAllocation,
+                          l3_db.Router, l3_db.FloatingIP,
+                          agents_db.Agent,
+                          l3_agentschedulers_db.RouterL3AgentBinding):
+                if model in self.tables:
+                    session.execute(model.__table__.insert(),
+                                    self.tables[model])
+
+
+def ip(prefix, index):
+    return '%s.%d.%d' % (prefix, index >> 8 & 255, index & 255)
+
+
+def populate(session, num_routers, num_floatingips):
+    rows = Rows()
+    now = timeutils.utcnow()
+    agent_id = rows.add(agents_db.Agent, id=uuidutils.generate_uuid(),
+                        agent_type=constants.AGENT_TYPE_L3,
+                        binary='neutron-l3-agent', topic='l3_agent',
+                        host=HOST, admin_state_up=True, created_at=now,
+                        started_at=now, heartbeat_timestamp=now,
+                        configurations='{}')
+    ext_net = rows.network('172.16.0.0/12')
+    fips_per_router = num_floatingips // num_routers
+    router_ids = []
+    for i in range(num_routers):
+        router_id = uuidutils.generate_uuid()
+        router_ids.append(router_id)
+        net = rows.network('10.%d.%d.0/24' % (i >> 8 & 255, i & 255))
+        gw_port_id = rows.port(ext_net, ip('172.16', i),
+                               l3_db.DEVICE_OWNER_ROUTER_GW, router_id)
+        rows.add(l3_db.Router, id=router_id, tenant_id=TENANT,
+                 name='router-%d' % i, status='ACTIVE', admin_state_up=True,
+                 gw_port_id=gw_port_id)
+        rows.add(l3_agentschedulers_db.RouterL3AgentBinding,
+                 id=uuidutils.generate_uuid(), router_id=router_id,
+                 l3_agent_id=agent_id)
+        rows.port(net, '10.%d.%d.1' % (i >> 8 & 255, i & 255),
+                  l3_db.DEVICE_OWNER_ROUTER_INTF, router_id)
+        for j in range(fips_per_router):
+            index = i * fips_per_router + j
+            fixed_ip = '10.%d.%d.%d' % (i >> 8 & 255, i & 255, j + 10)
+            floating_ip = ip('172.17', index)
+            fixed_port_id = rows.port(net, fixed_ip, 'compute:nova')
+            floating_port_id = rows.port(ext_net, floating_ip,
+                                         l3_db.DEVICE_OWNER_FLOATINGIP)
+            rows.add(l3_db.FloatingIP, id=uuidutils.generate_uuid(),
+                     tenant_id=TENANT, floating_ip_address=floating_ip,
+                     floating_network_id=ext_net[0],
+                     floating_port_id=floating_port_id,
+                     fixed_port_id=fixed_port_id, fixed_ip_address=fixed_ip,
+                     router_id=router_id, status='ACTIVE')
+    rows.insert(session)
+    return router_ids
+
+
+def sync_all(rpc, ctx, args, revisions):
+    routers = rpc.sync_routers(ctx, host=HOST)
+    return [routers], len(routers)
+
+
+def sync_chunks(rpc, ctx, args, revisions):
+    router_ids = rpc.get_router_ids(ctx, host=HOST)
+    replies = [rpc.sync_routers(ctx, host=HOST,
+                                router_ids=router_ids[i:i + args.chunk_size])
+               for i in range(0, len(router_ids), args.chunk_size)]
+    return replies, sum(len(routers) for routers in replies)
+
+
+def sync_changed(rpc, ctx, args, revisions):
+    router_ids = rpc.get_router_ids(ctx, host=HOST)
+    replies = []
+    for i in range(0, len(router_ids), args.chunk_size):
+        chunk = router_ids[i:i + args.chunk_size]
+        replies.append(rpc.get_changed_routers(
+            ctx, host=HOST,
+            router_revisions=dict((router_id, revisions.get(router_id))
+                                  for router_id in chunk)))
+    return replies, sum(len(reply['routers']) for reply in replies)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--connection')
+    parser.add_argument('--routers', type=int, default=2000)
+    parser.add_argument('--floatingips', type=int, default=10000)
+    parser.add_argument('--chunk-size', type=int, default=256)
+    parser.add_argument('--changed', type=int, default=20,
+                        help='routers renamed before the incremental sync')
+    args = parser.parse_args()
+
+    connection = args.connection
+    if not connection:
+        fd, path = tempfile.mkstemp(suffix='.sqlite')
+        os.close(fd)
+        connection = 'sqlite:///%s' % path
+    cfg.CONF.set_override('connection', connection, group='database')
+    cfg.CONF.set_override('core_plugin',
+                          'neutron.db.db_base_plugin_v2.NeutronDbPluginV2')
+    cfg.CONF.set_override('service_plugins',
+                          ['neutron.services.l3_router.l3_router_plugin.'
+                           'L3RouterPlugin'])
+    cfg.CONF.set_override('router_auto_schedule', False)
+    n_rpc.TRANSPORT = messaging.get_transport(cfg.CONF, 'fake:/')
+    db_api.configure_db()
+    manager.NeutronManager.get_instance()
+    ctx = context.get_admin_context()
+    router_ids = populate(ctx.session, args.routers, args.floatingips)
+    rpc = l3_router_plugin.L3RouterPluginRpcCallbacks()
+
+    routers = rpc.sync_routers(ctx, host=HOST)
+    revisions = dict((router['id'], router['revision'])
+                     for router in routers)
+    with ctx.session.begin():
+        ctx.session.query(l3_db.Router).filter(
+            l3_db.Router.id.in_(router_ids[:args.changed])).update(
+                {'name': 'renamed'}, synchronize_session=False)
+
+    print('%-14s %10s %8s %12s %14s %10s' % (
+        'sync', 'time (s)', 'calls', 'total (KiB)', 'largest (KiB)',
+        'routers'))
+    for name, sync in (('all at once', sync_all),
+                       ('chunks', sync_chunks),
+                       ('changed only', sync_changed)):
+        start = time.time()
+        replies, num_routers = sync(rpc, ctx, args, revisions)
+        elapsed = time.time() - start
+        sizes = [len(jsonutils.dumps(reply)) / 1024.0 for reply in replies]
+        print('%-14s %10.2f %8d %12.1f %14.1f %10d' % (
+            name, elapsed, len(replies), sum(sizes), max(sizes),
+            num_routers))
+
+
+if __name__ == '__main__':
+    main()
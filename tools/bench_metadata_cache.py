@@ -0,0 +1,112 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Measure the metadata agent port lookups during a mass VM boot.
+
+Greenthreads play the booting VMs, each one sending several metadata
+requests to the proxy handler, which looks their port up on a stub neutron
+API. Requests to nova are not sent, only the port lookups are measured,
+with and without the port lookup cache.
+
+Usage: PYTHONPATH=. python tools/bench_metadata_cache.py
+           [--vms N] [--requests N] [--concurrency N]
+"""
+
+from __future__ import print_function
+
+import eventlet
+eventlet.monkey_patch()
+
+import argparse
+import time
+
+from oslo.config import cfg
+import six.moves.urllib.parse as urlparse
+
+from neutron.agent.metadata import agent
+from neutron.openstack.common.cache import cache
+from neutron.openstack.common import jsonutils
+
+
+class StubNeutronAPI(object):
+    """Answers port listings filtered on a fixed IP with a single port."""
+
+    def __init__(self):
+        self.requests = 0
+
+    def __call__(self, environ, start_response):
+        self.requests += 1
+        query = urlparse.parse_qs(environ['QUERY_STRING'])
+        ports = []
+        for fixed_ip in query.get('fixed_ips', []):
+            address = fixed_ip.split('=', 1)[1]
+            ports.append({'device_id': 'vm-%s' % address,
+                          'tenant_id': 'tenant',
+                          'network_id': query['network_id'][0]})
+        start_response('200 OK', [('Content-Type', 'application/json')])
+        return [jsonutils.dumps({'ports': ports})]
+
+
+class FakeRequest(object):
+    def __init__(self, address):
+        self.headers = {'X-Forwarded-For': address,
+                        'X-Neutron-Network-ID': 'net'}
+
+
+def boot_vm(handler, address, requests):
+    for i in range(requests):
+        handler._get_instance_and_tenant_id(FakeRequest(address))
+
+
+def run(api, endpoint_url, cache_url, args):
+    cfg.CONF.set_override('cache_url', cache_url)
+    handler = agent.MetadataProxyHandler(cfg.CONF)
+    handler.auth_info = {'endpoint_url': endpoint_url}
+    api.requests = 0
+    pool = eventlet.GreenPool(args.concurrency)
+    start = time.time()
+    for vm in range(args.vms):
+        address = '10.%d.%d.%d' % (vm >> 16 & 255, vm >> 8 & 255, vm & 255)
+        pool.spawn_n(boot_vm, handler, address, args.requests)
+    pool.waitall()
+    return time.time() - start, api.requests
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--vms', type=int, default=200)
+    parser.add_argument('--requests', type=int, default=20,
+                        help='metadata requests sent by each VM')
+    parser.add_argument('--concurrency', type=int, default=50)
+    args = parser.parse_args()
+
+    cfg.CONF.register_opts(agent.MetadataProxyHandler.OPTS)
+    cache.register_oslo_configs(cfg.CONF)
+    cfg.CONF.set_override('auth_strategy', 'noauth')
+
+    api = StubNeutronAPI()
+    sock = eventlet.listen(('127.0.0.1', 0))
+    eventlet.spawn_n(eventlet.wsgi.server, sock, api,
+                     log=open('/dev/null', 'w'))
+    endpoint_url = 'http://127.0.0.1:%d' % sock.getsockname()[1]
+
+    total = args.vms * args.requests
+    print('%24s %10s %10s %14s' % ('cache_url', 'time (s)', 'lookups/s',
+                                   'API requests'))
+    for cache_url in ('', 'memory://?default_ttl=5'):
+        elapsed, requests = run(api, endpoint_url, cache_url, args)
+        print('%24s %10.2f %10.1f %14d' % (
+            cache_url or 'none', elapsed, total / elapsed, requests))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,150 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Measure the time ML2 takes to create ports with a slow controller.
+
+The OpenDaylight mechanism driver sends the ports to a stub of its REST
+interface, served in the same process, which waits the given latency
+before answering each request. Ports are created on a network of a
+temporary SQLite database, with the driver called in the postcommit
+methods, as ML2 did, and then with the driver using the journal. This
+measures the time taken to create a port, the time taken to process the
+journal afterwards, and the number of requests received by the stub.
+
+Usage: PYTHONPATH=. python tools/bench_ml2_journal.py
+           [--connection URL] [--ports N] [--latency MS]
+"""
+
+from __future__ import print_function
+
+import eventlet
+eventlet.monkey_patch()
+
+import argparse
+import os
+import tempfile
+import time
+
+from oslo.config import cfg
+from oslo import messaging
+import webob.dec
+
+from neutron.api.v2 import attributes
+from neutron.common import config  # noqa
+from neutron.common import rpc as n_rpc
+from neutron import context
+from neutron.db import api as db_api
+from neutron import manager
+from neutron.plugins.ml2 import config as ml2_config  # noqa
+from neutron.plugins.ml2.drivers import mechanism_odl  # noqa
+from neutron.plugins.ml2 import journal as ml2_journal
+from neutron import wsgi
+
+TENANT = 'bench'
+
+
+class StubController(object):
+    """Counts the requests, answering each of them after a latency."""
+
+    def __init__(self, latency):
+        self.latency = latency
+        self.requests = 0
+
+    @webob.dec.wsgify
+    def __call__(self, request):
+        self.requests += 1
+        eventlet.sleep(self.latency)
+        return webob.Response()
+
+
+def create_network(plugin, ctx, index):
+    network = plugin.create_network(ctx, {'network': {
+        'name': 'bench', 'admin_state_up': True, 'shared': False,
+        'tenant_id': TENANT}})
+    plugin.create_subnet(ctx, {'subnet': {
+        'name': 'bench', 'network_id': network['id'], 'tenant_id': TENANT,
+        'ip_version': 4, 'cidr': '10.%d.0.0/16' % index, 'enable_dhcp': False,
+        'gateway_ip': attributes.ATTR_NOT_SPECIFIED,
+        'allocation_pools': attributes.ATTR_NOT_SPECIFIED,
+        'dns_nameservers': attributes.ATTR_NOT_SPECIFIED,
+        'host_routes': attributes.ATTR_NOT_SPECIFIED}})
+    return network['id']
+
+
+def create_ports(plugin, ctx, network_id, num_ports):
+    start = time.time()
+    for i in range(num_ports):
+        plugin.create_port(ctx, {'port': {
+            'name': '', 'network_id': network_id, 'tenant_id': TENANT,
+            'admin_state_up': True, 'device_id': 'vm-%d' % i,
+            'device_owner': 'compute:nova',
+            'mac_address': attributes.ATTR_NOT_SPECIFIED,
+            'fixed_ips': attributes.ATTR_NOT_SPECIFIED}})
+    return (time.time() - start) / num_ports
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--connection')
+    parser.add_argument('--ports', type=int, default=200)
+    parser.add_argument('--latency', type=int, default=20,
+                        help='milliseconds taken by the controller to '
+                             'answer a request')
+    args = parser.parse_args()
+
+    connection = args.connection
+    if not connection:
+        fd, path = tempfile.mkstemp(suffix='.sqlite')
+        os.close(fd)
+        connection = 'sqlite:///%s' % path
+    controller = StubController(args.latency / 1000.0)
+    server = wsgi.Server('odl-stub')
+    server.start(controller, 0, host='127.0.0.1')
+
+    cfg.CONF.set_override('connection', connection, group='database')
+    cfg.CONF.set_override('core_plugin',
+                          'neutron.plugins.ml2.plugin.Ml2Plugin')
+    cfg.CONF.set_override('mechanism_drivers', ['opendaylight'],
+                          group='ml2')
+    cfg.CONF.set_override('journal_mechanism_drivers', ['opendaylight'],
+                          group='ml2')
+    cfg.CONF.set_override('url', 'http://127.0.0.1:%d/neutron' % server.port,
+                          group='ml2_odl')
+    cfg.CONF.set_override('username', 'bench', group='ml2_odl')
+    cfg.CONF.set_override('password', 'bench', group='ml2_odl')
+    n_rpc.TRANSPORT = messaging.get_transport(cfg.CONF, 'fake:/')
+    n_rpc.NOTIFIER = messaging.Notifier(n_rpc.TRANSPORT)
+    db_api.configure_db()
+    # The journal is processed once the ports are created, not by a worker
+    ml2_journal.Journal.start = lambda self: None
+    plugin = manager.NeutronManager.get_plugin()
+    mechanism_manager = plugin.mechanism_manager
+    journal = mechanism_manager.journal
+    ctx = context.get_admin_context()
+
+    print('%12s %18s %18s %10s' % ('driver', 'port create (ms)',
+                                   'journal (s)', 'requests'))
+    for index, name in enumerate(('postcommit', 'journal')):
+        mechanism_manager.journal = journal if name == 'journal' else None
+        network_id = create_network(plugin, ctx, index)
+        journal.process(ctx)
+        controller.requests = 0
+        create = create_ports(plugin, ctx, network_id, args.ports)
+        start = time.time()
+        journal.process(ctx)
+        print('%12s %18.1f %18.3f %10d' % (name, create * 1000,
+                                           time.time() - start,
+                                           controller.requests))
+
+
+if __name__ == '__main__':
+    main()
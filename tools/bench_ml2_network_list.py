@@ -0,0 +1,132 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Count the queries made by ML2 to list networks.
+
+VLAN networks are inserted directly in a temporary SQLite database. This
+measures the time taken and the number of SQL statements issued to list
+all of them as an admin, when the segments are fetched for each network,
+as ML2 used to do, and when they are fetched for all the networks at
+once. The last column is for a list filtered on a segmentation ID, which
+is now done by the database.
+
+Usage: PYTHONPATH=. python tools/bench_ml2_network_list.py
+           [--connection URL] [--networks N[,N...]]
+"""
+
+from __future__ import print_function
+
+import argparse
+import os
+import tempfile
+import time
+
+from oslo.config import cfg
+from oslo import messaging
+import sqlalchemy as sa
+
+from neutron.common import config  # noqa
+from neutron.common import rpc as n_rpc
+from neutron import context
+from neutron.db import api as db_api
+from neutron.db import models_v2
+from neutron.extensions import providernet as provider
+from neutron import manager
+from neutron.openstack.common import uuidutils
+from neutron.plugins.ml2 import config as ml2_config  # noqa
+from neutron.plugins.ml2 import db as ml2_db
+from neutron.plugins.ml2 import models
+
+TENANT = 'bench'
+
+
+class StatementCounter(object):
+    def __init__(self, engine):
+        self.statements = 0
+        sa.event.listen(engine, 'before_cursor_execute', self.count)
+
+    def count(self, *args, **kwargs):
+        self.statements += 1
+
+
+def populate(session, first, last):
+    networks = []
+    segments = []
+    for i in range(first, last):
+        network_id = uuidutils.generate_uuid()
+        networks.append({'id': network_id, 'tenant_id': TENANT,
+                         'name': 'net-%d' % i, 'status': 'ACTIVE',
+                         'admin_state_up': True, 'shared': False})
+        segments.append({'id': uuidutils.generate_uuid(),
+                         'network_id': network_id, 'network_type': 'vlan',
+                         'physical_network': 'physnet1',
+                         'segmentation_id': i % 4094 + 1})
+    with session.begin():
+        session.execute(models_v2.Network.__table__.insert(), networks)
+        session.execute(models.NetworkSegment.__table__.insert(), segments)
+
+
+def get_networks_segments(session, network_ids):
+    return dict((network_id, ml2_db.get_network_segments(session, network_id))
+                for network_id in network_ids)
+
+
+def list_networks(plugin, ctx, counter, filters=None):
+    counter.statements = 0
+    start = time.time()
+    plugin.get_networks(ctx, filters=filters)
+    return time.time() - start, counter.statements
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--connection')
+    parser.add_argument('--networks', default='100,1000,5000',
+                        help='comma separated numbers of networks')
+    args = parser.parse_args()
+
+    connection = args.connection
+    if not connection:
+        fd, path = tempfile.mkstemp(suffix='.sqlite')
+        os.close(fd)
+        connection = 'sqlite:///%s' % path
+    cfg.CONF.set_override('connection', connection, group='database')
+    cfg.CONF.set_override('core_plugin',
+                          'neutron.plugins.ml2.plugin.Ml2Plugin')
+    cfg.CONF.set_override('mechanism_drivers', [], group='ml2')
+    n_rpc.TRANSPORT = messaging.get_transport(cfg.CONF, 'fake:/')
+    n_rpc.NOTIFIER = messaging.Notifier(n_rpc.TRANSPORT)
+    db_api.configure_db()
+    plugin = manager.NeutronManager.get_plugin()
+    counter = StatementCounter(db_api.get_engine())
+    ctx = context.get_admin_context()
+    batched = ml2_db.get_networks_segments
+
+    print('%9s %22s %22s %22s' % ('networks', 'each network (s/sql)',
+                                  'batched (s/sql)', 'filtered (s/sql)'))
+    populated = 0
+    for num_networks in args.networks.split(','):
+        populate(ctx.session, populated, int(num_networks))
+        populated = int(num_networks)
+        ml2_db.get_networks_segments = get_networks_segments
+        each = list_networks(plugin, ctx, counter)
+        ml2_db.get_networks_segments = batched
+        many = list_networks(plugin, ctx, counter)
+        filtered = list_networks(plugin, ctx, counter,
+                                 {provider.SEGMENTATION_ID: [1, 2]})
+        print('%9s %16.3f %5d %16.3f %5d %16.3f %5d' % (
+            num_networks, each[0], each[1], many[0], many[1],
+            filtered[0], filtered[1]))
+
+
+if __name__ == '__main__':
+    main()
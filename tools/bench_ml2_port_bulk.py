@@ -0,0 +1,156 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Measure the time ML2 takes to create the ports of bulk requests.
+
+The ports of each request are created on a new network of a temporary
+SQLite database, with a mechanism driver counting the calls it gets,
+first by the create_port_bulk method of the base plugin, calling the
+create_port method of ML2 for each port as ML2 did, and then by the
+create_port_bulk method of ML2. This measures the time taken, the number
+of SQL statements, the number of calls to the driver and the number of
+security group notifications.
+
+Usage: PYTHONPATH=. python tools/bench_ml2_port_bulk.py
+           [--connection URL] [--ports N [N ...]]
+"""
+
+from __future__ import print_function
+
+import argparse
+import os
+import tempfile
+import time
+
+from oslo.config import cfg
+from oslo import messaging
+import sqlalchemy as sa
+
+from neutron.api.v2 import attributes
+from neutron.common import config  # noqa
+from neutron.common import rpc as n_rpc
+from neutron import context
+from neutron.db import api as db_api
+from neutron.db import db_base_plugin_v2
+from neutron import manager
+from neutron.plugins.ml2 import config as ml2_config  # noqa
+from neutron.plugins.ml2 import driver_api as api
+
+TENANT = 'bench'
+
+
+class CountingMechanismDriver(api.MechanismDriver):
+    """Counts the calls to its create_port methods."""
+
+    name = 'counting'
+
+    def __init__(self):
+        self.obj = self
+        self.calls = 0
+
+    def initialize(self):
+        pass
+
+    def create_port_precommit(self, context):
+        self.calls += 1
+
+    def create_port_postcommit(self, context):
+        self.calls += 1
+
+    def create_port_bulk_precommit(self, contexts):
+        self.calls += 1
+
+    def create_port_bulk_postcommit(self, contexts):
+        self.calls += 1
+
+
+def create_network(plugin, ctx, index):
+    network = plugin.create_network(ctx, {'network': {
+        'name': 'bench', 'admin_state_up': True, 'shared': False,
+        'tenant_id': TENANT}})
+    plugin.create_subnet(ctx, {'subnet': {
+        'name': 'bench', 'network_id': network['id'], 'tenant_id': TENANT,
+        'ip_version': 4, 'cidr': '10.%d.0.0/16' % index, 'enable_dhcp': False,
+        'gateway_ip': attributes.ATTR_NOT_SPECIFIED,
+        'allocation_pools': attributes.ATTR_NOT_SPECIFIED,
+        'dns_nameservers': attributes.ATTR_NOT_SPECIFIED,
+        'host_routes': attributes.ATTR_NOT_SPECIFIED}})
+    return network['id']
+
+
+def create_ports(plugin, ctx, network_id, num_ports, bulk):
+    ports = {'ports': [{'port': {
+        'name': '', 'network_id': network_id, 'tenant_id': TENANT,
+        'admin_state_up': True, 'device_id': 'vm-%d' % i,
+        'device_owner': 'compute:nova',
+        'mac_address': attributes.ATTR_NOT_SPECIFIED,
+        'fixed_ips': attributes.ATTR_NOT_SPECIFIED}}
+        for i in range(num_ports)]}
+    if bulk:
+        return plugin.create_port_bulk(ctx, ports)
+    return db_base_plugin_v2.NeutronDbPluginV2.create_port_bulk(plugin, ctx,
+                                                                ports)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--connection')
+    parser.add_argument('--ports', type=int, nargs='+',
+                        default=[100, 500, 1000],
+                        help='ports of each request')
+    args = parser.parse_args()
+
+    connection = args.connection
+    if not connection:
+        fd, path = tempfile.mkstemp(suffix='.sqlite')
+        os.close(fd)
+        connection = 'sqlite:///%s' % path
+    cfg.CONF.set_override('connection', connection, group='database')
+    cfg.CONF.set_override('core_plugin',
+                          'neutron.plugins.ml2.plugin.Ml2Plugin')
+    cfg.CONF.set_override('mechanism_drivers', [], group='ml2')
+    n_rpc.TRANSPORT = messaging.get_transport(cfg.CONF, 'fake:/')
+    n_rpc.NOTIFIER = messaging.Notifier(n_rpc.TRANSPORT)
+    db_api.configure_db()
+    plugin = manager.NeutronManager.get_plugin()
+    # The driver stands for its own extension
+    driver = CountingMechanismDriver()
+    plugin.mechanism_manager.ordered_mech_drivers.append(driver)
+    sg_notifications = []
+    plugin.notifier.security_groups_member_updated = (
+        lambda *args: sg_notifications.append(args))
+    statements = []
+    sa.event.listen(db_api.get_engine(), 'before_cursor_execute',
+                    lambda *args: statements.append(args[2]))
+    ctx = context.get_admin_context()
+
+    print('%8s %10s %10s %12s %14s %14s' % (
+        'ports', 'create', 'time (s)', 'statements', 'driver calls',
+        'sg notifies'))
+    index = 0
+    for num_ports in args.ports:
+        for name, bulk in (('per-port', False), ('bulk', True)):
+            network_id = create_network(plugin, ctx, index)
+            index += 1
+            driver.calls = 0
+            del statements[:]
+            del sg_notifications[:]
+            start = time.time()
+            create_ports(plugin, ctx, network_id, num_ports, bulk)
+            elapsed = time.time() - start
+            print('%8d %10s %10.3f %12d %14d %14d' % (
+                num_ports, name, elapsed, len(statements), driver.calls,
+                len(sg_notifications)))
+
+
+if __name__ == '__main__':
+    main()
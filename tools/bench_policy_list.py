@@ -0,0 +1,123 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Measure the time the API spends listing ports.
+
+The plugin is replaced by a fake which returns the given number of ports,
+all owned by the tenant of the request, so the numbers only cover the work
+done by the API controller, most of which is checking the policies. Ports
+are listed by an admin and by their owner, when the policies are checked
+one port at a time with match rules built for each of them, as the API
+used to do, and when they are checked with check_many. The policies are
+read from etc/policy.json.
+
+Usage: PYTHONPATH=. python tools/bench_policy_list.py
+           [--ports N[,N...]]
+"""
+
+from __future__ import print_function
+
+import argparse
+import time
+
+from oslo.config import cfg
+from oslo import messaging
+
+from neutron.api.v2 import attributes
+from neutron.api.v2 import base
+from neutron.common import config  # noqa
+from neutron.common import rpc as n_rpc
+from neutron import context
+from neutron.openstack.common import uuidutils
+from neutron import policy
+from neutron import wsgi
+
+TENANT = 'bench'
+
+
+class FakePlugin(object):
+    def __init__(self, ports):
+        self.ports = ports
+
+    def get_ports(self, context, filters=None, fields=None):
+        # Like the plugins, return new dicts which the API may change
+        return [dict(port) for port in self.ports]
+
+
+def make_port(index):
+    return {'id': uuidutils.generate_uuid(),
+            'name': '',
+            'network_id': uuidutils.generate_uuid(),
+            'tenant_id': TENANT,
+            'admin_state_up': True,
+            'status': 'ACTIVE',
+            'mac_address': 'fa:16:3e:%02x:%02x:%02x' % (
+                index >> 16 & 255, index >> 8 & 255, index & 255),
+            'fixed_ips': [{'subnet_id': uuidutils.generate_uuid(),
+                           'ip_address': '10.%d.%d.%d' % (
+                               index >> 16 & 255, index >> 8 & 255,
+                               index & 255)}],
+            'device_id': uuidutils.generate_uuid(),
+            'device_owner': 'compute:nova'}
+
+
+def check_each(context, action, targets, plugin=None, might_not_exist=False):
+    return [policy.check(context, action, target, plugin=plugin,
+                         might_not_exist=might_not_exist)
+            for target in targets]
+
+
+def build_match_rule(action, target):
+    return policy._compile_match_rule(
+        action, policy._get_enforced_attributes(action, target), target)
+
+
+def list_ports(controller, ctx):
+    request = wsgi.Request.blank('/ports')
+    request.environ['neutron.context'] = ctx
+    start = time.time()
+    controller._items(request, do_authz=True)
+    return time.time() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--ports', default='1000,10000,50000',
+                        help='comma separated numbers of ports')
+    args = parser.parse_args()
+
+    n_rpc.TRANSPORT = messaging.get_transport(cfg.CONF, 'fake:/')
+    n_rpc.NOTIFIER = messaging.Notifier(n_rpc.TRANSPORT)
+    policy.init()
+    contexts = (('admin', context.get_admin_context()),
+                ('owner', context.Context('user', TENANT, roles=['member'])))
+    check_many = policy.check_many
+    match_rule = policy._build_match_rule
+    attr_info = attributes.RESOURCE_ATTRIBUTE_MAP['ports']
+
+    print('%8s %8s %18s %18s' % ('ports', 'context', 'each port (s)',
+                                 'check_many (s)'))
+    for num_ports in args.ports.split(','):
+        plugin = FakePlugin([make_port(i) for i in range(int(num_ports))])
+        controller = base.Controller(plugin, 'ports', 'port', attr_info)
+        for name, ctx in contexts:
+            policy.check_many = check_each
+            policy._build_match_rule = build_match_rule
+            each = list_ports(controller, ctx)
+            policy.check_many = check_many
+            policy._build_match_rule = match_rule
+            many = list_ports(controller, ctx)
+            print('%8s %8s %18.3f %18.3f' % (num_ports, name, each, many))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,144 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Measure the time to list ports asking for a few fields.
+
+Ports, each with a fixed IP, are inserted directly in a temporary SQLite
+database and listed as an admin through the API controller of ML2, as for
+GET /v2.0/ports?fields=id&fields=device_id. This compares loading the port
+objects, with all the relationships they eagerly load, to reading only the
+columns of the requested fields. The time to list the ports with all their
+fields is given for reference.
+
+Usage: PYTHONPATH=. python tools/bench_port_list_fields.py
+           [--connection URL] [--ports N[,N...]]
+"""
+
+from __future__ import print_function
+
+import argparse
+import os
+import tempfile
+import time
+
+from oslo.config import cfg
+from oslo import messaging
+
+from neutron.api.v2 import attributes
+from neutron.api.v2 import base
+from neutron.common import config  # noqa
+from neutron.common import rpc as n_rpc
+from neutron import context
+from neutron.db import api as db_api
+from neutron.db import db_base_plugin_v2
+from neutron.db import models_v2
+from neutron import manager
+from neutron.openstack.common import uuidutils
+from neutron.plugins.ml2 import config as ml2_config  # noqa
+from neutron import policy
+from neutron import wsgi
+
+TENANT = 'bench'
+
+
+def populate(session, first, last, network_id, subnet_id):
+    ports = []
+    allocations = []
+    for i in range(first, last):
+        port_id = uuidutils.generate_uuid()
+        ports.append({'id': port_id, 'tenant_id': TENANT, 'name': '',
+                      'network_id': network_id,
+                      'mac_address': 'fa:16:3e:%02x:%02x:%02x' % (
+                          i >> 16 & 255, i >> 8 & 255, i & 255),
+                      'admin_state_up': True, 'status': 'ACTIVE',
+                      'device_id': uuidutils.generate_uuid(),
+                      'device_owner': 'compute:nova'})
+        allocations.append({'port_id': port_id, 'subnet_id': subnet_id,
+                            'network_id': network_id,
+                            'ip_address': '10.%d.%d.%d' % (
+                                i >> 16 & 255, i >> 8 & 255, i & 255)})
+    with session.begin():
+        session.execute(models_v2.Port.__table__.insert(), ports)
+        session.execute(models_v2.IPAllocation.__table__.insert(),
+                        allocations)
+
+
+def populate_network(session):
+    network_id = uuidutils.generate_uuid()
+    subnet_id = uuidutils.generate_uuid()
+    with session.begin():
+        session.execute(models_v2.Network.__table__.insert(),
+                        {'id': network_id, 'tenant_id': TENANT, 'name': '',
+                         'status': 'ACTIVE', 'admin_state_up': True,
+                         'shared': False})
+        session.execute(models_v2.Subnet.__table__.insert(),
+                        {'id': subnet_id, 'tenant_id': TENANT, 'name': '',
+                         'network_id': network_id, 'ip_version': 4,
+                         'cidr': '10.0.0.0/8', 'gateway_ip': '10.0.0.1',
+                         'enable_dhcp': False, 'shared': False})
+    return network_id, subnet_id
+
+
+def list_ports(controller, ctx, query_string):
+    request = wsgi.Request.blank('/ports?' + query_string)
+    request.environ['neutron.context'] = ctx
+    start = time.time()
+    controller._items(request, do_authz=True)
+    return time.time() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--connection')
+    parser.add_argument('--ports', default='10000,100000',
+                        help='comma separated numbers of ports')
+    args = parser.parse_args()
+
+    connection = args.connection
+    if not connection:
+        fd, path = tempfile.mkstemp(suffix='.sqlite')
+        os.close(fd)
+        connection = 'sqlite:///%s' % path
+    cfg.CONF.set_override('connection', connection, group='database')
+    cfg.CONF.set_override('core_plugin',
+                          'neutron.plugins.ml2.plugin.Ml2Plugin')
+    cfg.CONF.set_override('mechanism_drivers', [], group='ml2')
+    n_rpc.TRANSPORT = messaging.get_transport(cfg.CONF, 'fake:/')
+    n_rpc.NOTIFIER = messaging.Notifier(n_rpc.TRANSPORT)
+    db_api.configure_db()
+    policy.init()
+    plugin = manager.NeutronManager.get_plugin()
+    controller = base.Controller(plugin, 'ports', 'port',
+                                 attributes.RESOURCE_ATTRIBUTE_MAP['ports'])
+    ctx = context.get_admin_context()
+    network_id, subnet_id = populate_network(ctx.session)
+    plain_fields = db_base_plugin_v2.PLAIN_COLUMN_FIELDS
+    fields = 'fields=id&fields=device_id'
+
+    print('%8s %18s %18s %18s' % ('ports', 'all fields (s)',
+                                  'objects (s)', 'columns (s)'))
+    populated = 0
+    for num_ports in args.ports.split(','):
+        populate(ctx.session, populated, int(num_ports), network_id,
+                 subnet_id)
+        populated = int(num_ports)
+        full = list_ports(controller, ctx, '')
+        db_base_plugin_v2.PLAIN_COLUMN_FIELDS = {}
+        objects = list_ports(controller, ctx, fields)
+        db_base_plugin_v2.PLAIN_COLUMN_FIELDS = plain_fields
+        columns = list_ports(controller, ctx, fields)
+        print('%8s %18.3f %18.3f %18.3f' % (num_ports, full, objects,
+                                            columns))
+
+
+if __name__ == '__main__':
+    main()
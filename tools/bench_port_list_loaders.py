@@ -0,0 +1,174 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Measure the rows fetched by ML2 to list the ports of a tenant.
+
+The ports of a tenant, each with fixed IPs on several subnets and several
+security groups, are inserted directly in a temporary SQLite database and
+listed by the tenant. This measures the time taken, the number of SQL
+statements and the number of rows they return, when the relationships of
+the ports are joined to the query of the ports, as for a single port, and
+when they are loaded by separate queries, as is now done for collections.
+
+Usage: PYTHONPATH=. python tools/bench_port_list_loaders.py
+           [--connection URL] [--ports N] [--ips N] [--groups N]
+"""
+
+from __future__ import print_function
+
+import argparse
+import os
+import tempfile
+import time
+
+from oslo.config import cfg
+from oslo import messaging
+import sqlalchemy as sa
+
+from neutron.common import config  # noqa
+from neutron.common import rpc as n_rpc
+from neutron import context
+from neutron.db import api as db_api
+from neutron.db import db_base_plugin_v2
+from neutron.db import models_v2
+from neutron.db import securitygroups_db as sg_db
+from neutron import manager
+from neutron.openstack.common import uuidutils
+from neutron.plugins.ml2 import config as ml2_config  # noqa
+
+TENANT = 'bench'
+
+
+class StatementRecorder(object):
+    """Records the statements run, to count the rows they return."""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.statements = []
+        sa.event.listen(engine, 'before_cursor_execute', self.record)
+
+    def record(self, conn, cursor, statement, parameters, context,
+               executemany):
+        self.statements.append((statement, parameters))
+
+    def count_rows(self):
+        statements, self.statements = self.statements, []
+        connection = self.engine.raw_connection()
+        try:
+            cursor = connection.cursor()
+            rows = 0
+            for statement, parameters in statements:
+                cursor.execute('SELECT count(*) FROM (%s)' % statement,
+                               parameters)
+                rows += cursor.fetchone()[0]
+            return len(statements), rows
+        finally:
+            connection.close()
+
+
+def populate(session, args):
+    rows = dict((model, []) for model in (
+        models_v2.Network, models_v2.Subnet, models_v2.Port,
+        models_v2.IPAllocation, sg_db.SecurityGroup,
+        sg_db.SecurityGroupPortBinding))
+    network_id = uuidutils.generate_uuid()
+    rows[models_v2.Network].append(
+        {'id': network_id, 'tenant_id': TENANT, 'name': '',
+         'status': 'ACTIVE', 'admin_state_up': True, 'shared': False})
+    subnet_ids = []
+    for i in range(args.ips):
+        subnet_ids.append(uuidutils.generate_uuid())
+        rows[models_v2.Subnet].append(
+            {'id': subnet_ids[-1], 'tenant_id': TENANT, 'name': '',
+             'network_id': network_id, 'ip_version': 4,
+             'cidr': '10.%d.0.0/16' % i, 'gateway_ip': '10.%d.0.1' % i,
+             'enable_dhcp': False, 'shared': False})
+    group_ids = []
+    for i in range(args.groups):
+        group_ids.append(uuidutils.generate_uuid())
+        rows[sg_db.SecurityGroup].append(
+            {'id': group_ids[-1], 'tenant_id': TENANT,
+             'name': 'group-%d' % i, 'description': ''})
+    for i in range(args.ports):
+        port_id = uuidutils.generate_uuid()
+        rows[models_v2.Port].append(
+            {'id': port_id, 'tenant_id': TENANT, 'name': '',
+             'network_id': network_id,
+             'mac_address': 'fa:16:3e:00:%02x:%02x' % (i >> 8 & 255,
+                                                      i & 255),
+             'admin_state_up': True, 'status': 'ACTIVE',
+             'device_id': uuidutils.generate_uuid(),
+             'device_owner': 'compute:nova'})
+        for j, subnet_id in enumerate(subnet_ids):
+            rows[models_v2.IPAllocation].append(
+                {'port_id': port_id, 'subnet_id': subnet_id,
+                 'network_id': network_id,
+                 'ip_address': '10.%d.%d.%d' % (j, i >> 8 & 255, i & 255)})
+        for group_id in group_ids:
+            rows[sg_db.SecurityGroupPortBinding].append(
+                {'port_id': port_id, 'security_group_id': group_id})
+    with session.begin():
+        for model in (models_v2.Network, models_v2.Subnet, models_v2.Port,
+                      models_v2.IPAllocation, sg_db.SecurityGroup,
+                      sg_db.SecurityGroupPortBinding):
+            session.execute(model.__table__.insert(), rows[model])
+
+
+def list_ports(plugin, recorder):
+    # A new context, so that no port is already in the session
+    ctx = context.Context('user', TENANT)
+    recorder.count_rows()
+    start = time.time()
+    ports = plugin.get_ports(ctx)
+    elapsed = time.time() - start
+    statements, rows = recorder.count_rows()
+    return elapsed, statements, rows, len(ports)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--connection')
+    parser.add_argument('--ports', type=int, default=2000)
+    parser.add_argument('--ips', type=int, default=4,
+                        help='fixed IPs of each port')
+    parser.add_argument('--groups', type=int, default=3,
+                        help='security groups of each port')
+    args = parser.parse_args()
+
+    connection = args.connection
+    if not connection:
+        fd, path = tempfile.mkstemp(suffix='.sqlite')
+        os.close(fd)
+        connection = 'sqlite:///%s' % path
+    cfg.CONF.set_override('connection', connection, group='database')
+    cfg.CONF.set_override('core_plugin',
+                          'neutron.plugins.ml2.plugin.Ml2Plugin')
+    cfg.CONF.set_override('mechanism_drivers', [], group='ml2')
+    n_rpc.TRANSPORT = messaging.get_transport(cfg.CONF, 'fake:/')
+    n_rpc.NOTIFIER = messaging.Notifier(n_rpc.TRANSPORT)
+    db_api.configure_db()
+    plugin = manager.NeutronManager.get_plugin()
+    populate(db_api.get_session(), args)
+    recorder = StatementRecorder(db_api.get_engine())
+    loaders = db_base_plugin_v2.CommonDbMixin._collection_loaders
+
+    print('%10s %10s %12s %12s %8s' % ('loading', 'time (s)', 'statements',
+                                       'rows', 'ports'))
+    for name, collection_loaders in (('joined', {}), ('separate', loaders)):
+        db_base_plugin_v2.CommonDbMixin._collection_loaders = (
+            collection_loaders)
+        print('%10s %10.3f %12d %12d %8d' % ((name, ) +
+                                             list_ports(plugin, recorder)))
+
+
+if __name__ == '__main__':
+    main()
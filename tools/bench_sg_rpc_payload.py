@@ -0,0 +1,144 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Compare the security group RPC payloads sent to the L2 agents.
+
+All the ports of a host are in one security group, allowing ssh from the
+members of another group. For both RPC methods, this measures the time the
+server spends building the reply (the database queries are replaced by
+canned rows), the size of the serialized reply, and the time the agent
+spends deserializing it and setting up the iptables firewall (the iptables
+commands are replaced by an in-memory fake).
+
+Usage: PYTHONPATH=. python tools/bench_sg_rpc_payload.py
+           [--ports N] [--members N]
+"""
+
+from __future__ import print_function
+
+import argparse
+import tempfile
+import time
+
+from oslo.config import cfg
+
+from neutron.agent.common import config
+from neutron.agent.linux import iptables_firewall
+from neutron.agent.linux import utils
+from neutron.db import securitygroups_rpc_base as sg_db_rpc
+from neutron.openstack.common import jsonutils
+
+SG_ID = 'web-sg'
+REMOTE_SG_ID = 'admin-sg'
+
+
+def ip(index):
+    return '10.%d.%d.%d' % (index >> 16 & 255, index >> 8 & 255, index & 255)
+
+
+class FakeServer(sg_db_rpc.SecurityGroupServerRpcCallbackMixin):
+    """Answers the queries of the RPC methods with canned rows."""
+
+    def __init__(self, num_ports, num_members):
+        self.num_members = num_members
+        self.rules = [
+            {'id': 'rule-egress', 'security_group_id': SG_ID,
+             'direction': 'egress', 'ethertype': 'IPv4',
+             'remote_group_id': None},
+            {'id': 'rule-ssh', 'security_group_id': SG_ID,
+             'direction': 'ingress', 'ethertype': 'IPv4',
+             'protocol': 'tcp', 'port_range_min': 22, 'port_range_max': 22,
+             'remote_group_id': REMOTE_SG_ID}]
+        self.ports = dict(('tap%d' % i, i) for i in range(num_ports))
+
+    def get_port_from_device(self, device):
+        index = self.ports[device]
+        return {'id': 'port-%d' % index,
+                'device': device,
+                'device_owner': 'compute:nova',
+                'network_id': 'net',
+                'mac_address': 'fa:16:3e:00:%02x:%02x' % (index >> 8 & 255,
+                                                         index & 255),
+                'fixed_ips': ['192.168.%d.%d' % (index >> 8 & 255,
+                                                 index & 255)],
+                'security_groups': [SG_ID],
+                'security_group_rules': [],
+                'security_group_source_groups': []}
+
+    def _select_rules_for_ports(self, context, ports):
+        return [({'port_id': port_id}, rule)
+                for port_id in ports for rule in self.rules]
+
+    def _select_ips_for_remote_group(self, context, remote_group_ids):
+        return dict((remote_group_id,
+                     [ip(i) for i in range(self.num_members)])
+                    for remote_group_id in remote_group_ids)
+
+    def _select_dhcp_ips_for_network_ids(self, context, network_ids):
+        return dict((network_id, ['192.168.0.2']) for network_id in
+                    network_ids)
+
+    def _select_ra_ips_for_network_ids(self, context, network_ids):
+        return dict((network_id, set()) for network_id in network_ids)
+
+
+class FakeExecute(object):
+    def __call__(self, args, root_helper=None, process_input=None, **kwargs):
+        return ''
+
+
+def run(server, method):
+    devices = list(server.ports)
+    start = time.time()
+    reply = getattr(server, method)(None, devices=devices)
+    server_time = time.time() - start
+    payload = jsonutils.dumps(reply)
+
+    firewall = iptables_firewall.IptablesFirewallDriver()
+    start = time.time()
+    reply = jsonutils.loads(payload)
+    if method == 'security_group_info_for_devices':
+        for sg_id, rules in reply['security_groups'].items():
+            firewall.update_security_group_rules(sg_id, rules)
+        for sg_id, member_ips in reply['sg_member_ips'].items():
+            firewall.update_security_group_members(sg_id, member_ips)
+        reply = reply['devices']
+    with firewall.defer_apply():
+        for port in reply.values():
+            firewall.prepare_port_filter(port)
+    agent_time = time.time() - start
+    return server_time, len(payload), agent_time
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--ports', type=int, default=200)
+    parser.add_argument('--members', type=int, default=200,
+                        help='members of the remote security group')
+    args = parser.parse_args()
+
+    config.register_root_helper(cfg.CONF)
+    cfg.CONF.set_override('lock_path', tempfile.mkdtemp())
+    utils.execute = FakeExecute()
+    server = FakeServer(args.ports, args.members)
+
+    print('%34s %11s %12s %10s' % ('method', 'server (s)', 'payload (B)',
+                                   'agent (s)'))
+    for method in ('security_group_rules_for_devices',
+                   'security_group_info_for_devices'):
+        server_time, size, agent_time = run(server, method)
+        print('%34s %11.3f %12d %10.3f' % (method, server_time, size,
+                                           agent_time))
+
+
+if __name__ == '__main__':
+    main()